@@ -0,0 +1,709 @@
+"""asyncio API of api.Registry calls and of the container lifecycle, nothing in it blocks the event loop."""
+
+import asyncio
+import json
+import logging
+import shlex
+import tempfile
+import time
+import OIIInspector.exceptions as exceptions
+from OIIInspector.cache import get_active_cache
+from OIIInspector.container_manager import (
+    ContainerManager,
+    get_pull_policy,
+    local_image_usable,
+    start_failure,
+)
+from OIIInspector.container_runtime import detect_runtime
+from OIIInspector.filters import message_selector
+from OIIInspector.port_allocator import reserve_free_port, release_port
+from OIIInspector.utils import (
+    aiter_json_objects,
+    convert_message,
+    parse_output,
+    run_cmd_async,
+    run_cmd_stream_async,
+)
+
+log = logging.getLogger(__name__)
+
+
+def _fed_messages(feed):
+    """
+    Yield messages appended to the feed by the caller, one message per step of the consumer.
+
+    :param list feed: messages appended by the caller, None ends the generator
+    :return: generator of the messages
+    :rtype: Iterator[dict]
+    """
+    while True:
+        message = feed.pop()
+        if message is None:
+            return
+        yield message
+
+
+class AsyncContainerManager:
+    """asyncio counterpart of ContainerManager, readiness of the registry is awaited without blocking."""
+
+    _grpc_container_port = ContainerManager._grpc_container_port
+    _grpc_max_port_tries = ContainerManager._grpc_max_port_tries
+    _grpc_init_wait_time = ContainerManager._grpc_init_wait_time
+    # start of the registry at one port is tried twice, as ContainerManager does with retry decorator
+    _grpc_start_tries = 2
+    _base_container_name = ContainerManager._base_container_name
+    _readiness_initial_delay = ContainerManager._readiness_initial_delay
+    _readiness_max_delay = ContainerManager._readiness_max_delay
+    _readiness_backoff_factor = ContainerManager._readiness_backoff_factor
+    _tcp_connect_timeout = ContainerManager._tcp_connect_timeout
+
+    def __init__(self, image_address, runtime=None, pull_policy=None):
+        """
+        Initialize the AsyncContainerManager.
+
+        :param str image_address: address of the image, to which queries will be done
+        :param ContainerRuntime runtime: container runtime, the runtime detected on the platform is used by default
+        :param str pull_policy: one of PULL_POLICIES of ContainerManager
+        """
+        self._image_address = image_address
+        self._pull_policy = get_pull_policy(pull_policy)
+        self._runtime = runtime
+        self._port = None
+        self._rpc_proc = None
+        self._stderr_file = None
+        self._container_running = False
+        self._container_pulled = False
+        self._readiness_stats = None
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        """Return the AsyncContainerManager."""
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        """Stop and remove the container."""
+        await self.close_container_manager()
+
+    @property
+    def local_address_of_image(self):
+        """Return localhost address with running container."""
+        if self._container_running is False:
+            raise exceptions.OIIInspectorError("Image is not running")
+        return f"localhost:{self._port}"
+
+    @property
+    def readiness_stats(self):
+        """Return statistics of the last wait for the index registry service, see ContainerManager."""
+        return self._readiness_stats
+
+    async def start_container(self):
+        """Pull the image and start the registry service at free local port, concurrent calls start it once."""
+        async with self._lock:
+            if self._container_running is True:
+                return
+            if self._runtime is None:
+                # detection runs the runtime binaries and reads files, so it runs in a worker thread
+                self._runtime = await asyncio.to_thread(detect_runtime)
+            if self._container_pulled is False:
+                await self._pull_image()
+                self._container_pulled = True
+            await self._serve_index_registry()
+            self._container_running = True
+
+    async def close_container_manager(self):
+        """Stop and remove the container, the pulled image is left in local storage to be reused."""
+        async with self._lock:
+            if self._container_running is True:
+                await self._kill_registry_process()
+                await run_cmd_async(self._runtime.stop_command(self._container_name))
+                self._container_running = False
+            if self._port is not None:
+                await run_cmd_async(self._runtime.remove_command(self._container_name))
+                await asyncio.to_thread(release_port, self._port)
+                self._port = None
+            self._container_pulled = False
+
+    async def _pull_image(self):
+        """
+        Pull the image, unless the pull policy allows the image in local storage.
+
+        :raises OIIInspectorError: if the image is not in local storage and the pull policy is "never"
+        """
+        if local_image_usable(self._pull_policy, self._image_address):
+            output = await run_cmd_async(
+                self._runtime.image_exists_command(self._image_address),
+                tolerate_err=True,
+            )
+            if output.strip():
+                log.debug("Image %s is present in local storage.", self._image_address)
+                return
+            if self._pull_policy == "never":
+                raise exceptions.OIIInspectorError(
+                    f"Image {self._image_address} is not present in local storage and pull policy is never"
+                )
+        await run_cmd_async(self._runtime.pull_command(self._image_address))
+
+    @property
+    def _container_name(self):
+        """Return name of the container."""
+        return f"{self._base_container_name}_{self._port}"
+
+    async def _serve_index_registry(self):
+        """
+        Start the registry service at a reserved port, other ports are tried while the ports are in use.
+
+        :raises NoFreePortFound: if all tried ports are in use
+        """
+        for _ in range(self._grpc_max_port_tries):
+            # reservations are kept in lock files, the file locking runs in a worker thread
+            self._port = await asyncio.to_thread(reserve_free_port)
+            try:
+                for attempt in range(self._grpc_start_tries):
+                    try:
+                        await self._serve_index_registry_at_port(self._port)
+                        return
+                    except exceptions.AddressAlreadyInUse:
+                        raise
+                    except exceptions.OIIInspectorError as error:
+                        if attempt + 1 == self._grpc_start_tries:
+                            raise
+                        log.warning(f"{error}, retrying.")
+            except exceptions.AddressAlreadyInUse:
+                log.info("Port %d is in use, trying another.", self._port)
+                await asyncio.to_thread(release_port, self._port)
+                self._port = None
+            except BaseException:
+                await asyncio.to_thread(release_port, self._port)
+                self._port = None
+                raise
+        raise exceptions.NoFreePortFound(
+            f"No free port has been found after {self._grpc_max_port_tries} attempts."
+        )
+
+    async def _serve_index_registry_at_port(self, port):
+        """
+        Start the registry service at the port and wait until it answers.
+
+        :param int port: local port of the service
+        :raises AddressAlreadyInUse: if the port is already used by another service
+        :raises OIIInspectorError: if the service has failed or it has not been initialized in time
+        """
+        cmd = self._runtime.run_command(
+            self._container_name, port, self._grpc_container_port, self._image_address
+        )
+        # stderr goes to a file, the registry logs there for its whole lifetime
+        self._stderr_file = tempfile.TemporaryFile()
+        self._rpc_proc = await asyncio.create_subprocess_exec(
+            *shlex.split(cmd),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=self._stderr_file,
+        )
+        start_time = time.time()
+        delay = self._readiness_initial_delay
+        tcp_attempts = 0
+        grpc_probes = 0
+        while time.time() - start_time < self._grpc_init_wait_time:
+            if self._rpc_proc.returncode is not None:
+                self._stderr_file.seek(0)
+                stderr = self._stderr_file.read().decode("utf-8", errors="replace")
+                self._stderr_file.close()
+                raise start_failure(stderr, port, self._container_name, cmd)
+
+            tcp_attempts += 1
+            if await self._port_accepts_connections(port):
+                grpc_probes += 1
+                if await self._registry_responds(port):
+                    self._readiness_stats = {
+                        "wait_time": time.time() - start_time,
+                        "tcp_attempts": tcp_attempts,
+                        "grpc_probes": grpc_probes,
+                    }
+                    log.info(
+                        "Index registry service has been initialized in %.3f s.",
+                        self._readiness_stats["wait_time"],
+                    )
+                    return
+
+            await asyncio.sleep(delay)
+            delay = min(
+                delay * self._readiness_backoff_factor, self._readiness_max_delay
+            )
+
+        await self._kill_registry_process()
+        raise exceptions.OIIInspectorError("Index registry has not been initialized")
+
+    async def _kill_registry_process(self):
+        """Kill the process running the registry service, if it is still running."""
+        if self._rpc_proc.returncode is None:
+            self._rpc_proc.kill()
+        await self._rpc_proc.wait()
+        self._stderr_file.close()
+
+    async def _port_accepts_connections(self, port):
+        """
+        Check whether TCP connection to the local port can be opened.
+
+        :param int port: port to be checked
+        :return: True if the connection has been established
+        :rtype: bool
+        """
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection("localhost", port),
+                timeout=self._tcp_connect_timeout,
+            )
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        return True
+
+    async def _registry_responds(self, port):
+        """
+        Query the service running at the port with gRPC to see if it has started.
+
+        :param int port: port of the service
+        :return: True if the service provides api.Registry
+        :rtype: bool
+        """
+        try:
+            output = await run_cmd_async(
+                f"grpcurl -plaintext localhost:{port} list api.Registry"
+            )
+        except (RuntimeError, OSError):
+            output = ""
+        return "api.Registry.ListBundles" in output or (
+            "api.Registry.ListPackages" in output
+        )
+
+
+def _call_argument(**fields):
+    """
+    Build shell quoted JSON request for grpcurl -d option.
+
+    :param fields: fields of the request
+    :return: call argument
+    :rtype: str
+    """
+    return shlex.quote(json.dumps(fields))
+
+
+class AsyncIndexSession:
+    """
+    asyncio counterpart of IndexSession, one container is started on the first query for all queries of the session.
+
+    Responses are cached in the cache active when the session is created, the same way as in IndexSession.
+    """
+
+    def __init__(
+        self, image_address, cache=None, runtime=None, lazy=False, pull_policy=None
+    ):
+        """
+        Initialize the AsyncIndexSession.
+
+        :param str image_address: address of the index image, to which queries will be done
+        :param ResponseCache cache: cache of the responses, the cache activated by use_cache is used by default
+        :param ContainerRuntime runtime: container runtime, the detected runtime is used by default
+        :param bool lazy: decode csvJson, object and spec fields of the responses on their first access
+        :param str pull_policy: one of PULL_POLICIES of ContainerManager
+        """
+        self._image_address = image_address
+        self._lazy = lazy
+        self._cache = cache if cache is not None else get_active_cache()
+        self._container_manager = AsyncContainerManager(
+            image_address, runtime=runtime, pull_policy=pull_policy
+        )
+
+    async def __aenter__(self):
+        """Return the opened AsyncIndexSession."""
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_tb):
+        """Stop and remove the container used by this session."""
+        await self.close()
+
+    async def close(self):
+        """Stop and remove the container used by this session."""
+        await self._container_manager.close_container_manager()
+
+    async def _get_local_address(self):
+        """
+        Get local address of the running index image, start the container if it is not running yet.
+
+        :return: local address of the running image in format localhost:PORT
+        :rtype: str
+        """
+        await self._container_manager.start_container()
+        return self._container_manager.local_address_of_image
+
+    async def _command(self, api_address, call_argument=None):
+        """
+        Build grpcurl command calling api.Registry method on the running image.
+
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: grpcurl command
+        :rtype: str
+        """
+        address = await self._get_local_address()
+        if call_argument is None:
+            return f"grpcurl -plaintext {address} api.Registry/{api_address}"
+        return f"grpcurl -plaintext -d {call_argument} {address} api.Registry/{api_address}"
+
+    async def _load_cached(self, api_address, call_argument=None):
+        """
+        Load cached raw messages of the call, in a thread, as digest of the image can be resolved with skopeo.
+
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: generator of raw messages read from the entry one by one, or None if the response is not cached
+        :rtype: Iterator[dict]
+        """
+        if self._cache is None:
+            return None
+        return await asyncio.to_thread(
+            self._cache.load, self._image_address, api_address, call_argument
+        )
+
+    async def _store_cached(self, api_address, call_argument, messages):
+        """
+        Store raw messages of the call in the cache, in a thread.
+
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :param list messages: raw messages of the complete response
+        """
+        if self._cache is None:
+            return
+
+        def store():
+            for _ in self._cache.store(
+                self._image_address, api_address, call_argument, messages
+            ):
+                pass
+
+        await asyncio.to_thread(store)
+
+    async def _query(self, api_address, call_argument=None):
+        """
+        Call api.Registry method returning single message.
+
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: converted message
+        :rtype: JSON-object
+        """
+        cached = await self._load_cached(api_address, call_argument)
+        if cached is not None:
+            (message,) = cached
+        else:
+            message = parse_output(
+                await run_cmd_async(await self._command(api_address, call_argument))
+            )
+            await self._store_cached(api_address, call_argument, [message])
+        return convert_message(message, lazy=self._lazy)
+
+    async def _iter_messages(self, api_address, select=None):
+        """
+        Call api.Registry method returning stream of messages and yield every message as soon as it is decoded.
+
+        :param str api_address: API address to be accessed
+        :param callable select: function selecting the raw messages, see OIIInspector.filters.message_selector
+        :return: asynchronous generator of converted messages
+        :rtype: AsyncIterator[JSON-object]
+        """
+        select = select or message_selector()
+        cached = await self._load_cached(api_address)
+        if cached is not None:
+            for message in cached:
+                selected = select(message)
+                if selected is not None:
+                    yield convert_message(selected, lazy=self._lazy)
+            return
+        chunks = run_cmd_stream_async(await self._command(api_address))
+        # messages are written to the cache entry one by one, as ResponseCache.store takes them from the feed
+        feed = []
+        store = None
+        if self._cache is not None:
+            store = self._cache.store(
+                self._image_address, api_address, None, _fed_messages(feed)
+            )
+        try:
+            async for message in aiter_json_objects(chunks):
+                if store is not None:
+                    # the message is written before convert_message replaces its embedded JSON strings in place
+                    feed.append(message)
+                    next(store)
+                selected = select(message)
+                if selected is not None:
+                    yield convert_message(selected, lazy=self._lazy)
+            if store is not None:
+                feed.append(None)
+                # the complete entry is moved in place and the cache is evicted in a worker thread
+                await asyncio.to_thread(next, store, None)
+        finally:
+            if store is not None:
+                store.close()
+
+    def iter_packages(self):
+        """
+        Call api.Registry/ListPackages and yield every package as soon as it is decoded.
+
+        :return: asynchronous generator of data objects which contain json data
+        :rtype: AsyncIterator[JSON-object]
+        """
+        return self._iter_messages("ListPackages")
+
+    def iter_bundles(self, fields=None, filters=None):
+        """
+        Call api.Registry/ListBundles and yield every bundle as soon as it is decoded.
+
+        :param fields: names of the fields of the bundles, all fields are returned by default
+        :type fields: Iterable[str]
+        :param dict filters: conditions of OIIInspector.filters.BundleFilter, e.g. {"package": "etcd"}
+        :return: asynchronous generator of data objects which contain json data
+        :rtype: AsyncIterator[JSON-object]
+        """
+        return self._iter_messages("ListBundles", message_selector(fields, filters))
+
+    async def list_packages(self):
+        """
+        Call api.Registry/ListPackages.
+
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        return [package async for package in self.iter_packages()]
+
+    async def list_bundles(self, fields=None, filters=None):
+        """
+        Call api.Registry/ListBundles.
+
+        :param fields: names of the fields of the bundles, all fields are returned by default
+        :type fields: Iterable[str]
+        :param dict filters: conditions of OIIInspector.filters.BundleFilter, e.g. {"package": "etcd"}
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        return [bundle async for bundle in self.iter_bundles(fields, filters)]
+
+    async def get_bundle(self, pkg_name, channel_name, csv_name):
+        """
+        Call api.Registry/GetBundle.
+
+        :param str pkg_name: name of the package in the image
+        :param str channel_name: name of the channel in the image
+        :param str csv_name: name of the csv in the image
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        call_argument = _call_argument(
+            pkgName=pkg_name, channelName=channel_name, csvName=csv_name
+        )
+        return await self._query("GetBundle", call_argument)
+
+    async def get_package(self, package_name):
+        """
+        Call api.Registry/GetPackage.
+
+        :param str package_name: name of the package in the image
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        return await self._query("GetPackage", _call_argument(name=package_name))
+
+    async def get_bundle_for_channel(self, package_name, channel_name):
+        """
+        Call api.Registry/GetBundleForChannel.
+
+        :param str package_name: name of the package in the image
+        :param str channel_name: name of the channel in the image
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        call_argument = _call_argument(pkgName=package_name, channelName=channel_name)
+        return await self._query("GetBundleForChannel", call_argument)
+
+    async def get_bundle_that_replaces(self, package_name, channel_name, csv_name):
+        """
+        Call api.Registry/GetBundleThatReplaces.
+
+        :param str package_name: name of the package in the image
+        :param str channel_name: name of the channel in the image
+        :param str csv_name: name of the csv in the image
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        call_argument = _call_argument(
+            pkgName=package_name, channelName=channel_name, csvName=csv_name
+        )
+        return await self._query("GetBundleThatReplaces", call_argument)
+
+    async def get_default_bundle_that_provides(self, group, version, kind, plural):
+        """
+        Call api.Registry/GetDefaultBundleThatProvides.
+
+        :param str group: name of the group in the image
+        :param str version: version of the image
+        :param str kind: kind of the bundle
+        :param str plural: plural name of the image
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        call_argument = _call_argument(
+            group=group, version=version, kind=kind, plural=plural
+        )
+        return await self._query("GetDefaultBundleThatProvides", call_argument)
+
+
+async def get_bundle_async(
+    image_address, pkg_name, channel_name, csv_name, **session_options
+):
+    """
+    Call api.Registry/GetBundle on the image started in its own container.
+
+    :param str image_address: Image address of the image that will be started in container and queried
+    :param str pkg_name: name of the package in the image
+    :param str channel_name: name of the channel in the image
+    :param str csv_name: name of the csv in the image
+    :param session_options: options of the AsyncIndexSession
+    :return: Data object which contains json data
+    :rtype: JSON-object
+    """
+    async with AsyncIndexSession(image_address, **session_options) as session:
+        return await session.get_bundle(pkg_name, channel_name, csv_name)
+
+
+async def list_packages_async(image_address, **session_options):
+    """
+    Call api.Registry/ListPackages on the image started in its own container.
+
+    :param str image_address: Image address of the image that will be started and queried
+    :param session_options: options of the AsyncIndexSession
+    :return: Data object which contains json data
+    :rtype: JSON-object
+    """
+    async with AsyncIndexSession(image_address, **session_options) as session:
+        return await session.list_packages()
+
+
+async def list_bundles_async(
+    image_address, fields=None, filters=None, **session_options
+):
+    """
+    Call api.Registry/ListBundles on the image started in its own container.
+
+    :param str image_address: Image address of the image that will be started and queried
+    :param fields: names of the fields of the bundles, all fields are returned by default
+    :type fields: Iterable[str]
+    :param dict filters: conditions of OIIInspector.filters.BundleFilter, e.g. {"package": "etcd"}
+    :param session_options: options of the AsyncIndexSession
+    :return: Data object which contains json data
+    :rtype: JSON-object
+    """
+    async with AsyncIndexSession(image_address, **session_options) as session:
+        return await session.list_bundles(fields, filters)
+
+
+async def iter_packages_async(image_address, **session_options):
+    """
+    Stream packages of api.Registry/ListPackages, the container is removed when the iteration ends.
+
+    :param str image_address: Image address of the image that will be started and queried
+    :param session_options: options of the AsyncIndexSession
+    :return: asynchronous generator of data objects which contain json data
+    :rtype: AsyncIterator[JSON-object]
+    """
+    async with AsyncIndexSession(image_address, **session_options) as session:
+        async for package in session.iter_packages():
+            yield package
+
+
+async def iter_bundles_async(
+    image_address, fields=None, filters=None, **session_options
+):
+    """
+    Stream bundles of api.Registry/ListBundles, the container is removed when the iteration ends.
+
+    :param str image_address: Image address of the image that will be started and queried
+    :param fields: names of the fields of the bundles, all fields are returned by default
+    :type fields: Iterable[str]
+    :param dict filters: conditions of OIIInspector.filters.BundleFilter, e.g. {"package": "etcd"}
+    :param session_options: options of the AsyncIndexSession
+    :return: asynchronous generator of data objects which contain json data
+    :rtype: AsyncIterator[JSON-object]
+    """
+    async with AsyncIndexSession(image_address, **session_options) as session:
+        async for bundle in session.iter_bundles(fields, filters):
+            yield bundle
+
+
+async def get_package_async(image_address, package_name, **session_options):
+    """
+    Call api.Registry/GetPackage on the image started in its own container.
+
+    :param str image_address: Image address of the image that will be started and queried
+    :param str package_name: name of the package in the image
+    :param session_options: options of the AsyncIndexSession
+    :return: Data object which contains json data
+    :rtype: JSON-object
+    """
+    async with AsyncIndexSession(image_address, **session_options) as session:
+        return await session.get_package(package_name)
+
+
+async def get_bundle_for_channel_async(
+    image_address, package_name, channel_name, **session_options
+):
+    """
+    Call api.Registry/GetBundleForChannel on the image started in its own container.
+
+    :param str image_address: Image address of the image that will be started and queried
+    :param str package_name: name of the package in the image
+    :param str channel_name: name of the channel in the image
+    :param session_options: options of the AsyncIndexSession
+    :return: Data object which contains json data
+    :rtype: JSON-object
+    """
+    async with AsyncIndexSession(image_address, **session_options) as session:
+        return await session.get_bundle_for_channel(package_name, channel_name)
+
+
+async def get_bundle_that_replaces_async(
+    image_address, package_name, channel_name, csv_name, **session_options
+):
+    """
+    Call api.Registry/GetBundleThatReplaces on the image started in its own container.
+
+    :param str image_address: Image address of the image that will be started and queried
+    :param str package_name: name of the package in the image
+    :param str channel_name: name of the channel in the image
+    :param str csv_name: name of the csv in the image
+    :param session_options: options of the AsyncIndexSession
+    :return: Data object which contains json data
+    :rtype: JSON-object
+    """
+    async with AsyncIndexSession(image_address, **session_options) as session:
+        return await session.get_bundle_that_replaces(
+            package_name, channel_name, csv_name
+        )
+
+
+async def get_default_bundle_that_provides_async(
+    image_address, group, version, kind, plural, **session_options
+):
+    """
+    Call api.Registry/GetDefaultBundleThatProvides on the image started in its own container.
+
+    :param str image_address: Image address of the image that will be started and queried
+    :param str group: name of the group in the image
+    :param str version: version of the image
+    :param str kind: kind of the bundle
+    :param str plural: plural name of the image
+    :param session_options: options of the AsyncIndexSession
+    :return: Data object which contains json data
+    :rtype: JSON-object
+    """
+    async with AsyncIndexSession(image_address, **session_options) as session:
+        return await session.get_default_bundle_that_provides(
+            group, version, kind, plural
+        )
@@ -0,0 +1,142 @@
+"""Batch execution of many queries, every index image is started only once for all of its queries."""
+
+import json
+import logging
+from OIIInspector.oii_client import IndexSession
+
+log = logging.getLogger(__name__)
+
+# IndexSession methods which can be called by the queries
+QUERY_METHODS = (
+    "get_bundle",
+    "list_packages",
+    "list_bundles",
+    "get_package",
+    "get_bundle_for_channel",
+    "get_bundle_that_replaces",
+    "get_default_bundle_that_provides",
+)
+
+
+def read_queries(queries_file):
+    """
+    Read queries from JSONL file (one query per line) or from JSON file holding list of queries.
+
+    Query is an object with "image" (address of the index image), "method" (one of QUERY_METHODS), optional "args"
+    (list of positional arguments, or object of keyword arguments of the method) and optional "id".
+    Lines which are not valid JSON are yielded as strings, so they are reported as failed queries in their place.
+
+    :param file queries_file: opened file with queries
+    :return: generator of queries
+    :rtype: Iterator[dict]
+    """
+    content = queries_file.read()
+    if content.lstrip().startswith("["):
+        yield from json.loads(content)
+        return
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            yield line
+
+
+def validate_query(query):
+    """
+    Check that the query can be executed.
+
+    :param query: query read from the file
+    :raises ValueError: if the query is not valid
+    """
+    if not isinstance(query, dict):
+        raise ValueError(f"Query is not a JSON object: {query}")
+    if not isinstance(query.get("image"), str):
+        raise ValueError("Query has no image address")
+    if query.get("method") not in QUERY_METHODS:
+        raise ValueError(f"Unknown method {query.get('method')}")
+    if not isinstance(query.get("args", []), (list, dict)):
+        raise ValueError("Arguments of the query have to be list or object")
+
+
+def execute_query(session, query):
+    """
+    Execute the query in the session.
+
+    :param IndexSession session: session of the image of the query
+    :param dict query: valid query
+    :return: converted response
+    :rtype: JSON-object
+    """
+    method = getattr(session, query["method"])
+    args = query.get("args", [])
+    if isinstance(args, dict):
+        return method(**args)
+    return method(*args)
+
+
+def _result(index, query, result=None, error=None):
+    """
+    Build result record of the query.
+
+    :param int index: position of the query in the input
+    :param query: query read from the file
+    :param result: converted response of the query
+    :param Exception error: error of the query, if it failed
+    :return: result record
+    :rtype: dict
+    """
+    record = {"index": index}
+    if isinstance(query, dict):
+        for key in ("id", "image", "method"):
+            if key in query:
+                record[key] = query[key]
+    if error is None:
+        record["result"] = result
+    else:
+        record["error"] = f"{type(error).__name__}: {error}"
+    return record
+
+
+def run_queries(queries, **session_options):
+    """
+    Execute the queries, queries of one image share one IndexSession, so the container is started once per image.
+
+    Images are processed in order of their first query and results are yielded in the input order, each result
+    as soon as all preceding results are known. Failure of a query is reported in its result and the batch goes on.
+
+    :param Iterable queries: queries, see read_queries for their format
+    :param session_options: options of the IndexSession, e.g. transport
+    :return: generator of result records with "index", "id", "image", "method" and "result" or "error"
+    :rtype: Iterator[dict]
+    """
+    queries = list(queries)
+    results = {}
+    next_index = 0
+    images = {}
+    for index, query in enumerate(queries):
+        try:
+            validate_query(query)
+        except ValueError as error:
+            results[index] = _result(index, query, error=error)
+            continue
+        images.setdefault(query["image"], []).append(index)
+
+    for image, indexes in images.items():
+        with IndexSession(image, **session_options) as session:
+            for index in indexes:
+                query = queries[index]
+                try:
+                    result = _result(index, query, execute_query(session, query))
+                except Exception as error:
+                    log.error(f"Query {index} on {image} failed with {error}")
+                    result = _result(index, query, error=error)
+                results[index] = result
+                while next_index in results:
+                    yield results.pop(next_index)
+                    next_index += 1
+
+    while next_index in results:
+        yield results.pop(next_index)
+        next_index += 1
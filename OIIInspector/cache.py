@@ -0,0 +1,252 @@
+"""On-disk cache of api.Registry responses keyed by image digest, API method and call arguments."""
+
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from OIIInspector import profiling
+from OIIInspector.utils import run_cmd, parse_call_argument
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "OIIINSPECTOR_CACHE_DIR",
+    os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+        "OIIInspector",
+    ),
+)
+DEFAULT_MAX_SIZE = 2 * 1024**3
+ENTRY_SUFFIX = ".ndjson"
+
+_active_cache = contextvars.ContextVar("active_cache", default=None)
+
+
+def get_active_cache():
+    """
+    Get cache used by IndexSession when no cache is passed explicitly.
+
+    :return: active cache or None if responses are not cached
+    :rtype: ResponseCache
+    """
+    return _active_cache.get()
+
+
+@contextlib.contextmanager
+def use_cache(cache):
+    """
+    Use the cache for all IndexSessions opened in the block.
+
+    :param ResponseCache cache: cache to be used, None disables caching
+    """
+    token = _active_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _active_cache.reset(token)
+
+
+def resolve_image_digest(image_address):
+    """
+    Resolve reference of the image to digest of its manifest.
+
+    Digest of a reference pinned by digest is taken from the reference itself, other references are resolved
+    with skopeo, without pulling the image.
+
+    :param str image_address: reference of the image
+    :return: digest of the image, or None if it can not be resolved
+    :rtype: str
+    """
+    if "@sha256:" in image_address:
+        return image_address.rsplit("@", 1)[1]
+    try:
+        digest = run_cmd(
+            f"skopeo inspect --format {{{{.Digest}}}} docker://{image_address}"
+        ).strip()
+    except (RuntimeError, OSError):
+        log.info("Digest of %s can not be resolved, it is not cached.", image_address)
+        return None
+    return digest or None
+
+
+class ResponseCache:
+    """
+    Size bounded on-disk cache of api.Registry responses.
+
+    Every entry holds raw messages of one response, one message per line. Entries are evicted in least recently
+    used order when the total size of the cache exceeds the limit.
+    """
+
+    def __init__(
+        self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE, refresh=False
+    ):
+        """
+        Initialize the ResponseCache.
+
+        :param str cache_dir: directory where the entries are stored
+        :param int max_size: maximal total size of the entries in bytes
+        :param bool refresh: ignore stored entries and replace them with new responses
+        """
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        self._refresh = refresh
+        self._digests = {}
+
+    def _get_digest(self, image_address):
+        """
+        Get digest of the image, resolved digests are remembered for the lifetime of the cache object.
+
+        :param str image_address: reference of the image
+        :return: digest of the image or None
+        :rtype: str
+        """
+        if image_address not in self._digests:
+            self._digests[image_address] = resolve_image_digest(image_address)
+        return self._digests[image_address]
+
+    def _entry_path(self, image_address, api_address, call_argument):
+        """
+        Get path of the entry for the call.
+
+        :param str image_address: reference of the image
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: path of the entry, or None if the image can not be cached
+        :rtype: str
+        """
+        digest = self._get_digest(image_address)
+        if digest is None:
+            return None
+        key = json.dumps(
+            [digest, api_address, parse_call_argument(call_argument)], sort_keys=True
+        )
+        return os.path.join(
+            self._cache_dir,
+            hashlib.sha256(key.encode("utf-8")).hexdigest() + ENTRY_SUFFIX,
+        )
+
+    def load(self, image_address, api_address, call_argument=None):
+        """
+        Load cached response of the call.
+
+        :param str image_address: reference of the image
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: generator of raw messages of the response, or None if the response is not cached
+        :rtype: Iterator[dict]
+        """
+        path = self._entry_path(image_address, api_address, call_argument)
+        if path is None or self._refresh:
+            return None
+        try:
+            entry = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        except OSError as error:
+            log.warning("Cache entry of %s can not be read: %s", api_address, error)
+            return None
+        # mark the entry as recently used, the entry is still readable if the time can not be set
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        log.debug(
+            "Response of %s for %s loaded from cache.", api_address, image_address
+        )
+        return self._read_entry(entry)
+
+    @staticmethod
+    def _read_entry(entry):
+        """
+        Read messages of the entry.
+
+        :param file entry: opened entry
+        :return: generator of raw messages
+        :rtype: Iterator[dict]
+        """
+        with entry:
+            for line in entry:
+                profiling.count("bytes_read", len(line))
+                yield json.loads(line)
+
+    def store(self, image_address, api_address, call_argument, messages):
+        """
+        Store response of the call, while it is passed through.
+
+        The entry is written only if all messages have been consumed.
+
+        :param str image_address: reference of the image
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :param Iterable[dict] messages: raw messages of the response
+        :return: generator of the stored messages
+        :rtype: Iterator[dict]
+        """
+        path = self._entry_path(image_address, api_address, call_argument)
+        if path is None:
+            yield from messages
+            return
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+        except OSError as error:
+            # the response is returned uncached, failure of the cache does not fail the query
+            log.warning("Response of %s is not cached: %s", api_address, error)
+            yield from messages
+            return
+        entry = os.fdopen(fd, "w", encoding="utf-8")
+        written = True
+        try:
+            for message in messages:
+                if written:
+                    written = self._write_message(entry, message, api_address)
+                yield message
+            if written:
+                try:
+                    entry.close()
+                    os.replace(tmp_path, path)
+                    self._evict()
+                except OSError as error:
+                    log.warning("Response of %s is not cached: %s", api_address, error)
+        finally:
+            with contextlib.suppress(OSError):
+                entry.close()
+            with contextlib.suppress(OSError):
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    @staticmethod
+    def _write_message(entry, message, api_address):
+        """
+        Write the message to the entry.
+
+        :param file entry: opened temporary entry
+        :param dict message: raw message
+        :param str api_address: API address of the response, used in the warning
+        :return: True if the message has been written, False if the entry can not be written
+        :rtype: bool
+        """
+        try:
+            entry.write(json.dumps(message) + "\n")
+        except OSError as error:
+            log.warning("Response of %s is not cached: %s", api_address, error)
+            return False
+        return True
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits its size limit."""
+        entries = []
+        total_size = 0
+        with os.scandir(self._cache_dir) as dir_entries:
+            for dir_entry in dir_entries:
+                if dir_entry.name.endswith(ENTRY_SUFFIX):
+                    stat = dir_entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+                    total_size += stat.st_size
+        for _, size, path in sorted(entries):
+            if total_size <= self._max_size:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total_size -= size
@@ -0,0 +1,252 @@
+"""In-memory index of the catalog of one index image, answering point queries without any api.Registry call."""
+
+import logging
+from OIIInspector.versions import version_key
+
+log = logging.getLogger(__name__)
+
+
+class CatalogIndex:
+    """
+    Catalog of one index image, built once from ListBundles and ListPackages responses.
+
+    Bundles are indexed by package, channel and csv name, with heads of the channels, replaces edges and provided
+    APIs, so the point queries are dictionary lookups. Methods have the names and the arguments of IndexSession
+    methods and return bundles as they have been listed, the returned messages are shared and should not be
+    modified.
+    """
+
+    def __init__(self, bundles, packages=(), package_source=None):
+        """
+        Initialize the CatalogIndex.
+
+        :param Iterable[dict] bundles: converted bundles of ListBundles, e.g. from IndexSession.iter_bundles
+        :param Iterable[dict] packages: packages of ListPackages or GetPackage; default channel of a package
+            with several channels is known only from its GetPackage message
+        :param package_source: callable returning GetPackage message of the package name, e.g.
+            IndexSession.get_package, it is called once for a package with several channels whose default channel
+            is needed and is not known from the packages
+        :type package_source: Callable[[str], dict]
+        """
+        # bundles keyed by (package, channel, csv name)
+        self._bundles = {}
+        self._channels = {}
+        # bundle replacing or skipping the csv name, as the registry adds skipped bundles to the replaces edges
+        self._replaced_by = {}
+        self._providers = {}
+        self._default_channels = {}
+        self._package_source = package_source
+        for bundle in bundles:
+            package, channel, csv_name = (
+                bundle.get("packageName"),
+                bundle.get("channelName"),
+                bundle.get("csvName"),
+            )
+            self._bundles[(package, channel, csv_name)] = bundle
+            self._channels.setdefault(package, {}).setdefault(channel, []).append(
+                csv_name
+            )
+            if bundle.get("replaces"):
+                self._replaced_by[(package, channel, bundle["replaces"])] = csv_name
+            for skip in bundle.get("skips", ()):
+                self._replaced_by.setdefault((package, channel, skip), csv_name)
+            for api in bundle.get("providedApis", ()):
+                gvk = (api.get("group"), api.get("version"), api.get("kind"))
+                self._providers.setdefault(gvk, []).append((package, channel, csv_name))
+        for package in packages:
+            self._channels.setdefault(package["name"], {})
+            if package.get("defaultChannelName"):
+                self._default_channels[package["name"]] = package["defaultChannelName"]
+        self._heads = {}
+        self._depths = {}
+        for package, channels in self._channels.items():
+            for channel, csv_names in channels.items():
+                self._index_channel(package, channel, csv_names)
+            if package not in self._default_channels and len(channels) == 1:
+                (self._default_channels[package],) = channels
+
+    @classmethod
+    def from_session(cls, session):
+        """
+        Build the index from one ListBundles and one ListPackages call of the session.
+
+        Session opened with lazy=True keeps the embedded JSON payloads encoded until the answers are read. Default
+        channel of a package with several channels is queried with GetPackage when it is needed.
+
+        :param IndexSession session: session of the index image
+        :return: index of the catalog
+        :rtype: CatalogIndex
+        """
+        return cls(
+            session.iter_bundles(),
+            session.list_packages(),
+            package_source=session.get_package,
+        )
+
+    def _index_channel(self, package, channel, csv_names):
+        """
+        Find head of the channel and depths of its bundles, the head is the bundle which is not replaced or skipped.
+
+        :param str package: name of the package
+        :param str channel: name of the channel
+        :param list csv_names: csv names of the bundles in the channel
+        """
+        candidates = [
+            csv_name
+            for csv_name in csv_names
+            if (package, channel, csv_name) not in self._replaced_by
+        ]
+        if len(candidates) != 1:
+            log.warning(
+                f"Channel {channel} of {package} has {len(candidates)} heads, the highest version is used"
+            )
+            candidates = candidates or csv_names
+        head = max(
+            candidates,
+            key=lambda csv_name: version_key(
+                self._bundles[(package, channel, csv_name)].get("version") or "0"
+            ),
+        )
+        self._heads[(package, channel)] = head
+        key, depth = (package, channel, head), 0
+        while key in self._bundles and key not in self._depths:
+            self._depths[key] = depth
+            key = (package, channel, self._bundles[key].get("replaces"))
+            depth += 1
+
+    def _default_channel(self, package_name):
+        """
+        Get default channel of the package, it is queried from the package source if it is not known.
+
+        :param str package_name: name of the package
+        :return: name of the default channel, or None if it is not known
+        :rtype: str
+        """
+        if (
+            package_name not in self._default_channels
+            and len(self._channels.get(package_name, ())) > 1
+            and self._package_source
+        ):
+            package = self._package_source(package_name)
+            self._default_channels[package_name] = package.get("defaultChannelName")
+        return self._default_channels.get(package_name)
+
+    def _get_bundle(self, key):
+        """
+        Get the indexed bundle.
+
+        :param tuple key: package, channel and csv name of the bundle
+        :return: bundle
+        :rtype: JSON-object
+        :raises RuntimeError: if the bundle is not in the catalog
+        """
+        try:
+            return self._bundles[key]
+        except KeyError:
+            log.error(f"No bundle matches {key}")
+            raise RuntimeError("Requested bundle has not been found in the catalog.")
+
+    def list_packages(self):
+        """
+        Get names of all packages in the catalog.
+
+        :return: package name messages
+        :rtype: list
+        """
+        return [{"name": name} for name in sorted(self._channels)]
+
+    def list_bundles(self):
+        """
+        Get all bundles of the catalog.
+
+        :return: bundles
+        :rtype: list
+        """
+        return list(self._bundles.values())
+
+    def get_package(self, package_name):
+        """
+        Get package with heads of its channels.
+
+        :param str package_name: name of the package
+        :return: package message, defaultChannelName is missing if the default channel is not known and there is
+            no package source
+        :rtype: JSON-object
+        :raises RuntimeError: if the package is not in the catalog
+        """
+        if package_name not in self._channels:
+            log.error(f"Package {package_name} is not in the catalog")
+            raise RuntimeError("Requested package has not been found in the catalog.")
+        package = {
+            "name": package_name,
+            "channels": [
+                {"name": channel, "csvName": self._heads[(package_name, channel)]}
+                for channel in sorted(self._channels[package_name])
+            ],
+        }
+        default_channel = self._default_channel(package_name)
+        if default_channel:
+            package["defaultChannelName"] = default_channel
+        return package
+
+    def get_bundle(self, pkg_name, channel_name, csv_name):
+        """
+        Get bundle of the CSV in the channel.
+
+        :param str pkg_name: name of the package
+        :param str channel_name: name of the channel
+        :param str csv_name: name of the CSV
+        :return: bundle
+        :rtype: JSON-object
+        """
+        return self._get_bundle((pkg_name, channel_name, csv_name))
+
+    def get_bundle_for_channel(self, package_name, channel_name):
+        """
+        Get bundle at the head of the channel.
+
+        :param str package_name: name of the package
+        :param str channel_name: name of the channel
+        :return: bundle
+        :rtype: JSON-object
+        """
+        head = self._heads.get((package_name, channel_name))
+        return self._get_bundle((package_name, channel_name, head))
+
+    def get_bundle_that_replaces(self, package_name, channel_name, csv_name):
+        """
+        Get bundle which replaces or skips the CSV in the channel.
+
+        :param str package_name: name of the package
+        :param str channel_name: name of the channel
+        :param str csv_name: name of the replaced CSV
+        :return: bundle
+        :rtype: JSON-object
+        """
+        replacement = self._replaced_by.get((package_name, channel_name, csv_name))
+        return self._get_bundle((package_name, channel_name, replacement))
+
+    def get_default_bundle_that_provides(self, group, version, kind, plural=None):
+        """
+        Get bundle providing the API, which is the closest to the head of the default channel of its package.
+
+        :param str group: group of the API
+        :param str version: version of the API
+        :param str kind: kind of the API
+        :param str plural: plural of the API, it is not needed to identify the API
+        :return: bundle
+        :rtype: JSON-object
+        """
+        providers = [
+            key
+            for key in self._providers.get((group, version, kind), ())
+            if self._default_channel(key[0]) == key[1]
+        ]
+        if not providers:
+            log.error(
+                f"No bundle in a default channel provides {group}/{version}/{kind}"
+            )
+            raise RuntimeError("Requested bundle has not been found in the catalog.")
+        return self._bundles[
+            min(providers, key=lambda key: self._depths.get(key, len(self._bundles)))
+        ]
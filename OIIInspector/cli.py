@@ -0,0 +1,79 @@
+"""Single oii command with subcommands, the handler of a subcommand is imported only when it is run."""
+
+import argparse
+import importlib
+import sys
+
+HANDLERS_MODULE = "OIIInspector.oii_inspector_calls"
+
+# subcommand: (name of the entrypoint in HANDLERS_MODULE, help of the subcommand)
+SUBCOMMANDS = {
+    "get-bundle": ("get_bundle_main", "Get bundle"),
+    "list-packages": ("list_packages_main", "List packages in the image"),
+    "list-bundles": ("list_bundles_main", "List bundles in the image"),
+    "get-package": ("get_package_main", "Get package metadata"),
+    "get-bundle-for-channel": (
+        "get_bundle_for_channel_main",
+        "Get bundle metadata for desired channel",
+    ),
+    "get-bundle-that-replaces": (
+        "get_bundle_that_replaces_main",
+        "Get bundle metadata that replaces specified bundle",
+    ),
+    "get-default-bundle-that-provides": (
+        "get_default_bundle_that_provides_main",
+        "Get bundle metadata that provides API defined by group, version and kind",
+    ),
+    "batch": ("batch_main", "Run file of queries against one image"),
+    "inspect-images": (
+        "inspect_images_main",
+        "Run the same queries on many images concurrently",
+    ),
+    "diff": ("diff_main", "Compare bundles of two index images"),
+    "snapshot": (
+        "snapshot_main",
+        "Export all packages and bundles of the image to a snapshot file",
+    ),
+    "shell": (
+        "shell_main",
+        "Run interactive shell against one index image kept running until exit",
+    ),
+    "daemon": (
+        "daemon_main",
+        "Run the daemon keeping recently used index images running",
+    ),
+}
+
+
+def setup_parser():
+    """
+    Set up ArgumentParser of the oii command, listing the subcommands in its help.
+
+    Arguments of the subcommands are parsed by their handlers, so no handler is imported to build this parser.
+
+    :return: parser of the subcommand
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(
+        prog="oii",
+        description="Inspect operator index images, run 'oii COMMAND --help' for arguments of the command.",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+    for name, (_, help_text) in SUBCOMMANDS.items():
+        subparsers.add_parser(name, help=help_text, add_help=False)
+    return parser
+
+
+def main(sysargs=None):
+    """
+    Entrypoint of the oii command, running the handler of the subcommand.
+
+    :param list sysargs: command line arguments including name of the program, sys.argv by default
+    """
+    sysargs = sysargs or sys.argv
+    command = sysargs[1] if len(sysargs) > 1 else None
+    if command not in SUBCOMMANDS:
+        # writes the help, or the error of missing or unknown subcommand, and exits
+        setup_parser().parse_args(sysargs[1:])
+    handler = getattr(importlib.import_module(HANDLERS_MODULE), SUBCOMMANDS[command][0])
+    handler([f"oii {command}", *sysargs[2:]])
@@ -1,40 +1,175 @@
+import contextlib
 import logging
+import os
 from retry import retry
 import subprocess
+import socket
+import threading
 import time
 import shlex
 import OIIInspector.exceptions as exceptions
+from OIIInspector import profiling
 from OIIInspector.utils import run_cmd
+from OIIInspector.port_allocator import reserve_free_port, release_port
+from OIIInspector.container_runtime import detect_runtime
 
 log = logging.getLogger(__name__)
 
+# "always" pulls the image on every start, "if-not-present" pulls it only if it is not in local storage and
+# "never" uses only local storage; images pinned by digest are never pulled again, whatever the policy is
+PULL_POLICIES = ("always", "if-not-present", "never")
+PULL_POLICY_ENV = "OIIINSPECTOR_PULL_POLICY"
+DEFAULT_PULL_POLICY = "always"
+
+
+def get_pull_policy(pull_policy=None):
+    """
+    Get the pull policy, the policy from OIIINSPECTOR_PULL_POLICY environment variable is used by default.
+
+    :param str pull_policy: one of PULL_POLICIES
+    :return: pull policy
+    :rtype: str
+    :raises OIIInspectorError: if the policy is not known
+    """
+    pull_policy = pull_policy or os.environ.get(PULL_POLICY_ENV, DEFAULT_PULL_POLICY)
+    if pull_policy not in PULL_POLICIES:
+        raise exceptions.OIIInspectorError(
+            f"Unknown pull policy {pull_policy}, use one of {', '.join(PULL_POLICIES)}"
+        )
+    return pull_policy
+
+
+def local_image_usable(pull_policy, image_address):
+    """
+    Check whether the image present in local storage can be used instead of pulling it.
+
+    :param str pull_policy: one of PULL_POLICIES
+    :param str image_address: address of the image
+    :return: True if local storage should be checked before the pull
+    :rtype: bool
+    """
+    return pull_policy != "always" or "@sha256:" in image_address
+
+
+def start_failure(stderr, port, container_name, cmd):
+    """
+    Get exception describing why the registry service has terminated during its start.
+
+    :param str stderr: error output of the terminated service
+    :param int port: local port of the service
+    :param str container_name: name of the container
+    :param str cmd: command starting the service
+    :return: AddressAlreadyInUse if another port should be tried, OIIInspectorError otherwise
+    :rtype: Exception
+    """
+    if "address already in use" in stderr:
+        return exceptions.AddressAlreadyInUse(
+            f"Port {port} is already used by a different service"
+        )
+    if "the container name" in stderr and "is already in use by" in stderr:
+        return exceptions.AddressAlreadyInUse(
+            f"Port {port} is already used by service with name: {container_name}"
+        )
+    return exceptions.OIIInspectorError(f"Command {cmd} has failed with error {stderr}")
+
+
+class ContainerLimits:
+    """Limits of concurrent image pulls and running containers, shared by ContainerManagers of one process."""
+
+    def __init__(self, max_pulls=None, max_containers=None):
+        """
+        Initialize the ContainerLimits.
+
+        :param int max_pulls: maximal number of simultaneous image pulls, None for no limit
+        :param int max_containers: maximal number of simultaneously running containers, None for no limit
+        """
+        self._pulls = threading.BoundedSemaphore(max_pulls) if max_pulls else None
+        self._containers = (
+            threading.BoundedSemaphore(max_containers) if max_containers else None
+        )
+
+    def pull_slot(self):
+        """
+        Hold a slot for image pull, blocks while the limit of simultaneous pulls is reached.
+
+        :return: context manager holding the slot
+        """
+        return self._pulls if self._pulls is not None else contextlib.nullcontext()
+
+    def acquire_container_slot(self):
+        """Acquire a slot for running container, blocks while the limit of running containers is reached."""
+        if self._containers is not None:
+            self._containers.acquire()
+
+    def release_container_slot(self):
+        """Release the slot acquired by acquire_container_slot."""
+        if self._containers is not None:
+            self._containers.release()
+
 
 class ContainerManager:
     """Class used as context manager for container operations."""
 
     _grpc_start_port = 50051
+    # port at which the registry service listens inside of the container
+    _grpc_container_port = 50051
     _grpc_max_port_tries = 100
     _grpc_init_wait_time = 3
     _base_container_name = "OIIInspector_running_container"
+    # readiness is checked with exponential backoff, starting at _readiness_initial_delay seconds
+    _readiness_initial_delay = 0.005
+    _readiness_max_delay = 0.25
+    _readiness_backoff_factor = 2
+    _tcp_connect_timeout = 0.1
 
     @property
     def local_address_of_image(self):
         """Return localhost address with running container."""
         return self._get_local_address_of_image()
 
-    def __init__(self, image_address):
+    @property
+    def readiness_stats(self):
+        """
+        Return statistics of the last wait for the index registry service.
+
+        Dictionary contains "wait_time" (seconds from container start until the service answered),
+        "tcp_attempts" and "grpc_probes" (number of connection attempts and gRPC probes done).
+        """
+        return self._readiness_stats
+
+    def __init__(
+        self, image_address, limits=None, runtime=None, pull_policy=None, probe=None
+    ):
         """
         Initialize the ContainerManager.
 
         :param image_address: address of the image, to which queries will be done
         :type image_address: str
+        :param limits: limits of concurrent pulls and running containers shared with other ContainerManagers
+        :type limits: ContainerLimits
+        :param runtime: container runtime, the runtime detected on the platform is used by default
+        :type runtime: ContainerRuntime
+        :param pull_policy: one of PULL_POLICIES, OIIINSPECTOR_PULL_POLICY environment variable or "always" by default
+        :type pull_policy: str
+        :param probe: callable checking whether the registry service at the address in format localhost:PORT
+            provides api.Registry, it is used to wait for the started service, grpcurl is used by default
+        :type probe: Callable[[str], bool]
         """
+        self._probe = probe
         self._port = self._grpc_start_port
+        # whether self._port is reserved by this manager, the default port is never reserved
+        self._port_reserved = False
+        # name of the container created by the last start, it is removed even if the start has failed
+        self._container_name = None
+        self._pull_policy = get_pull_policy(pull_policy)
         self._rpc_proc = None
         self._image_address = image_address
-        self._container_platform = None
+        self._runtime = runtime
         self._container_running = False
         self._container_pulled = False
+        self._readiness_stats = None
+        self._limits = limits if limits is not None else ContainerLimits()
+        self._holds_container_slot = False
 
     def __enter__(self):
         """Return new instance of the ContainerManager."""
@@ -46,20 +181,29 @@ class ContainerManager:
 
     def start_container(self):
         """
-        Start desired container at first available port.
+        Start desired container at free local port assigned by the kernel.
 
-        Port, where container is started, is in range _grpc_start_port : _grpc_start_port + _grpc_max_port_tries.
+        Port is reserved for the lifetime of the container, so concurrent inspections never race for it.
         """
         # pull is done separately, instead of running just {platform} run command (which can pull image too),
         # because of better container control
         if self._container_running is True:
             return
-        if self._container_platform is None:
-            self._get_container_platform()
+        if self._runtime is None:
+            with profiling.span("detect_runtime"):
+                self._runtime = detect_runtime()
         if self._container_pulled is False:
-            self._pull_image()
+            with self._limits.pull_slot(), profiling.span(
+                "pull", image=self._image_address
+            ):
+                self._pull_image()
             self._container_pulled = True
-        self._port, self._rpc_proc = self._serve_index_registry()
+        if self._holds_container_slot is False:
+            self._limits.acquire_container_slot()
+            self._holds_container_slot = True
+        with profiling.span("serve", image=self._image_address):
+            self._port, self._rpc_proc = self._serve_index_registry()
+        self._port_reserved = True
         self._container_running = True
 
     def _get_local_address_of_image(self) -> str:
@@ -74,28 +218,41 @@ class ContainerManager:
         return f"localhost:{self._port}"
 
     def close_container_manager(self):
-        """Close running container and remove used image."""
-        if self._container_running is True:
-            self._rpc_proc.kill()
-            self._stop_container()
+        """Stop and remove the container, the pulled image is left in local storage to be reused."""
+        with profiling.span("teardown", image=self._image_address):
+            # errors of the cleanup after a failed start are tolerated, so the start error reaches the caller
+            tolerate_err = self._container_running is False
+            if self._container_name is not None:
+                if self._container_running is True:
+                    self._rpc_proc.kill()
+                self._stop_container(tolerate_err=tolerate_err)
+                self._remove_container(tolerate_err=tolerate_err)
+                self._container_name = None
             self._container_running = False
-        if self._container_pulled is True:
-            self._remove_container()
             self._container_pulled = False
+        if self._port_reserved is True:
+            release_port(self._port)
+            self._port_reserved = False
+        if self._holds_container_slot is True:
+            self._limits.release_container_slot()
+            self._holds_container_slot = False
 
-    def _get_container_platform(self):
-        """Search for available container platform."""
-        if self._container_platform is None:
-            docker_terminal_result = run_cmd("command -v docker")
-            podman_terminal_result = run_cmd("command -v podman")
-            if "/podman" in podman_terminal_result:
-                self._container_platform = "podman"
-            elif "/docker" in docker_terminal_result:
-                self._container_platform = "docker"
-            else:
-                raise exceptions.OIIInspectorError(
-                    "Docker or Podman is needed to be installed on the platform"
-                )
+    def copy_from_image(self, source_path, destination):
+        """
+        Copy file out of the image, the container is created for that but it is never started.
+
+        :param str source_path: path of the file in the image
+        :param str destination: local path, where the file will be copied
+        """
+        if self._runtime is None:
+            self._runtime = detect_runtime()
+        container_id = run_cmd(
+            self._runtime.create_command(self._image_address)
+        ).strip()
+        try:
+            run_cmd(self._runtime.copy_command(container_id, source_path, destination))
+        finally:
+            run_cmd(self._runtime.remove_command(container_id), tolerate_err=True)
 
     def _stop_container(self, tolerate_err=False):
         """
@@ -105,7 +262,7 @@ class ContainerManager:
         :type tolerate_err: bool
         """
         run_cmd(
-            f"{self._container_platform} stop {self._base_container_name}_{self._port}",
+            self._runtime.stop_command(self._container_name),
             tolerate_err=tolerate_err,
         )
 
@@ -117,13 +274,35 @@ class ContainerManager:
         :type tolerate_err: bool
         """
         run_cmd(
-            f"{self._container_platform} rm {self._base_container_name}_{self._port}",
+            self._runtime.remove_command(self._container_name),
             tolerate_err=tolerate_err,
         )
 
     def _pull_image(self):
-        """Pull the image with available container platform."""
-        run_cmd(f"{self._container_platform} pull {self._image_address}")
+        """
+        Pull the image with available container platform, unless the pull policy allows the image in local storage.
+
+        :raises OIIInspectorError: if the image is not in local storage and the pull policy is "never"
+        """
+        if local_image_usable(self._pull_policy, self._image_address):
+            if self._image_present():
+                log.debug("Image %s is present in local storage.", self._image_address)
+                return
+            if self._pull_policy == "never":
+                raise exceptions.OIIInspectorError(
+                    f"Image {self._image_address} is not present in local storage and pull policy is never"
+                )
+        run_cmd(self._runtime.pull_command(self._image_address))
+
+    def _image_present(self):
+        """
+        Check whether the image is present in local storage.
+
+        :return: True if the image is present
+        :rtype: bool
+        """
+        cmd = self._runtime.image_exists_command(self._image_address)
+        return bool(run_cmd(cmd, tolerate_err=True).strip())
 
     def _serve_index_registry(self):
         """
@@ -135,10 +314,9 @@ class ContainerManager:
         :rtype: (int, Popen)
         :raises OIIInspectorError: if all tried ports are in use, or the command failed for another reason.
         """
-        port_start = self._grpc_start_port
-        port_end = port_start + self._grpc_max_port_tries
-
-        for port in range(port_start, port_end):
+        for _ in range(self._grpc_max_port_tries):
+            port = reserve_free_port()
+            profiling.count("port_attempts")
             try:
                 return (
                     port,
@@ -146,6 +324,10 @@ class ContainerManager:
                 )
             except exceptions.AddressAlreadyInUse:
                 log.info("Port %d is in use, trying another.", port)
+                release_port(port)
+            except BaseException:
+                release_port(port)
+                raise
 
         err_msg = (
             f"No free port has been found after {self._grpc_max_port_tries} attempts."
@@ -165,54 +347,115 @@ class ContainerManager:
         error occurred.
         :raises AddressAlreadyInUse: if the specified port is already being used by another service.
         """
-        cmd = (
-            f"{self._container_platform} run --name={self._base_container_name}_{port} "
-            f"-p={port}:{port} {self._image_address}"
+        container_name = f"{self._base_container_name}_{port}"
+        cmd = self._runtime.run_command(
+            container_name,
+            port,
+            self._grpc_container_port,
+            self._image_address,
         )
+        self._container_name = container_name
         rpc_proc = subprocess.Popen(
             shlex.split(cmd),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             universal_newlines=True,
         )
+        with profiling.span("readiness", port=port):
+            return self._wait_for_registry(rpc_proc, port, cmd, wait_time)
+
+    def _wait_for_registry(self, rpc_proc, port, cmd, wait_time):
+        """
+        Wait until the started registry service answers gRPC queries.
+
+        :param Popen rpc_proc: process running the container
+        :param int port: local port of the service
+        :param str cmd: command which has started the process
+        :param wait_time: time to wait for the service
+        :return: the running Popen process
+        :rtype: Popen
+        :raises OIIInspectorError: if the process has terminated or the service has not answered in time
+        :raises AddressAlreadyInUse: if the port is already being used by another service
+        """
         start_time = time.time()
+        delay = self._readiness_initial_delay
+        tcp_attempts = 0
+        grpc_probes = 0
         while time.time() - start_time < wait_time:
-            time.sleep(1)
             ret = rpc_proc.poll()
             # process has terminated
             if ret is not None:
                 stderr = rpc_proc.stderr.read()
-                if "address already in use" in stderr:
-                    raise exceptions.AddressAlreadyInUse(
-                        f"Port {port} is already used by a different service"
-                    )
-                elif (
-                    "the container name" in stderr and "is already in use by" in stderr
-                ):
-                    raise exceptions.AddressAlreadyInUse(
-                        f"Port {port} is already used by service with name: {self._base_container_name}_{port}"
-                    )
-                else:
-                    raise exceptions.OIIInspectorError(
-                        f"Command {cmd} has failed with error {stderr}".format(
-                            cmd="".join(cmd), stderr=stderr
-                        )
-                    )
-
-            # query the service to see if it has started
-            try:
-                output = run_cmd(
-                    f"grpcurl -plaintext localhost:{port} list api.Registry"
+                if "is already in use by" in stderr:
+                    # container of the name belongs to another service, it is not removed
+                    self._container_name = None
+                raise start_failure(
+                    stderr,
+                    port,
+                    f"{self._base_container_name}_{port}",
+                    cmd,
                 )
-            except RuntimeError:
-                output = ""
 
-            if ("api.Registry.ListBundles" in output) or (
-                "api.Registry.ListPackages" in output
-            ):
-                log.debug("Started the command {cmd}".format(cmd="".join(cmd)))
-                log.info("Index registry service has been initialized.")
-                return rpc_proc
+            # cheap TCP connection attempts until the port is open, then query the service to see if it has started
+            tcp_attempts += 1
+            if self._port_accepts_connections(port):
+                grpc_probes += 1
+                if self._registry_responds(port):
+                    self._readiness_stats = {
+                        "wait_time": time.time() - start_time,
+                        "tcp_attempts": tcp_attempts,
+                        "grpc_probes": grpc_probes,
+                    }
+                    log.debug("Started the command {cmd}".format(cmd="".join(cmd)))
+                    log.info(
+                        "Index registry service has been initialized in %.3f s "
+                        "(%d connection attempts, %d gRPC probes).",
+                        self._readiness_stats["wait_time"],
+                        tcp_attempts,
+                        grpc_probes,
+                    )
+                    return rpc_proc
+
+            time.sleep(delay)
+            delay = min(
+                delay * self._readiness_backoff_factor, self._readiness_max_delay
+            )
 
         rpc_proc.kill()
         raise exceptions.OIIInspectorError("Index registry has not been initialized")
+
+    def _port_accepts_connections(self, port):
+        """
+        Check whether TCP connection to the local port can be opened.
+
+        :param int port: port to be checked.
+        :return: True if the connection has been established.
+        :rtype: bool
+        """
+        try:
+            with socket.create_connection(
+                ("localhost", port), timeout=self._tcp_connect_timeout
+            ):
+                return True
+        except OSError:
+            return False
+
+    def _registry_responds(self, port):
+        """
+        Query the service running at the port with gRPC to see if it has started.
+
+        :param int port: port of the service.
+        :return: True if the service provides api.Registry.
+        :rtype: bool
+        """
+        if self._probe is not None:
+            return self._probe(f"localhost:{port}")
+        try:
+            output = run_cmd(f"grpcurl -plaintext localhost:{port} list api.Registry")
+        except (RuntimeError, OSError):
+            # OSError is raised when grpcurl binary is missing
+            output = ""
+
+        return ("api.Registry.ListBundles" in output) or (
+            "api.Registry.ListPackages" in output
+        )
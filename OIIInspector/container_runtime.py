@@ -0,0 +1,196 @@
+"""Container runtimes used to run index images, the available runtime is detected once per process."""
+
+import logging
+import os
+import shutil
+import threading
+import OIIInspector.exceptions as exceptions
+
+log = logging.getLogger(__name__)
+
+# name of the runtime ("podman", "docker") or path of an executable emulating podman CLI, skips the detection
+RUNTIME_ENV = "OIIINSPECTOR_CONTAINER_RUNTIME"
+
+_detection_lock = threading.Lock()
+_detected_runtime = None
+
+
+class ContainerRuntime:
+    """
+    Container runtime driven through its command line interface.
+
+    Runtime only builds the commands, they are executed by ContainerManager, so the runtime can be replaced
+    without changes of the container lifecycle.
+    """
+
+    name = None
+
+    def __init__(self, executable=None):
+        """
+        Initialize the ContainerRuntime.
+
+        :param str executable: executable of the runtime, name of the runtime looked up in PATH by default
+        """
+        self.executable = executable or self.name
+
+    def __repr__(self):
+        """Return representation of the runtime."""
+        return f"{type(self).__name__}({self.executable!r})"
+
+    def pull_command(self, image_address):
+        """
+        Build command pulling the image.
+
+        :param str image_address: address of the image
+        :return: command
+        :rtype: str
+        """
+        return f"{self.executable} pull {image_address}"
+
+    def image_exists_command(self, image_address):
+        """
+        Build command printing ID of the image if it is present in local storage, it fails otherwise.
+
+        :param str image_address: address of the image
+        :return: command
+        :rtype: str
+        """
+        return f"{self.executable} image inspect --format {{{{.Id}}}} {image_address}"
+
+    def run_command(self, container_name, port, container_port, image_address):
+        """
+        Build command running the image in foreground, with the container port published at the local port.
+
+        :param str container_name: name of the container
+        :param int port: local port
+        :param int container_port: port of the service inside of the container
+        :param str image_address: address of the image
+        :return: command
+        :rtype: str
+        """
+        return (
+            f"{self.executable} run --name={container_name} "
+            f"-p={port}:{container_port} {image_address}"
+        )
+
+    def stop_command(self, container_name):
+        """
+        Build command stopping the container.
+
+        :param str container_name: name or ID of the container
+        :return: command
+        :rtype: str
+        """
+        return f"{self.executable} stop {container_name}"
+
+    def remove_command(self, container_name):
+        """
+        Build command removing the container.
+
+        :param str container_name: name or ID of the container
+        :return: command
+        :rtype: str
+        """
+        return f"{self.executable} rm {container_name}"
+
+    def create_command(self, image_address):
+        """
+        Build command creating container of the image without starting it, the command prints ID of the container.
+
+        :param str image_address: address of the image
+        :return: command
+        :rtype: str
+        """
+        return f"{self.executable} create {image_address}"
+
+    def copy_command(self, container_name, source_path, destination):
+        """
+        Build command copying file out of the container.
+
+        :param str container_name: name or ID of the container
+        :param str source_path: path of the file in the container
+        :param str destination: local path, where the file will be copied
+        :return: command
+        :rtype: str
+        """
+        return f"{self.executable} cp {container_name}:{source_path} {destination}"
+
+
+class PodmanRuntime(ContainerRuntime):
+    """Podman command line interface."""
+
+    name = "podman"
+
+
+class DockerRuntime(ContainerRuntime):
+    """Docker command line interface."""
+
+    name = "docker"
+
+
+class FakeRuntime(ContainerRuntime):
+    """Stand-in runtime for tests and benchmarks, any executable emulating podman CLI is used instead of podman."""
+
+    name = "fake"
+
+    def __init__(self, executable):
+        """
+        Initialize the FakeRuntime.
+
+        :param str executable: path of the executable emulating podman CLI
+        """
+        super().__init__(executable)
+
+
+# detected runtimes, in order of preference
+RUNTIMES = {runtime.name: runtime for runtime in (PodmanRuntime, DockerRuntime)}
+
+
+def get_runtime(runtime):
+    """
+    Get container runtime by its name.
+
+    :param str runtime: "podman", "docker" or path of an executable emulating podman CLI
+    :return: container runtime
+    :rtype: ContainerRuntime
+    :raises OIIInspectorError: if the runtime is not known
+    """
+    if runtime in RUNTIMES:
+        return RUNTIMES[runtime]()
+    if os.sep in runtime:
+        return FakeRuntime(runtime)
+    raise exceptions.OIIInspectorError(f"Unknown container runtime {runtime}")
+
+
+def _detect_runtime():
+    """
+    Detect available container runtime, podman is preferred over docker.
+
+    :return: container runtime
+    :rtype: ContainerRuntime
+    :raises OIIInspectorError: if no container runtime is available
+    """
+    if os.environ.get(RUNTIME_ENV):
+        return get_runtime(os.environ[RUNTIME_ENV])
+    for name, runtime_class in RUNTIMES.items():
+        if shutil.which(name):
+            return runtime_class()
+    raise exceptions.OIIInspectorError(
+        "Docker or Podman is needed to be installed on the platform"
+    )
+
+
+def detect_runtime():
+    """
+    Get container runtime of the platform, it is detected only on the first call in the process.
+
+    :return: container runtime
+    :rtype: ContainerRuntime
+    :raises OIIInspectorError: if no container runtime is available
+    """
+    global _detected_runtime
+    with _detection_lock:
+        if _detected_runtime is None:
+            _detected_runtime = _detect_runtime()
+            log.debug("Using container runtime %s.", _detected_runtime)
+        return _detected_runtime
@@ -0,0 +1,323 @@
+"""Local daemon keeping containers of recently used index images warm, CLI invocations attach to it over unix socket."""
+
+import collections
+import contextlib
+import json
+import logging
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import OIIInspector.exceptions as exceptions
+from OIIInspector import profiling
+from OIIInspector.batch import execute_query, validate_query
+from OIIInspector.oii_client import IndexSession
+
+log = logging.getLogger(__name__)
+
+# the socket is placed in a directory accessible only by its user, in the shared temporary directory too
+DEFAULT_SOCKET_PATH = os.environ.get(
+    "OIIINSPECTOR_DAEMON_SOCKET",
+    os.path.join(
+        os.environ.get(
+            "XDG_RUNTIME_DIR",
+            os.path.join(tempfile.gettempdir(), f"OIIInspector-{os.getuid()}"),
+        ),
+        "OIIInspector-daemon.sock",
+    ),
+)
+DEFAULT_IDLE_TTL = 600
+DEFAULT_CAPACITY = 4
+# maximal size of one request line
+MAX_REQUEST_SIZE = 1024**2
+# seconds to connect to the daemon, and to wait for the response, which can include pull of the image
+CONNECT_TIMEOUT = 1
+QUERY_TIMEOUT = 900
+
+# returned by forward_query when no daemon is listening at the socket
+NOT_RUNNING = object()
+
+
+def _private_directory(path):
+    """
+    Check that the directory is owned by the current user and not accessible by other users.
+
+    :param str path: path of the directory
+    :return: True if the directory is private
+    :rtype: bool
+    """
+    directory_stat = os.stat(path)
+    return directory_stat.st_uid == os.getuid() and not directory_stat.st_mode & 0o077
+
+
+class _PoolEntry:
+    """Session of one image in the SessionPool."""
+
+    def __init__(self, session):
+        """
+        Initialize the _PoolEntry.
+
+        :param IndexSession session: session of the image
+        """
+        self.session = session
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.closed = False
+
+    def close(self):
+        """Close the session once its running query has finished."""
+        with self.lock:
+            self.closed = True
+            self.session.close()
+
+
+class SessionPool:
+    """
+    IndexSessions of recently used images, evicted in least recently used order or after idle TTL.
+
+    Queries of one image are serialized on its session, queries of different images run concurrently.
+    """
+
+    def __init__(
+        self, capacity=DEFAULT_CAPACITY, idle_ttl=DEFAULT_IDLE_TTL, **session_options
+    ):
+        """
+        Initialize the SessionPool.
+
+        :param int capacity: maximal number of warm sessions
+        :param float idle_ttl: seconds after which unused session is closed
+        :param session_options: options of the IndexSessions, e.g. transport
+        """
+        self._capacity = capacity
+        self._idle_ttl = idle_ttl
+        self._session_options = session_options
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    @property
+    def images(self):
+        """Return images with warm session, from the least recently used."""
+        with self._lock:
+            return list(self._entries)
+
+    def _acquire_entry(self, image):
+        """
+        Get entry of the image, create it if it does not exist, and evict entries exceeding the capacity.
+
+        :param str image: address of the index image
+        :return: entry of the image and entries to be closed
+        :rtype: (_PoolEntry, list)
+        """
+        with self._lock:
+            entry = self._entries.get(image)
+            if entry is None:
+                entry = _PoolEntry(IndexSession(image, **self._session_options))
+                self._entries[image] = entry
+            self._entries.move_to_end(image)
+            entry.last_used = time.monotonic()
+            evicted = []
+            while len(self._entries) > self._capacity:
+                evicted_image, evicted_entry = self._entries.popitem(last=False)
+                log.info(f"Session of {evicted_image} is evicted")
+                evicted.append(evicted_entry)
+            return entry, evicted
+
+    def query(self, image, method, args=None):
+        """
+        Execute the query in warm session of the image.
+
+        :param str image: address of the index image
+        :param str method: IndexSession method to be called
+        :param args: positional arguments list, or keyword arguments object of the method
+        :type args: list or dict
+        :return: converted response
+        :rtype: JSON-object
+        """
+        query = {"image": image, "method": method, "args": args or []}
+        validate_query(query)
+        while True:
+            entry, evicted = self._acquire_entry(image)
+            for evicted_entry in evicted:
+                evicted_entry.close()
+            with entry.lock:
+                # the entry could have been evicted since it has been acquired
+                if entry.closed:
+                    continue
+                try:
+                    return execute_query(entry.session, query)
+                except Exception:
+                    if entry.session.start_error is not None:
+                        # the session fails all its queries after failed start, next query starts new session
+                        self._remove_entry(image, entry)
+                        entry.closed = True
+                        entry.session.close()
+                    raise
+
+    def _remove_entry(self, image, entry):
+        """
+        Remove the entry of the image from the pool, unless it has been replaced already.
+
+        :param str image: address of the index image
+        :param _PoolEntry entry: entry to be removed
+        """
+        with self._lock:
+            if self._entries.get(image) is entry:
+                del self._entries[image]
+                log.info(f"Session of {image} has failed to start and is removed")
+
+    def evict_idle(self):
+        """Close sessions which have not been used for the idle TTL."""
+        deadline = time.monotonic() - self._idle_ttl
+        with self._lock:
+            idle = [
+                image
+                for image, entry in self._entries.items()
+                if entry.last_used < deadline
+            ]
+            evicted = [self._entries.pop(image) for image in idle]
+        for image, entry in zip(idle, evicted):
+            log.info(f"Idle session of {image} is closed")
+            entry.close()
+
+    def close(self):
+        """Close all sessions."""
+        with self._lock:
+            evicted = list(self._entries.values())
+            self._entries.clear()
+        for entry in evicted:
+            entry.close()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Handler of one request, the request and the response are JSON objects on a single line."""
+
+    def handle(self):
+        """Answer the request."""
+        try:
+            request = json.loads(self.rfile.readline(MAX_REQUEST_SIZE))
+            with profiling.use_profiler(self.server.profiler):
+                result = self.server.pool.query(
+                    request.get("image"), request.get("method"), request.get("args")
+                )
+            response = {"result": result}
+        except Exception as error:
+            response = {"error": f"{type(error).__name__}: {error}"}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class InspectorDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server answering queries from warm sessions of the SessionPool."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        socket_path=DEFAULT_SOCKET_PATH,
+        capacity=DEFAULT_CAPACITY,
+        idle_ttl=DEFAULT_IDLE_TTL,
+        profiler=None,
+        **session_options,
+    ):
+        """
+        Initialize the InspectorDaemon and bind it to the socket.
+
+        :param str socket_path: path of the unix socket
+        :param int capacity: maximal number of warm sessions
+        :param float idle_ttl: seconds after which unused session is closed
+        :param profiler: profiler recording the queries and evictions, e.g. OIIInspector.metrics.InspectionMetrics
+        :type profiler: OIIInspector.profiling.Profiler
+        :param session_options: options of the IndexSessions, e.g. transport
+        """
+        self.pool = SessionPool(capacity, idle_ttl, **session_options)
+        self.profiler = profiler
+        self._idle_ttl = idle_ttl
+        self._stopped = threading.Event()
+        socket_dir = os.path.dirname(os.path.abspath(socket_path))
+        # the socket is created accessible only by its user, there is no window until its mode is changed
+        umask = os.umask(0o077)
+        try:
+            os.makedirs(socket_dir, exist_ok=True)
+            if not _private_directory(socket_dir):
+                raise exceptions.OIIInspectorError(
+                    f"Directory {socket_dir} of the daemon socket must be accessible only by its owner"
+                )
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(socket_path)
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+        self._reaper = threading.Thread(target=self._reap_idle_sessions, daemon=True)
+        self._reaper.start()
+
+    def _reap_idle_sessions(self):
+        """Periodically close idle sessions until the daemon is closed."""
+        with profiling.use_profiler(self.profiler):
+            while not self._stopped.wait(max(self._idle_ttl / 4, 0.01)):
+                self.pool.evict_idle()
+
+    def server_close(self):
+        """Close the socket and all sessions."""
+        self._stopped.set()
+        super().server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.server_address)
+        self.pool.close()
+
+
+def forward_query(
+    image, method, args=None, socket_path=DEFAULT_SOCKET_PATH, timeout=QUERY_TIMEOUT
+):
+    """
+    Forward the query to the daemon, if it is running.
+
+    Socket which is not owned by the current user, or which is in a directory accessible by other users, is not
+    trusted and the query is not forwarded.
+
+    :param str image: address of the index image
+    :param str method: IndexSession method to be called
+    :param args: positional arguments list, or keyword arguments object of the method
+    :type args: list or dict
+    :param str socket_path: path of the unix socket of the daemon
+    :param float timeout: seconds to wait for the response
+    :return: converted response, or NOT_RUNNING if no trusted daemon is listening at the socket
+    :rtype: JSON-object
+    :raises OIIInspectorError: if the query has failed in the daemon, or the daemon has not answered in time
+    """
+    try:
+        socket_stat = os.stat(socket_path)
+    except FileNotFoundError:
+        return NOT_RUNNING
+    socket_dir = os.path.dirname(os.path.abspath(socket_path))
+    if socket_stat.st_uid != os.getuid() or not _private_directory(socket_dir):
+        log.warning(
+            "Daemon socket %s is not owned by the user or its directory is accessible by other users, "
+            "the query is not forwarded.",
+            socket_path,
+        )
+        return NOT_RUNNING
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(CONNECT_TIMEOUT)
+    try:
+        connection.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError, socket.timeout):
+        connection.close()
+        log.debug("Daemon is not listening at %s.", socket_path)
+        return NOT_RUNNING
+    connection.settimeout(timeout)
+    try:
+        with connection, connection.makefile("rwb") as stream:
+            request = {"image": image, "method": method, "args": args or []}
+            stream.write(json.dumps(request).encode("utf-8") + b"\n")
+            stream.flush()
+            response = json.loads(stream.readline())
+    except socket.timeout:
+        raise exceptions.OIIInspectorError(
+            f"Daemon has not answered the query in {timeout} seconds"
+        )
+    if "error" in response:
+        raise exceptions.OIIInspectorError(
+            f"Query has failed in the daemon: {response['error']}"
+        )
+    return response["result"]
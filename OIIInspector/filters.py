@@ -0,0 +1,120 @@
+"""Filtering and field projection of streamed bundles, applied before the embedded JSON payloads are decoded."""
+
+import fnmatch
+from OIIInspector.versions import version_in_range
+
+
+class BundleFilter:
+    """Predicate on bundle messages, it reads only packageName, channelName, version and csvName fields."""
+
+    def __init__(
+        self,
+        package=None,
+        channel=None,
+        min_version=None,
+        max_version=None,
+        csv_name=None,
+    ):
+        """
+        Initialize the BundleFilter, bundles pass if they satisfy all given conditions.
+
+        :param str package: name of the package of the bundle
+        :param str channel: name of the channel of the bundle
+        :param str min_version: lowest version of the bundle (inclusive)
+        :param str max_version: version above the versions of the bundle (exclusive)
+        :param str csv_name: shell style pattern of the csv name, e.g. "etcd*"
+        """
+        self._package = package
+        self._channel = channel
+        self._min_version = min_version
+        self._max_version = max_version
+        self._csv_name = csv_name
+
+    def __bool__(self):
+        """Return False if the filter passes every bundle."""
+        return any(
+            condition is not None
+            for condition in (
+                self._package,
+                self._channel,
+                self._min_version,
+                self._max_version,
+                self._csv_name,
+            )
+        )
+
+    def matches(self, message):
+        """
+        Check that the bundle satisfies the conditions of the filter.
+
+        :param dict message: message of the bundle, embedded JSON strings do not have to be decoded
+        :return: True if the bundle passes the filter
+        :rtype: bool
+        """
+        if self._package is not None and message.get("packageName") != self._package:
+            return False
+        if self._channel is not None and message.get("channelName") != self._channel:
+            return False
+        if self._csv_name is not None and not fnmatch.fnmatchcase(
+            message.get("csvName", ""), self._csv_name
+        ):
+            return False
+        if self._min_version is not None or self._max_version is not None:
+            version = message.get("version")
+            if version is None or not version_in_range(
+                version, self._min_version, self._max_version
+            ):
+                return False
+        return True
+
+
+def project(message, fields):
+    """
+    Keep only the fields of the message.
+
+    :param dict message: message of API
+    :param fields: names of the kept fields, fields missing in the message are skipped
+    :type fields: Iterable[str]
+    :return: message with the fields
+    :rtype: dict
+    """
+    return {field: message[field] for field in fields if field in message}
+
+
+def message_selector(fields=None, filters=None):
+    """
+    Get function selecting messages of bundles.
+
+    :param fields: names of the fields of selected messages, all fields are kept by default
+    :type fields: Iterable[str]
+    :param dict filters: keyword arguments of BundleFilter, every bundle passes by default
+    :return: function returning the projected message, or None if the message does not pass the filters
+    :rtype: callable
+    """
+    bundle_filter = BundleFilter(**(filters or {}))
+    fields = None if fields is None else tuple(fields)
+
+    def select(message):
+        if bundle_filter and not bundle_filter.matches(message):
+            return None
+        return message if fields is None else project(message, fields)
+
+    return select
+
+
+def select_messages(messages, fields=None, filters=None):
+    """
+    Drop messages not passing the filters and project the rest to the fields.
+
+    :param Iterable[dict] messages: raw messages of the bundles
+    :param fields: names of the fields of selected messages, all fields are kept by default
+    :type fields: Iterable[str]
+    :param dict filters: keyword arguments of BundleFilter, every bundle passes by default
+    :return: generator of the selected messages
+    :rtype: Iterator[dict]
+    """
+    select = message_selector(fields, filters)
+    for message in messages:
+        selected = select(message)
+        if selected is not None:
+            yield selected
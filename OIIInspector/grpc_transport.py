@@ -0,0 +1,190 @@
+"""In-process gRPC transport for api.Registry, which does not need grpcurl binary."""
+
+import logging
+import threading
+import OIIInspector.exceptions as exceptions
+from OIIInspector import profiling
+from OIIInspector.utils import parse_call_argument
+
+try:
+    import grpc
+    from google.protobuf import descriptor_pool, json_format, message_factory
+    from grpc_reflection.v1alpha import reflection_pb2, reflection_pb2_grpc
+    from grpc_reflection.v1alpha.proto_reflection_descriptor_database import (
+        ProtoReflectionDescriptorDatabase,
+    )
+except ImportError:  # pragma: no cover
+    grpc = None
+
+log = logging.getLogger(__name__)
+
+
+class GrpcTransport:
+    """
+    Transport calling api.Registry through pooled in-process gRPC channels.
+
+    Message types are resolved once per address with gRPC server reflection, so no generated stubs are needed.
+    Responses are rendered to the same JSON text as grpcurl produces.
+    """
+
+    _service_name = "api.Registry"
+    # timeout of the reflection call checking whether the registry has started
+    _probe_timeout = 1
+    requires_container = True
+
+    def __init__(self):
+        """Initialize the GrpcTransport."""
+        if grpc is None:
+            raise exceptions.OIIInspectorError(
+                "gRPC transport requires grpcio, grpcio-reflection and protobuf packages, "
+                "install them with 'pip install OIIInspector[grpc]'"
+            )
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._methods = {}
+
+    def close(self):
+        """Close all pooled channels."""
+        with self._lock:
+            for channel in self._channels.values():
+                channel.close()
+            self._channels = {}
+            self._methods = {}
+
+    def _get_channel(self, address):
+        """
+        Get pooled channel to the address, create it if it does not exist yet.
+
+        :param str address: address of the running registry in format host:PORT
+        :return: gRPC channel
+        :rtype: grpc.Channel
+        """
+        with self._lock:
+            if address not in self._channels:
+                self._channels[address] = grpc.insecure_channel(address)
+            return self._channels[address]
+
+    def responds(self, address):
+        """
+        Check with server reflection whether the service at the address provides api.Registry.
+
+        It is used as readiness probe of the started container, so grpcurl binary is not needed to start it.
+
+        :param str address: address of the running registry in format host:PORT
+        :return: True if the service provides api.Registry
+        :rtype: bool
+        """
+        stub = reflection_pb2_grpc.ServerReflectionStub(self._get_channel(address))
+        request = reflection_pb2.ServerReflectionRequest(list_services="")
+        try:
+            responses = list(
+                stub.ServerReflectionInfo(iter([request]), timeout=self._probe_timeout)
+            )
+        except grpc.RpcError:
+            return False
+        return any(
+            service.name == self._service_name
+            for response in responses
+            for service in response.list_services_response.service
+        )
+
+    def _get_method(self, address, api_address):
+        """
+        Resolve api.Registry method with server reflection.
+
+        :param str address: address of the running registry in format host:PORT
+        :param str api_address: name of the api.Registry method
+        :return: tuple of callable of the method, request class and flag whether the response is streamed
+        :rtype: (grpc.UnaryUnaryMultiCallable, type, bool)
+        :raises OIIInspectorError: if the method is not provided by the registry
+        """
+        key = (address, api_address)
+        if key in self._methods:
+            return self._methods[key]
+
+        channel = self._get_channel(address)
+        pool = descriptor_pool.DescriptorPool(
+            ProtoReflectionDescriptorDatabase(channel)
+        )
+        service = pool.FindServiceByName(self._service_name)
+        method = service.methods_by_name.get(api_address)
+        if method is None:
+            raise exceptions.OIIInspectorError(
+                f"Method {api_address} is not provided by {self._service_name}"
+            )
+        request_class = message_factory.GetMessageClass(method.input_type)
+        response_class = message_factory.GetMessageClass(method.output_type)
+        factory = (
+            channel.unary_stream if method.server_streaming else channel.unary_unary
+        )
+        stub = factory(
+            f"/{self._service_name}/{api_address}",
+            request_serializer=request_class.SerializeToString,
+            response_deserializer=response_class.FromString,
+        )
+        self._methods[key] = (stub, request_class, method.server_streaming)
+        return self._methods[key]
+
+    def _responses(self, address, api_address, call_argument=None):
+        """
+        Call api.Registry method and yield every received message.
+
+        :param str address: address of the running registry in format host:PORT
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: generator of protobuf messages
+        :rtype: Iterator[Message]
+        :raises RuntimeError: if the gRPC call fails
+        """
+        stub, request_class, server_streaming = self._get_method(address, api_address)
+        request = json_format.ParseDict(
+            parse_call_argument(call_argument), request_class()
+        )
+        try:
+            responses = stub(request) if server_streaming else [stub(request)]
+            for response in responses:
+                profiling.count("bytes_read", response.ByteSize())
+                yield response
+        except grpc.RpcError as error:
+            log.error(f"Call {api_address} failed with {error}")
+            raise RuntimeError("An error has occurred when executing a command.")
+
+    def stream(self, address, api_address, call_argument=None):
+        """
+        Call api.Registry method and yield JSON text of every received message.
+
+        :param str address: address of the running registry in format host:PORT
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: generator of JSON texts of the messages
+        :rtype: Iterator[str]
+        """
+        for response in self._responses(address, api_address, call_argument):
+            yield json_format.MessageToJson(response, ensure_ascii=False) + "\n"
+
+    def call(self, address, api_address, call_argument=None):
+        """
+        Call api.Registry method.
+
+        :param str address: address of the running registry in format host:PORT
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: JSON text of the response, messages of streamed response are concatenated
+        :rtype: str
+        """
+        return "".join(self.stream(address, api_address, call_argument))
+
+    def messages(self, address, api_address, call_argument=None, streamed=False):
+        """
+        Call api.Registry method and convert received messages to dictionaries, without JSON text in between.
+
+        :param str address: address of the running registry in format host:PORT
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :param bool streamed: whether the method returns stream of messages, the stream is detected from the
+            method descriptor, so the flag is not needed
+        :return: generator of messages, JSON strings embedded in them are not decoded
+        :rtype: Iterator[dict]
+        """
+        for response in self._responses(address, api_address, call_argument):
+            yield json_format.MessageToDict(response)
@@ -0,0 +1,432 @@
+"""Container-free backend answering api.Registry queries from the sqlite database of the index image."""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+from OIIInspector.container_manager import ContainerManager
+from OIIInspector.utils import iter_json_objects, parse_call_argument
+
+log = logging.getLogger(__name__)
+
+INDEX_DATABASE_PATH = "/database/index.db"
+
+
+def _compact_message(message):
+    """
+    Drop empty fields of the message, the same way as protobuf JSON encoding omits default values.
+
+    :param dict message: message with all fields
+    :return: message without empty fields
+    :rtype: dict
+    """
+    return {key: value for key, value in message.items() if value not in (None, "", [])}
+
+
+class IndexDatabase:
+    """
+    Read-only api.Registry queries of the operator-registry sqlite database.
+
+    The queries mirror the sqlite querier of operator-registry, so the messages have the same shape
+    as the responses of the registry server running in the index image.
+    """
+
+    _bundle_columns = (
+        "channel_entry.entry_id, channel_entry.package_name, channel_entry.channel_name, "
+        "operatorbundle.name, operatorbundle.csv, operatorbundle.bundle, operatorbundle.bundlepath, "
+        "operatorbundle.version, operatorbundle.skiprange, operatorbundle.replaces, operatorbundle.skips"
+    )
+    _bundle_query = (
+        f"SELECT {_bundle_columns} FROM channel_entry "
+        "INNER JOIN operatorbundle ON operatorbundle.name = channel_entry.operatorbundle_name"
+    )
+
+    def __init__(self, db_path):
+        """
+        Initialize the IndexDatabase.
+
+        :param str db_path: path of the sqlite database of the index image
+        """
+        self._connection = sqlite3.connect(
+            f"file:{db_path}?mode=ro", uri=True, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+
+    def close(self):
+        """Close connection to the database."""
+        self._connection.close()
+
+    def _fetch(self, query, *parameters):
+        """
+        Execute the query.
+
+        :param str query: SQL query
+        :param parameters: parameters of the query
+        :return: all rows of the result
+        :rtype: list
+        """
+        with self._lock:
+            return self._connection.execute(query, parameters).fetchall()
+
+    def _fetch_bundle(self, condition, *parameters):
+        """
+        Fetch the first channel entry matching the condition and build its bundle message.
+
+        :param str condition: SQL condition selecting the channel entry
+        :param parameters: parameters of the condition
+        :return: bundle message
+        :rtype: dict
+        :raises RuntimeError: if no channel entry matches the condition
+        """
+        rows = self._fetch(
+            f"{self._bundle_query} WHERE {condition} "
+            "ORDER BY channel_entry.depth, channel_entry.entry_id LIMIT 1",
+            *parameters,
+        )
+        if not rows:
+            log.error(f"No bundle matches {parameters}")
+            raise RuntimeError(
+                "Requested bundle has not been found in the index database."
+            )
+        return self._build_bundle(rows[0])
+
+    def _get_apis(self, table, entry_id):
+        """
+        Get APIs provided or required by the channel entry.
+
+        :param str table: "api_provider" or "api_requirer"
+        :param int entry_id: ID of the channel entry
+        :return: list of group, version, kind and plural of the APIs
+        :rtype: list
+        """
+        rows = self._fetch(
+            "SELECT DISTINCT api.group_name, api.version, api.kind, api.plural FROM api "
+            f"INNER JOIN {table} ON api.group_name = {table}.group_name "
+            f"AND api.version = {table}.version AND api.kind = {table}.kind "
+            f"WHERE {table}.channel_entry_id = ?",
+            entry_id,
+        )
+        return [
+            _compact_message(
+                {"group": group, "version": version, "kind": kind, "plural": plural}
+            )
+            for group, version, kind, plural in rows
+        ]
+
+    def _get_type_values(self, table, bundle_name):
+        """
+        Get dependencies or properties of the bundle.
+
+        :param str table: "dependencies" or "properties"
+        :param str bundle_name: name of the bundle
+        :return: list of types and values
+        :rtype: list
+        """
+        rows = self._fetch(
+            f"SELECT DISTINCT type, value FROM {table} WHERE operatorbundle_name = ?",
+            bundle_name,
+        )
+        return [{"type": type_, "value": value} for type_, value in rows]
+
+    def _build_bundle(self, row):
+        """
+        Build bundle message from the row of the bundle query.
+
+        :param tuple row: row selected by the bundle query
+        :return: bundle message, embedded JSON strings are not decoded
+        :rtype: dict
+        """
+        (
+            entry_id,
+            package_name,
+            channel_name,
+            name,
+            csv,
+            bundle,
+            bundle_path,
+            version,
+            skip_range,
+            replaces,
+            skips,
+        ) = row
+        objects = iter_json_objects([bundle]) if bundle else ()
+        return _compact_message(
+            {
+                "csvName": name,
+                "packageName": package_name,
+                "channelName": channel_name,
+                "csvJson": csv,
+                "object": [json.dumps(obj, separators=(",", ":")) for obj in objects],
+                "bundlePath": bundle_path,
+                "providedApis": self._get_apis("api_provider", entry_id),
+                "requiredApis": self._get_apis("api_requirer", entry_id),
+                "version": version,
+                "skipRange": skip_range,
+                "dependencies": self._get_type_values("dependencies", name),
+                "properties": self._get_type_values("properties", name),
+                "replaces": replaces,
+                "skips": [skip for skip in (skips or "").split(",") if skip],
+            }
+        )
+
+    def list_packages(self):
+        """
+        Yield names of all packages in the index.
+
+        :return: generator of package name messages
+        :rtype: Iterator[dict]
+        """
+        for (name,) in self._fetch("SELECT DISTINCT name FROM package ORDER BY name"):
+            yield {"name": name}
+
+    def get_package(self, name):
+        """
+        Get package with heads of its channels.
+
+        :param str name: name of the package
+        :return: package message
+        :rtype: dict
+        :raises RuntimeError: if the package is not in the index
+        """
+        rows = self._fetch("SELECT default_channel FROM package WHERE name = ?", name)
+        if not rows:
+            log.error(f"Package {name} is not in the index database")
+            raise RuntimeError(
+                "Requested package has not been found in the index database."
+            )
+        channels = self._fetch(
+            "SELECT name, head_operatorbundle_name FROM channel WHERE package_name = ? ORDER BY name",
+            name,
+        )
+        return _compact_message(
+            {
+                "name": name,
+                "channels": [
+                    {"name": channel, "csvName": head} for channel, head in channels
+                ],
+                "defaultChannelName": rows[0][0],
+            }
+        )
+
+    def list_bundles(self):
+        """
+        Yield bundles of all channel entries in the index.
+
+        :return: generator of bundle messages
+        :rtype: Iterator[dict]
+        """
+        rows = self._fetch(
+            f"{self._bundle_query} ORDER BY channel_entry.package_name, "
+            "channel_entry.channel_name, channel_entry.depth"
+        )
+        for row in rows:
+            yield self._build_bundle(row)
+
+    def get_bundle(self, package_name, channel_name, csv_name):
+        """
+        Get bundle of the CSV in the channel.
+
+        :param str package_name: name of the package
+        :param str channel_name: name of the channel
+        :param str csv_name: name of the CSV
+        :return: bundle message
+        :rtype: dict
+        """
+        return self._fetch_bundle(
+            "channel_entry.package_name = ? AND channel_entry.channel_name = ? "
+            "AND channel_entry.operatorbundle_name = ?",
+            package_name,
+            channel_name,
+            csv_name,
+        )
+
+    def get_bundle_for_channel(self, package_name, channel_name):
+        """
+        Get bundle at the head of the channel.
+
+        :param str package_name: name of the package
+        :param str channel_name: name of the channel
+        :return: bundle message
+        :rtype: dict
+        """
+        return self._fetch_bundle(
+            "channel_entry.package_name = ? AND channel_entry.channel_name = ? "
+            "AND channel_entry.operatorbundle_name = (SELECT head_operatorbundle_name FROM channel "
+            "WHERE channel.package_name = ? AND channel.name = ?)",
+            package_name,
+            channel_name,
+            package_name,
+            channel_name,
+        )
+
+    def get_bundle_that_replaces(self, csv_name, package_name, channel_name):
+        """
+        Get bundle which replaces the CSV in the channel.
+
+        :param str csv_name: name of the replaced CSV
+        :param str package_name: name of the package
+        :param str channel_name: name of the channel
+        :return: bundle message
+        :rtype: dict
+        """
+        return self._fetch_bundle(
+            "channel_entry.package_name = ? AND channel_entry.channel_name = ? "
+            "AND channel_entry.replaces IN (SELECT replaced.entry_id FROM channel_entry AS replaced "
+            "WHERE replaced.package_name = ? AND replaced.channel_name = ? "
+            "AND replaced.operatorbundle_name = ?)",
+            package_name,
+            channel_name,
+            package_name,
+            channel_name,
+            csv_name,
+        )
+
+    def get_default_bundle_that_provides(self, group, version, kind, plural=None):
+        """
+        Get bundle providing the API, which is the closest to the head of the default channel of its package.
+
+        :param str group: group of the API
+        :param str version: version of the API
+        :param str kind: kind of the API
+        :param str plural: plural of the API, it is not needed to identify the API
+        :return: bundle message
+        :rtype: dict
+        """
+        return self._fetch_bundle(
+            "channel_entry.entry_id IN (SELECT channel_entry_id FROM api_provider "
+            "WHERE group_name = ? AND version = ? AND kind = ?) "
+            "AND channel_entry.channel_name = (SELECT default_channel FROM package "
+            "WHERE package.name = channel_entry.package_name)",
+            group,
+            version,
+            kind,
+        )
+
+    def query(self, api_address, request=None):
+        """
+        Answer api.Registry method.
+
+        :param str api_address: name of the api.Registry method
+        :param dict request: fields of the request message
+        :return: generator of response messages
+        :rtype: Iterator[dict]
+        :raises RuntimeError: if the method is not supported
+        """
+        request = request or {}
+        streamed_methods = {
+            "ListPackages": self.list_packages,
+            "ListBundles": self.list_bundles,
+        }
+        unary_methods = {
+            "GetPackage": (self.get_package, ("name",)),
+            "GetBundle": (self.get_bundle, ("pkgName", "channelName", "csvName")),
+            "GetBundleForChannel": (
+                self.get_bundle_for_channel,
+                ("pkgName", "channelName"),
+            ),
+            "GetBundleThatReplaces": (
+                self.get_bundle_that_replaces,
+                ("csvName", "pkgName", "channelName"),
+            ),
+            "GetDefaultBundleThatProvides": (
+                self.get_default_bundle_that_provides,
+                ("group", "version", "kind", "plural"),
+            ),
+        }
+        if api_address in streamed_methods:
+            yield from streamed_methods[api_address]()
+        elif api_address in unary_methods:
+            method, fields = unary_methods[api_address]
+            yield method(*(request.get(field) for field in fields))
+        else:
+            raise RuntimeError(
+                f"Method {api_address} is not supported by the index database backend."
+            )
+
+
+class DatabaseTransport:
+    """
+    Transport answering api.Registry calls from the index database, without running the registry server.
+
+    The database is copied out of the index image on the first call, the container is created but never started,
+    so no port is allocated and there is no readiness wait. Only sqlite based index images are supported.
+    """
+
+    requires_container = False
+
+    def __init__(self):
+        """Initialize the DatabaseTransport."""
+        self._lock = threading.Lock()
+        self._databases = {}
+        self._tmp_dir = None
+
+    def close(self):
+        """Close the databases and remove their local copies."""
+        with self._lock:
+            for database in self._databases.values():
+                database.close()
+            self._databases = {}
+            if self._tmp_dir is not None:
+                shutil.rmtree(self._tmp_dir, ignore_errors=True)
+                self._tmp_dir = None
+
+    def _get_database(self, image_address):
+        """
+        Get database of the index image, copy it out of the image if it has not been copied yet.
+
+        :param str image_address: address of the index image
+        :return: database of the index image
+        :rtype: IndexDatabase
+        """
+        with self._lock:
+            if image_address not in self._databases:
+                if self._tmp_dir is None:
+                    self._tmp_dir = tempfile.mkdtemp(prefix="OIIInspector-")
+                db_path = os.path.join(self._tmp_dir, f"{len(self._databases)}.db")
+                ContainerManager(image_address).copy_from_image(
+                    INDEX_DATABASE_PATH, db_path
+                )
+                self._databases[image_address] = IndexDatabase(db_path)
+            return self._databases[image_address]
+
+    def messages(self, address, api_address, call_argument=None, streamed=False):
+        """
+        Answer api.Registry method from the index database.
+
+        :param str address: address of the index image
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :param bool streamed: whether the method returns stream of messages, it is known from the method name
+        :return: generator of messages, JSON strings embedded in them are not decoded
+        :rtype: Iterator[dict]
+        """
+        database = self._get_database(address)
+        return database.query(api_address, parse_call_argument(call_argument))
+
+    def stream(self, address, api_address, call_argument=None):
+        """
+        Answer api.Registry method and yield JSON text of every message, formatted as grpcurl does.
+
+        :param str address: address of the index image
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: generator of JSON texts of the messages
+        :rtype: Iterator[str]
+        """
+        for message in self.messages(address, api_address, call_argument):
+            yield json.dumps(message, indent=2, ensure_ascii=False) + "\n"
+
+    def call(self, address, api_address, call_argument=None):
+        """
+        Answer api.Registry method.
+
+        :param str address: address of the index image
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: JSON text of the response, messages of streamed response are concatenated
+        :rtype: str
+        """
+        return "".join(self.stream(address, api_address, call_argument))
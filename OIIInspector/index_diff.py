@@ -0,0 +1,164 @@
+"""Difference of the bundles of two index images, computed from content fingerprints of the streamed bundles."""
+
+import contextvars
+import hashlib
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from OIIInspector.oii_client import iter_bundles
+
+log = logging.getLogger(__name__)
+
+# fields which change when the same bundle is published again, e.g. from other registry
+DEFAULT_IGNORED_FIELDS = ("bundlePath",)
+IDENTITY_FIELDS = ("packageName", "channelName", "csvName", "version")
+
+
+def _digest(value):
+    """
+    Get content hash of JSON value, independent of the order of object keys.
+
+    :param value: JSON value
+    :return: hexadecimal SHA-256 digest
+    :rtype: str
+    """
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def fingerprint(bundle, ignore_fields=DEFAULT_IGNORED_FIELDS):
+    """
+    Get content hashes of the fields of the bundle.
+
+    Embedded JSON fields are hashed decoded, so different encodings of the same content, and eagerly and lazily
+    decoded bundles, have the same fingerprint. Ignored fields of a lazily decoded bundle are not decoded.
+
+    :param dict bundle: bundle message
+    :param Iterable[str] ignore_fields: names of the fields which are not hashed
+    :return: digests of the fields keyed by the names of the fields
+    :rtype: dict
+    """
+    return {
+        field: _digest(bundle[field])
+        for field in dict.keys(bundle)
+        if field not in ignore_fields
+    }
+
+
+def index_bundles(bundles, ignore_fields=DEFAULT_IGNORED_FIELDS):
+    """
+    Fingerprint the bundles, only the identity and the fingerprints of the bundles are kept.
+
+    :param Iterable[dict] bundles: bundles of ListBundles
+    :param Iterable[str] ignore_fields: names of the fields which are not hashed
+    :return: (identity, fingerprint) of the bundles keyed by (package, channel, csv name)
+    :rtype: dict
+    """
+    ignore_fields = frozenset(ignore_fields)
+    indexed = {}
+    for bundle in bundles:
+        identity = {
+            field: bundle[field] for field in IDENTITY_FIELDS if field in bundle
+        }
+        key = (
+            identity.get("packageName"),
+            identity.get("channelName"),
+            identity.get("csvName"),
+        )
+        if key in indexed:
+            log.warning(f"Bundle {key} is listed more than once, the last one is used")
+        indexed[key] = (identity, fingerprint(bundle, ignore_fields))
+    return indexed
+
+
+def diff_bundles(old_bundles, new_bundles, ignore_fields=DEFAULT_IGNORED_FIELDS):
+    """
+    Compare two listings of bundles, bundles are matched by package, channel and csv name.
+
+    :param Iterable[dict] old_bundles: bundles of the previous index image
+    :param Iterable[dict] new_bundles: bundles of the new index image
+    :param Iterable[str] ignore_fields: names of the fields which are not compared
+    :return: delta, see diff_index_images
+    :rtype: dict
+    """
+    return _diff(
+        index_bundles(old_bundles, ignore_fields),
+        index_bundles(new_bundles, ignore_fields),
+    )
+
+
+def _diff(old_index, new_index):
+    """
+    Compare fingerprinted bundles of two index images.
+
+    :param dict old_index: fingerprinted bundles of the previous index image, see index_bundles
+    :param dict new_index: fingerprinted bundles of the new index image, see index_bundles
+    :return: delta, see diff_index_images
+    :rtype: dict
+    """
+    delta = {"added": [], "removed": [], "changed": [], "unchanged": 0}
+    for key in sorted(new_index.keys() - old_index.keys(), key=str):
+        delta["added"].append(new_index[key][0])
+    for key in sorted(old_index.keys() - new_index.keys(), key=str):
+        delta["removed"].append(old_index[key][0])
+    for key in sorted(old_index.keys() & new_index.keys(), key=str):
+        old_fields = old_index[key][1]
+        new_identity, new_fields = new_index[key]
+        if old_fields == new_fields:
+            delta["unchanged"] += 1
+            continue
+        changed_fields = sorted(
+            field
+            for field in old_fields.keys() | new_fields.keys()
+            if old_fields.get(field) != new_fields.get(field)
+        )
+        delta["changed"].append({**new_identity, "changedFields": changed_fields})
+    return delta
+
+
+def diff_index_images(
+    old_image_address,
+    new_image_address,
+    ignore_fields=DEFAULT_IGNORED_FIELDS,
+    **session_options,
+):
+    """
+    Compare bundles of two index images, both images are inspected concurrently.
+
+    Bundles are streamed and only their fingerprints are kept, so decoded embedded JSON payloads of only one bundle
+    are held at a time. The payloads are decoded eagerly, as every compared field is decoded for its fingerprint.
+
+    :param str old_image_address: address of the previous index image
+    :param str new_image_address: address of the new index image
+    :param Iterable[str] ignore_fields: names of the fields which are not compared
+    :param session_options: options of the IndexSession, e.g. transport
+    :return: {"added": identities of new bundles, "removed": identities of removed bundles,
+        "changed": identities of changed bundles with "changedFields", "unchanged": number of unchanged bundles}
+    :rtype: dict
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # workers run in copy of the current context, so they use the cache activated by the caller
+        old_future, new_future = (
+            executor.submit(
+                contextvars.copy_context().run,
+                _index_image,
+                image_address,
+                ignore_fields,
+                session_options,
+            )
+            for image_address in (old_image_address, new_image_address)
+        )
+        return _diff(old_future.result(), new_future.result())
+
+
+def _index_image(image_address, ignore_fields, session_options):
+    """
+    Stream bundles of the image and fingerprint them.
+
+    :param str image_address: address of the index image
+    :param Iterable[str] ignore_fields: names of the fields which are not hashed
+    :param dict session_options: options of the IndexSession
+    :return: fingerprinted bundles, see index_bundles
+    :rtype: dict
+    """
+    return index_bundles(iter_bundles(image_address, **session_options), ignore_fields)
@@ -0,0 +1,435 @@
+"""Opt-in metrics of the inspections, exposed in OpenMetrics text format as a textfile or over local HTTP."""
+
+import abc
+import contextlib
+import logging
+import math
+import os
+import tempfile
+import threading
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value):
+    """
+    Format sample value.
+
+    :param float value: value of the sample
+    :return: value in exposition format
+    :rtype: str
+    """
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    """
+    Format labels of the sample.
+
+    :param Iterable[tuple] labels: (name, value) pairs
+    :return: labels in exposition format, empty string for no labels
+    :rtype: str
+    """
+    labels = list(labels)
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class _Metric(abc.ABC):
+    """Metric family with samples keyed by values of its labels."""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames, lock):
+        """
+        Initialize the metric.
+
+        :param str name: name of the metric family, without _total suffix of counters
+        :param str documentation: help text of the metric
+        :param tuple labelnames: names of the labels
+        :param threading.Lock lock: lock of the registry guarding the samples
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = lock
+        self._values = {}
+
+    def _key(self, labels):
+        """
+        Get values of the labels in order of the label names.
+
+        :param dict labels: values of the labels
+        :return: values of the labels
+        :rtype: tuple
+        :raises ValueError: if the labels do not match the label names
+        """
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric {self.name} has labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def exposition(self, openmetrics=True):
+        """
+        Get lines of the metric family.
+
+        :param bool openmetrics: OpenMetrics format, Prometheus text format otherwise
+        :return: lines of the metric family
+        :rtype: list
+        """
+        family = self._family_name(openmetrics)
+        lines = [
+            f"# HELP {family} {self.documentation}",
+            f"# TYPE {family} {self.type}",
+        ]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.extend(self._samples(list(zip(self.labelnames, key)), value))
+        return lines
+
+    def _family_name(self, openmetrics):
+        """Return name of the metric family in the format."""
+        return self.name
+
+    @abc.abstractmethod
+    def _samples(self, labels, value):
+        """Return sample lines of one combination of the labels."""
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type = "counter"
+
+    def inc(self, value=1, **labels):
+        """
+        Increase the counter.
+
+        :param float value: increment, it must not be negative
+        :param labels: values of the labels of the counter
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels):
+        """
+        Get value of the counter.
+
+        :param labels: values of the labels of the counter
+        :return: value of the counter
+        :rtype: float
+        """
+        key = self._key(labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def _family_name(self, openmetrics):
+        """Return name of the metric family, Prometheus text format names counters with the _total suffix."""
+        return self.name if openmetrics else f"{self.name}_total"
+
+    def _samples(self, labels, value):
+        """Return the sample of the counter."""
+        return [f"{self.name}_total{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames, lock, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize the Histogram.
+
+        :param str name: name of the metric family
+        :param str documentation: help text of the metric
+        :param tuple labelnames: names of the labels
+        :param threading.Lock lock: lock of the registry guarding the samples
+        :param Iterable[float] buckets: upper bounds of the buckets, +Inf bucket is added
+        """
+        super().__init__(name, documentation, labelnames, lock)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        """
+        Record observed value.
+
+        :param float value: observed value, e.g. duration in seconds
+        :param labels: values of the labels of the histogram
+        """
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        """
+        Get number of observed values.
+
+        :param labels: values of the labels of the histogram
+        :return: number of observations
+        :rtype: int
+        """
+        key = self._key(labels)
+        with self._lock:
+            return self._values[key][0][-1] if key in self._values else 0
+
+    def _samples(self, labels, value):
+        """Return bucket, count and sum samples of the histogram."""
+        counts, total = value
+        lines = [
+            f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {count}"
+            for bound, count in zip(self.buckets, counts)
+        ]
+        lines.append(f"{self.name}_count{_format_labels(labels)} {counts[-1]}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Registry of metric families, rendered together in one exposition."""
+
+    def __init__(self):
+        """Initialize the MetricsRegistry."""
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        """
+        Register the metric.
+
+        :param _Metric metric: metric to be registered
+        :return: the registered metric
+        :rtype: _Metric
+        :raises ValueError: if a metric of the same name is already registered
+        """
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """
+        Register new counter.
+
+        :param str name: name of the counter, without _total suffix
+        :param str documentation: help text of the counter
+        :param Iterable[str] labelnames: names of the labels
+        :return: the counter
+        :rtype: Counter
+        """
+        return self._register(Counter(name, documentation, labelnames, self._lock))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """
+        Register new histogram.
+
+        :param str name: name of the histogram
+        :param str documentation: help text of the histogram
+        :param Iterable[str] labelnames: names of the labels
+        :param Iterable[float] buckets: upper bounds of the buckets
+        :return: the histogram
+        :rtype: Histogram
+        """
+        return self._register(
+            Histogram(name, documentation, labelnames, self._lock, buckets)
+        )
+
+    def exposition(self, openmetrics=True):
+        """
+        Render all metrics.
+
+        :param bool openmetrics: OpenMetrics format ending with "# EOF", Prometheus text format otherwise
+        :return: exposition of the metrics
+        :rtype: str
+        """
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.exposition(openmetrics))
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path, openmetrics=False):
+        """
+        Write the metrics to the file atomically, so a textfile collector never reads a partial file.
+
+        Prometheus text format is written by default, as node-exporter textfile collector expects it.
+
+        :param str path: path of the file, it should have .prom suffix for node-exporter
+        :param bool openmetrics: write OpenMetrics format instead
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(
+            "w", dir=directory, prefix=".metrics-", delete=False, encoding="utf-8"
+        ) as temporary:
+            temporary.write(self.exposition(openmetrics))
+        os.chmod(temporary.name, 0o644)
+        os.replace(temporary.name, path)
+
+    @contextlib.contextmanager
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve the metrics over HTTP in a background thread while the block runs.
+
+        OpenMetrics format is served to clients accepting it, Prometheus text format to the others.
+
+        :param int port: local port, 0 selects a free port
+        :param str host: address to listen at
+        :return: context manager yielding the HTTP server, its server_address holds the bound port
+        """
+        # HTTP server is imported only when the metrics are served, to keep start of the command line tools fast
+        import http.server
+
+        registry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            """Handler answering every GET request with the metrics of the registry."""
+
+            def do_GET(self):
+                """Answer with the exposition of the metrics."""
+                openmetrics = "application/openmetrics-text" in self.headers.get(
+                    "Accept", ""
+                )
+                body = registry.exposition(openmetrics).encode("utf-8")
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type",
+                    (
+                        OPENMETRICS_CONTENT_TYPE
+                        if openmetrics
+                        else PROMETHEUS_CONTENT_TYPE
+                    ),
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                """Log requests to the debug log instead of the standard error output."""
+                log.debug(format, *args)
+
+        server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        log.info("Metrics are served at http://%s:%d/", *server.server_address[:2])
+        try:
+            yield server
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+
+class InspectionMetrics:
+    """
+    Metrics of the inspections, fed by the instrumentation of OIIInspector.profiling.
+
+    Activate the metrics with OIIInspector.profiling.use_profiler, every span and counter of the inspections run
+    in the block then updates the metrics, the spans themselves are not kept.
+    """
+
+    def __init__(self, registry=None, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize the InspectionMetrics.
+
+        :param MetricsRegistry registry: registry of the metrics, new registry by default
+        :param Iterable[float] buckets: upper bounds of the buckets of the histograms, in seconds
+        """
+        self.registry = registry if registry is not None else MetricsRegistry()
+        self.container_starts = self.registry.counter(
+            "oii_container_starts", "Successfully started index image containers."
+        )
+        self.port_attempts = self.registry.counter(
+            "oii_port_attempts", "Local ports tried for the registry service."
+        )
+        self.subprocesses = self.registry.counter(
+            "oii_subprocesses", "Started subprocesses, e.g. podman and grpcurl."
+        )
+        self.read_bytes = self.registry.counter(
+            "oii_read_bytes",
+            "Bytes of the responses read from subprocesses, gRPC channels and the cache.",
+        )
+        self.cache_hits = self.registry.counter(
+            "oii_cache_hits", "Responses answered from the cache.", ["method"]
+        )
+        self.cache_misses = self.registry.counter(
+            "oii_cache_misses",
+            "Responses queried from the image, as the cache does not hold them.",
+            ["method"],
+        )
+        self.pull_seconds = self.registry.histogram(
+            "oii_pull_seconds", "Duration of the image pulls.", buckets=buckets
+        )
+        self.start_seconds = self.registry.histogram(
+            "oii_container_start_seconds",
+            "Duration of the successful container starts, including the readiness wait.",
+            buckets=buckets,
+        )
+        self.readiness_seconds = self.registry.histogram(
+            "oii_readiness_seconds",
+            "Wait for the registry service of the started container.",
+            buckets=buckets,
+        )
+        self.rpc_seconds = self.registry.histogram(
+            "oii_rpc_seconds",
+            "Latency of api.Registry calls, time of reading the whole response.",
+            ["method"],
+            buckets=buckets,
+        )
+
+    def finish(self, span):
+        """
+        Update the metrics by the finished span.
+
+        :param OIIInspector.profiling.Span span: finished span
+        """
+        if span.name == "pull":
+            self.pull_seconds.observe(span.duration)
+        elif span.name == "serve":
+            # failed starts are not counted as starts
+            if span.error is None:
+                self.container_starts.inc()
+                self.start_seconds.observe(span.duration)
+        elif span.name == "readiness":
+            self.readiness_seconds.observe(span.duration)
+        elif span.name == "query":
+            self.rpc_seconds.observe(span.duration, method=span.attributes["method"])
+            if span.attributes.get("cache") == "miss":
+                self.cache_misses.inc(method=span.attributes["method"])
+        elif span.name == "cache_load":
+            self.cache_hits.inc(method=span.attributes["method"])
+
+    def count(self, name, value=1):
+        """
+        Update the metrics by the counter of the instrumentation.
+
+        :param str name: name of the counter
+        :param int value: increment of the counter
+        """
+        counter = {
+            "port_attempts": self.port_attempts,
+            "subprocesses": self.subprocesses,
+            "bytes_read": self.read_bytes,
+        }.get(name)
+        if counter is not None:
+            counter.inc(value)
@@ -1,9 +1,431 @@
-import json
-from OIIInspector.utils import run_cmd, convert_output
+from contextlib import ExitStack
+from OIIInspector.utils import (
+    run_cmd,
+    run_cmd_stream,
+    parse_output,
+    convert_message,
+    iter_json_objects,
+)
+from OIIInspector.cache import get_active_cache
 from OIIInspector.container_manager import ContainerManager
+from OIIInspector.filters import select_messages
+from OIIInspector import profiling
+import OIIInspector.exceptions as exceptions
 
 
-def get_bundle(image_address, pkg_name, channel_name, csv_name):
+class GrpcurlTransport:
+    """Transport calling api.Registry through grpcurl binary."""
+
+    requires_container = True
+
+    @staticmethod
+    def _build_command(address, api_address, call_argument=None):
+        """
+        Build grpcurl command calling api.Registry method.
+
+        :param str address: address of the running registry in format host:PORT
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: grpcurl command
+        :rtype: str
+        """
+        if call_argument is None:
+            return f"grpcurl -plaintext {address} api.Registry/{api_address}"
+        return f"grpcurl -plaintext -d {call_argument} {address} api.Registry/{api_address}"
+
+    def call(self, address, api_address, call_argument=None):
+        """
+        Call api.Registry method with grpcurl.
+
+        :param str address: address of the running registry in format host:PORT
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: raw response of the API
+        :rtype: str
+        """
+        return run_cmd(self._build_command(address, api_address, call_argument))
+
+    def stream(self, address, api_address, call_argument=None):
+        """
+        Call api.Registry method with grpcurl and yield the response as it is read from the pipe.
+
+        :param str address: address of the running registry in format host:PORT
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: generator of chunks of the raw response
+        :rtype: Iterator[str]
+        """
+        return run_cmd_stream(self._build_command(address, api_address, call_argument))
+
+    def messages(self, address, api_address, call_argument=None, streamed=False):
+        """
+        Call api.Registry method with grpcurl and decode the response into messages.
+
+        :param str address: address of the running registry in format host:PORT
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :param bool streamed: whether the method returns stream of messages
+        :return: generator of messages, JSON strings embedded in them are not decoded
+        :rtype: Iterator[dict]
+        """
+        if streamed:
+            return iter_json_objects(self.stream(address, api_address, call_argument))
+        return iter([parse_output(self.call(address, api_address, call_argument))])
+
+    def close(self):
+        """Release resources held by the transport, grpcurl does not hold any."""
+
+
+def get_transport(transport):
+    """
+    Get transport used for calls of api.Registry.
+
+    :param transport: name of the transport ("grpcurl", "grpc", "database" or "snapshot"), or already created
+        transport object
+    :type transport: str or object
+    :return: transport object
+    :raises OIIInspectorError: if the transport name is not known
+    """
+    if not isinstance(transport, str):
+        return transport
+    if transport == "grpcurl":
+        return GrpcurlTransport()
+    if transport == "grpc":
+        from OIIInspector.grpc_transport import GrpcTransport
+
+        return GrpcTransport()
+    if transport == "database":
+        from OIIInspector.index_database import DatabaseTransport
+
+        return DatabaseTransport()
+    if transport == "snapshot":
+        from OIIInspector.snapshot import SnapshotTransport
+
+        return SnapshotTransport()
+    raise exceptions.OIIInspectorError(f"Unknown transport {transport}")
+
+
+class IndexSession:
+    """
+    Session which keeps one index image container running for many queries.
+
+    The container is started on the first query and it is stopped and removed when the session is closed,
+    so N queries issued through one session pay for a single container startup.
+    """
+
+    def __init__(
+        self,
+        image_address,
+        transport="grpcurl",
+        cache=None,
+        container_limits=None,
+        lazy=False,
+        pull_policy=None,
+    ):
+        """
+        Initialize the IndexSession.
+
+        :param image_address: address of the index image, to which queries will be done
+        :type image_address: str
+        :param transport: transport used for api.Registry calls, "grpcurl", "grpc" (in-process gRPC channel),
+            "database" (local queries of the index database copied out of the image, no container is run)
+            or "snapshot" (queries of the snapshot file written by OIIInspector.snapshot.write_snapshot, the image
+            address is path of the file)
+        :type transport: str or object
+        :param cache: cache of the responses, the cache activated by OIIInspector.cache.use_cache is used by default
+        :type cache: ResponseCache
+        :param container_limits: limits of concurrent pulls and running containers shared with other sessions
+        :type container_limits: ContainerLimits
+        :param lazy: decode csvJson, object and spec fields of the responses on their first access, which saves
+            decoding of large payloads that are never read
+        :type lazy: bool
+        :param pull_policy: pull policy of the image, one of OIIInspector.container_manager.PULL_POLICIES
+        :type pull_policy: str
+        """
+        self._image_address = image_address
+        self._lazy = lazy
+        self._container_options = {}
+        if container_limits is not None:
+            self._container_options["limits"] = container_limits
+        if pull_policy is not None:
+            self._container_options["pull_policy"] = pull_policy
+        self._exit_stack = ExitStack()
+        self._container_manager = None
+        self._start_error = None
+        self._transport = get_transport(transport)
+        # transport probing the registry itself does not need grpcurl binary to start the container
+        if getattr(self._transport, "responds", None) is not None:
+            self._container_options["probe"] = self._transport.responds
+        self._cache = cache if cache is not None else get_active_cache()
+        if not getattr(self._transport, "cacheable", True):
+            self._cache = None
+        self._exit_stack.callback(self._transport.close)
+
+    @property
+    def start_error(self):
+        """Return error of the failed start of the container, None if the container has not failed to start."""
+        return self._start_error
+
+    def __enter__(self):
+        """Return the opened IndexSession."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        """Handle termination of the IndexSession."""
+        self.close()
+
+    def close(self):
+        """Stop and remove the container used by this session."""
+        self._exit_stack.close()
+        self._container_manager = None
+        self._start_error = None
+
+    def _get_local_address(self):
+        """
+        Get local address of the running index image, start the container if it is not running yet.
+
+        :return: local address of the running image in format localhost:PORT, or the image address itself if the
+            transport does not need running container
+        :rtype: str
+        :raises Exception: error of the first failed start of the container, for this and all following queries
+        """
+        if not self._transport.requires_container:
+            return self._image_address
+        if self._start_error is not None:
+            # the container is not started again for every query of the session
+            raise self._start_error
+        if self._container_manager is None:
+            self._container_manager = self._exit_stack.enter_context(
+                ContainerManager(self._image_address, **self._container_options)
+            )
+        try:
+            self._container_manager.start_container()
+        except Exception as error:
+            self._start_error = error
+            raise
+        return self._container_manager.local_address_of_image
+
+    def call(self, api_address, call_argument=None):
+        """
+        Call api.Registry method on the running index image.
+
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: raw response of the API
+        :rtype: str
+        """
+        return self._transport.call(
+            self._get_local_address(), api_address, call_argument=call_argument
+        )
+
+    def stream(self, api_address, call_argument=None):
+        """
+        Call api.Registry method on the running index image and yield the response as it is received.
+
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: generator of chunks of the raw response
+        :rtype: Iterator[str]
+        """
+        return self._transport.stream(
+            self._get_local_address(), api_address, call_argument=call_argument
+        )
+
+    def _messages(self, api_address, call_argument=None, streamed=False):
+        """
+        Get raw messages of the api.Registry call, answer from the cache when it holds the response.
+
+        Container is not started at all when the response is cached.
+
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :param bool streamed: whether the method returns stream of messages
+        :return: generator of messages, JSON strings embedded in them are not decoded
+        :rtype: Iterator[dict]
+        """
+        # query of the session with cache is marked as cache miss
+        cache_attributes = {}
+        if self._cache is not None:
+            cached = self._cache.load(self._image_address, api_address, call_argument)
+            if cached is not None:
+                yield from profiling.timed_iter(
+                    "cache_load", cached, method=api_address
+                )
+                return
+            cache_attributes["cache"] = "miss"
+        messages = profiling.timed_iter(
+            "query",
+            self._transport.messages(
+                self._get_local_address(), api_address, call_argument, streamed=streamed
+            ),
+            method=api_address,
+            **cache_attributes,
+        )
+        if self._cache is not None:
+            messages = self._cache.store(
+                self._image_address, api_address, call_argument, messages
+            )
+        yield from messages
+
+    def _query(self, api_address, call_argument=None):
+        """
+        Call api.Registry method returning single message.
+
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: converted message
+        :rtype: JSON-object
+        """
+        (message,) = self._messages(api_address, call_argument)
+        with profiling.span("convert", method=api_address):
+            return convert_message(message, lazy=self._lazy)
+
+    def iter_packages(self):
+        """
+        Call api.Registry/ListPackages and yield every package as soon as it is decoded.
+
+        :return: generator of data objects which contain json data
+        :rtype: Iterator[JSON-object]
+        """
+        messages = self._messages("ListPackages", streamed=True)
+        yield from profiling.timed_iter(
+            "convert",
+            (convert_message(message, lazy=self._lazy) for message in messages),
+            method="ListPackages",
+        )
+
+    def iter_bundles(self, fields=None, filters=None):
+        """
+        Call api.Registry/ListBundles and yield every bundle as soon as it is decoded.
+
+        Bundles are filtered and projected before their embedded JSON payloads are decoded.
+
+        :param fields: names of the fields of the bundles, all fields are returned by default
+        :type fields: Iterable[str]
+        :param dict filters: conditions of OIIInspector.filters.BundleFilter, e.g. {"package": "etcd"}
+        :return: generator of data objects which contain json data
+        :rtype: Iterator[JSON-object]
+        """
+        messages = self._messages("ListBundles", streamed=True)
+        yield from profiling.timed_iter(
+            "convert",
+            (
+                convert_message(message, lazy=self._lazy)
+                for message in select_messages(messages, fields, filters)
+            ),
+            method="ListBundles",
+        )
+
+    def iter_raw_bundles(self):
+        """
+        Call api.Registry/ListBundles and yield every bundle message as it has been received.
+
+        :return: generator of messages, JSON strings embedded in them are not decoded
+        :rtype: Iterator[dict]
+        """
+        return self._messages("ListBundles", streamed=True)
+
+    def get_bundle(self, pkg_name, channel_name, csv_name):
+        """
+        Call api.Registry/GetBundle.
+
+        :param str pkg_name: name of the package in the image
+        :param str channel_name: name of the channel in the image
+        :param str csv_name: name of the csv in the image
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        call_argument = (
+            f'\'{{"pkgName":"{pkg_name}", '
+            f'"channelName":"{channel_name}", '
+            f'"csvName":"{csv_name}"}}\''
+        )
+        return self._query("GetBundle", call_argument)
+
+    def list_packages(self):
+        """
+        Call api.Registry/ListPackages.
+
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        return list(self.iter_packages())
+
+    def list_bundles(self, fields=None, filters=None):
+        """
+        Call api.Registry/ListBundles.
+
+        :param fields: names of the fields of the bundles, all fields are returned by default
+        :type fields: Iterable[str]
+        :param dict filters: conditions of OIIInspector.filters.BundleFilter, e.g. {"package": "etcd"}
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        return list(self.iter_bundles(fields, filters))
+
+    def get_package(self, package_name):
+        """
+        Call api.Registry/GetPackage.
+
+        :param str package_name: name of the package in the image
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        call_argument = f'\'{{"name":"{package_name}"}}\''
+        return self._query("GetPackage", call_argument)
+
+    def get_bundle_for_channel(self, package_name, channel_name):
+        """
+        Call api.Registry/GetBundleForChannel.
+
+        :param str package_name: name of the package in the image
+        :param str channel_name: name of the channel in the image
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        call_argument = (
+            f'\'{{"pkgName":"{package_name}", ' f'"channelName":"{channel_name}"}}\''
+        )
+        return self._query("GetBundleForChannel", call_argument)
+
+    def get_bundle_that_replaces(self, package_name, channel_name, csv_name):
+        """
+        Call api.Registry/GetBundleThatReplaces.
+
+        :param str package_name: name of the package in the image
+        :param str channel_name: name of the channel in the image
+        :param str csv_name: name of the csv in the image
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        call_argument = (
+            f'\'{{"pkgName":"{package_name}",'
+            f' "channelName":"{channel_name}",'
+            f'"csvName":"{csv_name}"}}\''
+        )
+        return self._query("GetBundleThatReplaces", call_argument)
+
+    def get_default_bundle_that_provides(self, group, version, kind, plural):
+        """
+        Call api.Registry/GetDefaultBundleThatProvides.
+
+        :param str group: name of the group in the image
+        :param str version: version of the image
+        :param str kind: kind of the bundle
+        :param str plural: plural name of the image
+        :return: Data object which contains json data
+        :rtype: JSON-object
+        """
+        call_argument = (
+            f'\'{{"group":"{group}",'
+            f' "version":"{version}",'
+            f'"kind":"{kind}",'
+            f'"plural":"{plural}"}}\''
+        )
+        return self._query("GetDefaultBundleThatProvides", call_argument)
+
+
+def get_bundle(image_address, pkg_name, channel_name, csv_name, **session_options):
     """
     Build the command for grpCurl call on api.Registry/GetBundle, execute the call.
 
@@ -12,66 +434,88 @@ def get_bundle(image_address, pkg_name, channel_name, csv_name):
     :param str channel_name: name of the channel in the image, for grpCurl request
     :param str csv_name: name of the csv in the image, for grpCurl request
     :return: Data object which contains json data
+    :param session_options: options of the IndexSession, e.g. transport
     :rtype: JSON-object
     """
-    call_argument = (
-        f'\'{{"pkgName":"{pkg_name}", '
-        f'"channelName":"{channel_name}", '
-        f'"csvName":"{csv_name}"}}\''
-    )
-    out = use_container_manager(image_address, "GetBundle", call_argument=call_argument)
-    return convert_output(out)
+    with IndexSession(image_address, **session_options) as session:
+        return session.get_bundle(pkg_name, channel_name, csv_name)
 
 
-def list_packages(image_address):
+def list_packages(image_address, **session_options):
     """
     Build the command for grpCurl call on api.Registry/ListPackages, execute the call.
 
     :param str image_address: Image address of the image that will be started and queried
     :return: Data object which contains json data
+    :param session_options: options of the IndexSession, e.g. transport
     :rtype: JSON-object
     """
-    out = use_container_manager(image_address, "ListPackages")
-    out = f'{{"data":[ {out} ]}}'
-    json_data = []
-    for part in convert_output(out)["data"]:
-        json_data.append(convert_output(json.dumps(part)))
-    return json_data
+    with IndexSession(image_address, **session_options) as session:
+        return session.list_packages()
 
 
-def list_bundles(image_address):
+def list_bundles(image_address, fields=None, filters=None, **session_options):
     """
     Build the command for grpCurl call on api.Registry/ListBundles, execute the call.
 
     :param str image_address: Image address of the image that will be started and queried
+    :param fields: names of the fields of the bundles, all fields are returned by default
+    :type fields: Iterable[str]
+    :param dict filters: conditions of OIIInspector.filters.BundleFilter, e.g. {"package": "etcd"}
     :return: Data object which contains json data
+    :param session_options: options of the IndexSession, e.g. transport
     :rtype: JSON-object
     """
-    out = use_container_manager(image_address, "ListBundles")
-    out = f'{{"data":[ {out} ]}}'
-    json_data = []
-    for part in convert_output(out)["data"]:
-        json_data.append(convert_output(json.dumps(part)))
-    return json_data
+    with IndexSession(image_address, **session_options) as session:
+        return session.list_bundles(fields, filters)
+
+
+def iter_packages(image_address, **session_options):
+    """
+    Stream packages of api.Registry/ListPackages, the container is removed when the iteration ends.
+
+    :param str image_address: Image address of the image that will be started and queried
+    :param session_options: options of the IndexSession, e.g. transport
+    :return: generator of data objects which contain json data
+    :rtype: Iterator[JSON-object]
+    """
+    with IndexSession(image_address, **session_options) as session:
+        yield from session.iter_packages()
+
+
+def iter_bundles(image_address, fields=None, filters=None, **session_options):
+    """
+    Stream bundles of api.Registry/ListBundles, the container is removed when the iteration ends.
+
+    :param str image_address: Image address of the image that will be started and queried
+    :param fields: names of the fields of the bundles, all fields are returned by default
+    :type fields: Iterable[str]
+    :param dict filters: conditions of OIIInspector.filters.BundleFilter, e.g. {"package": "etcd"}
+    :param session_options: options of the IndexSession, e.g. transport
+    :return: generator of data objects which contain json data
+    :rtype: Iterator[JSON-object]
+    """
+    with IndexSession(image_address, **session_options) as session:
+        yield from session.iter_bundles(fields, filters)
 
 
-def get_package(image_address, package_name):
+def get_package(image_address, package_name, **session_options):
     """
     Build the command for grpCurl call on api.Registry/GetPackage, execute the call.
 
     :param str image_address: Image address of the image that will be started and queried
     :param str package_name: name of the package in the image, for grpCurl request
     :return: Data object which contains json data
+    :param session_options: options of the IndexSession, e.g. transport
     :rtype: JSON-object
     """
-    call_argument = f'\'{{"name":"{package_name}"}}\''
-    out = use_container_manager(
-        image_address, "GetPackage", call_argument=call_argument
-    )
-    return convert_output(out)
+    with IndexSession(image_address, **session_options) as session:
+        return session.get_package(package_name)
 
 
-def get_bundle_for_channel(image_address, package_name, channel_name):
+def get_bundle_for_channel(
+    image_address, package_name, channel_name, **session_options
+):
     """
     Build the command for grpCurl call on api.Registry/GetBundleForChannel, execute the call.
 
@@ -79,18 +523,16 @@ def get_bundle_for_channel(image_address, package_name, channel_name):
     :param str package_name: name of the package in the image, for grpCurl request
     :param str channel_name: name of the channel in the image, for grpCurl request
     :return: Data object which contains json data
+    :param session_options: options of the IndexSession, e.g. transport
     :rtype: JSON-object
     """
-    call_argument = (
-        f'\'{{"pkgName":"{package_name}", ' f'"channelName":"{channel_name}"}}\''
-    )
-    out = use_container_manager(
-        image_address, "GetBundleForChannel", call_argument=call_argument
-    )
-    return convert_output(out)
+    with IndexSession(image_address, **session_options) as session:
+        return session.get_bundle_for_channel(package_name, channel_name)
 
 
-def get_bundle_that_replaces(image_address, package_name, channel_name, csv_name):
+def get_bundle_that_replaces(
+    image_address, package_name, channel_name, csv_name, **session_options
+):
     """
     Build the command for grpCurl call on api.Registry/GetBundleThatReplaces, execute the call.
 
@@ -99,20 +541,16 @@ def get_bundle_that_replaces(image_address, package_name, channel_name, csv_name
     :param str channel_name: name of the channel in the image, for grpCurl request
     :param str csv_name: name of the csv in the image, for grpCurl request
     :return: Data object which contains json data
+    :param session_options: options of the IndexSession, e.g. transport
     :rtype: JSON-object
     """
-    call_argument = (
-        f'\'{{"pkgName":"{package_name}",'
-        f' "channelName":"{channel_name}",'
-        f'"csvName":"{csv_name}"}}\''
-    )
-    out = use_container_manager(
-        image_address, "GetBundleThatReplaces", call_argument=call_argument
-    )
-    return convert_output(out)
+    with IndexSession(image_address, **session_options) as session:
+        return session.get_bundle_that_replaces(package_name, channel_name, csv_name)
 
 
-def get_default_bundle_that_provides(image_address, group, version, kind, plural):
+def get_default_bundle_that_provides(
+    image_address, group, version, kind, plural, **session_options
+):
     """
     Build the command for grpCurl call on api.Registry/GetDefaultBundleThatProvides, execute the call.
 
@@ -122,36 +560,23 @@ def get_default_bundle_that_provides(image_address, group, version, kind, plural
     :param str kind: kind of the bundle, for grpCurl request
     :param str plural: plural name of the image, for grpCurl request
     :return: Data object which contains json data
+    :param session_options: options of the IndexSession, e.g. transport
     :rtype: JSON-object
     """
-    call_argument = (
-        f'\'{{"group":"{group}",'
-        f' "version":"{version}",'
-        f'"kind":"{kind}",'
-        f'"plural":"{plural}"}}\''
-    )
-    out = use_container_manager(
-        image_address, "GetDefaultBundleThatProvides", call_argument=call_argument
-    )
-    return convert_output(out)
+    with IndexSession(image_address, **session_options) as session:
+        return session.get_default_bundle_that_provides(group, version, kind, plural)
 
 
-def use_container_manager(image_address, api_address, call_argument=None):
+def use_container_manager(
+    image_address, api_address, call_argument=None, **session_options
+):
     """
     Handle usage of ContainerManager.
 
     :param str image_address: Address of the image, to be observed
     :param str api_address: API address to be accessed
     :param str call_argument: Arguments for specification of the query
+    :param session_options: options of the IndexSession, e.g. transport
     """
-    with ContainerManager(image_address) as image_manager:
-        image_manager.start_container()
-        local_image_address = image_manager.local_address_of_image
-        if call_argument is None:
-            command_to_call = (
-                f"grpcurl -plaintext {local_image_address} api.Registry/{api_address}"
-            )
-        else:
-            command_to_call = f"grpcurl -plaintext -d {call_argument} {local_image_address} api.Registry/{api_address}"
-        result = run_cmd(command_to_call)
-    return result
+    with IndexSession(image_address, **session_options) as session:
+        return session.call(api_address, call_argument=call_argument)
@@ -1,16 +1,11 @@
+import contextlib
 import json
 import sys
 
+from OIIInspector import profiling
 from OIIInspector.utils import setup_arg_parser
-from OIIInspector.oii_client import (
-    get_bundle,
-    list_packages,
-    list_bundles,
-    get_package,
-    get_bundle_for_channel,
-    get_bundle_that_replaces,
-    get_default_bundle_that_provides,
-)
+
+# modules used by the handlers are imported in the handlers, so every command imports only what it runs
 
 ADDRESS_ARG = {
     ("--address",): {
@@ -20,6 +15,71 @@ ADDRESS_ARG = {
     }
 }
 
+CACHE_ARGS = {
+    ("--no-cache",): {
+        "help": "Do not use the on-disk cache of responses",
+        "type": bool,
+        "default": False,
+    },
+    ("--refresh",): {
+        "help": "Query the index image even if the response is cached, and update the cache",
+        "type": bool,
+        "default": False,
+    },
+}
+
+DAEMON_ARG = {
+    ("--no-daemon",): {
+        "help": "Do not forward the query to the running OIIInspector daemon",
+        "type": bool,
+        "default": False,
+    }
+}
+
+OUTPUT_FORMATS = ("pretty", "compact", "ndjson")
+
+OUTPUT_ARG = {
+    ("--output-format",): {
+        "help": "Format of the output, ndjson writes every item of a listing on its own line as soon as it is read",
+        "type": str,
+        "default": "pretty",
+        "choices": OUTPUT_FORMATS,
+    }
+}
+
+PROFILE_ARG = {
+    ("--profile",): {
+        "help": "Write timing breakdown of the phases of the inspection as JSON to the file, "
+        "or to the standard error output if no file is given",
+        "type": str,
+        "count": "?",
+        "const": "-",
+    },
+    ("--metrics-file",): {
+        "help": "Write metrics of the inspection to the file in Prometheus text format, "
+        "e.g. into the directory of node-exporter textfile collector",
+        "type": str,
+    },
+}
+
+SNAPSHOT_ARG = {
+    ("--snapshot",): {
+        "help": "Address is path of a snapshot file written by the snapshot command, "
+        "the query is answered from the file without any container",
+        "type": bool,
+        "default": False,
+    }
+}
+
+COMMON_ARGS = {
+    **ADDRESS_ARG,
+    **CACHE_ARGS,
+    **DAEMON_ARG,
+    **OUTPUT_ARG,
+    **PROFILE_ARG,
+    **SNAPSHOT_ARG,
+}
+
 PKG_NAME_ARG = {
     "help": "Name of the desired package",
     "required": True,
@@ -38,28 +98,50 @@ CSV_NAME_ARG = {
     "type": str,
 }
 
-GET_INDEX_IMAGE_PACKAGES_LIST_ARGS = ADDRESS_ARG.copy()
-LIST_PACKAGES_ARGS = ADDRESS_ARG.copy()
-LIST_BUNDLES_ARGS = ADDRESS_ARG.copy()
+GET_INDEX_IMAGE_PACKAGES_LIST_ARGS = COMMON_ARGS.copy()
+LIST_PACKAGES_ARGS = COMMON_ARGS.copy()
+LIST_BUNDLES_ARGS = COMMON_ARGS.copy()
+LIST_BUNDLES_ARGS[("--fields",)] = {
+    "help": "Fields of the bundles to be printed, e.g. csvName version",
+    "type": str,
+    "count": "+",
+}
+# options of BundleFilter, keyed by their keyword argument
+BUNDLE_FILTER_ARGS = {
+    "package": ("--package", "Keep only bundles of the package"),
+    "channel": ("--channel", "Keep only bundles of the channel"),
+    "min_version": ("--min-version", "Keep only bundles of this or higher version"),
+    "max_version": ("--max-version", "Keep only bundles of lower version than this"),
+    "csv_name": (
+        "--csv-name",
+        "Keep only bundles with csv name matching the shell style pattern",
+    ),
+}
+for option, help_text in BUNDLE_FILTER_ARGS.values():
+    LIST_BUNDLES_ARGS[(option,)] = {
+        "help": help_text,
+        "type": str,
+        "group": "bundle filters",
+    }
 
-GET_PACKAGE_ARGS = ADDRESS_ARG.copy()
+GET_PACKAGE_ARGS = COMMON_ARGS.copy()
 GET_PACKAGE_ARGS[("--package-name",)] = PKG_NAME_ARG
 
-GET_BUNDLE_FOR_CHANNEL_ARGS = ADDRESS_ARG.copy()
+GET_BUNDLE_FOR_CHANNEL_ARGS = COMMON_ARGS.copy()
 GET_BUNDLE_FOR_CHANNEL_ARGS[("--package-name",)] = PKG_NAME_ARG
 GET_BUNDLE_FOR_CHANNEL_ARGS[("--channel-name",)] = CHANNEL_NAME_ARG
 
-GET_BUNDLE_ARGS = ADDRESS_ARG.copy()
+GET_BUNDLE_ARGS = COMMON_ARGS.copy()
 GET_BUNDLE_ARGS[("--package-name",)] = PKG_NAME_ARG
 GET_BUNDLE_ARGS[("--channel-name",)] = CHANNEL_NAME_ARG
 GET_BUNDLE_ARGS[("--csv-name",)] = CSV_NAME_ARG
 
-GET_BUNDLE_THAT_REPLACES_ARGS = ADDRESS_ARG.copy()
+GET_BUNDLE_THAT_REPLACES_ARGS = COMMON_ARGS.copy()
 GET_BUNDLE_THAT_REPLACES_ARGS[("--package-name",)] = PKG_NAME_ARG
 GET_BUNDLE_THAT_REPLACES_ARGS[("--channel-name",)] = CHANNEL_NAME_ARG
 GET_BUNDLE_THAT_REPLACES_ARGS[("--csv-name",)] = CSV_NAME_ARG
 
-GET_DEFAULT_BUNDLE_THAT_PROVIDES_ARGS = ADDRESS_ARG.copy()
+GET_DEFAULT_BUNDLE_THAT_PROVIDES_ARGS = COMMON_ARGS.copy()
 GET_DEFAULT_BUNDLE_THAT_PROVIDES_ARGS[("--group",)] = {
     "help": "Name of the desired group.",
     "required": True,
@@ -81,6 +163,198 @@ GET_DEFAULT_BUNDLE_THAT_PROVIDES_ARGS[("--plural",)] = {
     "type": str,
 }
 
+BATCH_ARGS = {**CACHE_ARGS, **PROFILE_ARG}
+BATCH_ARGS[("--queries",)] = {
+    "help": "JSONL or JSON file with queries, '-' reads the queries from the standard input",
+    "required": True,
+    "type": str,
+}
+
+INSPECT_IMAGES_ARGS = {**CACHE_ARGS, **OUTPUT_ARG, **PROFILE_ARG}
+INSPECT_IMAGES_ARGS[("--images",)] = {
+    "help": "Addresses of the index images",
+    "required": True,
+    "type": str,
+    "count": "+",
+}
+INSPECT_IMAGES_ARGS[("--queries",)] = {
+    "help": "JSONL or JSON file with queries run on every image, queries do not contain image address",
+    "required": True,
+    "type": str,
+}
+INSPECT_IMAGES_ARGS[("--max-pulls",)] = {
+    "help": "Maximal number of simultaneous image pulls",
+    "type": int,
+}
+INSPECT_IMAGES_ARGS[("--max-containers",)] = {
+    "help": "Maximal number of simultaneously running containers",
+    "type": int,
+}
+
+DIFF_ARGS = {**CACHE_ARGS, **OUTPUT_ARG, **PROFILE_ARG}
+DIFF_ARGS[("--old-address",)] = {
+    "help": "Address of the previous index image",
+    "required": True,
+    "type": str,
+}
+DIFF_ARGS[("--new-address",)] = {
+    "help": "Address of the new index image",
+    "required": True,
+    "type": str,
+}
+DIFF_ARGS[("--ignore-fields",)] = {
+    "help": "Fields of the bundles which are not compared, bundlePath by default",
+    "type": str,
+    "count": "*",
+}
+
+SHELL_ARGS = {**ADDRESS_ARG, **CACHE_ARGS}
+SHELL_ARGS[("--output-format",)] = {
+    "help": "Format of the responses",
+    "type": str,
+    "default": "pretty",
+    "choices": ("pretty", "compact"),
+}
+
+SNAPSHOT_ARGS = {**ADDRESS_ARG, **PROFILE_ARG}
+SNAPSHOT_ARGS[("--output",)] = {
+    "help": "Path of the written snapshot file",
+    "required": True,
+    "type": str,
+}
+
+DAEMON_ARGS = {
+    ("--socket",): {
+        "help": "Path of the unix socket of the daemon",
+        "type": str,
+    },
+    ("--capacity",): {
+        "help": "Maximal number of index images kept running",
+        "type": int,
+    },
+    ("--idle-ttl",): {
+        "help": "Seconds after which unused index image is stopped",
+        "type": float,
+    },
+    ("--metrics-port",): {
+        "help": "Serve metrics of the inspections over HTTP at the local port while the daemon runs",
+        "type": int,
+    },
+}
+
+
+def _use_response_cache(args):
+    """
+    Activate the on-disk cache of responses according to the command line arguments.
+
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    :return: context manager activating the cache
+    """
+    from OIIInspector.cache import ResponseCache, use_cache
+
+    return use_cache(None if args.no_cache else ResponseCache(refresh=args.refresh))
+
+
+@contextlib.contextmanager
+def _use_profiler(args):
+    """
+    Profile the block or collect its metrics if it is requested by the command line arguments.
+
+    The profile report and the metrics are written at the end of the block.
+
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    """
+    profiler = profiling.Profiler() if args.profile is not None else None
+    metrics = None
+    if args.metrics_file is not None:
+        from OIIInspector.metrics import InspectionMetrics
+
+        metrics = InspectionMetrics()
+    profilers = [recorder for recorder in (profiler, metrics) if recorder is not None]
+    if not profilers:
+        yield
+        return
+    try:
+        with profiling.use_profiler(profiling.ProfilerGroup(profilers)):
+            yield
+    finally:
+        if metrics is not None:
+            metrics.registry.write_textfile(args.metrics_file)
+        if profiler is not None:
+            report = json.dumps(profiler.report(), sort_keys=True, indent=4)
+            if args.profile == "-":
+                sys.stderr.write(report + "\n")
+            else:
+                with open(args.profile, "w", encoding="utf-8") as profile_file:
+                    profile_file.write(report + "\n")
+
+
+def _write_ndjson(items):
+    """
+    Write every item on its own line of the standard output, as soon as the item is available.
+
+    :param Iterable items: items to be written
+    """
+    # items produced lazily are timed in their own spans, nested in this one
+    with profiling.span("output"):
+        for item in items:
+            sys.stdout.write(json.dumps(item, separators=(",", ":")) + "\n")
+            sys.stdout.flush()
+
+
+def _write_output(resp, output_format):
+    """
+    Write the response to the standard output.
+
+    :param resp: converted response
+    :type resp: JSON-object
+    :param str output_format: one of OUTPUT_FORMATS
+    """
+    if output_format == "ndjson":
+        _write_ndjson(resp if isinstance(resp, list) else [resp])
+        return
+    with profiling.span("output"):
+        if output_format == "pretty":
+            json.dump(
+                resp, sys.stdout, sort_keys=True, indent=4, separators=(",", ": ")
+            )
+        else:
+            json.dump(resp, sys.stdout, separators=(",", ":"))
+            sys.stdout.write("\n")
+
+
+def _query(args, method, client_function, *method_args, **method_kwargs):
+    """
+    Run the query in the daemon if it is running, otherwise run it in this process.
+
+    Queries bypassing the cache are run in this process too, as the daemon uses its own cache options.
+
+    :param args: parsed command line arguments
+    :type args: argparse.Namespace
+    :param str method: name of the IndexSession method
+    :param callable client_function: oii_client function running the query locally
+    :param method_args: arguments of the query
+    :param method_kwargs: keyword arguments of the query, only for queries without positional arguments
+    :return: converted response
+    :rtype: JSON-object
+    """
+    if args.snapshot:
+        return client_function(
+            args.address, *method_args, transport="snapshot", **method_kwargs
+        )
+    if not (args.no_daemon or args.no_cache or args.refresh):
+        from OIIInspector.daemon import NOT_RUNNING, forward_query
+
+        with profiling.span("daemon", method=method):
+            resp = forward_query(
+                args.address, method, method_kwargs or list(method_args)
+            )
+        if resp is not NOT_RUNNING:
+            return resp
+    return client_function(args.address, *method_args, **method_kwargs)
+
 
 def get_bundle_main(sysargs=None):
     """
@@ -89,13 +363,23 @@ def get_bundle_main(sysargs=None):
     :returns: JSON string with bundle.
     :rtype: str
     """
+    from OIIInspector.oii_client import get_bundle
+
     parser = setup_arg_parser(GET_BUNDLE_ARGS)
     if sysargs:
         args = parser.parse_args(sysargs[1:])
     else:
         args = parser.parse_args()  # pragma: no cover"
-    resp = get_bundle(args.address, args.package_name, args.channel_name, args.csv_name)
-    json.dump(resp, sys.stdout, sort_keys=True, indent=4, separators=(",", ": "))
+    with _use_response_cache(args), _use_profiler(args):
+        resp = _query(
+            args,
+            "get_bundle",
+            get_bundle,
+            args.package_name,
+            args.channel_name,
+            args.csv_name,
+        )
+        _write_output(resp, args.output_format)
     return resp
 
 
@@ -103,16 +387,22 @@ def list_packages_main(sysargs=None):
     """
     Entrypoint for getting list of packages in the image.
 
-    :returns: JSON string with list of packages
+    :returns: JSON string with list of packages, None if the packages have been streamed as NDJSON
     :rtype: str
     """
+    from OIIInspector.oii_client import iter_packages, list_packages
+
     parser = setup_arg_parser(LIST_PACKAGES_ARGS)
     if sysargs:
         args = parser.parse_args(sysargs[1:])
     else:
         args = parser.parse_args()  # pragma: no cover"
-    resp = list_packages(args.address)
-    json.dump(resp, sys.stdout, sort_keys=True, indent=4, separators=(",", ": "))
+    with _use_response_cache(args), _use_profiler(args):
+        if args.output_format == "ndjson":
+            _write_ndjson(_query(args, "list_packages", iter_packages))
+            return None
+        resp = _query(args, "list_packages", list_packages)
+        _write_output(resp, args.output_format)
     return resp
 
 
@@ -120,9 +410,11 @@ def list_bundles_main(sysargs=None):
     """
     Entrypoint for getting list of bundles in the image.
 
-    :returns: JSON string with list of bundles.
+    :returns: JSON string with list of bundles, None if the bundles have been streamed as NDJSON.
     :rtype: str
     """
+    from OIIInspector.oii_client import iter_bundles, list_bundles
+
     parser = setup_arg_parser(LIST_BUNDLES_ARGS)
 
     if sysargs:
@@ -130,8 +422,22 @@ def list_bundles_main(sysargs=None):
     else:
         args = parser.parse_args()  # pragma: no cover"
 
-    resp = list_bundles(args.address)
-    json.dump(resp, sys.stdout, sort_keys=True, indent=4, separators=(",", ": "))
+    method_kwargs = {}
+    if args.fields:
+        method_kwargs["fields"] = args.fields
+    filters = {
+        name: getattr(args, name)
+        for name in BUNDLE_FILTER_ARGS
+        if getattr(args, name) is not None
+    }
+    if filters:
+        method_kwargs["filters"] = filters
+    with _use_response_cache(args), _use_profiler(args):
+        if args.output_format == "ndjson":
+            _write_ndjson(_query(args, "list_bundles", iter_bundles, **method_kwargs))
+            return None
+        resp = _query(args, "list_bundles", list_bundles, **method_kwargs)
+        _write_output(resp, args.output_format)
     return resp
 
 
@@ -142,6 +448,8 @@ def get_package_main(sysargs=None):
     :returns: JSON string with package metadata.
     :rtype: str
     """
+    from OIIInspector.oii_client import get_package
+
     parser = setup_arg_parser(GET_PACKAGE_ARGS)
 
     if sysargs:
@@ -149,8 +457,9 @@ def get_package_main(sysargs=None):
     else:
         args = parser.parse_args()  # pragma: no cover"
 
-    resp = get_package(args.address, args.package_name)
-    json.dump(resp, sys.stdout, sort_keys=True, indent=4, separators=(",", ": "))
+    with _use_response_cache(args), _use_profiler(args):
+        resp = _query(args, "get_package", get_package, args.package_name)
+        _write_output(resp, args.output_format)
     return resp
 
 
@@ -161,6 +470,8 @@ def get_bundle_for_channel_main(sysargs=None):
     :returns: JSON string with bundle metadata.
     :rtype: str
     """
+    from OIIInspector.oii_client import get_bundle_for_channel
+
     parser = setup_arg_parser(GET_BUNDLE_FOR_CHANNEL_ARGS)
 
     if sysargs:
@@ -168,8 +479,15 @@ def get_bundle_for_channel_main(sysargs=None):
     else:
         args = parser.parse_args()  # pragma: no cover"
 
-    resp = get_bundle_for_channel(args.address, args.package_name, args.channel_name)
-    json.dump(resp, sys.stdout, sort_keys=True, indent=4, separators=(",", ": "))
+    with _use_response_cache(args), _use_profiler(args):
+        resp = _query(
+            args,
+            "get_bundle_for_channel",
+            get_bundle_for_channel,
+            args.package_name,
+            args.channel_name,
+        )
+        _write_output(resp, args.output_format)
     return resp
 
 
@@ -180,6 +498,8 @@ def get_bundle_that_replaces_main(sysargs=None):
     :returns: JSON string with image metadata.
     :rtype: str
     """
+    from OIIInspector.oii_client import get_bundle_that_replaces
+
     parser = setup_arg_parser(GET_BUNDLE_THAT_REPLACES_ARGS)
 
     if sysargs:
@@ -187,10 +507,16 @@ def get_bundle_that_replaces_main(sysargs=None):
     else:
         args = parser.parse_args()  # pragma: no cover"
 
-    resp = get_bundle_that_replaces(
-        args.address, args.package_name, args.channel_name, args.csv_name
-    )
-    json.dump(resp, sys.stdout, sort_keys=True, indent=4, separators=(",", ": "))
+    with _use_response_cache(args), _use_profiler(args):
+        resp = _query(
+            args,
+            "get_bundle_that_replaces",
+            get_bundle_that_replaces,
+            args.package_name,
+            args.channel_name,
+            args.csv_name,
+        )
+        _write_output(resp, args.output_format)
     return resp
 
 
@@ -201,14 +527,204 @@ def get_default_bundle_that_provides_main(sysargs=None):
     :returns: JSON string with bundle image metadata.
     :rtype: str
     """
+    from OIIInspector.oii_client import get_default_bundle_that_provides
+
     parser = setup_arg_parser(GET_DEFAULT_BUNDLE_THAT_PROVIDES_ARGS)
     if sysargs:
         args = parser.parse_args(sysargs[1:])
     else:
         args = parser.parse_args()  # pragma: no cover"
 
-    resp = get_default_bundle_that_provides(
-        args.address, args.group, args.version, args.kind, args.plural
+    with _use_response_cache(args), _use_profiler(args):
+        resp = _query(
+            args,
+            "get_default_bundle_that_provides",
+            get_default_bundle_that_provides,
+            args.group,
+            args.version,
+            args.kind,
+            args.plural,
+        )
+        _write_output(resp, args.output_format)
+    return resp
+
+
+def batch_main(sysargs=None):
+    """
+    Entrypoint for running file of queries, results are written as NDJSON in order of the queries.
+
+    :returns: list of results of the queries.
+    :rtype: list
+    """
+    from OIIInspector.batch import read_queries, run_queries
+
+    parser = setup_arg_parser(BATCH_ARGS)
+    if sysargs:
+        args = parser.parse_args(sysargs[1:])
+    else:
+        args = parser.parse_args()  # pragma: no cover"
+
+    resp = []
+    with _use_response_cache(args), _use_profiler(args):
+        if args.queries == "-":
+            queries = list(read_queries(sys.stdin))
+        else:
+            with open(args.queries, "r", encoding="utf-8") as queries_file:
+                queries = list(read_queries(queries_file))
+        for result in run_queries(queries):
+            sys.stdout.write(json.dumps(result, sort_keys=True) + "\n")
+            sys.stdout.flush()
+            resp.append(result)
+    return resp
+
+
+def inspect_images_main(sysargs=None):
+    """
+    Entrypoint for running the same queries on many images concurrently.
+
+    :returns: JSON object with results of the queries keyed by image.
+    :rtype: dict
+    """
+    from OIIInspector.batch import read_queries
+    from OIIInspector.parallel import (
+        DEFAULT_MAX_CONTAINERS,
+        DEFAULT_MAX_PULLS,
+        inspect_images,
     )
-    json.dump(resp, sys.stdout, sort_keys=True, indent=4, separators=(",", ": "))
+
+    parser = setup_arg_parser(INSPECT_IMAGES_ARGS)
+    if sysargs:
+        args = parser.parse_args(sysargs[1:])
+    else:
+        args = parser.parse_args()  # pragma: no cover"
+
+    with open(args.queries, "r", encoding="utf-8") as queries_file:
+        queries = list(read_queries(queries_file))
+    with _use_response_cache(args), _use_profiler(args):
+        resp = inspect_images(
+            args.images,
+            queries,
+            max_pulls=(
+                args.max_pulls if args.max_pulls is not None else DEFAULT_MAX_PULLS
+            ),
+            max_containers=(
+                args.max_containers
+                if args.max_containers is not None
+                else DEFAULT_MAX_CONTAINERS
+            ),
+        )
+        _write_output(resp, args.output_format)
     return resp
+
+
+def diff_main(sysargs=None):
+    """
+    Entrypoint for comparing bundles of two index images, ndjson output has one line for every changed bundle.
+
+    :returns: JSON object with added, removed and changed bundles.
+    :rtype: dict
+    """
+    from OIIInspector.index_diff import DEFAULT_IGNORED_FIELDS, diff_index_images
+
+    parser = setup_arg_parser(DIFF_ARGS)
+    if sysargs:
+        args = parser.parse_args(sysargs[1:])
+    else:
+        args = parser.parse_args()  # pragma: no cover"
+
+    with _use_response_cache(args), _use_profiler(args):
+        ignore_fields = args.ignore_fields
+        if ignore_fields is None:
+            ignore_fields = list(DEFAULT_IGNORED_FIELDS)
+        resp = diff_index_images(
+            args.old_address, args.new_address, ignore_fields=ignore_fields
+        )
+        if args.output_format == "ndjson":
+            _write_ndjson(
+                {"change": change, **bundle}
+                for change in ("added", "removed", "changed")
+                for bundle in resp[change]
+            )
+        else:
+            _write_output(resp, args.output_format)
+    return resp
+
+
+def shell_main(sysargs=None):
+    """
+    Entrypoint for the interactive shell, which keeps the index image running until the shell is left.
+
+    :returns: None, the shell runs until it is left.
+    """
+    from OIIInspector.oii_client import IndexSession
+    from OIIInspector.shell import InspectorShell
+
+    parser = setup_arg_parser(SHELL_ARGS)
+    if sysargs:
+        args = parser.parse_args(sysargs[1:])
+    else:
+        args = parser.parse_args()  # pragma: no cover"
+
+    with _use_response_cache(args), IndexSession(args.address) as session:
+        InspectorShell(session, output_format=args.output_format).cmdloop()
+
+
+def snapshot_main(sysargs=None):
+    """
+    Entrypoint for exporting all packages and bundles of the image to a compressed snapshot file.
+
+    :returns: statistics of the snapshot
+    :rtype: dict
+    """
+    from OIIInspector.snapshot import write_snapshot
+
+    parser = setup_arg_parser(SNAPSHOT_ARGS)
+    if sysargs:
+        args = parser.parse_args(sysargs[1:])
+    else:
+        args = parser.parse_args()  # pragma: no cover"
+
+    with _use_profiler(args):
+        resp = write_snapshot(args.address, args.output)
+        _write_output(resp, "pretty")
+    return resp
+
+
+def daemon_main(sysargs=None):
+    """
+    Entrypoint for running the daemon, which keeps recently used index images running for other invocations.
+
+    :returns: None, the daemon runs until it is interrupted.
+    """
+    from OIIInspector.daemon import (
+        DEFAULT_CAPACITY,
+        DEFAULT_IDLE_TTL,
+        DEFAULT_SOCKET_PATH,
+        InspectorDaemon,
+    )
+    from OIIInspector.metrics import InspectionMetrics
+
+    parser = setup_arg_parser(DAEMON_ARGS)
+    if sysargs:
+        args = parser.parse_args(sysargs[1:])
+    else:
+        args = parser.parse_args()  # pragma: no cover"
+
+    with contextlib.ExitStack() as stack:
+        daemon_options = {}
+        if args.metrics_port is not None:
+            metrics = InspectionMetrics()
+            stack.enter_context(metrics.registry.serve(args.metrics_port))
+            daemon_options["profiler"] = metrics
+        daemon = stack.enter_context(
+            InspectorDaemon(
+                args.socket if args.socket is not None else DEFAULT_SOCKET_PATH,
+                args.capacity if args.capacity is not None else DEFAULT_CAPACITY,
+                args.idle_ttl if args.idle_ttl is not None else DEFAULT_IDLE_TTL,
+                **daemon_options,
+            )
+        )
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,82 @@
+"""Concurrent inspection of many index images with bounded number of pulls and running containers."""
+
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from OIIInspector.batch import run_queries
+from OIIInspector.container_manager import ContainerLimits
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_PULLS = 2
+DEFAULT_MAX_CONTAINERS = 4
+
+
+def _inspect_image(image, queries, container_limits, session_options):
+    """
+    Run the queries on one image, any failure is isolated to the result of the image.
+
+    :param str image: address of the index image
+    :param list queries: queries without image address
+    :param ContainerLimits container_limits: limits shared by all workers
+    :param dict session_options: options of the IndexSession
+    :return: {"results": list of result records} or {"error": description of the failure}
+    :rtype: dict
+    """
+    try:
+        image_queries = [{**query, "image": image} for query in queries]
+        return {
+            "results": list(
+                run_queries(
+                    image_queries, container_limits=container_limits, **session_options
+                )
+            )
+        }
+    except Exception as error:
+        log.error(f"Inspection of {image} failed with {error}")
+        return {"error": f"{type(error).__name__}: {error}"}
+
+
+def inspect_images(
+    images,
+    queries,
+    max_pulls=DEFAULT_MAX_PULLS,
+    max_containers=DEFAULT_MAX_CONTAINERS,
+    max_workers=None,
+    **session_options,
+):
+    """
+    Run the same queries on many images concurrently.
+
+    Every worker inspects one image in its own IndexSession, so every container gets its own reserved port.
+    Pulls and running containers are bounded across all workers.
+
+    :param Iterable[str] images: addresses of the index images
+    :param Iterable queries: queries with "method", optional "args" and optional "id", see batch.read_queries
+    :param int max_pulls: maximal number of simultaneous image pulls, None for no limit
+    :param int max_containers: maximal number of simultaneously running containers, None for no limit
+    :param int max_workers: number of worker threads, max_containers by default
+    :param session_options: options of the IndexSession, e.g. transport
+    :return: results keyed by image, each value is {"results": list of result records} or {"error": description}
+    :rtype: dict
+    """
+    images = list(dict.fromkeys(images))
+    queries = list(queries)
+    if not images:
+        return {}
+    container_limits = ContainerLimits(max_pulls, max_containers)
+    workers = max_workers or max_containers or len(images)
+    with ThreadPoolExecutor(max_workers=min(workers, len(images))) as executor:
+        # workers run in copy of the current context, so they use the cache activated by the caller
+        futures = {
+            image: executor.submit(
+                contextvars.copy_context().run,
+                _inspect_image,
+                image,
+                queries,
+                container_limits,
+                session_options,
+            )
+            for image in images
+        }
+    return {image: future.result() for image, future in futures.items()}
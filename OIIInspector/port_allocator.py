@@ -0,0 +1,145 @@
+"""Allocation of free local ports shared by all OIIInspector processes of the user on the host."""
+
+import contextlib
+import fcntl
+import logging
+import os
+import socket
+import stat
+import tempfile
+import OIIInspector.exceptions as exceptions
+
+log = logging.getLogger(__name__)
+
+# reservations are kept in a directory of the user accessible only by the user, ports used by the processes of
+# other users are detected when the container fails to bind them
+RESERVATIONS_DIR = os.path.join(
+    tempfile.gettempdir(), f"OIIInspector-ports-{os.getuid()}"
+)
+MAX_ALLOCATION_TRIES = 100
+
+# ports reserved by this process, distinguishes reservations of threads sharing one PID
+_process_reservations = set()
+
+
+def _check_reservations_dir():
+    """
+    Create the reservations directory accessible only by the user, or check the existing one.
+
+    :raises OIIInspectorError: if the directory is a symlink, it is owned by another user or other users can
+        access it
+    """
+    os.makedirs(RESERVATIONS_DIR, mode=0o700, exist_ok=True)
+    directory_stat = os.lstat(RESERVATIONS_DIR)
+    if (
+        not stat.S_ISDIR(directory_stat.st_mode)
+        or directory_stat.st_uid != os.getuid()
+        or directory_stat.st_mode & 0o077
+    ):
+        raise exceptions.OIIInspectorError(
+            f"Directory {RESERVATIONS_DIR} of the port reservations must be accessible only by its owner"
+        )
+
+
+@contextlib.contextmanager
+def _reservations_lock():
+    """Hold the lock of the user guarding the port reservations."""
+    _check_reservations_dir()
+    lock_fd = os.open(
+        os.path.join(RESERVATIONS_DIR, ".lock"),
+        os.O_WRONLY | os.O_CREAT | os.O_NOFOLLOW,
+        0o600,
+    )
+    with os.fdopen(lock_fd, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _reservation_path(port):
+    """
+    Get path of the file reserving the port.
+
+    :param int port: reserved port
+    :return: path of the reservation file
+    :rtype: str
+    """
+    return os.path.join(RESERVATIONS_DIR, str(port))
+
+
+def _reservation_owner(port):
+    """
+    Get PID of the living process which reserved the port.
+
+    :param int port: port to be checked
+    :return: PID of the owner, or None if the port is not reserved or the owner does not exist anymore
+    :rtype: int or None
+    """
+    try:
+        with open(_reservation_path(port)) as reservation:
+            pid = int(reservation.read())
+    except (OSError, ValueError):
+        return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass
+    return pid
+
+
+def _get_kernel_free_port():
+    """
+    Ask the kernel for a currently free local port.
+
+    :return: port number
+    :rtype: int
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("", 0))
+        return sock.getsockname()[1]
+
+
+def reserve_free_port():
+    """
+    Reserve a free local port for this process.
+
+    The port is assigned by the kernel and it is recorded in a reservation file under a lock of the user,
+    so concurrent OIIInspector processes of the user never use the same port. Reservations of terminated
+    processes are reused.
+
+    :return: reserved port
+    :rtype: int
+    :raises NoFreePortFound: if no port free of reservation has been found
+    """
+    with _reservations_lock():
+        for _ in range(MAX_ALLOCATION_TRIES):
+            port = _get_kernel_free_port()
+            owner = _reservation_owner(port)
+            if port in _process_reservations or owner not in (None, os.getpid()):
+                log.debug("Port %d is already reserved, trying another.", port)
+                continue
+            with open(_reservation_path(port), "w") as reservation:
+                reservation.write(str(os.getpid()))
+            _process_reservations.add(port)
+            return port
+    raise exceptions.NoFreePortFound(
+        f"No free port has been found after {MAX_ALLOCATION_TRIES} attempts."
+    )
+
+
+def release_port(port):
+    """
+    Release the port reserved by this process.
+
+    :param int port: port to be released
+    """
+    with _reservations_lock():
+        if port not in _process_reservations:
+            return
+        _process_reservations.discard(port)
+        if _reservation_owner(port) == os.getpid():
+            os.remove(_reservation_path(port))
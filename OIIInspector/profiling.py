@@ -0,0 +1,279 @@
+"""Timing spans and counters of the phases of an inspection, recorded only while a profiler is active."""
+
+import contextlib
+import contextvars
+import threading
+import time
+
+_active_profiler = contextvars.ContextVar("active_profiler", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def get_active_profiler():
+    """
+    Get profiler recording spans of the current context.
+
+    :return: active profiler or None if nothing is recorded
+    :rtype: Profiler
+    """
+    return _active_profiler.get()
+
+
+@contextlib.contextmanager
+def use_profiler(profiler):
+    """
+    Record spans and counters of all operations run in the block by the profiler.
+
+    Threads started with a copy of the context, e.g. workers of OIIInspector.parallel, record to the same profiler.
+
+    :param profiler: profiler to be used, or any object with the finish and count methods of Profiler, e.g.
+        OIIInspector.metrics.InspectionMetrics; None disables profiling
+    :type profiler: Profiler
+    """
+    token = _active_profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _active_profiler.reset(token)
+
+
+class Span:
+    """Timed operation, time of the spans nested in it is tracked separately from its own time."""
+
+    def __init__(self, name, attributes, parent):
+        """
+        Initialize the Span.
+
+        :param str name: name of the operation
+        :param dict attributes: attributes of the operation, e.g. the called method
+        :param Span parent: span in which this span runs, None for top level span
+        """
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.child_duration = 0.0
+        # exception which has ended the operation, None if the operation has succeeded
+        self.error = None
+
+    def add_time(self, duration):
+        """
+        Add time spent in the operation, the time is also counted as time of the nested spans of its parent.
+
+        :param float duration: seconds spent in the operation
+        """
+        self.duration += duration
+        if self.parent is not None:
+            self.parent.child_duration += duration
+
+    @property
+    def self_duration(self):
+        """Return time spent in the operation itself, outside of the nested spans."""
+        return max(self.duration - self.child_duration, 0.0)
+
+
+class Profiler:
+    """
+    Recorder of the spans and counters of one or more inspections.
+
+    Hooks are called with every finished Span, so library users can forward the spans to their own tracing.
+    """
+
+    def __init__(self, hooks=()):
+        """
+        Initialize the Profiler.
+
+        :param Iterable[callable] hooks: functions called with every finished Span
+        """
+        self._hooks = list(hooks)
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._spans = []
+        self._counters = {}
+
+    def add_hook(self, hook):
+        """
+        Call the hook with every span finished from now on.
+
+        :param callable hook: function called with the finished Span
+        """
+        with self._lock:
+            self._hooks.append(hook)
+
+    def finish(self, span):
+        """
+        Record the finished span and pass it to the hooks.
+
+        :param Span span: finished span
+        """
+        with self._lock:
+            self._spans.append(span)
+            hooks = list(self._hooks)
+        for hook in hooks:
+            hook(span)
+
+    def count(self, name, value=1):
+        """
+        Increase the counter.
+
+        :param str name: name of the counter, e.g. "subprocesses"
+        :param int value: increment of the counter
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def report(self):
+        """
+        Get machine readable breakdown of the recorded time.
+
+        :return: {"spans": finished spans in order of their finish, "phases": count, total and own time of
+            the spans summed by their name, "counters": values of the counters}
+        :rtype: dict
+        """
+        with self._lock:
+            spans = list(self._spans)
+            counters = dict(self._counters)
+        phases = {}
+        for span in spans:
+            phase = phases.setdefault(
+                span.name, {"count": 0, "total_s": 0.0, "self_s": 0.0}
+            )
+            phase["count"] += 1
+            phase["total_s"] += span.duration
+            phase["self_s"] += span.self_duration
+        return {
+            "spans": [
+                {
+                    "name": span.name,
+                    "start_s": span.start - self._start,
+                    "duration_s": span.duration,
+                    "self_s": span.self_duration,
+                    **span.attributes,
+                }
+                for span in spans
+            ],
+            "phases": phases,
+            "counters": counters,
+        }
+
+
+class ProfilerGroup:
+    """Profilers recording the same spans and counters, e.g. Profiler and InspectionMetrics."""
+
+    def __init__(self, profilers):
+        """
+        Initialize the ProfilerGroup.
+
+        :param Iterable profilers: profilers of the group
+        """
+        self._profilers = list(profilers)
+
+    def finish(self, span):
+        """
+        Pass the finished span to all profilers.
+
+        :param Span span: finished span
+        """
+        for profiler in self._profilers:
+            profiler.finish(span)
+
+    def count(self, name, value=1):
+        """
+        Increase the counter of all profilers.
+
+        :param str name: name of the counter
+        :param int value: increment of the counter
+        """
+        for profiler in self._profilers:
+            profiler.count(name, value)
+
+
+def count(name, value=1):
+    """
+    Increase the counter of the active profiler.
+
+    :param str name: name of the counter, e.g. "subprocesses" or "bytes_read"
+    :param int value: increment of the counter
+    """
+    profiler = _active_profiler.get()
+    if profiler is not None:
+        profiler.count(name, value)
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    Time the block as a span of the active profiler, nothing is recorded if no profiler is active.
+
+    :param str name: name of the operation, e.g. "pull"
+    :param attributes: attributes of the operation, e.g. the called method
+    """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        yield
+        return
+    current = Span(name, attributes, _current_span.get())
+    token = _current_span.set(current)
+    try:
+        yield
+    except BaseException as error:
+        current.error = error
+        raise
+    finally:
+        _current_span.reset(token)
+        current.add_time(time.perf_counter() - current.start)
+        profiler.finish(current)
+
+
+def timed_iter(name, iterable, **attributes):
+    """
+    Time the iteration as a span of the active profiler, only the time spent in producing the items is counted.
+
+    :param str name: name of the operation, e.g. "query"
+    :param Iterable iterable: iterated items
+    :param attributes: attributes of the operation, the number of the items is added as "items"
+    :return: iterator of the items
+    :rtype: Iterator
+    """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        return iter(iterable)
+    return _timed_iter(profiler, name, iter(iterable), attributes)
+
+
+def _timed_iter(profiler, name, iterator, attributes):
+    """
+    Yield the items and time the production of every item, the span is finished when the iteration ends.
+
+    :param Profiler profiler: profiler recording the span
+    :param str name: name of the operation
+    :param Iterator iterator: iterated items
+    :param dict attributes: attributes of the operation
+    :return: iterator of the items
+    :rtype: Iterator
+    """
+    current = Span(name, attributes, _current_span.get())
+    items = 0
+    try:
+        while True:
+            token = _current_span.set(current)
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            except BaseException as error:
+                current.error = error
+                raise
+            finally:
+                _current_span.reset(token)
+                current.add_time(time.perf_counter() - start)
+            items += 1
+            yield item
+    finally:
+        # iteration stopped by the consumer stops the iterated generator too, e.g. it kills its process
+        if hasattr(iterator, "close"):
+            iterator.close()
+        current.attributes["items"] = items
+        profiler.finish(current)
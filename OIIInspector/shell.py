@@ -0,0 +1,235 @@
+"""Interactive shell running api.Registry calls against one index image, which is kept running until exit."""
+
+import cmd
+import json
+import shlex
+
+try:
+    import readline
+except ImportError:  # pragma: no cover
+    readline = None
+
+# characters separating the completed words, package and CSV names contain "-" and "." which readline splits by default
+COMPLETER_DELIMS = " \t\n"
+
+
+class InspectorShell(cmd.Cmd):
+    """
+    Shell with a command for every api.Registry call of IndexSession, arguments are separated by spaces.
+
+    Names of the packages, channels and CSVs are listed once with a single ListBundles call when the shell starts,
+    so completion does not query the image.
+    """
+
+    intro = "Index image inspector shell, type help or ? to list the commands, exit or Ctrl-D to leave."
+    prompt = "oii> "
+
+    def __init__(self, session, output_format="pretty", stdin=None, stdout=None):
+        """
+        Initialize the InspectorShell.
+
+        :param IndexSession session: session of the inspected index image, it is not closed by the shell
+        :param str output_format: "pretty" or "compact" JSON output of the responses
+        :param file stdin: input of the commands, standard input by default
+        :param file stdout: output of the responses, standard output by default
+        """
+        super().__init__(stdin=stdin, stdout=stdout)
+        if stdin is not None:
+            self.use_rawinput = False
+        self.session = session
+        self.output_format = output_format
+        self._packages = []
+        # channel names keyed by package, CSV names keyed by (package, channel)
+        self._channels = {}
+        self._csv_names = {}
+        self._completer_delims = None
+
+    def preloop(self):
+        """Start the container by listing names of the packages, channels and CSVs for completion."""
+        if readline is not None and self.use_rawinput:
+            self._completer_delims = readline.get_completer_delims()
+            readline.set_completer_delims(COMPLETER_DELIMS)
+        try:
+            bundles = self.session.list_bundles(
+                fields=["packageName", "channelName", "csvName"]
+            )
+        except Exception as e:
+            self.stdout.write(f"Error: {e}, names will not be completed\n")
+            return
+        csv_names = {}
+        for bundle in bundles:
+            key = (bundle["packageName"], bundle["channelName"])
+            csv_names.setdefault(key, set()).add(bundle["csvName"])
+        channels = {}
+        for package, channel in csv_names:
+            channels.setdefault(package, set()).add(channel)
+        self._packages = sorted(channels)
+        self._channels = {package: sorted(names) for package, names in channels.items()}
+        self._csv_names = {key: sorted(names) for key, names in csv_names.items()}
+
+    def postloop(self):
+        """Restore completion of the other readline users."""
+        if self._completer_delims is not None:
+            readline.set_completer_delims(self._completer_delims)
+            self._completer_delims = None
+
+    def emptyline(self):
+        """Do nothing on empty line, instead of repeating the last command."""
+
+    def default(self, line):
+        """Report unknown command."""
+        self.stdout.write(
+            f"Unknown command: {line.split()[0]}, type help to list the commands\n"
+        )
+
+    def _write(self, resp):
+        """
+        Write the response to the output of the shell.
+
+        :param resp: converted response
+        :type resp: JSON-object
+        """
+        if self.output_format == "pretty":
+            output = json.dumps(resp, sort_keys=True, indent=4, separators=(",", ": "))
+        else:
+            output = json.dumps(resp, separators=(",", ":"))
+        self.stdout.write(output + "\n")
+
+    def _parse(self, line, usage, count, optional=0):
+        """
+        Split the arguments of the command, wrong arguments are reported with the usage of the command.
+
+        :param str line: arguments of the command
+        :param str usage: usage of the command
+        :param int count: number of the required arguments
+        :param int optional: number of the optional arguments
+        :return: arguments of the command, None if they are not valid
+        :rtype: list
+        """
+        try:
+            args = shlex.split(line)
+        except ValueError as e:
+            self.stdout.write(f"Error: {e}\n")
+            return None
+        if not count <= len(args) <= count + optional:
+            self.stdout.write(f"Usage: {usage}\n")
+            return None
+        return args
+
+    def _respond(self, method, *args, **kwargs):
+        """
+        Call the IndexSession method and write its response, any error is written too, so the shell keeps running.
+
+        :param str method: name of the IndexSession method
+        :param args: arguments of the method
+        :param kwargs: keyword arguments of the method
+        """
+        try:
+            resp = getattr(self.session, method)(*args, **kwargs)
+        except Exception as e:
+            self.stdout.write(f"Error: {e}\n")
+            return
+        self._write(resp)
+
+    def _complete(self, text, line, begidx, argument_kinds):
+        """
+        Complete the argument of the command by its kind.
+
+        :param str text: completed prefix of the argument
+        :param str line: whole command line
+        :param int begidx: position of the completed argument in the line
+        :param tuple argument_kinds: "package", "channel" or "csv" kind of every argument of the command
+        :return: completions of the argument
+        :rtype: list
+        """
+        try:
+            previous = shlex.split(line[:begidx])[1:]
+        except ValueError:
+            return []
+        position = len(previous)
+        if position >= len(argument_kinds):
+            return []
+        kind = argument_kinds[position]
+        if kind == "package":
+            candidates = self._packages
+        elif kind == "channel":
+            candidates = self._channels.get(previous[0], [])
+        else:
+            candidates = self._csv_names.get((previous[0], previous[1]), [])
+        return [candidate for candidate in candidates if candidate.startswith(text)]
+
+    def do_list_packages(self, line):
+        """List packages of the image, usage: list_packages."""
+        if self._parse(line, "list_packages", 0) is not None:
+            self._respond("list_packages")
+
+    def do_list_bundles(self, line):
+        """List bundles of the image, optionally of the package and its channel: list_bundles [PACKAGE [CHANNEL]]."""
+        args = self._parse(line, "list_bundles [PACKAGE [CHANNEL]]", 0, optional=2)
+        if args is not None:
+            self._respond(
+                "list_bundles", filters=dict(zip(("package", "channel"), args))
+            )
+
+    def complete_list_bundles(self, text, line, begidx, endidx):
+        """Complete package and channel names."""
+        return self._complete(text, line, begidx, ("package", "channel"))
+
+    def do_get_package(self, line):
+        """Get package metadata, usage: get_package PACKAGE."""
+        args = self._parse(line, "get_package PACKAGE", 1)
+        if args is not None:
+            self._respond("get_package", *args)
+
+    def complete_get_package(self, text, line, begidx, endidx):
+        """Complete package names."""
+        return self._complete(text, line, begidx, ("package",))
+
+    def do_get_bundle(self, line):
+        """Get bundle, usage: get_bundle PACKAGE CHANNEL CSV."""
+        args = self._parse(line, "get_bundle PACKAGE CHANNEL CSV", 3)
+        if args is not None:
+            self._respond("get_bundle", *args)
+
+    def complete_get_bundle(self, text, line, begidx, endidx):
+        """Complete package, channel and CSV names."""
+        return self._complete(text, line, begidx, ("package", "channel", "csv"))
+
+    def do_get_bundle_for_channel(self, line):
+        """Get bundle metadata for desired channel, usage: get_bundle_for_channel PACKAGE CHANNEL."""
+        args = self._parse(line, "get_bundle_for_channel PACKAGE CHANNEL", 2)
+        if args is not None:
+            self._respond("get_bundle_for_channel", *args)
+
+    def complete_get_bundle_for_channel(self, text, line, begidx, endidx):
+        """Complete package and channel names."""
+        return self._complete(text, line, begidx, ("package", "channel"))
+
+    def do_get_bundle_that_replaces(self, line):
+        """Get bundle metadata that replaces specified bundle, usage: get_bundle_that_replaces PACKAGE CHANNEL CSV."""
+        args = self._parse(line, "get_bundle_that_replaces PACKAGE CHANNEL CSV", 3)
+        if args is not None:
+            self._respond("get_bundle_that_replaces", *args)
+
+    def complete_get_bundle_that_replaces(self, text, line, begidx, endidx):
+        """Complete package, channel and CSV names."""
+        return self._complete(text, line, begidx, ("package", "channel", "csv"))
+
+    def do_get_default_bundle_that_provides(self, line):
+        """Get bundle providing the API, usage: get_default_bundle_that_provides GROUP VERSION KIND PLURAL."""
+        args = self._parse(
+            line, "get_default_bundle_that_provides GROUP VERSION KIND PLURAL", 4
+        )
+        if args is not None:
+            self._respond("get_default_bundle_that_provides", *args)
+
+    def do_exit(self, line):
+        """Leave the shell and stop the container, usage: exit."""
+        return True
+
+    do_quit = do_exit
+
+    def do_EOF(self, line):
+        """Leave the shell on Ctrl-D."""
+        self.stdout.write("\n")
+        return True
@@ -0,0 +1,532 @@
+"""Compact offline snapshot of the whole content of an index image, answering api.Registry calls without the image."""
+
+import functools
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from OIIInspector.catalog_index import CatalogIndex
+from OIIInspector.oii_client import IndexSession
+from OIIInspector.utils import parse_call_argument
+import OIIInspector.exceptions as exceptions
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"OIISNAP1"
+# offset and length of the compressed index, followed by MAGIC
+TRAILER = struct.Struct(">QQ8s")
+SNAPSHOT_VERSION = 1
+DEFAULT_COMPRESSION_LEVEL = 9
+BLOCK_CACHE_SIZE = 16
+
+
+def _pack_bundle(message):
+    """
+    Drop copy of the CSV from the object field of the bundle message, the CSV is stored only in csvJson.
+
+    :param dict message: raw bundle message
+    :return: message with None in place of the CSV in the object field
+    :rtype: dict
+    """
+    csv = message.get("csvJson")
+    if not csv or csv not in message.get("object", ()):
+        return message
+    return {
+        **message,
+        "object": [None if obj == csv else obj for obj in message["object"]],
+    }
+
+
+def _unpack_bundle(message):
+    """
+    Restore the CSV in the object field of the bundle message packed by _pack_bundle.
+
+    :param dict message: packed bundle message
+    :return: raw bundle message
+    :rtype: dict
+    """
+    if None in message.get("object", ()):
+        message["object"] = [
+            message["csvJson"] if obj is None else obj for obj in message["object"]
+        ]
+    return message
+
+
+def _provider_key(group, version, kind):
+    """
+    Get key of the API in the index of the providers.
+
+    :param str group: group of the API
+    :param str version: version of the API
+    :param str kind: kind of the API
+    :return: key of the API
+    :rtype: str
+    """
+    return f"{group}/{version}/{kind}"
+
+
+def _spill_bundles(session, spill):
+    """
+    Read the bundles by one ListBundles call of the session and write them to the spill file as they are read.
+
+    :param IndexSession session: session of the index image, the response cache of the session is used
+    :param file spill: binary file the packed bundle messages are written to, each prefixed with a newline
+    :return: (spans of the bundles of every package in the spill file, number of the bundles, index of the
+        providers, size of the bundle messages as compact JSON)
+    :rtype: tuple
+    """
+    # [offset, length] of the runs of adjacent bundles of every package
+    spans = {}
+    bundle_count = 0
+    providers = {}
+    raw_bytes = 0
+    for message in session.iter_raw_bundles():
+        bundle_count += 1
+        package_name = message.get("packageName")
+        raw_bytes += len(json.dumps(message, separators=(",", ":")))
+        line = b"\n" + json.dumps(_pack_bundle(message), separators=(",", ":")).encode(
+            "utf-8"
+        )
+        offset = spill.tell()
+        spill.write(line)
+        package_spans = spans.setdefault(package_name, [])
+        if package_spans and sum(package_spans[-1]) == offset:
+            package_spans[-1][1] += len(line)
+        else:
+            package_spans.append([offset, len(line)])
+        for api in message.get("providedApis", ()):
+            key = _provider_key(api.get("group"), api.get("version"), api.get("kind"))
+            if package_name not in providers.setdefault(key, []):
+                providers[key].append(package_name)
+    return spans, bundle_count, providers, raw_bytes
+
+
+def _compress_block(package, spill, spans, compression_level):
+    """
+    Compress block of the package, its bundles are read back from the spill file.
+
+    :param dict package: package message
+    :param file spill: spill file written by _spill_bundles
+    :param list spans: [offset, length] of the bundles of the package in the spill file
+    :param int compression_level: zlib compression level of the block
+    :return: compressed block
+    :rtype: bytes
+    """
+    compressor = zlib.compressobj(compression_level)
+    chunks = [
+        compressor.compress(json.dumps(package, separators=(",", ":")).encode("utf-8"))
+    ]
+    for offset, length in spans:
+        spill.seek(offset)
+        chunks.append(compressor.compress(spill.read(length)))
+    chunks.append(compressor.flush())
+    return b"".join(chunks)
+
+
+def write_snapshot(
+    image_address, path, compression_level=DEFAULT_COMPRESSION_LEVEL, **session_options
+):
+    """
+    Export all packages, channels and bundles of the index image to the snapshot file.
+
+    The bundles are read by one ListBundles call of one running container and stored as they have been received,
+    with the embedded CSVs and manifests. They are spilled to a temporary file as they are read, so only one
+    package is held in memory when its block is compressed. Packages are stored as GetPackage answers them, with
+    the heads of their channels. Every package is
+    compressed as a separate block, and the index of the blocks is stored at the end of the file, so a point query
+    decompresses only the block of its package. The file is replaced atomically.
+
+    :param str image_address: address of the index image
+    :param str path: path of the snapshot file
+    :param int compression_level: zlib compression level of the blocks
+    :param session_options: options of the IndexSession, e.g. transport
+    :return: {"packages": number of packages, "bundles": number of bundles, "rawBytes": size of the bundle
+        messages as compact JSON, "snapshotBytes": size of the snapshot file}
+    :rtype: dict
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.TemporaryFile(dir=directory, prefix=".snapshot-spill-") as spill:
+        with IndexSession(image_address, **session_options) as session:
+            spans, bundle_count, providers, raw_bytes = _spill_bundles(session, spill)
+            packages = {
+                package["name"]: session.get_package(package["name"])
+                for package in session.list_packages()
+            }
+        # packages without bundles are kept, bundles of packages missing in ListPackages too
+        package_names = list(packages) + sorted(set(spans) - set(packages))
+
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=directory, prefix=".snapshot-", delete=False
+        ) as snapshot_file:
+            try:
+                snapshot_file.write(MAGIC)
+                index_packages = []
+                for package_name in package_names:
+                    block = _compress_block(
+                        packages.get(package_name, {"name": package_name}),
+                        spill,
+                        spans.get(package_name, ()),
+                        compression_level,
+                    )
+                    index_packages.append(
+                        [package_name, snapshot_file.tell(), len(block)]
+                    )
+                    snapshot_file.write(block)
+                index = {
+                    "version": SNAPSHOT_VERSION,
+                    "image": image_address,
+                    "packages": index_packages,
+                    "providers": providers,
+                }
+                index_block = zlib.compress(
+                    json.dumps(index).encode("utf-8"), compression_level
+                )
+                index_offset = snapshot_file.tell()
+                snapshot_file.write(index_block)
+                snapshot_file.write(TRAILER.pack(index_offset, len(index_block), MAGIC))
+            except BaseException:
+                snapshot_file.close()
+                os.remove(snapshot_file.name)
+                raise
+    os.replace(snapshot_file.name, path)
+    return {
+        "packages": len(package_names),
+        "bundles": bundle_count,
+        "rawBytes": raw_bytes,
+        "snapshotBytes": os.path.getsize(path),
+    }
+
+
+class Snapshot:
+    """
+    Read-only api.Registry queries of a snapshot file written by write_snapshot.
+
+    Only the index of the blocks is read when the snapshot is opened. Point queries decompress the block of their
+    package, recently used blocks are kept decompressed and indexed by OIIInspector.catalog_index.CatalogIndex.
+    """
+
+    def __init__(self, path, block_cache_size=BLOCK_CACHE_SIZE):
+        """
+        Initialize the Snapshot.
+
+        :param str path: path of the snapshot file
+        :param int block_cache_size: number of packages kept decompressed
+        :raises OIIInspectorError: if the file is not a snapshot of a supported version
+        """
+        self._path = path
+        self._file = open(path, "rb")
+        self._lock = threading.Lock()
+        try:
+            index = self._read_index()
+        except BaseException:
+            self._file.close()
+            raise
+        self.image = index["image"]
+        self._packages = {
+            name: (offset, length) for name, offset, length in index["packages"]
+        }
+        self._providers = index["providers"]
+        self._catalog = functools.lru_cache(maxsize=block_cache_size)(
+            self._load_catalog
+        )
+
+    def __enter__(self):
+        """Return the opened Snapshot."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        """Close the Snapshot."""
+        self.close()
+
+    def close(self):
+        """Close the snapshot file."""
+        self._file.close()
+
+    def _read(self, offset, length):
+        """
+        Read bytes of the snapshot file.
+
+        :param int offset: position of the first byte
+        :param int length: number of the bytes
+        :return: read bytes
+        :rtype: bytes
+        """
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def _read_index(self):
+        """
+        Read index of the blocks from the end of the file.
+
+        :return: index of the snapshot
+        :rtype: dict
+        :raises OIIInspectorError: if the file is not a snapshot of a supported version
+        """
+        size = os.fstat(self._file.fileno()).st_size
+        if size < len(MAGIC) + TRAILER.size or self._read(0, len(MAGIC)) != MAGIC:
+            raise exceptions.OIIInspectorError(
+                f"{self._path} is not a snapshot of an index image"
+            )
+        index_offset, index_length, magic = TRAILER.unpack(
+            self._read(size - TRAILER.size, TRAILER.size)
+        )
+        if magic != MAGIC:
+            raise exceptions.OIIInspectorError(f"Snapshot {self._path} is truncated")
+        index = json.loads(zlib.decompress(self._read(index_offset, index_length)))
+        if index.get("version") != SNAPSHOT_VERSION:
+            raise exceptions.OIIInspectorError(
+                f"Version {index.get('version')} of snapshot {self._path} is not supported"
+            )
+        return index
+
+    def _read_block(self, package_name):
+        """
+        Decompress block of the package.
+
+        :param str package_name: name of the package
+        :return: package message and raw bundle messages of the package
+        :rtype: tuple
+        :raises RuntimeError: if the package is not in the snapshot
+        """
+        if package_name not in self._packages:
+            log.error(f"Package {package_name} is not in the snapshot")
+            raise RuntimeError("Requested package has not been found in the snapshot.")
+        lines = zlib.decompress(self._read(*self._packages[package_name])).split(b"\n")
+        return json.loads(lines[0]), [
+            _unpack_bundle(json.loads(line)) for line in lines[1:]
+        ]
+
+    def _load_catalog(self, package_name):
+        """
+        Decompress and index block of the package, the result is cached by self._catalog.
+
+        :param str package_name: name of the package
+        :return: package message and catalog of the bundles of the package
+        :rtype: tuple
+        """
+        package, bundles = self._read_block(package_name)
+        return package, CatalogIndex(bundles, [package])
+
+    def list_packages(self):
+        """
+        Yield names of all packages in the snapshot.
+
+        :return: generator of package name messages
+        :rtype: Iterator[dict]
+        """
+        for name in self._packages:
+            yield {"name": name}
+
+    def list_bundles(self):
+        """
+        Yield bundles of all packages, blocks are decompressed one by one.
+
+        :return: generator of raw bundle messages
+        :rtype: Iterator[dict]
+        """
+        for name in self._packages:
+            yield from self._read_block(name)[1]
+
+    # messages of the cached catalogs are copied, as IndexSession decodes the embedded JSON fields in place
+
+    def get_package(self, name):
+        """
+        Get package with heads of its channels.
+
+        :param str name: name of the package
+        :return: package message
+        :rtype: dict
+        """
+        return dict(self._catalog(name)[0])
+
+    def get_bundle(self, package_name, channel_name, csv_name):
+        """
+        Get bundle of the CSV in the channel.
+
+        :param str package_name: name of the package
+        :param str channel_name: name of the channel
+        :param str csv_name: name of the CSV
+        :return: raw bundle message
+        :rtype: dict
+        """
+        catalog = self._catalog(package_name)[1]
+        return dict(catalog.get_bundle(package_name, channel_name, csv_name))
+
+    def get_bundle_for_channel(self, package_name, channel_name):
+        """
+        Get bundle at the head of the channel, the head is read from the channels of the stored package.
+
+        :param str package_name: name of the package
+        :param str channel_name: name of the channel
+        :return: raw bundle message
+        :rtype: dict
+        """
+        package, catalog = self._catalog(package_name)
+        heads = {
+            channel["name"]: channel["csvName"]
+            for channel in package.get("channels", ())
+        }
+        return dict(
+            catalog.get_bundle(package_name, channel_name, heads.get(channel_name))
+        )
+
+    def get_bundle_that_replaces(self, package_name, channel_name, csv_name):
+        """
+        Get bundle which replaces the CSV in the channel.
+
+        :param str package_name: name of the package
+        :param str channel_name: name of the channel
+        :param str csv_name: name of the replaced CSV
+        :return: raw bundle message
+        :rtype: dict
+        """
+        catalog = self._catalog(package_name)[1]
+        return dict(
+            catalog.get_bundle_that_replaces(package_name, channel_name, csv_name)
+        )
+
+    def get_default_bundle_that_provides(self, group, version, kind, plural=None):
+        """
+        Get bundle providing the API from the default channel of the first package providing it.
+
+        :param str group: group of the API
+        :param str version: version of the API
+        :param str kind: kind of the API
+        :param str plural: plural of the API, it is not needed to identify the API
+        :return: raw bundle message
+        :rtype: dict
+        :raises RuntimeError: if no bundle in a default channel provides the API
+        """
+        for package_name in self._providers.get(
+            _provider_key(group, version, kind), ()
+        ):
+            catalog = self._catalog(package_name)[1]
+            try:
+                return dict(
+                    catalog.get_default_bundle_that_provides(group, version, kind)
+                )
+            except RuntimeError:
+                continue
+        log.error(f"No bundle in a default channel provides {group}/{version}/{kind}")
+        raise RuntimeError("Requested bundle has not been found in the snapshot.")
+
+    def query(self, api_address, request=None):
+        """
+        Answer api.Registry method.
+
+        :param str api_address: name of the api.Registry method
+        :param dict request: fields of the request message
+        :return: generator of response messages
+        :rtype: Iterator[dict]
+        :raises RuntimeError: if the method is not supported
+        """
+        request = request or {}
+        streamed_methods = {
+            "ListPackages": self.list_packages,
+            "ListBundles": self.list_bundles,
+        }
+        unary_methods = {
+            "GetPackage": (self.get_package, ("name",)),
+            "GetBundle": (self.get_bundle, ("pkgName", "channelName", "csvName")),
+            "GetBundleForChannel": (
+                self.get_bundle_for_channel,
+                ("pkgName", "channelName"),
+            ),
+            "GetBundleThatReplaces": (
+                self.get_bundle_that_replaces,
+                ("pkgName", "channelName", "csvName"),
+            ),
+            "GetDefaultBundleThatProvides": (
+                self.get_default_bundle_that_provides,
+                ("group", "version", "kind", "plural"),
+            ),
+        }
+        if api_address in streamed_methods:
+            yield from streamed_methods[api_address]()
+        elif api_address in unary_methods:
+            method, fields = unary_methods[api_address]
+            yield method(*(request.get(field) for field in fields))
+        else:
+            raise RuntimeError(
+                f"Method {api_address} is not supported by the snapshot backend."
+            )
+
+
+class SnapshotTransport:
+    """
+    Transport answering api.Registry calls from snapshot files, the address of the image is path of its snapshot.
+
+    No container runtime is needed. Responses are not stored in the response cache, the snapshot is a local copy
+    of the image already.
+    """
+
+    requires_container = False
+    cacheable = False
+
+    def __init__(self):
+        """Initialize the SnapshotTransport."""
+        self._lock = threading.Lock()
+        self._snapshots = {}
+
+    def close(self):
+        """Close the snapshots."""
+        with self._lock:
+            for snapshot in self._snapshots.values():
+                snapshot.close()
+            self._snapshots = {}
+
+    def _get_snapshot(self, path):
+        """
+        Get opened snapshot, open it if it has not been opened yet.
+
+        :param str path: path of the snapshot file
+        :return: the snapshot
+        :rtype: Snapshot
+        """
+        with self._lock:
+            if path not in self._snapshots:
+                self._snapshots[path] = Snapshot(path)
+            return self._snapshots[path]
+
+    def messages(self, address, api_address, call_argument=None, streamed=False):
+        """
+        Answer api.Registry method from the snapshot.
+
+        :param str address: path of the snapshot file
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :param bool streamed: whether the method returns stream of messages, it is known from the method name
+        :return: generator of messages, JSON strings embedded in them are not decoded
+        :rtype: Iterator[dict]
+        """
+        snapshot = self._get_snapshot(address)
+        return snapshot.query(api_address, parse_call_argument(call_argument))
+
+    def stream(self, address, api_address, call_argument=None):
+        """
+        Answer api.Registry method and yield JSON text of every message, formatted as grpcurl does.
+
+        :param str address: path of the snapshot file
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: generator of JSON texts of the messages
+        :rtype: Iterator[str]
+        """
+        for message in self.messages(address, api_address, call_argument):
+            yield json.dumps(message, indent=2, ensure_ascii=False) + "\n"
+
+    def call(self, address, api_address, call_argument=None):
+        """
+        Answer api.Registry method.
+
+        :param str address: path of the snapshot file
+        :param str api_address: API address to be accessed
+        :param str call_argument: Arguments for specification of the query
+        :return: JSON text of the response, messages of streamed response are concatenated
+        :rtype: str
+        """
+        return "".join(self.stream(address, api_address, call_argument))
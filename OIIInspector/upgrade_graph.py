@@ -0,0 +1,249 @@
+"""Upgrade graph of the channels of an index image, built once from list_bundles output."""
+
+import collections
+import logging
+from OIIInspector.versions import sorted_keys_in_version_range, version_key
+
+log = logging.getLogger(__name__)
+
+
+class UpgradeGraph:
+    """
+    Upgrade edges of every channel, parsed from replaces, skips and skipRange fields of the bundles.
+
+    Bundle B upgrades bundle A of the same channel if B replaces A, B skips A, or version of A satisfies skipRange
+    of B. Nodes of every channel are sorted by version and heads of all channels are computed when the graph is built.
+    """
+
+    def __init__(self, bundles):
+        """
+        Initialize the UpgradeGraph.
+
+        :param Iterable[dict] bundles: bundles of ListBundles, embedded JSON payloads are not read
+        """
+        # csv names of every (package, channel) sorted by version, and their version keys in the same order
+        self._nodes = {}
+        self._node_versions = {}
+        self._versions = {}
+        # csv names of the bundles upgrading the (package, channel, csv name), and the reverse edges
+        self._upgrades = collections.defaultdict(set)
+        self._upgraded_from = collections.defaultdict(set)
+        skip_ranges = []
+        named_edges = []
+        for bundle in bundles:
+            channel_key = (bundle.get("packageName"), bundle.get("channelName"))
+            csv_name = bundle.get("csvName")
+            self._nodes.setdefault(channel_key, []).append(csv_name)
+            self._versions[(*channel_key, csv_name)] = version_key(
+                bundle.get("version") or "0"
+            )
+            for replaced in [bundle.get("replaces"), *bundle.get("skips", ())]:
+                if replaced:
+                    named_edges.append((channel_key, replaced, csv_name))
+            if bundle.get("skipRange"):
+                skip_ranges.append((channel_key, bundle["skipRange"], csv_name))
+        for channel_key, csv_names in self._nodes.items():
+            csv_names.sort(key=lambda name: self._versions[(*channel_key, name)])
+            self._node_versions[channel_key] = [
+                self._versions[(*channel_key, name)] for name in csv_names
+            ]
+        for channel_key, replaced, csv_name in named_edges:
+            if (*channel_key, replaced) in self._versions:
+                self._add_edge(channel_key, replaced, csv_name)
+        for channel_key, skip_range, csv_name in skip_ranges:
+            self._add_skip_range_edges(channel_key, skip_range, csv_name)
+        self.heads = {
+            channel_key: self._find_head(channel_key) for channel_key in self._nodes
+        }
+
+    def _add_edge(self, channel_key, old_csv_name, new_csv_name):
+        """
+        Add upgrade edge.
+
+        :param tuple channel_key: package and channel of the bundles
+        :param str old_csv_name: csv name of the upgraded bundle
+        :param str new_csv_name: csv name of the bundle upgrading it
+        """
+        if old_csv_name != new_csv_name:
+            self._upgrades[(*channel_key, old_csv_name)].add(new_csv_name)
+            self._upgraded_from[(*channel_key, new_csv_name)].add(old_csv_name)
+
+    def _add_skip_range_edges(self, channel_key, skip_range, csv_name):
+        """
+        Add upgrade edges from all bundles of the channel with version in the skipRange of the bundle.
+
+        Bundles in the range are found by bisection of the versions of the channel.
+
+        :param tuple channel_key: package and channel of the bundle
+        :param str skip_range: skipRange of the bundle
+        :param str csv_name: csv name of the bundle
+        """
+        nodes = self._nodes[channel_key]
+        for index in sorted_keys_in_version_range(
+            self._node_versions[channel_key], skip_range
+        ):
+            self._add_edge(channel_key, nodes[index], csv_name)
+
+    def _find_head(self, channel_key):
+        """
+        Find head of the channel, the bundle which is not upgraded by any other bundle.
+
+        :param tuple channel_key: package and channel
+        :return: csv name of the head, the highest version if the channel has more candidates
+        :rtype: str
+        """
+        candidates = [
+            csv_name
+            for csv_name in self._nodes[channel_key]
+            if not self._upgrades.get((*channel_key, csv_name))
+        ]
+        if len(candidates) != 1:
+            log.warning(
+                f"Channel {channel_key[1]} of {channel_key[0]} has {len(candidates)} heads, "
+                "the highest version is used"
+            )
+        # nodes are sorted by version
+        return (candidates or self._nodes[channel_key])[-1]
+
+    def _check_node(self, package, channel, csv_name):
+        """
+        Check that the bundle is in the graph.
+
+        :raises RuntimeError: if the bundle is not in the channel
+        """
+        if (package, channel, csv_name) not in self._versions:
+            log.error(f"Bundle {csv_name} is not in channel {channel} of {package}")
+            raise RuntimeError(
+                "Requested bundle has not been found in the upgrade graph."
+            )
+
+    def channels(self):
+        """
+        Get all channels of the graph.
+
+        :return: (package, channel) tuples, sorted
+        :rtype: list
+        """
+        return sorted(self._nodes)
+
+    def nodes(self, package, channel):
+        """
+        Get bundles of the channel.
+
+        :param str package: name of the package
+        :param str channel: name of the channel
+        :return: csv names sorted by version
+        :rtype: list
+        """
+        return list(self._nodes.get((package, channel), ()))
+
+    def upgrades(self, package, channel, csv_name):
+        """
+        Get bundles directly upgrading the bundle.
+
+        :param str package: name of the package
+        :param str channel: name of the channel
+        :param str csv_name: csv name of the bundle
+        :return: csv names sorted by version
+        :rtype: list
+        """
+        self._check_node(package, channel, csv_name)
+        return self._sorted(
+            package, channel, self._upgrades.get((package, channel, csv_name), ())
+        )
+
+    def _sorted(self, package, channel, csv_names):
+        """
+        Sort the bundles of the channel by version.
+
+        :return: csv names sorted by version
+        :rtype: list
+        """
+        return sorted(
+            csv_names, key=lambda csv_name: self._versions[(package, channel, csv_name)]
+        )
+
+    def _traverse(self, edges, package, channel, csv_name):
+        """
+        Find all bundles reachable from the bundle over the edges.
+
+        :param dict edges: upgrade edges or reverse upgrade edges
+        :return: csv names of the reachable bundles, without the bundle itself
+        :rtype: set
+        """
+        reached = {csv_name}
+        pending = [csv_name]
+        while pending:
+            for neighbour in edges.get((package, channel, pending.pop()), ()):
+                if neighbour not in reached:
+                    reached.add(neighbour)
+                    pending.append(neighbour)
+        reached.discard(csv_name)
+        return reached
+
+    def reachable(self, package, channel, csv_name):
+        """
+        Get all bundles which the bundle can be upgraded to, directly or over other bundles.
+
+        :param str package: name of the package
+        :param str channel: name of the channel
+        :param str csv_name: csv name of the bundle
+        :return: csv names sorted by version
+        :rtype: list
+        """
+        self._check_node(package, channel, csv_name)
+        return self._sorted(
+            package, channel, self._traverse(self._upgrades, package, channel, csv_name)
+        )
+
+    def shortest_path(self, package, channel, from_csv_name, to_csv_name=None):
+        """
+        Find upgrade path with the lowest number of upgrades.
+
+        Of the equally long paths, the path through the highest versions is returned.
+
+        :param str package: name of the package
+        :param str channel: name of the channel
+        :param str from_csv_name: csv name of the installed bundle
+        :param str to_csv_name: csv name of the target bundle, head of the channel by default
+        :return: csv names of the bundles on the path, from the installed to the target bundle,
+            or None if the target can not be reached
+        :rtype: list
+        """
+        self._check_node(package, channel, from_csv_name)
+        if to_csv_name is None:
+            to_csv_name = self.heads[(package, channel)]
+        self._check_node(package, channel, to_csv_name)
+        previous = {from_csv_name: None}
+        queue = collections.deque([from_csv_name])
+        while queue:
+            csv_name = queue.popleft()
+            if csv_name == to_csv_name:
+                path = []
+                while csv_name is not None:
+                    path.append(csv_name)
+                    csv_name = previous[csv_name]
+                return path[::-1]
+            for upgrade in reversed(self.upgrades(package, channel, csv_name)):
+                if upgrade not in previous:
+                    previous[upgrade] = csv_name
+                    queue.append(upgrade)
+        return None
+
+    def orphaned(self):
+        """
+        Find bundles from which the head of their channel can not be reached.
+
+        :return: (package, channel, csv name) tuples of the orphaned bundles, sorted
+        :rtype: list
+        """
+        orphaned = []
+        for (package, channel), head in sorted(self.heads.items()):
+            connected = self._traverse(self._upgraded_from, package, channel, head)
+            connected.add(head)
+            orphaned.extend(
+                (package, channel, csv_name)
+                for csv_name in self._nodes[(package, channel)]
+                if csv_name not in connected
+            )
+        return orphaned
@@ -1,9 +1,19 @@
 import argparse
+import codecs
+import contextlib
 import subprocess
 import shlex
 import logging
 import json
 import re
+import tempfile
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
+from OIIInspector import profiling
+
+STREAM_CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r"\s*")
+# fields of api.Registry messages holding JSON encoded payloads
+EMBEDDED_JSON_FIELDS = ("csvJson", "object", "spec")
 
 
 def setup_arg_parser(args: dict) -> argparse.ArgumentParser:
@@ -37,6 +47,10 @@ def setup_arg_parser(args: dict) -> argparse.ArgumentParser:
         else:
             kwargs["type"] = arg_data.get("type", "str")
             kwargs["nargs"] = arg_data.get("count")
+            if "choices" in arg_data:
+                kwargs["choices"] = arg_data["choices"]
+            if "const" in arg_data:
+                kwargs["const"] = arg_data["const"]
 
         holder.add_argument(*aliases, **kwargs)
 
@@ -58,10 +72,115 @@ def run_cmd(cmd: str, err_msg: str = None, tolerate_err: bool = False) -> (str,
     """
     log = logging.getLogger("OIIInspector")
     err_msg = err_msg or "An error has occurred when executing a command."
-    p = subprocess.Popen(
-        shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    args = shlex.split(cmd)
+    with profiling.span("run_cmd", command=args[0]):
+        p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = p.communicate()
+    profiling.count("subprocesses")
+    profiling.count("bytes_read", len(out))
+    if p.returncode != 0 and not tolerate_err:
+        log.error(f"Command {cmd} failed with {err}")
+        raise RuntimeError(err_msg)
+
+    return out.decode("utf-8")
+
+
+def run_cmd_stream(
+    cmd: str, err_msg: str = None, chunk_size: int = STREAM_CHUNK_SIZE
+) -> Iterator[str]:
+    """
+    Run a command locally and yield its stdout in chunks, as it is produced.
+
+    The process is killed when the consumer stops the iteration before the end of the output.
+
+    :param cmd: Shell command to be executed.
+    :type cmd: str
+    :param err_msg: Error message written when the command fails.
+    :type err_msg: str
+    :param chunk_size: Maximal number of characters in one chunk.
+    :type chunk_size: int
+    :return: Generator of stdout chunks.
+    :rtype: Iterator[str]
+    """
+    args = shlex.split(cmd)
+    return profiling.timed_iter(
+        "run_cmd_stream",
+        _run_cmd_stream(cmd, args, err_msg, chunk_size),
+        command=args[0],
     )
-    out, err = p.communicate()
+
+
+def _run_cmd_stream(
+    cmd: str, args: list, err_msg: str, chunk_size: int
+) -> Iterator[str]:
+    """
+    Run a command locally and yield its stdout in chunks, see run_cmd_stream.
+
+    :param cmd: Shell command to be executed.
+    :type cmd: str
+    :param args: Arguments of the command split by shell rules.
+    :type args: list
+    :param err_msg: Error message written when the command fails.
+    :type err_msg: str
+    :param chunk_size: Maximal number of characters in one chunk.
+    :type chunk_size: int
+    :return: Generator of stdout chunks.
+    :rtype: Iterator[str]
+    """
+    log = logging.getLogger("OIIInspector")
+    err_msg = err_msg or "An error has occurred when executing a command."
+    # stderr goes to a file, so a command writing a lot to stderr can not block the stdout pipe
+    with tempfile.TemporaryFile() as stderr_file:
+        p = subprocess.Popen(
+            args,
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+            encoding="utf-8",
+        )
+        profiling.count("subprocesses")
+        try:
+            for chunk in iter(lambda: p.stdout.read(chunk_size), ""):
+                profiling.count("bytes_read", len(chunk))
+                yield chunk
+        finally:
+            if p.poll() is None:
+                p.kill()
+            p.stdout.close()
+            p.wait()
+        if p.returncode != 0:
+            stderr_file.seek(0)
+            log.error(f"Command {cmd} failed with {stderr_file.read()}")
+            raise RuntimeError(err_msg)
+
+
+async def run_cmd_async(
+    cmd: str, err_msg: str = None, tolerate_err: bool = False
+) -> str:
+    """
+    Run a command locally without blocking the event loop.
+
+    :param cmd: Shell command to be executed.
+    :type cmd: str
+    :param err_msg: Error message written when the command fails.
+    :type err_msg: str
+    :param tolerate_err: Whether to tolerate a failed command.
+    :type tolerate_err: bool
+    :return: stdout generated by the command.
+    :rtype: str
+    """
+    # asyncio is imported only by the asynchronous API, it is the largest import of the command line tools
+    import asyncio
+
+    log = logging.getLogger("OIIInspector")
+    err_msg = err_msg or "An error has occurred when executing a command."
+    args = shlex.split(cmd)
+    with profiling.span("run_cmd", command=args[0]):
+        p = await asyncio.create_subprocess_exec(
+            *args, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        out, err = await p.communicate()
+    profiling.count("subprocesses")
+    profiling.count("bytes_read", len(out))
     if p.returncode != 0 and not tolerate_err:
         log.error(f"Command {cmd} failed with {err}")
         raise RuntimeError(err_msg)
@@ -69,6 +188,165 @@ def run_cmd(cmd: str, err_msg: str = None, tolerate_err: bool = False) -> (str,
     return out.decode("utf-8")
 
 
+async def run_cmd_stream_async(
+    cmd: str, err_msg: str = None, chunk_size: int = STREAM_CHUNK_SIZE
+) -> AsyncIterator[str]:
+    """
+    Run a command locally and yield its stdout in chunks, without blocking the event loop.
+
+    The process is killed when the consumer stops the iteration before the end of the output.
+
+    :param cmd: Shell command to be executed.
+    :type cmd: str
+    :param err_msg: Error message written when the command fails.
+    :type err_msg: str
+    :param chunk_size: Maximal number of bytes read at once.
+    :type chunk_size: int
+    :return: Asynchronous generator of stdout chunks.
+    :rtype: AsyncIterator[str]
+    """
+    import asyncio
+
+    log = logging.getLogger("OIIInspector")
+    err_msg = err_msg or "An error has occurred when executing a command."
+    # characters split among reads are decoded once they are complete
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with tempfile.TemporaryFile() as stderr_file:
+        p = await asyncio.create_subprocess_exec(
+            *shlex.split(cmd), stdout=subprocess.PIPE, stderr=stderr_file
+        )
+        profiling.count("subprocesses")
+        finished = False
+        try:
+            while not finished:
+                data = await p.stdout.read(chunk_size)
+                profiling.count("bytes_read", len(data))
+                finished = not data
+                chunk = decoder.decode(data, final=finished)
+                if chunk:
+                    yield chunk
+        finally:
+            if not finished:
+                with contextlib.suppress(ProcessLookupError):
+                    p.kill()
+            await p.wait()
+        if p.returncode != 0:
+            stderr_file.seek(0)
+            log.error(f"Command {cmd} failed with {stderr_file.read()}")
+            raise RuntimeError(err_msg)
+
+
+def iter_json_objects(chunks: Iterable[str]) -> Iterator[dict]:
+    """
+    Decode stream of concatenated JSON objects, such as streamed response of grpcurl.
+
+    Every object is yielded as soon as it has been read completely, so the whole stream is never held in memory.
+
+    :param chunks: Iterable of text chunks of the stream, objects can be split among chunks.
+    :type chunks: Iterable[str]
+    :return: Generator of decoded objects.
+    :rtype: Iterator[dict]
+    :raises JSONDecodeError: if the stream is not valid sequence of JSON objects
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    # length of buffer needed before next decoding attempt, growing geometrically keeps decoding of
+    # objects spread over many chunks linear; grpcurl closes every top-level object with "}" at the
+    # start of a line, which triggers the attempt sooner
+    retry_length = 0
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) < retry_length and "\n}" not in chunk:
+            continue
+        objects, buffer = _decode_complete_objects(decoder, buffer)
+        yield from objects
+        retry_length = 2 * len(buffer)
+    yield from _decode_remaining_objects(decoder, buffer)
+
+
+async def aiter_json_objects(chunks: AsyncIterable[str]) -> AsyncIterator[dict]:
+    """
+    Decode asynchronous stream of concatenated JSON objects, the same way as iter_json_objects.
+
+    :param chunks: Asynchronous iterable of text chunks of the stream, objects can be split among chunks.
+    :type chunks: AsyncIterable[str]
+    :return: Asynchronous generator of decoded objects.
+    :rtype: AsyncIterator[dict]
+    :raises JSONDecodeError: if the stream is not valid sequence of JSON objects
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    retry_length = 0
+    async for chunk in chunks:
+        buffer += chunk
+        if len(buffer) < retry_length and "\n}" not in chunk:
+            continue
+        objects, buffer = _decode_complete_objects(decoder, buffer)
+        for obj in objects:
+            yield obj
+        retry_length = 2 * len(buffer)
+    for obj in _decode_remaining_objects(decoder, buffer):
+        yield obj
+
+
+def _decode_complete_objects(decoder: json.JSONDecoder, buffer: str) -> (list, str):
+    """
+    Decode all complete objects at the start of the buffer.
+
+    :param decoder: JSON decoder.
+    :type decoder: json.JSONDecoder
+    :param buffer: Text read from the stream and not decoded yet.
+    :type buffer: str
+    :return: Tuple of decoded objects and the rest of the buffer.
+    :rtype: tuple of (list, str)
+    """
+    objects = []
+    position = 0
+    while True:
+        position = _skip_whitespace(buffer, position)
+        if position == len(buffer):
+            break
+        try:
+            obj, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            break
+        objects.append(obj)
+    return objects, buffer[position:]
+
+
+def _decode_remaining_objects(decoder: json.JSONDecoder, buffer: str) -> Iterator[dict]:
+    """
+    Decode the rest of the stream, all objects in it have to be complete.
+
+    :param decoder: JSON decoder.
+    :type decoder: json.JSONDecoder
+    :param buffer: Text left in the buffer at the end of the stream.
+    :type buffer: str
+    :return: Generator of decoded objects.
+    :rtype: Iterator[dict]
+    :raises JSONDecodeError: if the text is not valid sequence of JSON objects
+    """
+    position = _skip_whitespace(buffer, 0)
+    while position < len(buffer):
+        obj, position = decoder.raw_decode(buffer, position)
+        yield obj
+        position = _skip_whitespace(buffer, position)
+
+
+def _skip_whitespace(text: str, position: int) -> int:
+    """
+    Get position of the first non-whitespace character.
+
+    :param text: Text to be searched.
+    :type text: str
+    :param position: Position to start from.
+    :type position: int
+    :return: Position of the first non-whitespace character, or length of the text.
+    :rtype: int
+    """
+    return WHITESPACE.match(text, position).end()
+
+
 def convert_output(api_response: str) -> dict:
     """
     Convert answer from API into JSON.
@@ -78,21 +356,157 @@ def convert_output(api_response: str) -> dict:
     :return: JSON-object that is possible to convert into string.
     :rtype: str
     """
+    return convert_message(parse_output(api_response))
+
+
+def parse_output(api_response: str) -> dict:
+    """
+    Parse answer from API into message, JSON strings embedded in the message are left encoded.
+
+    :param api_response: String received from grpcurl call on api.Registry
+    :type api_response: str
+    :return: Decoded message.
+    :rtype: dict
+    """
     log = logging.getLogger("OIIInspector")
     if api_response == "":
         log.error("Answer from API is empty")
         raise RuntimeError("Answer from API is empty")
 
     api_response = re.sub(r"}\s*{", "} ,{", api_response)
-    json_data = json.loads(api_response)
-    if "csvJson" in json_data:
-        json_data["csvJson"] = json.loads(json_data["csvJson"])
-
-    if "object" in json_data:
-        new_object = []
-        for item in json_data["object"]:
-            new_object.append(json.loads(item))
-        json_data["object"] = new_object
-    if "spec" in json_data:
-        json_data["spec"] = json.loads(json_data["spec"])
+    return json.loads(api_response)
+
+
+def convert_message(json_data: dict, lazy: bool = False) -> dict:
+    """
+    Decode JSON strings embedded in a decoded message of API.
+
+    :param json_data: Decoded message received from api.Registry
+    :type json_data: dict
+    :param lazy: Decode the embedded fields on their first access instead of right now.
+    :type lazy: bool
+    :return: Message with decoded csvJson, object and spec fields.
+    :rtype: dict
+    """
+    if lazy:
+        return LazyMessage(json_data)
+    for field in EMBEDDED_JSON_FIELDS:
+        if field in json_data:
+            json_data[field] = _decode_embedded_field(field, json_data[field])
     return json_data
+
+
+def _decode_embedded_field(field: str, value):
+    """
+    Decode one of EMBEDDED_JSON_FIELDS of a message.
+
+    :param field: Name of the field.
+    :type field: str
+    :param value: JSON string, or list of JSON strings for the object field.
+    :return: Decoded value of the field.
+    """
+    if field == "object":
+        return [json.loads(item) for item in value]
+    return json.loads(value)
+
+
+class LazyMessage(dict):
+    """
+    Message of API whose csvJson, object and spec fields are decoded on their first access.
+
+    The message behaves as the message converted by convert_message: indexing, get, items, values, equality,
+    copies made with dict() and json.dumps all see the decoded fields, only the fields which are read are decoded.
+    Representation of the message shows the fields which have not been read yet still encoded.
+    """
+
+    def __init__(self, json_data: dict):
+        """
+        Initialize the LazyMessage.
+
+        :param json_data: Decoded message received from api.Registry, it is not modified.
+        :type json_data: dict
+        """
+        super().__init__(json_data)
+        self._pending = {field for field in EMBEDDED_JSON_FIELDS if field in json_data}
+
+    def _decode(self, key):
+        """Decode the field, if it is still encoded."""
+        if key in self._pending:
+            self._pending.discard(key)
+            value = _decode_embedded_field(key, super().__getitem__(key))
+            super().__setitem__(key, value)
+
+    def _decode_all(self):
+        """Decode all fields which are still encoded."""
+        for key in list(self._pending):
+            self._decode(key)
+
+    def __getitem__(self, key):
+        """Return the field, decode it first if needed."""
+        self._decode(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        """Set the field, the value is never decoded."""
+        self._pending.discard(key)
+        super().__setitem__(key, value)
+
+    def __iter__(self):
+        """
+        Iterate over the keys.
+
+        Overriding __iter__ makes dict() and ** unpacking read the values through __getitem__.
+        """
+        return super().__iter__()
+
+    def __eq__(self, other):
+        """Compare the decoded messages."""
+        self._decode_all()
+        if isinstance(other, LazyMessage):
+            other._decode_all()
+        return super().__eq__(other)
+
+    def __ne__(self, other):
+        """Compare the decoded messages."""
+        return not self == other
+
+    __hash__ = None
+
+    def get(self, key, default=None):
+        """Return the field or the default, decode the field first if needed."""
+        self._decode(key)
+        return super().get(key, default)
+
+    def pop(self, key, *default):
+        """Remove the field and return it, decode the field first if needed."""
+        self._decode(key)
+        self._pending.discard(key)
+        return super().pop(key, *default)
+
+    def items(self):
+        """Return the decoded items."""
+        self._decode_all()
+        return super().items()
+
+    def values(self):
+        """Return the decoded values."""
+        self._decode_all()
+        return super().values()
+
+    def copy(self):
+        """Return shallow copy of the decoded message as a plain dictionary."""
+        return dict(self.items())
+
+
+def parse_call_argument(call_argument: str) -> dict:
+    """
+    Parse the argument of api.Registry call.
+
+    :param call_argument: Shell quoted JSON request, as passed to grpcurl -d option.
+    :type call_argument: str
+    :return: Request represented as dictionary, empty dictionary if there is no argument.
+    :rtype: dict
+    """
+    if call_argument is None:
+        return {}
+    return json.loads(" ".join(shlex.split(call_argument)))
@@ -0,0 +1,159 @@
+"""Ordering and ranges of bundle versions, versions are compared by semantic versioning rules."""
+
+import bisect
+import functools
+import operator
+import re
+
+_RANGE_OPERATORS = {
+    ">=": operator.ge,
+    "<=": operator.le,
+    ">": operator.gt,
+    "<": operator.lt,
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+# bisection finding the first sorted key satisfying the lower bound, or the first key above the upper bound
+_LOWER_BISECT = {
+    operator.ge: bisect.bisect_left,
+    operator.gt: bisect.bisect_right,
+    operator.eq: bisect.bisect_left,
+}
+_UPPER_BISECT = {
+    operator.le: bisect.bisect_right,
+    operator.lt: bisect.bisect_left,
+    operator.eq: bisect.bisect_right,
+}
+_CONSTRAINT = re.compile(r"(>=|<=|!=|==|=|>|<)?\s*(v?[0-9][^\s|]*)")
+
+
+def _identifier_key(identifier):
+    """
+    Get sort key of one dot separated identifier, numeric identifiers are lower than alphanumeric ones.
+
+    :param str identifier: identifier of the version
+    :return: sort key of the identifier
+    :rtype: tuple
+    """
+    if identifier.isdigit():
+        return (0, int(identifier), "")
+    return (1, 0, identifier)
+
+
+@functools.lru_cache(maxsize=4096)
+def version_key(version):
+    """
+    Get sort key of the version, e.g. "v1.2.0-rc.1+build" is lower than "1.2" which is equal to "1.2.0".
+
+    Leading "v" and build metadata are ignored, pre-release versions are lower than the release version.
+
+    :param str version: version of the bundle
+    :return: sort key of the version
+    :rtype: tuple
+    """
+    version = version.strip()
+    if version.startswith("v"):
+        version = version[1:]
+    version = version.split("+", 1)[0]
+    release, _, prerelease = version.partition("-")
+    release_key = [_identifier_key(part) for part in release.split(".")]
+    while release_key and release_key[-1] == (0, 0, ""):
+        release_key.pop()
+    if not prerelease:
+        return (tuple(release_key), (1,))
+    prerelease_key = tuple(_identifier_key(part) for part in prerelease.split("."))
+    return (tuple(release_key), (0,) + prerelease_key)
+
+
+def version_in_range(version, min_version=None, max_version=None):
+    """
+    Check that the version lies in the range.
+
+    :param str version: version of the bundle
+    :param str min_version: lowest allowed version (inclusive), None for no lower bound
+    :param str max_version: version above the allowed range (exclusive), None for no upper bound
+    :return: True if the version lies in the range
+    :rtype: bool
+    """
+    key = version_key(version)
+    if min_version is not None and key < version_key(min_version):
+        return False
+    if max_version is not None and key >= version_key(max_version):
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_version_range(version_range):
+    """
+    Parse range of versions, e.g. skipRange of a bundle ">=4.1.0 <4.3.0 || 4.5.0".
+
+    Constraints separated by spaces must all be satisfied, alternatives are separated by "||".
+
+    :param str version_range: range of versions
+    :return: alternatives, each of them tuple of (comparison operator, version key) constraints
+    :rtype: tuple
+    """
+    alternatives = []
+    for alternative in version_range.split("||"):
+        constraints = tuple(
+            (_RANGE_OPERATORS[comparison or "="], version_key(version))
+            for comparison, version in _CONSTRAINT.findall(alternative)
+        )
+        if constraints:
+            alternatives.append(constraints)
+    return tuple(alternatives)
+
+
+def matches_version_range(version, version_range):
+    """
+    Check that the version satisfies the range of versions.
+
+    :param str version: version of the bundle
+    :param str version_range: range of versions, see parse_version_range
+    :return: True if the version is in the range
+    :rtype: bool
+    """
+    return key_in_version_range(version_key(version), version_range)
+
+
+def key_in_version_range(key, version_range):
+    """
+    Check that the version key satisfies the range of versions.
+
+    :param tuple key: sort key of the version, see version_key
+    :param str version_range: range of versions, see parse_version_range
+    :return: True if the version is in the range
+    :rtype: bool
+    """
+    return any(
+        all(compare(key, bound) for compare, bound in constraints)
+        for constraints in parse_version_range(version_range)
+    )
+
+
+def sorted_keys_in_version_range(keys, version_range):
+    """
+    Find the sorted version keys satisfying the range of versions, bounds of the range are found by bisection.
+
+    :param list keys: sort keys of the versions, see version_key, sorted in ascending order
+    :param str version_range: range of versions, see parse_version_range
+    :return: indexes of the keys in the range, in ascending order
+    :rtype: list
+    """
+    indexes = set()
+    for constraints in parse_version_range(version_range):
+        low, high = 0, len(keys)
+        for compare, bound in constraints:
+            if compare in _LOWER_BISECT:
+                low = max(low, _LOWER_BISECT[compare](keys, bound))
+            if compare in _UPPER_BISECT:
+                high = min(high, _UPPER_BISECT[compare](keys, bound))
+        # constraints without bounds, e.g. "!=", are checked only on the keys between the bounds
+        indexes.update(
+            index
+            for index in range(low, high)
+            if all(compare(keys[index], bound) for compare, bound in constraints)
+        )
+    return sorted(indexes)
@@ -0,0 +1,107 @@
+"""
+Stand-in for grpcurl, answering api.Registry calls with canned responses of configurable size.
+
+The responses are generated deterministically and printed in the format of grpcurl, stream methods print one
+indented JSON object per message. OIIBENCH_BUNDLES sets the number of listed bundles, OIIBENCH_CSV_SIZE the size
+of csvJson of every bundle in bytes and OIIBENCH_QUERY_DELAY the delay before the response (seconds).
+"""
+
+import json
+import os
+import sys
+import time
+
+SERVICES = (
+    "api.Registry.GetBundle",
+    "api.Registry.GetBundleForChannel",
+    "api.Registry.GetBundleThatReplaces",
+    "api.Registry.GetChannelEntriesThatProvide",
+    "api.Registry.GetChannelEntriesThatReplace",
+    "api.Registry.GetDefaultBundleThatProvides",
+    "api.Registry.GetLatestChannelEntriesThatProvide",
+    "api.Registry.GetPackage",
+    "api.Registry.ListBundles",
+    "api.Registry.ListPackages",
+)
+PACKAGES = 20
+CHANNELS = ("stable", "alpha")
+
+
+def bundle(index):
+    """Bundle of the canned catalog, bundles of one channel replace each other in order of their index."""
+    package = f"package-{index % PACKAGES}"
+    channel = CHANNELS[(index // PACKAGES) % len(CHANNELS)]
+    version = f"1.{index // (PACKAGES * len(CHANNELS))}.0"
+    csv_name = f"{package}.v{version}"
+    csv = {
+        "apiVersion": "operators.coreos.com/v1alpha1",
+        "kind": "ClusterServiceVersion",
+        "metadata": {"name": csv_name, "annotations": {"description": ""}},
+        "spec": {"version": version},
+    }
+    padding = int(os.environ.get("OIIBENCH_CSV_SIZE", "0")) - len(json.dumps(csv))
+    csv["metadata"]["annotations"]["description"] = "x" * max(padding, 0)
+    message = {
+        "csvName": csv_name,
+        "packageName": package,
+        "channelName": channel,
+        "csvJson": json.dumps(csv),
+        "object": [json.dumps(csv)],
+        "bundlePath": f"quay.io/benchmark/{package}-bundle:v{version}",
+        "providedApis": [
+            {"group": f"{package}.example.com", "version": "v1", "kind": "Example"}
+        ],
+        "version": version,
+    }
+    if index >= PACKAGES * len(CHANNELS):
+        previous_version = f"1.{index // (PACKAGES * len(CHANNELS)) - 1}.0"
+        message["replaces"] = f"{package}.v{previous_version}"
+    return message
+
+
+def write(message):
+    sys.stdout.write(json.dumps(message, indent=2) + "\n")
+
+
+def main(argv):
+    arguments = [argument for argument in argv if argument != "-plaintext"]
+    if "-d" in arguments:
+        position = arguments.index("-d")
+        # call argument does not change the canned responses
+        del arguments[position], arguments[position]
+    if arguments[1:] == ["list", "api.Registry"]:
+        print("\n".join(SERVICES))
+        return 0
+    method = arguments[1].rsplit("/", 1)[-1]
+    time.sleep(float(os.environ.get("OIIBENCH_QUERY_DELAY", "0")))
+    bundles = int(os.environ.get("OIIBENCH_BUNDLES", "100"))
+    if method == "ListBundles":
+        for index in range(bundles):
+            write(bundle(index))
+    elif method == "ListPackages":
+        for index in range(min(bundles, PACKAGES)):
+            write({"name": f"package-{index}"})
+    elif method == "GetPackage":
+        write(
+            {
+                "name": "package-0",
+                "channels": [
+                    {"name": channel, "csvName": "package-0.v1.0.0"}
+                    for channel in CHANNELS
+                ],
+                "defaultChannelName": CHANNELS[0],
+            }
+        )
+    elif "api.Registry." + method in SERVICES:
+        write(bundle(0))
+    else:
+        print(
+            f"Error invoking method {arguments[1]}: target server does not expose service",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+"""
+Stand-in for podman and docker CLI, used by the benchmarks instead of a real container runtime.
+
+Only the subcommands run by ContainerManager are emulated. "run" listens at the published local port until it
+is killed, the registry itself is emulated by fake_grpcurl.py. Delays of the pull and the start of the registry
+are read from OIIBENCH_PULL_DELAY and OIIBENCH_START_DELAY (seconds), pulled images and running containers are
+recorded in OIIBENCH_STATE_DIR.
+"""
+
+import hashlib
+import os
+import signal
+import socket
+import sys
+import time
+
+
+def _delay(name):
+    time.sleep(float(os.environ.get(name, "0")))
+
+
+def _state_path(kind, name):
+    digest = hashlib.sha256(name.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(os.environ["OIIBENCH_STATE_DIR"], f"{kind}-{digest}")
+
+
+def _image_id(image):
+    return hashlib.sha256(image.encode("utf-8")).hexdigest()
+
+
+def pull(image):
+    _delay("OIIBENCH_PULL_DELAY")
+    with open(_state_path("image", image), "w") as image_file:
+        image_file.write(image)
+    print(_image_id(image))
+    return 0
+
+
+def image_inspect(image):
+    if not os.path.exists(_state_path("image", image)):
+        print(f"Error: {image}: image not known", file=sys.stderr)
+        return 125
+    print(_image_id(image))
+    return 0
+
+
+def run(options, image):
+    name = options["--name"]
+    port = int(options["-p"].split(":", 1)[0])
+    container_path = _state_path("container", name)
+    if os.path.exists(container_path):
+        print(
+            f'Error: the container name "{name}" is already in use by', file=sys.stderr
+        )
+        return 125
+    with open(container_path, "w") as container_file:
+        container_file.write(str(os.getpid()))
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    _delay("OIIBENCH_START_DELAY")
+    try:
+        server = socket.create_server(("localhost", port))
+    except OSError:
+        print(
+            f"Error: listen tcp :{port}: bind: address already in use", file=sys.stderr
+        )
+        os.remove(container_path)
+        return 126
+    with server:
+        while True:
+            connection, _ = server.accept()
+            connection.close()
+
+
+def stop(name):
+    try:
+        with open(_state_path("container", name)) as container_file:
+            pid = int(container_file.read())
+    except OSError:
+        print(f"Error: no container with name or ID {name} found", file=sys.stderr)
+        return 125
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    print(name)
+    return 0
+
+
+def remove(name):
+    try:
+        os.remove(_state_path("container", name))
+    except OSError:
+        print(f"Error: no container with name or ID {name} found", file=sys.stderr)
+        return 1
+    print(name)
+    return 0
+
+
+def create(image):
+    if not os.path.exists(_state_path("image", image)):
+        pull(image)
+    container_id = _image_id(image)[:12]
+    with open(_state_path("container", container_id), "w") as container_file:
+        container_file.write("0")
+    print(container_id)
+    return 0
+
+
+def copy(source, destination):
+    # images of the benchmarks do not contain any files, the copied file is always empty
+    open(destination, "w").close()
+    return 0
+
+
+def main(argv):
+    command, arguments = argv[0], argv[1:]
+    options = dict(
+        argument.split("=", 1)
+        for argument in arguments
+        if argument.startswith("-") and "=" in argument
+    )
+    positional = [argument for argument in arguments if not argument.startswith("-")]
+    if command == "pull":
+        return pull(positional[0])
+    if command == "image" and positional[0] == "inspect":
+        # "--format {{.Id}}" is ignored
+        return image_inspect(positional[-1])
+    if command == "run":
+        return run(options, positional[-1])
+    if command == "stop":
+        return stop(positional[0])
+    if command == "rm":
+        return remove(positional[0])
+    if command == "create":
+        return create(positional[0])
+    if command == "cp":
+        return copy(*positional)
+    if command == "--version":
+        print(f"{os.path.basename(sys.argv[0])} version 0.0.0-benchmark")
+        return 0
+    print(f"Error: unsupported command {' '.join(argv)}", file=sys.stderr)
+    return 125
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,334 @@
+"""
+Phase level benchmarks of an index image inspection, run against stand-in podman, docker and grpcurl.
+
+The stand-ins from benchmarks/fakes are the only executables on PATH of the benchmark, so no container runtime
+is needed. Every iteration detects the runtime, pulls and runs the image, waits for the registry, lists the
+bundles, parses them, writes the output and tears the container down, then the same inspection is run end to end
+through OIIInspector.oii_client.list_bundles. Time and peak of allocated memory are reported for every phase.
+
+Usage:
+    python benchmarks/run_benchmarks.py --bundles 2000 --csv-size 20000 --repeat 5 --json results.json
+    python benchmarks/run_benchmarks.py --compare results.json
+"""
+
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FAKES_DIR = os.path.join(BENCHMARKS_DIR, "fakes")
+# the checkout is benchmarked, not the installed package
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+IMAGE = "quay.io/benchmark/index:latest"
+PHASES = (
+    "detect",
+    "pull",
+    "run",
+    "readiness",
+    "query",
+    "parse",
+    "output",
+    "teardown",
+    "end_to_end",
+)
+
+
+class PhaseRecorder:
+    """Time and peak of allocated memory of the phases, every phase can be recorded once per iteration."""
+
+    def __init__(self, trace_memory=True):
+        """
+        Initialize the PhaseRecorder.
+
+        :param bool trace_memory: trace allocations, which slows down phases run in Python
+        """
+        self.times = collections.defaultdict(list)
+        self.memory = collections.defaultdict(list)
+        self._trace_memory = trace_memory
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Record time and memory of the block.
+
+        :param str name: name of the phase
+        """
+        if self._trace_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name].append(time.perf_counter() - start)
+            if self._trace_memory:
+                self.memory[name].append(tracemalloc.get_traced_memory()[1] - baseline)
+
+    def wrap(self, name, function):
+        """
+        Record every call of the function as the phase.
+
+        :param str name: name of the phase
+        :param callable function: function to be wrapped
+        :return: wrapped function
+        :rtype: callable
+        """
+
+        def recorded(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+
+        return recorded
+
+    def summary(self):
+        """
+        Get median and minimum of the recorded phases.
+
+        :return: statistics keyed by name of the phase
+        :rtype: dict
+        """
+        summary = {}
+        for name in PHASES:
+            if name not in self.times:
+                continue
+            summary[name] = {
+                "median_s": statistics.median(self.times[name]),
+                "min_s": min(self.times[name]),
+            }
+            if self.memory[name]:
+                summary[name]["peak_kib"] = max(self.memory[name]) // 1024
+        return summary
+
+
+def install_fakes(work_dir, runtime):
+    """
+    Create executables of the stand-ins, the returned directory is used as the only entry of PATH.
+
+    :param str work_dir: directory of the benchmark
+    :param str runtime: runtime to be detected, "podman" or "docker"
+    :return: directory with the executables
+    :rtype: str
+    """
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(bin_dir)
+    scripts = {runtime: "fake_runtime.py", "grpcurl": "fake_grpcurl.py"}
+    for executable, script in scripts.items():
+        path = os.path.join(bin_dir, executable)
+        with open(path, "w") as wrapper:
+            wrapper.write(
+                f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(FAKES_DIR, script)}" "$@"\n'
+            )
+        os.chmod(path, 0o755)
+    return bin_dir
+
+
+def configure_environment(args, work_dir):
+    """
+    Set environment of the stand-ins and of OIIInspector, it has to be done before OIIInspector is imported.
+
+    :param argparse.Namespace args: parsed command line arguments
+    :param str work_dir: directory of the benchmark
+    """
+    state_dir = os.path.join(work_dir, "state")
+    os.makedirs(state_dir)
+    os.environ.pop("OIIINSPECTOR_CONTAINER_RUNTIME", None)
+    os.environ.update(
+        {
+            "PATH": install_fakes(work_dir, args.runtime),
+            "OIIINSPECTOR_CACHE_DIR": os.path.join(work_dir, "cache"),
+            "OIIINSPECTOR_PULL_POLICY": "always",
+            "OIIBENCH_STATE_DIR": state_dir,
+            "OIIBENCH_BUNDLES": str(args.bundles),
+            "OIIBENCH_CSV_SIZE": str(args.csv_size),
+            "OIIBENCH_PULL_DELAY": str(args.pull_delay),
+            "OIIBENCH_START_DELAY": str(args.start_delay),
+            "OIIBENCH_QUERY_DELAY": str(args.query_delay),
+        }
+    )
+
+
+def run_iteration(recorder):
+    """
+    Inspect the image once phase by phase, and once end to end.
+
+    :param PhaseRecorder recorder: recorder of the phases
+    :return: number of listed bundles
+    :rtype: int
+    """
+    from OIIInspector import container_runtime
+    from OIIInspector.cache import use_cache
+    from OIIInspector.container_manager import ContainerManager
+    from OIIInspector.oii_client import GrpcurlTransport, list_bundles
+    from OIIInspector.utils import convert_message, iter_json_objects
+
+    # runtime is detected again in every iteration, as it is in every new process
+    container_runtime._detected_runtime = None
+    with recorder.phase("detect"):
+        runtime = container_runtime.detect_runtime()
+    manager = ContainerManager(IMAGE, runtime=runtime)
+    manager._pull_image = recorder.wrap("pull", manager._pull_image)
+    manager._serve_index_registry = recorder.wrap("run", manager._serve_index_registry)
+    try:
+        manager.start_container()
+        # run phase covers the start of the container and the wait for the registry, which is recorded separately
+        readiness = manager.readiness_stats["wait_time"]
+        recorder.times["run"][-1] -= readiness
+        recorder.times["readiness"].append(readiness)
+        with recorder.phase("query"):
+            chunks = list(
+                GrpcurlTransport().stream(manager.local_address_of_image, "ListBundles")
+            )
+        with recorder.phase("parse"):
+            bundles = [
+                convert_message(message) for message in iter_json_objects(chunks)
+            ]
+        with recorder.phase("output"):
+            json.dump(
+                bundles, io.StringIO(), sort_keys=True, indent=4, separators=(",", ": ")
+            )
+    finally:
+        with recorder.phase("teardown"):
+            manager.close_container_manager()
+    with use_cache(None), recorder.phase("end_to_end"):
+        count = len(list_bundles(IMAGE))
+    return count
+
+
+def compare(summary, baseline, threshold):
+    """
+    Find phases whose median time has grown over the threshold.
+
+    :param dict summary: summary of this run
+    :param dict baseline: summary of the baseline run
+    :param float threshold: allowed ratio of the median times
+    :return: descriptions of the regressions
+    :rtype: list
+    """
+    regressions = []
+    for name, stats in summary.items():
+        if name not in baseline:
+            continue
+        ratio = stats["median_s"] / max(baseline[name]["median_s"], 1e-9)
+        if ratio > threshold:
+            regressions.append(
+                f"{name}: {stats['median_s']:.4f} s, baseline {baseline[name]['median_s']:.4f} s ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def print_summary(summary, bundles):
+    """
+    Print table of the phases.
+
+    :param dict summary: statistics of the phases
+    :param int bundles: number of listed bundles
+    """
+    print(f"{bundles} bundles")
+    print(f"{'phase':<12}{'median [s]':>12}{'min [s]':>12}{'peak [KiB]':>12}")
+    for name, stats in summary.items():
+        peak = stats.get("peak_kib", "-")
+        print(f"{name:<12}{stats['median_s']:>12.4f}{stats['min_s']:>12.4f}{peak:>12}")
+
+
+def parse_args(argv):
+    """
+    Parse command line arguments of the benchmarks.
+
+    :param list argv: command line arguments
+    :return: parsed arguments
+    :rtype: argparse.Namespace
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--bundles", type=int, default=1000, help="Number of listed bundles"
+    )
+    parser.add_argument(
+        "--csv-size",
+        type=int,
+        default=10000,
+        help="Size of csvJson of every bundle in bytes",
+    )
+    parser.add_argument(
+        "--pull-delay",
+        type=float,
+        default=0.0,
+        help="Duration of the image pull in seconds",
+    )
+    parser.add_argument(
+        "--start-delay",
+        type=float,
+        default=0.0,
+        help="Duration of the registry start in seconds",
+    )
+    parser.add_argument(
+        "--query-delay",
+        type=float,
+        default=0.0,
+        help="Delay of every response in seconds",
+    )
+    parser.add_argument(
+        "--runtime",
+        choices=("podman", "docker"),
+        default="podman",
+        help="Emulated runtime",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Number of iterations")
+    parser.add_argument(
+        "--no-memory", action="store_true", help="Do not trace allocated memory"
+    )
+    parser.add_argument("--json", help="File where the summary is written")
+    parser.add_argument(
+        "--compare", help="Summary of a baseline run, regressions fail the benchmark"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="Allowed ratio of median times against the baseline",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Run the benchmarks.
+
+    :param list argv: command line arguments
+    :return: exit code, 1 if a phase has regressed against the baseline
+    :rtype: int
+    """
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="oii-benchmark-") as work_dir:
+        configure_environment(args, work_dir)
+        recorder = PhaseRecorder(trace_memory=not args.no_memory)
+        if not args.no_memory:
+            tracemalloc.start()
+        for _ in range(args.repeat):
+            bundles = run_iteration(recorder)
+        tracemalloc.stop()
+    summary = recorder.summary()
+    print_summary(summary, bundles)
+    if args.json:
+        with open(args.json, "w") as summary_file:
+            json.dump({"bundles": bundles, "phases": summary}, summary_file, indent=4)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(
+                summary, json.load(baseline_file)["phases"], args.threshold
+            )
+        for regression in regressions:
+            print(f"Regression of {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
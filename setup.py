@@ -45,6 +45,7 @@ setup(
 
     entry_points={
         "console_scripts": [
+            "oii = OIIInspector.cli:main",
             "OIIInspector-get-bundle = OIIInspector.oii_inspector_calls:get_bundle_main",
             "OIIInspector-list-packages = OIIInspector.oii_inspector_calls:list_packages_main",
             "OIIInspector-list-bundles = OIIInspector.oii_inspector_calls:list_bundles_main",
@@ -53,10 +54,17 @@ setup(
             "OIIInspector-get-bundle-that-replaces = OIIInspector.oii_inspector_calls:get_bundle_that_replaces_main",
             "OIIInspector-get-default-bundle-that-provides = "
             "OIIInspector.oii_inspector_calls:get_default_bundle_that_provides_main",
+            "OIIInspector-batch = OIIInspector.oii_inspector_calls:batch_main",
+            "OIIInspector-inspect-images = OIIInspector.oii_inspector_calls:inspect_images_main",
+            "OIIInspector-diff = OIIInspector.oii_inspector_calls:diff_main",
+            "OIIInspector-shell = OIIInspector.oii_inspector_calls:shell_main",
+            "OIIInspector-snapshot = OIIInspector.oii_inspector_calls:snapshot_main",
+            "OIIInspector-daemon = OIIInspector.oii_inspector_calls:daemon_main",
         ]
 
     },
     install_requires=get_requirements(),
+    extras_require={"grpc": ["grpcio", "grpcio-reflection", "protobuf"]},
     tests_require=["tox"],
     cmdclass={"test": Tox}
 )
@@ -0,0 +1,411 @@
+import asyncio
+import json
+import os
+import threading
+from unittest.mock import patch, call, AsyncMock, MagicMock
+import pytest
+import OIIInspector.container_runtime as container_runtime
+import OIIInspector.exceptions as exceptions
+from OIIInspector import async_client, cache
+
+input_file_name = "./tests/data/{test_name}"
+IMAGE = "registry.test/index@sha256:1234"
+
+
+def load_file(file_name):
+    test_file_name = input_file_name.format(test_name=file_name)
+    return open(test_file_name, "r").read()
+
+
+def registry_process(stderr_outputs):
+    """Return fake create_subprocess_exec, every registry process fails with next of the stderr outputs."""
+    stderr_outputs = iter(stderr_outputs)
+
+    async def create_subprocess_exec(*args, stdout, stderr):
+        process = MagicMock()
+        process.wait = AsyncMock()
+        output = next(stderr_outputs, None)
+        if output is None:
+            process.returncode = None
+        else:
+            stderr.write(output.encode("utf-8"))
+            process.returncode = 1
+        return process
+
+    return create_subprocess_exec
+
+
+async def run_registry_cmd(cmd, err_msg=None, tolerate_err=False):
+    if cmd.startswith("grpcurl"):
+        return "api.Registry.ListBundles\napi.Registry.ListPackages\n"
+    return ""
+
+
+def create_manager():
+    return async_client.AsyncContainerManager(
+        "test_address", runtime=container_runtime.PodmanRuntime()
+    )
+
+
+@patch("OIIInspector.async_client.asyncio.open_connection")
+@patch("OIIInspector.async_client.release_port")
+@patch("OIIInspector.async_client.reserve_free_port", return_value=41000)
+@patch("OIIInspector.async_client.run_cmd_async", side_effect=run_registry_cmd)
+@patch("OIIInspector.async_client.asyncio.create_subprocess_exec")
+def test_container_manager_lifecycle(
+    mock_exec, mock_run_cmd, mock_reserve, mock_release, mock_open_connection
+):
+    mock_exec.side_effect = registry_process([])
+    mock_open_connection.return_value = (MagicMock(), MagicMock())
+
+    async def run():
+        async with create_manager() as manager:
+            with pytest.raises(exceptions.OIIInspectorError):
+                manager.local_address_of_image
+            # concurrent starts start the container once
+            await asyncio.gather(manager.start_container(), manager.start_container())
+            assert manager.local_address_of_image == "localhost:41000"
+            assert manager.readiness_stats["tcp_attempts"] == 1
+            assert manager.readiness_stats["grpc_probes"] == 1
+
+    asyncio.run(run())
+    assert mock_exec.call_args.args == (
+        "podman",
+        "run",
+        "--name=OIIInspector_running_container_41000",
+        "-p=41000:50051",
+        "test_address",
+    )
+    assert mock_run_cmd.call_args_list == [
+        call("podman pull test_address"),
+        call("grpcurl -plaintext localhost:41000 list api.Registry"),
+        call("podman stop OIIInspector_running_container_41000"),
+        call("podman rm OIIInspector_running_container_41000"),
+    ]
+    mock_release.assert_called_once_with(41000)
+
+
+@patch("OIIInspector.async_client.asyncio.open_connection")
+@patch("OIIInspector.async_client.release_port")
+@patch("OIIInspector.async_client.reserve_free_port")
+@patch("OIIInspector.async_client.detect_runtime")
+@patch("OIIInspector.async_client.run_cmd_async", side_effect=run_registry_cmd)
+@patch("OIIInspector.async_client.asyncio.create_subprocess_exec")
+def test_container_manager_file_io_off_event_loop(
+    mock_exec,
+    mock_run_cmd,
+    mock_detect,
+    mock_reserve,
+    mock_release,
+    mock_open_connection,
+):
+    mock_exec.side_effect = registry_process([])
+    mock_open_connection.return_value = (MagicMock(), MagicMock())
+    threads = []
+
+    def record_thread(result):
+        threads.append(threading.current_thread())
+        return result
+
+    mock_detect.side_effect = lambda: record_thread(container_runtime.PodmanRuntime())
+    mock_reserve.side_effect = lambda: record_thread(41000)
+    mock_release.side_effect = lambda port: record_thread(None)
+
+    async def run():
+        async with async_client.AsyncContainerManager("test_address") as manager:
+            await manager.start_container()
+
+    asyncio.run(run())
+    # runtime detection and the port reservation files are not touched in the thread of the event loop
+    assert len(threads) == 3
+    assert threading.main_thread() not in threads
+
+
+@patch("OIIInspector.async_client.asyncio.open_connection")
+@patch("OIIInspector.async_client.release_port")
+@patch("OIIInspector.async_client.reserve_free_port", side_effect=[41000, 41001])
+@patch("OIIInspector.async_client.run_cmd_async", side_effect=run_registry_cmd)
+@patch("OIIInspector.async_client.asyncio.create_subprocess_exec")
+def test_container_manager_port_in_use(
+    mock_exec, mock_run_cmd, mock_reserve, mock_release, mock_open_connection
+):
+    mock_exec.side_effect = registry_process(["Error: address already in use"])
+    mock_open_connection.return_value = (MagicMock(), MagicMock())
+
+    async def run():
+        manager = create_manager()
+        await manager.start_container()
+        assert manager.local_address_of_image == "localhost:41001"
+        await manager.close_container_manager()
+
+    asyncio.run(run())
+    assert mock_release.call_args_list == [call(41000), call(41001)]
+
+
+@patch("OIIInspector.async_client.release_port")
+@patch("OIIInspector.async_client.reserve_free_port", return_value=41000)
+@patch("OIIInspector.async_client.run_cmd_async", side_effect=run_registry_cmd)
+@patch("OIIInspector.async_client.asyncio.create_subprocess_exec")
+def test_container_manager_start_failure(
+    mock_exec, mock_run_cmd, mock_reserve, mock_release
+):
+    mock_exec.side_effect = registry_process(["Error: bad image", "Error: bad image"])
+
+    async def run():
+        async with create_manager() as manager:
+            with pytest.raises(exceptions.OIIInspectorError, match="bad image"):
+                await manager.start_container()
+
+    asyncio.run(run())
+    # the start is retried once at the same port
+    assert mock_exec.call_count == 2
+    mock_release.assert_called_once_with(41000)
+    assert mock_run_cmd.call_args_list == [call("podman pull test_address")]
+
+
+@patch("OIIInspector.async_client.release_port")
+@patch("OIIInspector.async_client.reserve_free_port", side_effect=[41000, 41001])
+@patch("OIIInspector.async_client.run_cmd_async", side_effect=run_registry_cmd)
+@patch("OIIInspector.async_client.asyncio.create_subprocess_exec")
+@patch.object(async_client.AsyncContainerManager, "_grpc_max_port_tries", 2)
+def test_container_manager_no_free_port(
+    mock_exec, mock_run_cmd, mock_reserve, mock_release
+):
+    mock_exec.side_effect = registry_process(
+        ["the container name is already in use by 1234"] * 2
+    )
+    manager = async_client.AsyncContainerManager("test_address")
+    with patch(
+        "OIIInspector.async_client.detect_runtime",
+        return_value=container_runtime.DockerRuntime(),
+    ):
+        with pytest.raises(exceptions.NoFreePortFound):
+            asyncio.run(manager.start_container())
+    assert mock_exec.call_args.args[0] == "docker"
+    assert mock_release.call_args_list == [call(41000), call(41001)]
+
+
+@patch("OIIInspector.async_client.run_cmd_async")
+def test_container_manager_pull_policy(mock_run_cmd):
+    mock_run_cmd.return_value = "sha256:1234"
+    manager = async_client.AsyncContainerManager(
+        "test@sha256:1234", runtime=container_runtime.PodmanRuntime()
+    )
+    asyncio.run(manager._pull_image())
+    assert mock_run_cmd.call_args_list == [
+        call(
+            "podman image inspect --format {{.Id}} test@sha256:1234",
+            tolerate_err=True,
+        )
+    ]
+    mock_run_cmd.return_value = ""
+    manager = async_client.AsyncContainerManager(
+        "test:v1", runtime=container_runtime.PodmanRuntime(), pull_policy="never"
+    )
+    with pytest.raises(exceptions.OIIInspectorError, match="not present"):
+        asyncio.run(manager._pull_image())
+
+
+@patch("OIIInspector.async_client.asyncio.open_connection")
+@patch("OIIInspector.async_client.run_cmd_async")
+@patch("OIIInspector.async_client.asyncio.create_subprocess_exec")
+@patch.object(async_client.AsyncContainerManager, "_readiness_initial_delay", 0.001)
+def test_readiness_backoff(mock_exec, mock_run_cmd, mock_open_connection):
+    mock_exec.side_effect = registry_process([])
+    mock_open_connection.side_effect = [
+        ConnectionRefusedError,
+        asyncio.TimeoutError,
+        (MagicMock(), MagicMock()),
+        (MagicMock(), MagicMock()),
+    ]
+    mock_run_cmd.side_effect = [RuntimeError, "api.Registry.ListPackages"]
+    manager = create_manager()
+    asyncio.run(manager._serve_index_registry_at_port(41000))
+    # the gRPC probe is done only once the port accepts TCP connections
+    assert mock_run_cmd.call_count == 2
+    assert manager.readiness_stats["tcp_attempts"] == 4
+    assert manager.readiness_stats["grpc_probes"] == 2
+
+
+@patch("OIIInspector.async_client.asyncio.create_subprocess_exec")
+@patch.object(async_client.AsyncContainerManager, "_grpc_init_wait_time", 0)
+def test_readiness_timeout(mock_exec):
+    mock_exec.side_effect = registry_process([])
+    manager = create_manager()
+    with pytest.raises(exceptions.OIIInspectorError, match="not been initialized"):
+        asyncio.run(manager._serve_index_registry_at_port(41000))
+    manager._rpc_proc.kill.assert_called_once_with()
+    assert manager.readiness_stats is None
+
+
+@pytest.fixture
+def mock_manager():
+    with patch("OIIInspector.async_client.AsyncContainerManager") as manager_class:
+        manager = manager_class.return_value
+        manager.start_container = AsyncMock()
+        manager.close_container_manager = AsyncMock()
+        manager.local_address_of_image = "test_address:50051"
+        yield manager
+
+
+def stream_output(file_name):
+    async def run_cmd_stream_async(cmd):
+        yield load_file(file_name)
+
+    return MagicMock(side_effect=run_cmd_stream_async)
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+@patch("OIIInspector.async_client.run_cmd_async")
+def test_get_queries(mock_run_cmd, mock_manager):
+    mock_run_cmd.return_value = load_file("get_bundle.json")
+    output = asyncio.run(
+        async_client.get_bundle_async(
+            "test_address", "serverless-operator", "4.3", "serverless-operator.v1.2.0"
+        )
+    )
+    assert output["version"] == "1.2.0"
+    mock_run_cmd.assert_called_once_with(
+        "grpcurl -plaintext -d "
+        '\'{"pkgName": "serverless-operator", "channelName": "4.3", '
+        '"csvName": "serverless-operator.v1.2.0"}\' '
+        "test_address:50051 api.Registry/GetBundle"
+    )
+    mock_manager.close_container_manager.assert_awaited_once_with()
+
+    mock_run_cmd.return_value = load_file("get_package.json")
+    output = asyncio.run(async_client.get_package_async("test_address", "test"))
+    assert output["name"] == "test-operator"
+    mock_run_cmd.return_value = load_file("get_bundle_for_channel.json")
+    output = asyncio.run(
+        async_client.get_bundle_for_channel_async("test_address", "test", "4.3")
+    )
+    assert output["csvName"] == "test-name.v0.8.1"
+    mock_run_cmd.return_value = load_file("get_bundle_that_replaces.json")
+    output = asyncio.run(
+        async_client.get_bundle_that_replaces_async("test_address", "a", "b", "c")
+    )
+    assert output["csvName"] == "test-operator.v1.3.0"
+    mock_run_cmd.return_value = load_file("get_default_bundle_that_provides.json")
+    output = asyncio.run(
+        async_client.get_default_bundle_that_provides_async(
+            "test_address", "group", "v1", "kind", "plural"
+        )
+    )
+    assert isinstance(output["csvJson"], dict)
+    assert json.loads(mock_run_cmd.call_args.args[0].split("'")[1]) == {
+        "group": "group",
+        "version": "v1",
+        "kind": "kind",
+        "plural": "plural",
+    }
+
+
+def test_list_and_iter_queries(mock_manager):
+    with patch(
+        "OIIInspector.async_client.run_cmd_stream_async",
+        stream_output("list_packages.json"),
+    ) as mock_stream:
+        packages = asyncio.run(async_client.list_packages_async("test_address"))
+        assert packages[0] == {"name": "test-operator"}
+        assert (
+            asyncio.run(collect(async_client.iter_packages_async("test_address")))
+            == packages
+        )
+        mock_stream.assert_called_with(
+            "grpcurl -plaintext test_address:50051 api.Registry/ListPackages"
+        )
+    with patch(
+        "OIIInspector.async_client.run_cmd_stream_async",
+        stream_output("list_bundles.json"),
+    ):
+        bundles = asyncio.run(async_client.list_bundles_async("test_address"))
+        assert len(bundles) == 3
+        assert isinstance(bundles[0]["csvJson"], dict)
+        assert (
+            asyncio.run(collect(async_client.iter_bundles_async("test_address")))
+            == bundles
+        )
+        lazy_bundles = asyncio.run(
+            async_client.list_bundles_async("test_address", lazy=True)
+        )
+        assert isinstance(dict.__getitem__(lazy_bundles[0], "csvJson"), str)
+        assert lazy_bundles == bundles
+        filtered = asyncio.run(
+            async_client.list_bundles_async(
+                "test_address", fields=["csvName"], filters={"channel": "beta"}
+            )
+        )
+        assert filtered == [{"csvName": "test_csv_name 3"}]
+
+
+@patch("OIIInspector.async_client.run_cmd_async")
+def test_cached_queries(mock_run_cmd, mock_manager, tmp_path):
+    response_cache = cache.ResponseCache(cache_dir=str(tmp_path))
+    mock_run_cmd.return_value = load_file("get_bundle.json")
+
+    async def run():
+        async with async_client.AsyncIndexSession(
+            IMAGE, cache=response_cache
+        ) as session:
+            first = await session.get_bundle("a", "b", "c")
+            assert await session.get_bundle("a", "b", "c") == first
+            return await session.list_bundles(), await session.list_bundles()
+
+    with patch(
+        "OIIInspector.async_client.run_cmd_stream_async",
+        stream_output("list_bundles.json"),
+    ) as mock_stream:
+        first_bundles, second_bundles = asyncio.run(run())
+    assert first_bundles == second_bundles
+    assert isinstance(second_bundles[0]["csvJson"], dict)
+    mock_run_cmd.assert_called_once()
+    mock_stream.assert_called_once()
+    # the session started from the cache does not start the container at all
+    with cache.use_cache(response_cache):
+        bundles = asyncio.run(async_client.list_bundles_async(IMAGE))
+    assert bundles == first_bundles
+    with cache.use_cache(response_cache):
+        filtered = asyncio.run(
+            collect(async_client.iter_bundles_async(IMAGE, filters={"package": "x"}))
+        )
+    assert filtered == []
+    assert mock_manager.start_container.await_count == 2
+
+
+WRITE_MESSAGE = cache.ResponseCache._write_message
+
+
+def flush_message(entry, message, api_address):
+    written = WRITE_MESSAGE(entry, message, api_address)
+    entry.flush()
+    return written
+
+
+def test_cached_stream_written_while_read(mock_manager, tmp_path):
+    response_cache = cache.ResponseCache(cache_dir=str(tmp_path))
+    written = []
+
+    async def run():
+        async with async_client.AsyncIndexSession(
+            IMAGE, cache=response_cache
+        ) as session:
+            bundles = session.iter_bundles()
+            await bundles.__anext__()
+            # the first message is in the entry before the rest of the stream is read
+            written.extend(
+                os.path.getsize(entry.path) > 0 for entry in os.scandir(tmp_path)
+            )
+            await bundles.aclose()
+
+    with patch(
+        "OIIInspector.async_client.run_cmd_stream_async",
+        stream_output("list_bundles.json"),
+    ), patch.object(cache.ResponseCache, "_write_message", staticmethod(flush_message)):
+        asyncio.run(run())
+    assert written == [True]
+    # incomplete response is not stored
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,97 @@
+from unittest.mock import patch, MagicMock
+import io
+import json
+from OIIInspector import batch
+
+
+def test_read_queries_jsonl():
+    queries_file = io.StringIO(
+        '{"image": "a", "method": "list_packages"}\n'
+        "\n"
+        "not json\n"
+        '{"image": "b", "method": "get_package", "args": ["test"]}\n'
+    )
+    assert list(batch.read_queries(queries_file)) == [
+        {"image": "a", "method": "list_packages"},
+        "not json",
+        {"image": "b", "method": "get_package", "args": ["test"]},
+    ]
+
+
+def test_read_queries_json_list():
+    queries = [{"image": "a", "method": "list_packages"}]
+    assert list(batch.read_queries(io.StringIO(json.dumps(queries)))) == queries
+
+
+@patch("OIIInspector.batch.IndexSession")
+def test_run_queries(mock_index_session):
+    sessions = {}
+
+    def create_session(image, **session_options):
+        session = sessions[image] = MagicMock()
+        session.__enter__.return_value = session
+        session.get_package.side_effect = lambda name: {"name": name, "image": image}
+        session.list_packages.side_effect = RuntimeError("grpcurl failed")
+        return session
+
+    mock_index_session.side_effect = create_session
+    queries = [
+        {"image": "a", "method": "get_package", "args": ["first"], "id": "q1"},
+        {"image": "b", "method": "get_package", "args": {"name": "second"}},
+        "not json",
+        {"image": "a", "method": "list_packages"},
+        {"image": "a", "method": "remove_everything"},
+        {"method": "list_packages"},
+        {"image": "b", "method": "get_package", "args": "third"},
+    ]
+    results = list(batch.run_queries(queries, transport="grpc"))
+    assert results == [
+        {
+            "index": 0,
+            "id": "q1",
+            "image": "a",
+            "method": "get_package",
+            "result": {"name": "first", "image": "a"},
+        },
+        {
+            "index": 1,
+            "image": "b",
+            "method": "get_package",
+            "result": {"name": "second", "image": "b"},
+        },
+        {"index": 2, "error": "ValueError: Query is not a JSON object: not json"},
+        {
+            "index": 3,
+            "image": "a",
+            "method": "list_packages",
+            "error": "RuntimeError: grpcurl failed",
+        },
+        {
+            "index": 4,
+            "image": "a",
+            "method": "remove_everything",
+            "error": "ValueError: Unknown method remove_everything",
+        },
+        {
+            "index": 5,
+            "method": "list_packages",
+            "error": "ValueError: Query has no image address",
+        },
+        {
+            "index": 6,
+            "image": "b",
+            "method": "get_package",
+            "error": "ValueError: Arguments of the query have to be list or object",
+        },
+    ]
+    # every image is opened once, in order of its first query
+    assert [call.args for call in mock_index_session.call_args_list] == [("a",), ("b",)]
+    assert mock_index_session.call_args.kwargs == {"transport": "grpc"}
+    sessions["a"].__exit__.assert_called_once()
+    sessions["b"].__exit__.assert_called_once()
+
+
+def test_run_queries_without_valid_query():
+    assert list(batch.run_queries(["not json"])) == [
+        {"index": 0, "error": "ValueError: Query is not a JSON object: not json"}
+    ]
@@ -0,0 +1,158 @@
+import errno
+import io
+import os
+from unittest.mock import patch
+import pytest
+from OIIInspector import cache, profiling
+from OIIInspector.oii_client import IndexSession, get_bundle, list_bundles
+
+input_file_name = "./tests/data/{test_name}"
+IMAGE = "registry.test/index@sha256:1234"
+
+
+def load_file(file_name):
+    test_file_name = input_file_name.format(test_name=file_name)
+    return open(test_file_name, "r").read()
+
+
+@pytest.fixture
+def response_cache(tmp_path):
+    return cache.ResponseCache(cache_dir=str(tmp_path))
+
+
+@patch("OIIInspector.cache.run_cmd", return_value="sha256:abcd\n")
+def test_resolve_image_digest(mock_run_cmd):
+    assert cache.resolve_image_digest(IMAGE) == "sha256:1234"
+    mock_run_cmd.assert_not_called()
+    assert cache.resolve_image_digest("registry.test/index:v4.9") == "sha256:abcd"
+    mock_run_cmd.assert_called_once_with(
+        "skopeo inspect --format {{.Digest}} docker://registry.test/index:v4.9"
+    )
+    mock_run_cmd.side_effect = FileNotFoundError
+    assert cache.resolve_image_digest("registry.test/index:v4.9") is None
+
+
+def test_store_and_load(response_cache, tmp_path):
+    assert response_cache.load(IMAGE, "ListBundles") is None
+    messages = [{"csvName": "a"}, {"csvName": "b"}]
+    assert list(response_cache.store(IMAGE, "ListBundles", None, messages)) == messages
+    profiler = profiling.Profiler()
+    with profiling.use_profiler(profiler):
+        assert list(response_cache.load(IMAGE, "ListBundles")) == messages
+    assert profiler.report()["counters"]["bytes_read"] == len(
+        '{"csvName": "a"}\n{"csvName": "b"}\n'
+    )
+    # different arguments and different image digests are different entries
+    assert response_cache.load(IMAGE, "ListBundles", "'{\"a\": 1}'") is None
+    assert response_cache.load("registry.test/index@sha256:5678", "ListBundles") is None
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_store_not_finished(response_cache, tmp_path):
+    stored = response_cache.store(
+        IMAGE, "ListBundles", None, iter([{"a": 1}, {"b": 2}])
+    )
+    assert next(stored) == {"a": 1}
+    stored.close()
+    assert os.listdir(tmp_path) == []
+    assert response_cache.load(IMAGE, "ListBundles") is None
+
+
+def test_cache_dir_not_writable(tmp_path):
+    (tmp_path / "file").write_text("")
+    # the cache directory can not be created under a file
+    response_cache = cache.ResponseCache(cache_dir=str(tmp_path / "file" / "cache"))
+    messages = [{"csvName": "a"}]
+    assert list(response_cache.store(IMAGE, "ListBundles", None, messages)) == messages
+    assert response_cache.load(IMAGE, "ListBundles") is None
+
+
+class FullDiskFile(io.StringIO):
+    """Entry file failing on every write."""
+
+    def write(self, text):
+        """Fail as the write to a full disk does."""
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+
+def test_store_write_failure(response_cache, tmp_path):
+    messages = [{"csvName": "a"}, {"csvName": "b"}]
+
+    def open_full_disk_file(fd, *args, **kwargs):
+        os.close(fd)
+        return FullDiskFile()
+
+    with patch("OIIInspector.cache.os.fdopen", side_effect=open_full_disk_file):
+        stored = list(response_cache.store(IMAGE, "ListBundles", None, messages))
+    assert stored == messages
+    with patch("OIIInspector.cache.os.replace", side_effect=PermissionError):
+        stored = list(response_cache.store(IMAGE, "ListBundles", None, messages))
+    assert stored == messages
+    assert os.listdir(tmp_path) == []
+    assert response_cache.load(IMAGE, "ListBundles") is None
+
+
+@patch("OIIInspector.cache.resolve_image_digest", return_value=None)
+def test_image_without_digest_is_not_cached(mock_resolve, response_cache, tmp_path):
+    assert list(response_cache.store("test:1", "ListBundles", None, [{"a": 1}])) == [
+        {"a": 1}
+    ]
+    assert response_cache.load("test:1", "ListBundles") is None
+    assert os.listdir(tmp_path) == []
+    # digest is resolved only once
+    mock_resolve.assert_called_once_with("test:1")
+
+
+def test_refresh(response_cache, tmp_path):
+    list(response_cache.store(IMAGE, "ListPackages", None, [{"name": "old"}]))
+    refreshing_cache = cache.ResponseCache(cache_dir=str(tmp_path), refresh=True)
+    assert refreshing_cache.load(IMAGE, "ListPackages") is None
+    list(refreshing_cache.store(IMAGE, "ListPackages", None, [{"name": "new"}]))
+    assert list(response_cache.load(IMAGE, "ListPackages")) == [{"name": "new"}]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    response_cache = cache.ResponseCache(cache_dir=str(tmp_path), max_size=250)
+    message = {"csvName": "x" * 90}
+    for number, api_address in enumerate(("First", "Second")):
+        list(response_cache.store(IMAGE, api_address, None, [message]))
+        for name in os.listdir(tmp_path):
+            os.utime(tmp_path / name, (number, number))
+    # loading marks the entry as recently used
+    list(response_cache.load(IMAGE, "First"))
+    list(response_cache.store(IMAGE, "Third", None, [message]))
+    assert response_cache.load(IMAGE, "Second") is None
+    assert response_cache.load(IMAGE, "First") is not None
+    assert response_cache.load(IMAGE, "Third") is not None
+
+
+def test_use_cache(response_cache):
+    assert cache.get_active_cache() is None
+    with cache.use_cache(response_cache):
+        assert cache.get_active_cache() is response_cache
+        with cache.use_cache(None):
+            assert cache.get_active_cache() is None
+    assert cache.get_active_cache() is None
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+@patch("OIIInspector.oii_client.run_cmd_stream")
+@patch("OIIInspector.oii_client.run_cmd", return_value=load_file("get_bundle.json"))
+def test_cached_queries_do_not_start_container(
+    mock_run_cmd, mock_run_cmd_stream, mock_container_manager, response_cache
+):
+    mock_run_cmd_stream.return_value = iter([load_file("list_bundles.json")])
+    with cache.use_cache(response_cache):
+        first_bundle = get_bundle(IMAGE, "pkg", "4.3", "csv")
+        first_listing = list_bundles(IMAGE)
+    assert mock_container_manager.call_count == 2
+
+    mock_container_manager.reset_mock()
+    with IndexSession(IMAGE, cache=response_cache) as session:
+        assert session.get_bundle("pkg", "4.3", "csv") == first_bundle
+        assert session.list_bundles() == first_listing
+        # not cached arguments are queried
+        session.get_bundle("pkg", "4.3", "other-csv")
+    mock_container_manager.assert_called_once_with(IMAGE)
+    assert mock_run_cmd.call_count == 2
+    mock_run_cmd_stream.assert_called_once()
@@ -0,0 +1,127 @@
+from unittest.mock import MagicMock
+import pytest
+from OIIInspector.catalog_index import CatalogIndex
+
+ETCD_API = {
+    "group": "etcd.database.coreos.com",
+    "version": "v1beta2",
+    "kind": "EtcdCluster",
+}
+
+
+def bundle(package, channel, csv_name, version, **fields):
+    return {
+        "packageName": package,
+        "channelName": channel,
+        "csvName": csv_name,
+        "version": version,
+        **fields,
+    }
+
+
+BUNDLES = [
+    bundle("etcd", "stable", "etcd.v0.9.0", "0.9.0", providedApis=[ETCD_API]),
+    bundle(
+        "etcd",
+        "stable",
+        "etcd.v0.9.2",
+        "0.9.2",
+        replaces="etcd.v0.9.0",
+        providedApis=[ETCD_API],
+    ),
+    bundle("etcd", "stable", "etcd.v0.9.3", "0.9.3", replaces="etcd.v0.9.2"),
+    bundle(
+        "etcd",
+        "stable",
+        "etcd.v0.9.4",
+        "0.9.4",
+        replaces="etcd.v0.9.2",
+        skips=["etcd.v0.9.3"],
+        providedApis=[ETCD_API],
+    ),
+    bundle("etcd", "alpha", "etcd.v0.10.0", "0.10.0", providedApis=[ETCD_API]),
+    bundle("other", "beta", "other.v1.0.0", "1.0.0"),
+    bundle("other", "beta", "other.v1.1.0", "1.1.0"),
+]
+
+
+@pytest.fixture
+def catalog():
+    packages = [
+        {"name": "etcd", "defaultChannelName": "stable"},
+        {"name": "other"},
+        {"name": "empty"},
+    ]
+    return CatalogIndex(BUNDLES, packages)
+
+
+def test_point_queries(catalog):
+    assert catalog.get_bundle("etcd", "stable", "etcd.v0.9.2") is BUNDLES[1]
+    assert catalog.get_bundle_for_channel("etcd", "stable") is BUNDLES[3]
+    assert catalog.get_bundle_that_replaces("etcd", "stable", "etcd.v0.9.0") is (
+        BUNDLES[1]
+    )
+    # skipped bundle is replaced by the skipping one, as in the registry
+    assert catalog.get_bundle_that_replaces("etcd", "stable", "etcd.v0.9.3") is (
+        BUNDLES[3]
+    )
+    assert catalog.get_package("etcd") == {
+        "name": "etcd",
+        "channels": [
+            {"name": "alpha", "csvName": "etcd.v0.10.0"},
+            {"name": "stable", "csvName": "etcd.v0.9.4"},
+        ],
+        "defaultChannelName": "stable",
+    }
+    # the only channel is the default one, broken channel has head of the highest version
+    assert catalog.get_package("other") == {
+        "name": "other",
+        "channels": [{"name": "beta", "csvName": "other.v1.1.0"}],
+        "defaultChannelName": "beta",
+    }
+    assert catalog.get_package("empty") == {"name": "empty", "channels": []}
+    assert catalog.get_default_bundle_that_provides(
+        "etcd.database.coreos.com", "v1beta2", "EtcdCluster", "etcdclusters"
+    ) is (BUNDLES[3])
+    assert catalog.list_packages() == [
+        {"name": "empty"},
+        {"name": "etcd"},
+        {"name": "other"},
+    ]
+    assert catalog.list_bundles() == BUNDLES
+
+
+def test_missing_entries(catalog):
+    with pytest.raises(RuntimeError):
+        catalog.get_bundle("etcd", "stable", "etcd.v1.0.0")
+    with pytest.raises(RuntimeError):
+        catalog.get_bundle_for_channel("etcd", "beta")
+    with pytest.raises(RuntimeError):
+        catalog.get_bundle_that_replaces("etcd", "stable", "etcd.v0.9.4")
+    with pytest.raises(RuntimeError):
+        catalog.get_package("missing")
+    with pytest.raises(RuntimeError):
+        catalog.get_default_bundle_that_provides("group", "v1", "Kind")
+
+
+def test_from_session():
+    session = MagicMock()
+    session.iter_bundles.return_value = iter(BUNDLES)
+    session.list_packages.return_value = [{"name": "etcd"}]
+    session.get_package.return_value = {"name": "etcd", "defaultChannelName": "alpha"}
+    catalog = CatalogIndex.from_session(session)
+    # default channel of package with several channels is not known from ListPackages, it is queried once
+    assert catalog.get_package("etcd")["defaultChannelName"] == "alpha"
+    assert catalog.get_default_bundle_that_provides(
+        "etcd.database.coreos.com", "v1beta2", "EtcdCluster"
+    ) is (BUNDLES[4])
+    session.get_package.assert_called_once_with("etcd")
+    # the only channel is the default one without the query
+    assert catalog.get_package("other")["defaultChannelName"] == "beta"
+    session.get_package.assert_called_once_with("etcd")
+    assert catalog.get_bundle_for_channel("etcd", "alpha") is BUNDLES[4]
+
+
+def test_default_channel_not_known():
+    catalog = CatalogIndex(BUNDLES, [{"name": "etcd"}])
+    assert "defaultChannelName" not in catalog.get_package("etcd")
@@ -0,0 +1,107 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from unittest.mock import patch, MagicMock
+from OIIInspector import cli
+from OIIInspector.cache import ResponseCache
+from OIIInspector.oii_client import IndexSession
+
+# modules not needed to list the subcommands, or to answer a query from the cache
+HEAVY_MODULES = ("asyncio", "http.server", "grpc", "OIIInspector.oii_inspector_calls")
+OTHER_SUBCOMMAND_MODULES = (
+    "OIIInspector.index_diff",
+    "OIIInspector.metrics",
+    "OIIInspector.parallel",
+    "OIIInspector.shell",
+    "OIIInspector.snapshot",
+)
+# seconds from the start of the oii command until it exits, without start of the interpreter
+RUN_BUDGET = 0.1
+IMAGE = "registry.test/index@sha256:1234"
+
+
+def run_oii(sysargs, env=None):
+    """Run the oii command in new interpreter, return its duration, imported modules and output."""
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "from OIIInspector import cli\n"
+        "try:\n"
+        f"    cli.main({sysargs!r})\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(time.perf_counter() - start, file=sys.stderr)\n"
+        "print(' '.join(sys.modules), file=sys.stderr)\n"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, **(env or {})},
+    )
+    duration, modules = completed.stderr.splitlines()[-2:]
+    return float(duration), modules.split(), completed.stdout
+
+
+@patch("OIIInspector.oii_inspector_calls.get_package_main")
+def test_main(mock_get_package_main):
+    cli.main(["oii", "get-package", "--address", "a", "--package-name", "b"])
+    mock_get_package_main.assert_called_once_with(
+        ["oii get-package", "--address", "a", "--package-name", "b"]
+    )
+
+
+@patch("OIIInspector.oii_inspector_calls.list_packages_main")
+def test_main_arguments_of_subcommand(mock_list_packages_main):
+    with patch.object(sys, "argv", ["oii", "list-packages", "--help"]):
+        cli.main()
+    mock_list_packages_main.assert_called_once_with(["oii list-packages", "--help"])
+
+
+@pytest.mark.parametrize("sysargs", [["oii"], ["oii", "unknown"], ["oii", "--help"]])
+def test_main_without_subcommand(sysargs, capsys):
+    with pytest.raises(SystemExit):
+        cli.main(sysargs)
+    assert "usage: oii [-h] COMMAND ..." in "".join(capsys.readouterr())
+
+
+def test_subcommands_exist():
+    from OIIInspector import oii_inspector_calls
+
+    for handler_name, _ in cli.SUBCOMMANDS.values():
+        assert callable(getattr(oii_inspector_calls, handler_name))
+
+
+def test_help_does_not_import_handlers():
+    _, imported, _ = run_oii(["oii", "--help"])
+    assert not set(HEAVY_MODULES) & set(imported)
+
+
+@pytest.fixture
+def cached_response(tmp_path):
+    """Cache the response of GetPackage of an image pinned by digest, so no container is needed to answer it."""
+    transport = MagicMock(requires_container=False)
+    transport.messages.return_value = iter([{"name": "etcd"}])
+    response_cache = ResponseCache(cache_dir=str(tmp_path / "cache"))
+    with IndexSession(IMAGE, cache=response_cache, transport=transport) as session:
+        session.get_package("etcd")
+    return {
+        "OIIINSPECTOR_CACHE_DIR": str(tmp_path / "cache"),
+        "OIIINSPECTOR_DAEMON_SOCKET": str(tmp_path / "daemon.sock"),
+    }
+
+
+def test_help_and_cached_query_budget(cached_response):
+    query = ["oii", "get-package", "--address", IMAGE, "--package-name", "etcd"]
+    for sysargs, env in ((["oii", "--help"], None), (query, cached_response)):
+        runs = [run_oii(sysargs, env) for _ in range(3)]
+        assert not set(HEAVY_MODULES[:-1]) & set(runs[0][1])
+        # the fastest run is compared, so the budget is not exceeded just by a busy machine
+        assert min(duration for duration, _, _ in runs) < RUN_BUDGET
+    # the query has been answered from the cache
+    assert json.loads(runs[0][2]) == {"name": "etcd"}
+    # modules of the other subcommands are not imported
+    assert not set(OTHER_SUBCOMMAND_MODULES) & set(runs[0][1])
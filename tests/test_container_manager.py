@@ -1,70 +1,85 @@
 from unittest import mock
 from unittest.mock import patch, call
 import OIIInspector.container_manager as container_manager
+import OIIInspector.container_runtime as container_runtime
 import pytest
 import OIIInspector.exceptions as exceptions
 import retry.api
 import shlex
 
 
+@pytest.fixture(autouse=True)
+def mock_detect_runtime():
+    with patch(
+        "OIIInspector.container_manager.detect_runtime",
+        return_value=container_runtime.PodmanRuntime(),
+    ) as mock_detect:
+        yield mock_detect
+
+
 @patch("OIIInspector.container_manager.subprocess")
 @patch(
     "OIIInspector.container_manager.run_cmd",
     side_effect=[
-        "no_dock",
-        "/usr/bin/podman",
         "pull-resp",
         "api.Registry.ListPackages",
         "stop-resp",
         "remove-resp",
-        "/usr/bin/docker",
-        "no_pod",
         "pull-result",
         "api.Registry.ListPackages",
         "stop-resp",
         "remove-resp",
-        "pull-resp",
-        "api.Registry.ListPackages",
-        "stop-resp",
-        "remove-resp",
     ],
 )
-def test_platform_check(mock_run_cmd, mock_subprocess):
+@patch("OIIInspector.container_manager.socket")
+def test_runtime_check(mock_socket, mock_run_cmd, mock_subprocess, mock_detect_runtime):
     mock_subprocess.Popen.return_value.poll.return_value = None
     with container_manager.ContainerManager("test") as image_manager_instance:
         image_manager_instance.start_container()
-    assert call("command -v podman") in mock_run_cmd.call_args_list
-    assert call("command -v docker") in mock_run_cmd.call_args_list
-    assert image_manager_instance._container_platform == "podman"
-
-    with container_manager.ContainerManager("test") as image_manager_instance:
-        image_manager_instance.start_container()
-    assert call("command -v podman") in mock_run_cmd.call_args_list
-    assert call("command -v docker") in mock_run_cmd.call_args_list
-    assert image_manager_instance._container_platform == "docker"
+    mock_detect_runtime.assert_called_once_with()
+    assert image_manager_instance._runtime.name == "podman"
+    assert call("podman pull test") in mock_run_cmd.call_args_list
 
     mock_run_cmd.reset_mock()
-    with container_manager.ContainerManager("test") as image_manager_instance:
-        image_manager_instance._container_platform = "podman"
-        image_manager_instance.start_container()
-    assert call("command -v podman") not in mock_run_cmd.call_args_list
-    assert call("command -v docker") not in mock_run_cmd.call_args_list
-    assert call("podman pull test") in mock_run_cmd.call_args_list
+    docker = container_runtime.DockerRuntime()
+    with container_manager.ContainerManager("test", runtime=docker) as image_manager:
+        image_manager.start_container()
+    mock_detect_runtime.assert_called_once_with()
+    assert call("docker pull test") in mock_run_cmd.call_args_list
+    assert (
+        call(
+            "docker stop OIIInspector_running_container_{port}".format(
+                port=image_manager._port
+            ),
+            tolerate_err=False,
+        )
+        in mock_run_cmd.call_args_list
+    )
 
 
 @patch("OIIInspector.container_manager.run_cmd")
-def test_platform_missing(mock_run_cmd):
-    mock_run_cmd.return_value = ""
+def test_runtime_missing(mock_run_cmd, mock_detect_runtime):
+    mock_detect_runtime.side_effect = exceptions.OIIInspectorError
     with pytest.raises(exceptions.OIIInspectorError):
         container_manager.ContainerManager("test").start_container()
-    assert mock_run_cmd.call_count == 2
-    assert call("command -v podman") in mock_run_cmd.call_args_list
-    assert call("command -v docker") in mock_run_cmd.call_args_list
+    mock_run_cmd.assert_not_called()
+
+
+@patch("OIIInspector.container_manager.run_cmd")
+def test_copy_from_image(mock_run_cmd):
+    mock_run_cmd.side_effect = ["container_id\n", "", ""]
+    container_manager.ContainerManager("test_address").copy_from_image(
+        "/database/index.db", "/tmp/index.db"
+    )
+    assert mock_run_cmd.call_args_list == [
+        call("podman create test_address"),
+        call("podman cp container_id:/database/index.db /tmp/index.db"),
+        call("podman rm container_id", tolerate_err=True),
+    ]
 
 
 @patch("OIIInspector.container_manager.run_cmd")
 def test_address_setup(mock_run_cmd):
-    mock_run_cmd.return_value = "/usr/bin/podman"
     with container_manager.ContainerManager("test_address") as image_manager_instance:
         assert image_manager_instance._image_address == "test_address"
 
@@ -73,15 +88,15 @@ def test_address_setup(mock_run_cmd):
 @patch(
     "OIIInspector.container_manager.run_cmd",
     side_effect=[
-        "no_dock",
-        "/usr/bin/podman",
         "pull-resp",
         "api.Registry.ListPackages",
         "stop-resp",
         "remove-resp",
     ],
 )
-def test_container_commands(mock_run_cmd, mock_subprocess):
+@patch("OIIInspector.container_manager.socket")
+@patch("OIIInspector.container_manager.reserve_free_port", return_value=50051)
+def test_container_commands(mock_reserve, mock_socket, mock_run_cmd, mock_subprocess):
     mock_subprocess.Popen.return_value.poll.return_value = None
     mock_subprocess.PIPE = "test_PIPE"
     with container_manager.ContainerManager("test_address") as image_manager_instance:
@@ -127,9 +142,10 @@ def test_get_address_before_running(mock_subprocess):
 @patch("OIIInspector.container_manager.subprocess")
 @patch(
     "OIIInspector.container_manager.run_cmd",
-    side_effect=["not_d_ocker", "/usr/bin/podman", "pull-resp", "rm-resp"],
+    side_effect=["pull-resp", "stop-resp", "rm-resp"],
 )
-def test_time_out(mock_run_cmd, mock_subprocess, mock_time):
+@patch("OIIInspector.container_manager.reserve_free_port", return_value=53291)
+def test_time_out(mock_reserve, mock_run_cmd, mock_subprocess, mock_time):
     mock_subprocess.Popen.return_value.poll.return_value = None
     mock_time.time.side_effect = [5, 11]
 
@@ -141,12 +157,17 @@ def test_time_out(mock_run_cmd, mock_subprocess, mock_time):
             ) as image_manager_instance:
                 image_manager_instance.start_container()
     mock_subprocess.Popen.return_value.kill.assert_called_once()
-    assert mock_run_cmd.call_count == 4
+    # container started at the reserved port is removed, errors of the cleanup do not hide the start error
+    assert mock_run_cmd.call_args_list[1:] == [
+        call("podman stop OIIInspector_running_container_53291", tolerate_err=True),
+        call("podman rm OIIInspector_running_container_53291", tolerate_err=True),
+    ]
 
 
 @patch("OIIInspector.container_manager.subprocess")
-@patch("OIIInspector.container_manager.run_cmd", return_value="/usr/bin/podman")
-def test_retry_called_twice(mock_run_cmd, mock_subprocess):
+@patch("OIIInspector.container_manager.run_cmd", return_value="")
+@patch("OIIInspector.container_manager.socket")
+def test_retry_called_twice(mock_socket, mock_run_cmd, mock_subprocess):
     mock_subprocess.Popen.return_value.poll.return_value = None
     with pytest.raises(exceptions.OIIInspectorError):
         with container_manager.ContainerManager(
@@ -155,22 +176,25 @@ def test_retry_called_twice(mock_run_cmd, mock_subprocess):
             image_manager_instance.start_container()
     # other ports are not used, as exception will get trough try block in _serve_index_registry
     assert mock_subprocess.Popen.return_value.kill.call_count == 2
-    assert mock_run_cmd.call_count > 5
+    assert mock_run_cmd.call_count > 3
 
 
 @patch("OIIInspector.container_manager.subprocess")
 @patch(
     "OIIInspector.container_manager.run_cmd",
     side_effect=[
-        "not_d_ocker",
-        "/usr/bin/podman",
         "pull_resp",
         "api.Registry.ListPackages",
         "stop-resp",
         "rm-resp",
     ],
 )
-def test_address_already_in_use_and_next_port_used(mock_run_cmd, mock_subprocess):
+@patch("OIIInspector.container_manager.socket")
+@patch("OIIInspector.container_manager.release_port")
+@patch("OIIInspector.container_manager.reserve_free_port", side_effect=[41000, 41001])
+def test_address_already_in_use_and_next_port_used(
+    mock_reserve, mock_release, mock_socket, mock_run_cmd, mock_subprocess
+):
     # only two return values are needed, as the retry decorator will not be applied due to thrown exception
     mock_subprocess.Popen.return_value.poll.side_effect = ["terminated", None]
     mock_subprocess.Popen.return_value.stderr.read.return_value = (
@@ -178,25 +202,25 @@ def test_address_already_in_use_and_next_port_used(mock_run_cmd, mock_subprocess
     )
     with container_manager.ContainerManager("test_address") as image_manager_instance:
         image_manager_instance.start_container()
-        assert (
-            image_manager_instance._port == image_manager_instance._grpc_start_port + 1
-        )
-    assert mock_run_cmd.call_count == 6
+        # port used by other service is released and another reserved port is used
+        assert image_manager_instance._port == 41001
+        mock_release.assert_called_once_with(41000)
+    mock_release.assert_called_with(41001)
+    assert mock_run_cmd.call_count == 4
 
 
 @patch("OIIInspector.container_manager.subprocess")
 @patch(
     "OIIInspector.container_manager.run_cmd",
     side_effect=[
-        "not_d_ocker",
-        "/usr/bin/podman",
         "pull_resp",
         "api.Registry.ListPackages",
         "stop-resp",
         "rm-resp",
     ],
 )
-def test_exception_address_used(mock_run_cmd, mock_subprocess):
+@patch("OIIInspector.container_manager.socket")
+def test_exception_address_used(mock_socket, mock_run_cmd, mock_subprocess):
     mock_subprocess.Popen.return_value.poll.side_effect = ["terminated", None]
     mock_subprocess.Popen.return_value.stderr.read.return_value = (
         "address already in use"
@@ -204,22 +228,21 @@ def test_exception_address_used(mock_run_cmd, mock_subprocess):
     with container_manager.ContainerManager("test_address") as image_manager_instance:
         image_manager_instance.start_container()
         assert mock_subprocess.Popen.return_value.poll.call_count == 2
-    assert mock_run_cmd.call_count == 6
+    assert mock_run_cmd.call_count == 4
 
 
 @patch("OIIInspector.container_manager.subprocess")
 @patch(
     "OIIInspector.container_manager.run_cmd",
     side_effect=[
-        "not_d_ocker",
-        "/usr/bin/podman",
         "pull_resp",
         "api.Registry.ListPackages",
         "stop-resp",
         "rm-resp",
     ],
 )
-def test_exception_name_in_use(mock_run_cmd, mock_subprocess):
+@patch("OIIInspector.container_manager.socket")
+def test_exception_name_in_use(mock_socket, mock_run_cmd, mock_subprocess):
     mock_subprocess.Popen.return_value.poll.side_effect = ["terminated", None]
     mock_subprocess.Popen.return_value.stderr.read.return_value = (
         "the container name test_ is already in use by test_"
@@ -227,29 +250,31 @@ def test_exception_name_in_use(mock_run_cmd, mock_subprocess):
     with container_manager.ContainerManager("test_address") as image_manager_instance:
         image_manager_instance.start_container()
         assert mock_subprocess.Popen.return_value.poll.call_count == 2
-    assert mock_run_cmd.call_count == 6
+    assert mock_run_cmd.call_count == 4
 
 
 @patch("OIIInspector.container_manager.subprocess")
 @patch(
     "OIIInspector.container_manager.run_cmd",
     side_effect=[
-        "not_d_ocker",
-        "/usr/bin/podman",
         "pull_resp",
         "api.Registry.ListPackages",
         "stop-resp",
         "rm-resp",
     ],
 )
-def test_exception_unknown(mock_run_cmd, mock_subprocess):
+@patch("OIIInspector.container_manager.socket")
+@patch("OIIInspector.container_manager.reserve_free_port", return_value=41000)
+def test_exception_unknown(mock_reserve, mock_socket, mock_run_cmd, mock_subprocess):
     mock_subprocess.Popen.return_value.poll.side_effect = ["terminated", None]
     # retry is applied
     with container_manager.ContainerManager("test_address") as image_manager_instance:
         image_manager_instance.start_container()
         assert mock_subprocess.Popen.return_value.poll.call_count == 2
-        assert image_manager_instance._port == image_manager_instance._grpc_start_port
-    assert mock_run_cmd.call_count == 6
+        # retry is done at the same port
+        assert image_manager_instance._port == 41000
+        mock_reserve.assert_called_once()
+    assert mock_run_cmd.call_count == 4
 
 
 @patch("OIIInspector.container_manager.time.sleep")
@@ -257,7 +282,7 @@ def test_exception_unknown(mock_run_cmd, mock_subprocess):
 @patch("OIIInspector.container_manager.subprocess")
 @patch(
     "OIIInspector.container_manager.run_cmd",
-    side_effect=["not_d_ocker", "/usr/bin/podman", "pull-resp", "rm-resp"],
+    side_effect=["pull-resp", "stop-resp", "rm-resp"],
 )
 def test_exception_no_free_port(mock_run_cmd, mock_subprocess, mock_time, mock_sleep):
     mock_subprocess.Popen.return_value.poll.return_value = "terminated"
@@ -270,17 +295,16 @@ def test_exception_no_free_port(mock_run_cmd, mock_subprocess, mock_time, mock_s
             "test_address"
         ) as image_manager_instance:
             image_manager_instance.start_container()
-    assert mock_sleep.call_count == 100
+    # terminated process is detected before any readiness wait
+    assert mock_sleep.call_count == 0
     assert mock_time.call_count == 200
-    assert mock_run_cmd.call_count == 4
+    assert mock_run_cmd.call_count == 3
 
 
 @patch("OIIInspector.container_manager.subprocess")
 @patch(
     "OIIInspector.container_manager.run_cmd",
     side_effect=[
-        "not_d_ocker",
-        "/usr/bin/podman",
         "pull-resp",
         RuntimeError,
         "api.Registry.ListBundles",
@@ -288,11 +312,30 @@ def test_exception_no_free_port(mock_run_cmd, mock_subprocess, mock_time, mock_s
         "remove-resp",
     ],
 )
-def test_grpcurl_query_failed_recovery(mock_run_cmd, mock_subprocess):
+@patch("OIIInspector.container_manager.socket")
+def test_grpcurl_query_failed_recovery(mock_socket, mock_run_cmd, mock_subprocess):
     mock_subprocess.Popen.return_value.poll.return_value = None
     with container_manager.ContainerManager("test_address") as image_manager_instance:
         image_manager_instance.start_container()
-    assert mock_run_cmd.call_count == 7
+    assert mock_run_cmd.call_count == 5
+
+
+@patch("OIIInspector.container_manager.run_cmd", side_effect=FileNotFoundError)
+def test_registry_probe_without_grpcurl(mock_run_cmd):
+    image_manager_instance = container_manager.ContainerManager("test_address")
+    assert image_manager_instance._registry_responds(50051) is False
+
+
+@patch("OIIInspector.container_manager.run_cmd")
+def test_registry_probe_of_transport(mock_run_cmd):
+    probe = mock.MagicMock(side_effect=[False, True])
+    image_manager_instance = container_manager.ContainerManager(
+        "test_address", probe=probe
+    )
+    assert image_manager_instance._registry_responds(50051) is False
+    assert image_manager_instance._registry_responds(50051) is True
+    assert probe.call_args_list == [call("localhost:50051")] * 2
+    mock_run_cmd.assert_not_called()
 
 
 @patch("OIIInspector.container_manager.subprocess")
@@ -314,8 +357,6 @@ def test_already_running_container_will_not_start(mock_run_cmd, mock_subprocess)
 @patch(
     "OIIInspector.container_manager.run_cmd",
     side_effect=[
-        "not_d_ocker",
-        "/usr/bin/podman",
         "pull_resp",
         "api.Registry.ListPackages",
         "stop-resp",
@@ -327,3 +368,181 @@ def test_close_manager_without_pull(mock_run_cmd, mock_subprocess):
     with container_manager.ContainerManager("test") as image_manager_instance:
         image_manager_instance._container_pulled = False
     assert mock_run_cmd.call_count == 0
+
+
+@patch("OIIInspector.container_manager.time.sleep")
+@patch("OIIInspector.container_manager.time.time", side_effect=[10, 10, 10, 10, 10.2])
+@patch("OIIInspector.container_manager.subprocess")
+@patch("OIIInspector.container_manager.socket")
+@patch(
+    "OIIInspector.container_manager.run_cmd", return_value="api.Registry.ListBundles"
+)
+def test_readiness_backoff(
+    mock_run_cmd, mock_socket, mock_subprocess, mock_time, mock_sleep
+):
+    mock_subprocess.Popen.return_value.poll.return_value = None
+    mock_socket.create_connection.side_effect = [
+        ConnectionRefusedError,
+        ConnectionRefusedError,
+        mock.MagicMock(),
+    ]
+    image_manager_instance = container_manager.ContainerManager(
+        "test_address", runtime=container_runtime.PodmanRuntime()
+    )
+    image_manager_instance._serve_index_registry_at_port(50051, 3)
+    # the gRPC probe is done only once the port accepts TCP connections
+    assert mock_run_cmd.call_args_list == [
+        call("grpcurl -plaintext localhost:50051 list api.Registry"),
+    ]
+    assert mock_sleep.call_args_list == [call(0.005), call(0.01)]
+    assert image_manager_instance.readiness_stats == {
+        "wait_time": pytest.approx(0.2),
+        "tcp_attempts": 3,
+        "grpc_probes": 1,
+    }
+
+
+@patch("OIIInspector.container_manager.time.sleep")
+@patch("OIIInspector.container_manager.time.time", side_effect=[0] + [1] * 9 + [5])
+@patch("OIIInspector.container_manager.subprocess")
+@patch("OIIInspector.container_manager.socket")
+@patch("OIIInspector.container_manager.run_cmd", return_value="")
+def test_readiness_backoff_limit(
+    mock_run_cmd, mock_socket, mock_subprocess, mock_time, mock_sleep
+):
+    mock_subprocess.Popen.return_value.poll.return_value = None
+    image_manager_instance = container_manager.ContainerManager(
+        "test_address", runtime=container_runtime.PodmanRuntime()
+    )
+    with mock.patch.object(retry.api, "__retry_internal", lambda f, *args: f()):
+        with pytest.raises(exceptions.OIIInspectorError):
+            image_manager_instance._serve_index_registry_at_port(50051, 3)
+    delays = [delay_call.args[0] for delay_call in mock_sleep.call_args_list]
+    assert delays == [0.005, 0.01, 0.02, 0.04, 0.08, 0.16, 0.25, 0.25, 0.25]
+    assert mock_run_cmd.call_count == 9
+    assert image_manager_instance.readiness_stats is None
+
+
+@patch("OIIInspector.container_manager.socket")
+def test_port_accepts_connections(mock_socket):
+    image_manager_instance = container_manager.ContainerManager("test_address")
+    assert image_manager_instance._port_accepts_connections(50051) is True
+    mock_socket.create_connection.assert_called_once_with(
+        ("localhost", 50051), timeout=0.1
+    )
+    mock_socket.create_connection.side_effect = OSError
+    assert image_manager_instance._port_accepts_connections(50051) is False
+
+
+@patch("OIIInspector.container_manager.subprocess")
+@patch("OIIInspector.container_manager.socket")
+@patch("OIIInspector.container_manager.release_port")
+@patch("OIIInspector.container_manager.reserve_free_port", return_value=41000)
+@patch(
+    "OIIInspector.container_manager.run_cmd", return_value="api.Registry.ListBundles"
+)
+def test_reserved_port_published_to_registry_port(
+    mock_run_cmd, mock_reserve, mock_release, mock_socket, mock_subprocess
+):
+    mock_subprocess.Popen.return_value.poll.return_value = None
+    with container_manager.ContainerManager("test_address") as image_manager_instance:
+        image_manager_instance.start_container()
+        assert image_manager_instance.local_address_of_image == "localhost:41000"
+        mock_release.assert_not_called()
+    assert mock_subprocess.Popen.call_args.args[0] == shlex.split(
+        "podman run --name=OIIInspector_running_container_41000 -p=41000:50051 test_address"
+    )
+    mock_release.assert_called_once_with(41000)
+
+
+@patch("OIIInspector.container_manager.release_port")
+@patch("OIIInspector.container_manager.reserve_free_port", return_value=41000)
+def test_reserved_port_released_on_failure(mock_reserve, mock_release):
+    image_manager_instance = container_manager.ContainerManager("test_address")
+    with patch.object(
+        image_manager_instance,
+        "_serve_index_registry_at_port",
+        side_effect=exceptions.OIIInspectorError,
+    ):
+        with pytest.raises(exceptions.OIIInspectorError):
+            image_manager_instance._serve_index_registry()
+    mock_release.assert_called_once_with(41000)
+
+
+@patch("OIIInspector.container_manager.release_port")
+def test_port_not_reserved_is_not_released(mock_release):
+    with container_manager.ContainerManager("test_address"):
+        pass
+    # the default port may be reserved by another manager in the process
+    mock_release.assert_not_called()
+
+
+def test_container_limits():
+    limits = container_manager.ContainerLimits(max_pulls=1, max_containers=1)
+    with limits.pull_slot():
+        assert limits._pulls.acquire(blocking=False) is False
+    assert limits._pulls.acquire(blocking=False) is True
+    limits.acquire_container_slot()
+    assert limits._containers.acquire(blocking=False) is False
+    limits.release_container_slot()
+    unlimited = container_manager.ContainerLimits()
+    with unlimited.pull_slot():
+        unlimited.acquire_container_slot()
+        unlimited.release_container_slot()
+
+
+@patch("OIIInspector.container_manager.release_port")
+@patch("OIIInspector.container_manager.reserve_free_port", return_value=41000)
+@patch("OIIInspector.container_manager.subprocess")
+@patch("OIIInspector.container_manager.socket")
+@patch(
+    "OIIInspector.container_manager.run_cmd", return_value="api.Registry.ListBundles"
+)
+def test_container_slot_held_while_running(
+    mock_run_cmd, mock_socket, mock_subprocess, mock_reserve, mock_release
+):
+    mock_subprocess.Popen.return_value.poll.return_value = None
+    limits = container_manager.ContainerLimits(max_pulls=1, max_containers=1)
+    with container_manager.ContainerManager("test", limits=limits) as image_manager:
+        image_manager.start_container()
+        assert limits._pulls.acquire(blocking=False) is True
+        limits._pulls.release()
+        assert limits._containers.acquire(blocking=False) is False
+    assert limits._containers.acquire(blocking=False) is True
+
+
+@patch("OIIInspector.container_manager.run_cmd")
+def test_pull_policy(mock_run_cmd, monkeypatch):
+    monkeypatch.delenv(container_manager.PULL_POLICY_ENV, raising=False)
+    podman = container_runtime.PodmanRuntime()
+    mock_run_cmd.return_value = ""
+    container_manager.ContainerManager("test:v1", runtime=podman)._pull_image()
+    assert mock_run_cmd.call_args_list == [call("podman pull test:v1")]
+
+    # digest pinned image is not pulled again, even with the default policy
+    mock_run_cmd.reset_mock()
+    mock_run_cmd.return_value = "sha256:1234\n"
+    container_manager.ContainerManager("test@sha256:1234", runtime=podman)._pull_image()
+    assert mock_run_cmd.call_args_list == [
+        call(
+            "podman image inspect --format {{.Id}} test@sha256:1234",
+            tolerate_err=True,
+        )
+    ]
+
+    mock_run_cmd.reset_mock()
+    mock_run_cmd.return_value = ""
+    container_manager.ContainerManager(
+        "test:v1", runtime=podman, pull_policy="if-not-present"
+    )._pull_image()
+    assert mock_run_cmd.call_args_list == [
+        call("podman image inspect --format {{.Id}} test:v1", tolerate_err=True),
+        call("podman pull test:v1"),
+    ]
+
+    monkeypatch.setenv(container_manager.PULL_POLICY_ENV, "never")
+    image_manager = container_manager.ContainerManager("test:v1", runtime=podman)
+    with pytest.raises(exceptions.OIIInspectorError, match="not present"):
+        image_manager._pull_image()
+    with pytest.raises(exceptions.OIIInspectorError, match="Unknown pull policy"):
+        container_manager.ContainerManager("test:v1", pull_policy="sometimes")
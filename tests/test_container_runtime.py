@@ -0,0 +1,71 @@
+from unittest.mock import patch
+import pytest
+import OIIInspector.container_runtime as container_runtime
+import OIIInspector.exceptions as exceptions
+
+
+@pytest.fixture(autouse=True)
+def undetected_runtime(monkeypatch):
+    monkeypatch.setattr(container_runtime, "_detected_runtime", None)
+    monkeypatch.delenv(container_runtime.RUNTIME_ENV, raising=False)
+
+
+def test_runtime_commands():
+    runtime = container_runtime.DockerRuntime()
+    assert repr(runtime) == "DockerRuntime('docker')"
+    assert runtime.pull_command("image") == "docker pull image"
+    assert (
+        runtime.run_command("name", 41000, 50051, "image")
+        == "docker run --name=name -p=41000:50051 image"
+    )
+    assert runtime.stop_command("name") == "docker stop name"
+    assert runtime.remove_command("name") == "docker rm name"
+    assert runtime.create_command("image") == "docker create image"
+    assert (
+        runtime.image_exists_command("image")
+        == "docker image inspect --format {{.Id}} image"
+    )
+    assert runtime.copy_command("id", "/src", "/dst") == "docker cp id:/src /dst"
+    fake = container_runtime.FakeRuntime("/opt/fake-podman")
+    assert fake.pull_command("image") == "/opt/fake-podman pull image"
+
+
+def test_get_runtime():
+    assert isinstance(
+        container_runtime.get_runtime("podman"), container_runtime.PodmanRuntime
+    )
+    fake = container_runtime.get_runtime("/opt/fake-podman")
+    assert isinstance(fake, container_runtime.FakeRuntime)
+    assert fake.executable == "/opt/fake-podman"
+    with pytest.raises(exceptions.OIIInspectorError):
+        container_runtime.get_runtime("lxc")
+
+
+@patch("OIIInspector.container_runtime.shutil.which")
+def test_detect_runtime_once_per_process(mock_which):
+    mock_which.side_effect = lambda name: (
+        "/usr/bin/docker" if name == "docker" else None
+    )
+    runtime = container_runtime.detect_runtime()
+    assert runtime.name == "docker"
+    assert container_runtime.detect_runtime() is runtime
+    assert mock_which.call_count == 2
+
+
+@patch("OIIInspector.container_runtime.shutil.which", return_value="/usr/bin/podman")
+def test_detect_runtime_prefers_podman(mock_which):
+    assert container_runtime.detect_runtime().name == "podman"
+    mock_which.assert_called_once_with("podman")
+
+
+@patch("OIIInspector.container_runtime.shutil.which", return_value=None)
+def test_detect_runtime_missing(mock_which):
+    with pytest.raises(exceptions.OIIInspectorError):
+        container_runtime.detect_runtime()
+
+
+@patch("OIIInspector.container_runtime.shutil.which")
+def test_detect_runtime_from_environment(mock_which, monkeypatch):
+    monkeypatch.setenv(container_runtime.RUNTIME_ENV, "/opt/fake-podman")
+    assert container_runtime.detect_runtime().executable == "/opt/fake-podman"
+    mock_which.assert_not_called()
@@ -0,0 +1,228 @@
+from unittest.mock import patch, MagicMock
+import os
+import socket
+import threading
+import time
+import pytest
+import OIIInspector.exceptions as exceptions
+from OIIInspector import daemon, profiling
+
+
+def create_session(image, **session_options):
+    session = MagicMock(start_error=None)
+    session.image = image
+    session.get_package.side_effect = lambda name: {"name": name, "image": image}
+    session.list_bundles.side_effect = RuntimeError("grpcurl failed")
+    return session
+
+
+@patch("OIIInspector.daemon.IndexSession", side_effect=create_session)
+def test_session_pool_reuses_sessions(mock_index_session):
+    pool = daemon.SessionPool(capacity=2, idle_ttl=60, transport="grpc")
+    assert pool.query("image-1", "get_package", ["a"]) == {
+        "name": "a",
+        "image": "image-1",
+    }
+    assert pool.query("image-1", "get_package", {"name": "b"})["name"] == "b"
+    mock_index_session.assert_called_once_with("image-1", transport="grpc")
+    with pytest.raises(ValueError):
+        pool.query("image-1", "remove_everything")
+    with pytest.raises(RuntimeError):
+        pool.query("image-1", "list_bundles")
+    pool.close()
+    assert pool.images == []
+
+
+@patch("OIIInspector.daemon.IndexSession", side_effect=create_session)
+def test_session_pool_lru_eviction(mock_index_session):
+    pool = daemon.SessionPool(capacity=2, idle_ttl=60)
+    pool.query("image-1", "get_package", ["a"])
+    pool.query("image-2", "get_package", ["a"])
+    first_session = pool._entries["image-1"].session
+    pool.query("image-1", "get_package", ["a"])
+    second_session = pool._entries["image-2"].session
+    pool.query("image-3", "get_package", ["a"])
+    assert pool.images == ["image-1", "image-3"]
+    second_session.close.assert_called_once_with()
+    first_session.close.assert_not_called()
+    pool.close()
+    first_session.close.assert_called_once_with()
+
+
+@patch("OIIInspector.daemon.IndexSession", side_effect=create_session)
+def test_session_pool_idle_eviction(mock_index_session):
+    pool = daemon.SessionPool(capacity=2, idle_ttl=60)
+    pool.query("image-1", "get_package", ["a"])
+    pool.query("image-2", "get_package", ["a"])
+    pool._entries["image-1"].last_used -= 120
+    idle_session = pool._entries["image-1"].session
+    pool.evict_idle()
+    assert pool.images == ["image-2"]
+    idle_session.close.assert_called_once_with()
+    pool.close()
+
+
+@patch("OIIInspector.daemon.IndexSession", side_effect=create_session)
+def test_session_pool_retries_evicted_entry(mock_index_session):
+    pool = daemon.SessionPool()
+    closed_entry = daemon._PoolEntry(create_session("image-1"))
+    closed_entry.close()
+    fresh_entry = daemon._PoolEntry(create_session("image-1"))
+    with patch.object(
+        pool, "_acquire_entry", side_effect=[(closed_entry, []), (fresh_entry, [])]
+    ):
+        assert pool.query("image-1", "get_package", ["a"])["name"] == "a"
+    closed_entry.session.get_package.assert_not_called()
+
+
+@patch("OIIInspector.daemon.IndexSession")
+def test_session_pool_removes_session_failed_to_start(mock_index_session):
+    failed_session = MagicMock(start_error=exceptions.OIIInspectorError("pull failed"))
+    failed_session.get_package.side_effect = failed_session.start_error
+    mock_index_session.side_effect = [failed_session, create_session("image-1")]
+    pool = daemon.SessionPool()
+    with pytest.raises(exceptions.OIIInspectorError):
+        pool.query("image-1", "get_package", ["a"])
+    assert pool.images == []
+    failed_session.close.assert_called_once_with()
+    # the image is started again by the next query
+    assert pool.query("image-1", "get_package", ["a"])["name"] == "a"
+    # the entry replaced in the meantime is kept
+    entry = pool._entries["image-1"]
+    pool._remove_entry("image-1", daemon._PoolEntry(failed_session))
+    assert pool._entries["image-1"] is entry
+    pool.close()
+
+
+@pytest.fixture
+def running_daemon(tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    with patch("OIIInspector.daemon.IndexSession", side_effect=create_session):
+        server = daemon.InspectorDaemon(socket_path, capacity=2, idle_ttl=0.04)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        yield server, socket_path
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+def test_forward_query(running_daemon):
+    server, socket_path = running_daemon
+    assert daemon.forward_query(
+        "image-1", "get_package", ["a"], socket_path=socket_path
+    ) == {"name": "a", "image": "image-1"}
+    assert server.pool.images == ["image-1"]
+    with pytest.raises(exceptions.OIIInspectorError, match="grpcurl failed"):
+        daemon.forward_query("image-1", "list_bundles", socket_path=socket_path)
+    # idle sessions are closed by the daemon
+    for _ in range(100):
+        if not server.pool.images:
+            break
+        time.sleep(0.01)
+    assert server.pool.images == []
+
+
+def test_forward_query_without_daemon(tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    assert (
+        daemon.forward_query("image-1", "list_packages", socket_path=socket_path)
+        is daemon.NOT_RUNNING
+    )
+    # socket left behind by terminated daemon
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+    assert (
+        daemon.forward_query("image-1", "list_packages", socket_path=socket_path)
+        is daemon.NOT_RUNNING
+    )
+
+
+def test_forward_query_untrusted_socket(running_daemon):
+    server, socket_path = running_daemon
+    with patch("OIIInspector.daemon.os.getuid", return_value=os.getuid() + 1):
+        assert (
+            daemon.forward_query("image-1", "list_packages", socket_path=socket_path)
+            is daemon.NOT_RUNNING
+        )
+    os.chmod(os.path.dirname(socket_path), 0o755)
+    assert (
+        daemon.forward_query("image-1", "list_packages", socket_path=socket_path)
+        is daemon.NOT_RUNNING
+    )
+    assert server.pool.images == []
+
+
+def test_forward_query_timeout(tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    # listening socket, which never answers
+    silent = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    silent.bind(socket_path)
+    silent.listen()
+    with silent, pytest.raises(exceptions.OIIInspectorError, match="not answered"):
+        daemon.forward_query(
+            "image-1", "list_packages", socket_path=socket_path, timeout=0.01
+        )
+    with patch("OIIInspector.daemon.socket.socket") as mock_socket:
+        mock_socket.return_value.connect.side_effect = socket.timeout
+        assert (
+            daemon.forward_query("image-1", "list_packages", socket_path=socket_path)
+            is daemon.NOT_RUNNING
+        )
+
+
+def test_daemon_replaces_stale_socket(tmp_path):
+    socket_path = str(tmp_path / "run" / "daemon.sock")
+    os.mkdir(tmp_path / "run", 0o700)
+    open(socket_path, "w").close()
+    server = daemon.InspectorDaemon(socket_path)
+    # the socket is created accessible only by its owner
+    assert os.stat(socket_path).st_mode & 0o077 == 0
+    server.server_close()
+    assert not os.path.exists(socket_path)
+
+
+def test_daemon_creates_private_socket_directory(tmp_path):
+    socket_path = str(tmp_path / "run" / "daemon.sock")
+    server = daemon.InspectorDaemon(socket_path)
+    assert oct(os.stat(tmp_path / "run").st_mode & 0o777) == "0o700"
+    server.server_close()
+    os.chmod(tmp_path / "run", 0o755)
+    with pytest.raises(exceptions.OIIInspectorError, match="accessible only"):
+        daemon.InspectorDaemon(socket_path)
+
+
+def create_profiled_session(image, **session_options):
+    session = create_session(image)
+    session.close.side_effect = lambda: profiling.count("closed")
+
+    def get_package(name):
+        with profiling.span("query", method="GetPackage"):
+            return {"name": name}
+
+    session.get_package.side_effect = get_package
+    return session
+
+
+@patch("OIIInspector.daemon.IndexSession", side_effect=create_profiled_session)
+def test_daemon_profiler(mock_index_session, tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    profiler = profiling.Profiler()
+    server = daemon.InspectorDaemon(socket_path, idle_ttl=0.04, profiler=profiler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        daemon.forward_query("image-1", "get_package", ["a"], socket_path=socket_path)
+        for _ in range(100):
+            if not server.pool.images:
+                break
+            time.sleep(0.01)
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+    report = profiler.report()
+    assert [span["name"] for span in report["spans"]] == ["query"]
+    # session evicted by the reaper thread is recorded too
+    assert report["counters"] == {"closed": 1}
@@ -0,0 +1,47 @@
+from OIIInspector.filters import BundleFilter, project, select_messages
+from OIIInspector.utils import iter_json_objects
+
+input_file_name = "./tests/data/{test_name}"
+
+
+def load_messages(file_name):
+    with open(input_file_name.format(test_name=file_name), "r") as file:
+        return list(iter_json_objects([file.read()]))
+
+
+def test_bundle_filter():
+    bundle = {
+        "packageName": "etcd",
+        "channelName": "stable",
+        "csvName": "etcdoperator.v0.9.4",
+        "version": "0.9.4",
+    }
+    assert not BundleFilter()
+    assert BundleFilter().matches(bundle)
+    assert BundleFilter(package="etcd", channel="stable").matches(bundle)
+    assert not BundleFilter(package="other").matches(bundle)
+    assert not BundleFilter(channel="alpha").matches(bundle)
+    assert BundleFilter(csv_name="etcdoperator.*").matches(bundle)
+    assert not BundleFilter(csv_name="etcd").matches(bundle)
+    assert BundleFilter(min_version="0.9", max_version="1.0").matches(bundle)
+    assert not BundleFilter(min_version="0.9.5").matches(bundle)
+    # bundles without version do not pass version conditions
+    assert not BundleFilter(max_version="1.0").matches({"packageName": "etcd"})
+
+
+def test_project():
+    assert project({"a": 1, "b": 2}, ["b", "c"]) == {"b": 2}
+
+
+def test_select_messages():
+    messages = load_messages("list_bundles.json")
+    selected = list(
+        select_messages(
+            messages, fields=["csvName", "version"], filters={"min_version": "0.2"}
+        )
+    )
+    assert selected == [
+        {"csvName": "test_csv_name 2", "version": "1.2.0"},
+        {"csvName": "test_csv_name 3", "version": "0.3.0"},
+    ]
+    assert list(select_messages(messages)) == messages
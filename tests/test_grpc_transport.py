@@ -0,0 +1,191 @@
+from concurrent import futures
+from unittest.mock import patch
+import json
+import pytest
+import OIIInspector.exceptions as exceptions
+from OIIInspector import profiling
+from OIIInspector.oii_client import IndexSession, get_transport
+
+grpc = pytest.importorskip("grpc")
+descriptor_pb2 = pytest.importorskip("google.protobuf.descriptor_pb2")
+descriptor_pool = pytest.importorskip("google.protobuf.descriptor_pool")
+message_factory = pytest.importorskip("google.protobuf.message_factory")
+reflection = pytest.importorskip("grpc_reflection.v1alpha.reflection")
+grpc_transport = pytest.importorskip("OIIInspector.grpc_transport")
+
+
+def build_registry_pool():
+    file_proto = descriptor_pb2.FileDescriptorProto(
+        name="test_registry.proto", package="api", syntax="proto3"
+    )
+    string_type = descriptor_pb2.FieldDescriptorProto.TYPE_STRING
+    message_type = descriptor_pb2.FieldDescriptorProto.TYPE_MESSAGE
+    repeated = descriptor_pb2.FieldDescriptorProto.LABEL_REPEATED
+    optional = descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL
+
+    def add_message(name, *fields):
+        message = file_proto.message_type.add(name=name)
+        for number, (field_name, json_name, field_type, label, type_name) in enumerate(
+            fields, start=1
+        ):
+            field = message.field.add(
+                name=field_name,
+                json_name=json_name,
+                number=number,
+                type=field_type,
+                label=label,
+            )
+            if type_name:
+                field.type_name = type_name
+
+    add_message("GetPackageRequest", ("name", "name", string_type, optional, None))
+    add_message(
+        "ChannelEntry",
+        ("name", "name", string_type, optional, None),
+        ("csv_name", "csvName", string_type, optional, None),
+    )
+    add_message(
+        "Package",
+        ("name", "name", string_type, optional, None),
+        ("channels", "channels", message_type, repeated, ".api.ChannelEntry"),
+        ("default_channel_name", "defaultChannelName", string_type, optional, None),
+    )
+    add_message("ListPackageRequest")
+    add_message("PackageName", ("name", "name", string_type, optional, None))
+    service = file_proto.service.add(name="Registry")
+    service.method.add(
+        name="ListPackages",
+        input_type=".api.ListPackageRequest",
+        output_type=".api.PackageName",
+        server_streaming=True,
+    )
+    service.method.add(
+        name="GetPackage",
+        input_type=".api.GetPackageRequest",
+        output_type=".api.Package",
+    )
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    return pool
+
+
+@pytest.fixture(scope="module")
+def registry_address():
+    pool = build_registry_pool()
+
+    def message_class(name):
+        return message_factory.GetMessageClass(pool.FindMessageTypeByName(name))
+
+    package_class = message_class("api.Package")
+    package_name_class = message_class("api.PackageName")
+
+    def get_package(request, context):
+        if request.name != "test-operator":
+            context.abort(grpc.StatusCode.NOT_FOUND, "package not found")
+        return package_class(
+            name=request.name,
+            channels=[{"name": "4.6", "csv_name": "test-operator.v1.10.0"}],
+            default_channel_name="4.6",
+        )
+
+    def list_packages(request, context):
+        for name in ("test-operator", "amq-online", "ščťž-operator"):
+            yield package_name_class(name=name)
+
+    handler = grpc.method_handlers_generic_handler(
+        "api.Registry",
+        {
+            "GetPackage": grpc.unary_unary_rpc_method_handler(
+                get_package,
+                request_deserializer=message_class("api.GetPackageRequest").FromString,
+                response_serializer=package_class.SerializeToString,
+            ),
+            "ListPackages": grpc.unary_stream_rpc_method_handler(
+                list_packages,
+                request_deserializer=message_class("api.ListPackageRequest").FromString,
+                response_serializer=package_name_class.SerializeToString,
+            ),
+        },
+    )
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=2))
+    server.add_generic_rpc_handlers((handler,))
+    reflection.enable_server_reflection(
+        ("api.Registry", reflection.SERVICE_NAME), server, pool=pool
+    )
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    yield f"localhost:{port}"
+    server.stop(None)
+
+
+def test_grpc_transport_unary_call(registry_address):
+    transport = grpc_transport.GrpcTransport()
+    profiler = profiling.Profiler()
+    with profiling.use_profiler(profiler):
+        output = transport.call(
+            registry_address,
+            "GetPackage",
+            call_argument='\'{"name":"test-operator"}\'',
+        )
+    # size of the received message is counted
+    assert profiler.report()["counters"]["bytes_read"] > 0
+    assert json.loads(output) == {
+        "name": "test-operator",
+        "channels": [{"name": "4.6", "csvName": "test-operator.v1.10.0"}],
+        "defaultChannelName": "4.6",
+    }
+    transport.close()
+
+
+def test_grpc_transport_streamed_call(registry_address):
+    transport = grpc_transport.GrpcTransport()
+    messages = list(transport.stream(registry_address, "ListPackages"))
+    assert len(messages) == 3
+    assert json.loads(messages[2]) == {"name": "ščťž-operator"}
+    # the channel and the resolved method are reused by following calls
+    assert transport.call(registry_address, "ListPackages") == "".join(messages)
+    assert len(transport._channels) == 1
+    transport.close()
+    assert transport._channels == {}
+
+
+def test_grpc_transport_errors(registry_address):
+    transport = grpc_transport.GrpcTransport()
+    with pytest.raises(exceptions.OIIInspectorError):
+        transport.call(registry_address, "ListBundles")
+    with pytest.raises(RuntimeError):
+        transport.call(
+            registry_address, "GetPackage", call_argument='\'{"name":"missing"}\''
+        )
+    transport.close()
+
+
+def test_grpc_transport_responds(registry_address):
+    transport = grpc_transport.GrpcTransport()
+    assert transport.responds(registry_address) is True
+    # nothing listens at port 1
+    assert transport.responds("localhost:1") is False
+    transport.close()
+
+
+@patch("OIIInspector.grpc_transport.grpc", None)
+def test_grpc_transport_missing_dependencies():
+    with pytest.raises(exceptions.OIIInspectorError):
+        get_transport("grpc")
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+def test_index_session_with_grpc_transport(mock_container_manager, registry_address):
+    mock_container_manager.return_value.__enter__.return_value.local_address_of_image = (
+        registry_address
+    )
+    with IndexSession("test_address:50051", transport="grpc") as session:
+        probe = session._transport.responds
+        assert session.get_package("test-operator")["defaultChannelName"] == "4.6"
+        assert [package["name"] for package in session.list_packages()] == [
+            "test-operator",
+            "amq-online",
+            "ščťž-operator",
+        ]
+    # readiness of the container is probed through the transport, not with grpcurl
+    mock_container_manager.assert_called_once_with("test_address:50051", probe=probe)
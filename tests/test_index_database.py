@@ -0,0 +1,251 @@
+from unittest.mock import patch
+import json
+import os
+import shutil
+import sqlite3
+import pytest
+from OIIInspector.oii_client import IndexSession, get_transport
+from OIIInspector.index_database import IndexDatabase, DatabaseTransport
+
+SCHEMA = """
+CREATE TABLE package (name TEXT PRIMARY KEY, default_channel TEXT);
+CREATE TABLE channel (name TEXT, package_name TEXT, head_operatorbundle_name TEXT);
+CREATE TABLE operatorbundle (
+    name TEXT PRIMARY KEY, csv TEXT, bundle TEXT, bundlepath TEXT, skiprange TEXT,
+    version TEXT, replaces TEXT, skips TEXT
+);
+CREATE TABLE channel_entry (
+    entry_id INTEGER PRIMARY KEY, channel_name TEXT, package_name TEXT,
+    operatorbundle_name TEXT, replaces INTEGER, depth INTEGER
+);
+CREATE TABLE api (group_name TEXT, version TEXT, kind TEXT, plural TEXT);
+CREATE TABLE api_provider (group_name TEXT, version TEXT, kind TEXT, channel_entry_id INTEGER);
+CREATE TABLE api_requirer (group_name TEXT, version TEXT, kind TEXT, channel_entry_id INTEGER);
+CREATE TABLE dependencies (type TEXT, value TEXT, operatorbundle_name TEXT);
+CREATE TABLE properties (type TEXT, value TEXT, operatorbundle_name TEXT);
+"""
+
+
+@pytest.fixture
+def index_db(tmp_path):
+    db_path = str(tmp_path / "index.db")
+    csv = {
+        "kind": "ClusterServiceVersion",
+        "metadata": {"name": "test-operator.v1.1.0"},
+    }
+    crd = {"kind": "CustomResourceDefinition"}
+    connection = sqlite3.connect(db_path)
+    connection.executescript(SCHEMA)
+    connection.executemany(
+        "INSERT INTO package VALUES (?, ?)",
+        [("test-operator", "stable"), ("other-operator", "alpha")],
+    )
+    connection.executemany(
+        "INSERT INTO channel VALUES (?, ?, ?)",
+        [
+            ("stable", "test-operator", "test-operator.v1.1.0"),
+            ("alpha", "other-operator", "other-operator.v0.1.0"),
+        ],
+    )
+    connection.executemany(
+        "INSERT INTO operatorbundle VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                "test-operator.v1.1.0",
+                json.dumps(csv),
+                json.dumps(csv) + "\n" + json.dumps(crd),
+                "registry/test-operator-bundle:v1.1.0",
+                ">=1.0.0 <1.1.0",
+                "1.1.0",
+                "test-operator.v1.0.0",
+                "test-operator.v0.9.0,test-operator.v0.9.1",
+            ),
+            (
+                "test-operator.v1.0.0",
+                "",
+                "",
+                "registry/test-operator-bundle:v1.0.0",
+                "",
+                "1.0.0",
+                None,
+                None,
+            ),
+            (
+                "other-operator.v0.1.0",
+                None,
+                None,
+                "registry/other-operator-bundle:v0.1.0",
+                None,
+                "0.1.0",
+                None,
+                None,
+            ),
+        ],
+    )
+    connection.executemany(
+        "INSERT INTO channel_entry VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (1, "stable", "test-operator", "test-operator.v1.1.0", 2, 0),
+            (2, "stable", "test-operator", "test-operator.v1.0.0", None, 1),
+            (3, "alpha", "other-operator", "other-operator.v0.1.0", None, 0),
+        ],
+    )
+    connection.execute(
+        "INSERT INTO api VALUES ('test.io', 'v1', 'Test', 'tests')",
+    )
+    connection.executemany(
+        "INSERT INTO api_provider VALUES ('test.io', 'v1', 'Test', ?)", [(1,), (2,)]
+    )
+    connection.execute("INSERT INTO api_requirer VALUES ('test.io', 'v1', 'Test', 3)")
+    connection.execute(
+        "INSERT INTO dependencies VALUES ('olm.gvk', ?, 'other-operator.v0.1.0')",
+        ('{"group":"test.io","kind":"Test","version":"v1"}',),
+    )
+    connection.execute(
+        "INSERT INTO properties VALUES ('olm.package', ?, 'test-operator.v1.1.0')",
+        ('{"packageName":"test-operator","version":"1.1.0"}',),
+    )
+    connection.commit()
+    connection.close()
+    return db_path
+
+
+def test_list_packages(index_db):
+    database = IndexDatabase(index_db)
+    assert list(database.query("ListPackages")) == [
+        {"name": "other-operator"},
+        {"name": "test-operator"},
+    ]
+    database.close()
+
+
+def test_get_package(index_db):
+    database = IndexDatabase(index_db)
+    assert list(database.query("GetPackage", {"name": "test-operator"})) == [
+        {
+            "name": "test-operator",
+            "channels": [{"name": "stable", "csvName": "test-operator.v1.1.0"}],
+            "defaultChannelName": "stable",
+        }
+    ]
+    with pytest.raises(RuntimeError):
+        database.get_package("missing-operator")
+    database.close()
+
+
+def test_get_bundle(index_db):
+    database = IndexDatabase(index_db)
+    bundle = database.get_bundle("test-operator", "stable", "test-operator.v1.1.0")
+    assert list(bundle) == [
+        "csvName",
+        "packageName",
+        "channelName",
+        "csvJson",
+        "object",
+        "bundlePath",
+        "providedApis",
+        "version",
+        "skipRange",
+        "properties",
+        "replaces",
+        "skips",
+    ]
+    assert json.loads(bundle["csvJson"])["metadata"]["name"] == "test-operator.v1.1.0"
+    assert [json.loads(obj)["kind"] for obj in bundle["object"]] == [
+        "ClusterServiceVersion",
+        "CustomResourceDefinition",
+    ]
+    assert bundle["providedApis"] == [
+        {"group": "test.io", "version": "v1", "kind": "Test", "plural": "tests"}
+    ]
+    assert bundle["skips"] == ["test-operator.v0.9.0", "test-operator.v0.9.1"]
+    with pytest.raises(RuntimeError):
+        database.get_bundle("test-operator", "alpha", "test-operator.v1.1.0")
+    database.close()
+
+
+def test_get_bundle_queries(index_db):
+    database = IndexDatabase(index_db)
+    assert (
+        database.get_bundle_for_channel("test-operator", "stable")["csvName"]
+        == "test-operator.v1.1.0"
+    )
+    assert (
+        database.get_bundle_that_replaces(
+            "test-operator.v1.0.0", "test-operator", "stable"
+        )["csvName"]
+        == "test-operator.v1.1.0"
+    )
+    provider = database.get_default_bundle_that_provides("test.io", "v1", "Test")
+    assert provider["csvName"] == "test-operator.v1.1.0"
+    other = database.get_bundle_for_channel("other-operator", "alpha")
+    assert other == {
+        "csvName": "other-operator.v0.1.0",
+        "packageName": "other-operator",
+        "channelName": "alpha",
+        "bundlePath": "registry/other-operator-bundle:v0.1.0",
+        "requiredApis": [
+            {"group": "test.io", "version": "v1", "kind": "Test", "plural": "tests"}
+        ],
+        "version": "0.1.0",
+        "dependencies": [
+            {
+                "type": "olm.gvk",
+                "value": '{"group":"test.io","kind":"Test","version":"v1"}',
+            }
+        ],
+    }
+    database.close()
+
+
+def test_list_bundles_and_unsupported_method(index_db):
+    database = IndexDatabase(index_db)
+    assert [bundle["csvName"] for bundle in database.query("ListBundles")] == [
+        "other-operator.v0.1.0",
+        "test-operator.v1.1.0",
+        "test-operator.v1.0.0",
+    ]
+    with pytest.raises(RuntimeError):
+        list(database.query("GetChannelEntriesThatProvide"))
+    database.close()
+
+
+@patch("OIIInspector.index_database.ContainerManager")
+def test_database_transport(mock_container_manager, index_db):
+    mock_container_manager.return_value.copy_from_image.side_effect = (
+        lambda source, destination: shutil.copy(index_db, destination)
+    )
+    transport = get_transport("database")
+    assert isinstance(transport, DatabaseTransport)
+    assert (
+        json.loads(
+            transport.call("test_address", "GetPackage", '\'{"name":"test-operator"}\'')
+        )["defaultChannelName"]
+        == "stable"
+    )
+    assert len(list(transport.stream("test_address", "ListPackages"))) == 2
+    mock_container_manager.assert_called_once_with("test_address")
+    mock_container_manager.return_value.copy_from_image.assert_called_once()
+    tmp_dir = transport._tmp_dir
+    transport.close()
+    assert not os.path.exists(tmp_dir)
+    transport.close()
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+@patch("OIIInspector.index_database.ContainerManager")
+def test_index_session_with_database_transport(
+    mock_database_container_manager, mock_container_manager, index_db
+):
+    mock_database_container_manager.return_value.copy_from_image.side_effect = (
+        lambda source, destination: shutil.copy(index_db, destination)
+    )
+    with IndexSession("test_address", transport="database") as session:
+        bundle = session.get_bundle("test-operator", "stable", "test-operator.v1.1.0")
+        assert bundle["csvJson"]["metadata"]["name"] == "test-operator.v1.1.0"
+        assert bundle["object"][1] == {"kind": "CustomResourceDefinition"}
+        assert [package["name"] for package in session.list_packages()] == [
+            "other-operator",
+            "test-operator",
+        ]
+    mock_container_manager.assert_not_called()
@@ -0,0 +1,115 @@
+from unittest.mock import patch
+from OIIInspector import index_diff
+from OIIInspector.cache import get_active_cache, use_cache
+from OIIInspector.utils import LazyMessage
+
+
+def bundle(csv_name, version, channel="stable", **fields):
+    return {
+        "packageName": "etcd",
+        "channelName": channel,
+        "csvName": csv_name,
+        "version": version,
+        "bundlePath": "quay.io/etcd:" + version,
+        **fields,
+    }
+
+
+OLD_BUNDLES = [
+    bundle("etcd.v0.9.0", "0.9.0", csvJson='{"spec": {}}'),
+    bundle("etcd.v0.9.2", "0.9.2", replaces="etcd.v0.9.0"),
+    bundle("etcd.v0.9.2", "0.9.2", channel="alpha"),
+]
+NEW_BUNDLES = [
+    {
+        **bundle("etcd.v0.9.0", "0.9.0", csvJson='{"spec": {}}'),
+        "bundlePath": "registry.io/etcd:0.9.0",
+    },
+    bundle("etcd.v0.9.2", "0.9.2", replaces="etcd.v0.9.1", skips=["etcd.v0.9.1"]),
+    bundle("etcd.v0.9.4", "0.9.4", replaces="etcd.v0.9.2"),
+]
+
+
+def test_fingerprint():
+    first = index_diff.fingerprint({"a": {"x": 1, "y": 2}, "bundlePath": "first"})
+    second = index_diff.fingerprint({"bundlePath": "second", "a": {"y": 2, "x": 1}})
+    assert first == second
+    assert list(first) == ["a"]
+    assert index_diff.fingerprint({"a": 1}) != index_diff.fingerprint({"a": 2})
+    assert index_diff.fingerprint({"a": 1, "bundlePath": "x"}, ignore_fields=()) != (
+        index_diff.fingerprint({"a": 1})
+    )
+
+
+def test_fingerprint_lazy_message():
+    message = LazyMessage(
+        {"csvJson": '{"spec": {}, "kind": "CSV"}', "csvName": "etcd", "spec": "{}"}
+    )
+    # the same content encoded differently, and eagerly decoded bundle have the same fingerprint
+    other_encoding = LazyMessage(
+        {"csvJson": '{"kind":"CSV","spec":{}}', "csvName": "etcd", "spec": "{}"}
+    )
+    eager = {"csvJson": {"kind": "CSV", "spec": {}}, "csvName": "etcd", "spec": {}}
+    assert index_diff.fingerprint(message, ignore_fields=("spec",)) == (
+        index_diff.fingerprint(other_encoding, ignore_fields=("spec",))
+    )
+    assert index_diff.fingerprint(other_encoding) == index_diff.fingerprint(eager)
+    # ignored fields are not decoded
+    assert message._pending == {"spec"}
+
+
+def test_diff_bundles(caplog):
+    delta = index_diff.diff_bundles(OLD_BUNDLES, NEW_BUNDLES + NEW_BUNDLES[-1:])
+    assert delta == {
+        "added": [
+            {
+                "packageName": "etcd",
+                "channelName": "stable",
+                "csvName": "etcd.v0.9.4",
+                "version": "0.9.4",
+            }
+        ],
+        "removed": [
+            {
+                "packageName": "etcd",
+                "channelName": "alpha",
+                "csvName": "etcd.v0.9.2",
+                "version": "0.9.2",
+            }
+        ],
+        "changed": [
+            {
+                "packageName": "etcd",
+                "channelName": "stable",
+                "csvName": "etcd.v0.9.2",
+                "version": "0.9.2",
+                "changedFields": ["replaces", "skips"],
+            }
+        ],
+        "unchanged": 1,
+    }
+    assert "is listed more than once" in caplog.text
+
+
+@patch("OIIInspector.index_diff.iter_bundles")
+def test_diff_index_images(mock_iter_bundles):
+    cache = object()
+    used_caches = []
+
+    def iter_bundles(image_address, **session_options):
+        used_caches.append(get_active_cache())
+        assert session_options == {"transport": "grpc"}
+        return iter(OLD_BUNDLES if image_address == "old-image" else NEW_BUNDLES)
+
+    mock_iter_bundles.side_effect = iter_bundles
+    with use_cache(cache):
+        delta = index_diff.diff_index_images(
+            "old-image", "new-image", ignore_fields=(), transport="grpc"
+        )
+    assert [item["csvName"] for item in delta["changed"]] == [
+        "etcd.v0.9.0",
+        "etcd.v0.9.2",
+    ]
+    assert delta["changed"][0]["changedFields"] == ["bundlePath"]
+    assert delta["unchanged"] == 0
+    assert used_caches == [cache, cache]
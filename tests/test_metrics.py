@@ -0,0 +1,119 @@
+import os
+import urllib.request
+import pytest
+from OIIInspector import metrics, profiling
+
+
+@pytest.fixture
+def registry():
+    registry = metrics.MetricsRegistry()
+    requests = registry.counter("test_requests", "Handled requests.", ["method"])
+    requests.inc(method="GetPackage")
+    requests.inc(2, method='List"Bundles')
+    duration = registry.histogram(
+        "test_duration_seconds", "Duration.", buckets=[1, 0.5]
+    )
+    duration.observe(0.25)
+    duration.observe(0.75)
+    duration.observe(3)
+    return registry
+
+
+def test_exposition(registry):
+    assert registry.exposition() == (
+        "# HELP test_requests Handled requests.\n"
+        "# TYPE test_requests counter\n"
+        'test_requests_total{method="GetPackage"} 1\n'
+        'test_requests_total{method="List\\"Bundles"} 2\n'
+        "# HELP test_duration_seconds Duration.\n"
+        "# TYPE test_duration_seconds histogram\n"
+        'test_duration_seconds_bucket{le="0.5"} 1\n'
+        'test_duration_seconds_bucket{le="1"} 2\n'
+        'test_duration_seconds_bucket{le="+Inf"} 3\n'
+        "test_duration_seconds_count 3\n"
+        "test_duration_seconds_sum 4\n"
+        "# EOF\n"
+    )
+    prometheus = registry.exposition(openmetrics=False)
+    assert prometheus.startswith(
+        "# HELP test_requests_total Handled requests.\n"
+        "# TYPE test_requests_total counter\n"
+    )
+    assert "# EOF" not in prometheus
+
+
+def test_metric_errors(registry):
+    with pytest.raises(ValueError, match="already registered"):
+        registry.counter("test_requests", "Duplicate.")
+    counter = registry.counter("test_labelled", "Labelled.", ["method"])
+    with pytest.raises(ValueError, match="has labels"):
+        counter.inc()
+    assert counter.value(method="GetPackage") == 0
+    histogram = registry.histogram("test_empty_seconds", "Empty.")
+    assert histogram.count() == 0
+    histogram.observe(0.125)
+    assert histogram.count() == 1
+    assert "test_empty_seconds_sum 0.125\n" in registry.exposition()
+
+
+def test_write_textfile(registry, tmp_path):
+    path = tmp_path / "oii.prom"
+    registry.write_textfile(str(path))
+    assert path.read_text() == registry.exposition(openmetrics=False)
+    assert oct(os.stat(path).st_mode & 0o777) == "0o644"
+    registry.write_textfile(str(path), openmetrics=True)
+    assert path.read_text().endswith("# EOF\n")
+    assert os.listdir(tmp_path) == ["oii.prom"]
+
+
+def test_serve(registry):
+    with registry.serve(0) as server:
+        url = "http://%s:%d/metrics" % server.server_address[:2]
+        with urllib.request.urlopen(url) as response:
+            assert response.headers["Content-Type"] == metrics.PROMETHEUS_CONTENT_TYPE
+            assert response.read().decode() == registry.exposition(openmetrics=False)
+        request = urllib.request.Request(
+            url, headers={"Accept": "application/openmetrics-text; version=1.0.0"}
+        )
+        with urllib.request.urlopen(request) as response:
+            assert response.headers["Content-Type"] == metrics.OPENMETRICS_CONTENT_TYPE
+            assert response.read().decode() == registry.exposition()
+
+
+def test_inspection_metrics():
+    inspection_metrics = metrics.InspectionMetrics()
+    profiler = profiling.Profiler()
+    with profiling.use_profiler(
+        profiling.ProfilerGroup([profiler, inspection_metrics])
+    ):
+        with profiling.span("pull", image="a"):
+            profiling.count("subprocesses")
+        with profiling.span("serve", image="a"):
+            profiling.count("port_attempts", 2)
+            with profiling.span("readiness", port=50051):
+                pass
+        # failed start is not counted
+        with pytest.raises(RuntimeError):
+            with profiling.span("serve", image="b"):
+                raise RuntimeError("failed")
+        list(profiling.timed_iter("query", [b"{}"], method="ListBundles"))
+        list(profiling.timed_iter("query", [b"{}"], method="ListBundles", cache="miss"))
+        list(profiling.timed_iter("cache_load", [{}], method="ListBundles"))
+        profiling.count("bytes_read", 512)
+        profiling.count("unknown")
+        with profiling.span("output"):
+            pass
+
+    assert inspection_metrics.pull_seconds.count() == 1
+    assert inspection_metrics.container_starts.value() == 1
+    assert inspection_metrics.start_seconds.count() == 1
+    assert inspection_metrics.readiness_seconds.count() == 1
+    assert inspection_metrics.rpc_seconds.count(method="ListBundles") == 2
+    assert inspection_metrics.cache_hits.value(method="ListBundles") == 1
+    assert inspection_metrics.cache_misses.value(method="ListBundles") == 1
+    assert inspection_metrics.port_attempts.value() == 2
+    assert inspection_metrics.subprocesses.value() == 1
+    assert inspection_metrics.read_bytes.value() == 512
+    # the profiler of the group records the same spans
+    assert len(profiler.report()["spans"]) == 8
+    assert profiler.report()["counters"]["unknown"] == 1
@@ -1,4 +1,5 @@
-from unittest.mock import patch
+import json
+from unittest.mock import patch, MagicMock
 from OIIInspector.oii_client import (
     get_bundle,
     list_packages,
@@ -8,7 +9,15 @@ from OIIInspector.oii_client import (
     get_bundle_that_replaces,
     get_default_bundle_that_provides,
     use_container_manager,
+    IndexSession,
+    GrpcurlTransport,
+    iter_bundles,
+    iter_packages,
+    get_transport,
 )
+import pytest
+import OIIInspector.exceptions as exceptions
+from OIIInspector import profiling
 
 input_file_name = "./tests/data/{test_name}"
 
@@ -41,7 +50,10 @@ def test_get_bundle(mock_run_cmd, mock_container_manager):
 
 
 @patch("OIIInspector.oii_client.ContainerManager")
-@patch("OIIInspector.oii_client.run_cmd", return_value=load_file("list_packages.json"))
+@patch(
+    "OIIInspector.oii_client.run_cmd_stream",
+    return_value=iter([load_file("list_packages.json")]),
+)
 def test_list_packages(mock_run_cmd, mock_container_manager):
     mock_container_manager.return_value.__enter__.return_value.local_address_of_image = (
         "test_address:50051"
@@ -55,7 +67,10 @@ def test_list_packages(mock_run_cmd, mock_container_manager):
 
 
 @patch("OIIInspector.oii_client.ContainerManager")
-@patch("OIIInspector.oii_client.run_cmd", return_value=load_file("list_bundles.json"))
+@patch(
+    "OIIInspector.oii_client.run_cmd_stream",
+    return_value=iter([load_file("list_bundles.json")]),
+)
 def test_list_bundles(mock_run_cmd, mock_container_manager):
     mock_container_manager.return_value.__enter__.return_value.local_address_of_image = (
         "test_address:50051"
@@ -71,6 +86,43 @@ def test_list_bundles(mock_run_cmd, mock_container_manager):
     assert output[2]["csvName"] == "test_csv_name 3"
 
 
+@patch("OIIInspector.oii_client.ContainerManager")
+@patch(
+    "OIIInspector.oii_client.run_cmd_stream",
+    return_value=iter([load_file("list_bundles.json")]),
+)
+def test_list_bundles_lazy(mock_run_cmd, mock_container_manager):
+    mock_container_manager.return_value.__enter__.return_value.local_address_of_image = (
+        "test_address:50051"
+    )
+    output = list_bundles("test_address:50051", lazy=True)
+    assert output[0]["csvName"] == "test_csv_name 1"
+    assert isinstance(dict.__getitem__(output[0], "object")[0], str)
+    assert output[0]["object"][2]["apiVersion"] == "test_api_version_0"
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+@patch(
+    "OIIInspector.oii_client.run_cmd_stream",
+    return_value=iter([load_file("list_bundles.json")]),
+)
+@patch("OIIInspector.oii_client.convert_message", side_effect=lambda m, lazy: m)
+def test_list_bundles_filtered(
+    mock_convert_message, mock_run_cmd, mock_container_manager
+):
+    mock_container_manager.return_value.__enter__.return_value.local_address_of_image = (
+        "test_address:50051"
+    )
+    output = list_bundles(
+        "test_address:50051",
+        fields=["csvName", "csvJson"],
+        filters={"package": "awx-resource-operator"},
+    )
+    # filtered out bundles are never converted
+    mock_convert_message.assert_called_once()
+    assert [sorted(bundle) for bundle in output] == [["csvJson", "csvName"]]
+
+
 @patch("OIIInspector.oii_client.ContainerManager")
 @patch("OIIInspector.oii_client.run_cmd", return_value=load_file("get_package.json"))
 def test_get_package(mock_run_cmd, mock_container_manager):
@@ -185,3 +237,197 @@ def test_use_container_manager(mock_run_cmd, mock_container_manager):
         "test-local-addr "
         "api.Registry/test-api-address"
     )
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+@patch(
+    "OIIInspector.oii_client.run_cmd_stream",
+    return_value=iter([load_file("list_packages.json")]),
+)
+@patch("OIIInspector.oii_client.run_cmd")
+def test_index_session_reuses_container(
+    mock_run_cmd, mock_run_cmd_stream, mock_container_manager
+):
+    image_manager = mock_container_manager.return_value.__enter__.return_value
+    image_manager.local_address_of_image = "localhost:50051"
+    mock_run_cmd.side_effect = [
+        load_file("get_package.json"),
+        load_file("get_bundle.json"),
+    ]
+    with IndexSession("test_address:50051") as session:
+        assert session.get_package("test-operator")["name"] == "test-operator"
+        assert session.get_bundle("pkg", "4.3", "csv")["version"] == "1.2.0"
+        assert session.list_packages()[0]["name"] == "test-operator"
+        mock_container_manager.return_value.__exit__.assert_not_called()
+    mock_container_manager.assert_called_once_with("test_address:50051")
+    assert image_manager.start_container.call_count == 3
+    mock_container_manager.return_value.__exit__.assert_called_once()
+    assert mock_run_cmd.call_count == 2
+    mock_run_cmd_stream.assert_called_once_with(
+        "grpcurl -plaintext localhost:50051 api.Registry/ListPackages"
+    )
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+@patch("OIIInspector.oii_client.run_cmd")
+def test_index_session_remembers_start_error(mock_run_cmd, mock_container_manager):
+    image_manager = mock_container_manager.return_value.__enter__.return_value
+    image_manager.start_container.side_effect = exceptions.OIIInspectorError("failed")
+    session = IndexSession("test_address:50051")
+    for _ in range(2):
+        with pytest.raises(exceptions.OIIInspectorError):
+            session.get_package("test-operator")
+    image_manager.start_container.assert_called_once()
+    assert session.start_error is image_manager.start_container.side_effect
+    session.close()
+    assert session.start_error is None
+    with pytest.raises(exceptions.OIIInspectorError):
+        session.get_package("test-operator")
+    assert image_manager.start_container.call_count == 2
+    mock_run_cmd.assert_not_called()
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+@patch("OIIInspector.oii_client.run_cmd", return_value='{"name": "test-operator"}')
+def test_index_session_container_limits(mock_run_cmd, mock_container_manager):
+    limits = MagicMock()
+    with IndexSession("test_address:50051", container_limits=limits) as session:
+        session.get_package("test-operator")
+    mock_container_manager.assert_called_once_with("test_address:50051", limits=limits)
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+@patch("OIIInspector.oii_client.run_cmd", return_value='{"name": "test-operator"}')
+def test_index_session_pull_policy(mock_run_cmd, mock_container_manager):
+    with IndexSession("test_address:50051", pull_policy="never") as session:
+        session.get_package("test-operator")
+    mock_container_manager.assert_called_once_with(
+        "test_address:50051", pull_policy="never"
+    )
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+def test_index_session_without_query_does_not_start_container(
+    mock_container_manager,
+):
+    with IndexSession("test_address:50051"):
+        pass
+    mock_container_manager.assert_not_called()
+
+
+def test_get_transport():
+    assert isinstance(get_transport("grpcurl"), GrpcurlTransport)
+    transport = MagicMock()
+    assert get_transport(transport) is transport
+    with pytest.raises(exceptions.OIIInspectorError):
+        get_transport("unknown")
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+def test_index_session_custom_transport(mock_container_manager):
+    mock_container_manager.return_value.__enter__.return_value.local_address_of_image = (
+        "localhost:50051"
+    )
+    transport = MagicMock(requires_container=True)
+    transport.messages.return_value = iter([json.loads(load_file("get_package.json"))])
+    output = get_package("test_address:50051", "test-operator", transport=transport)
+    assert output["name"] == "test-operator"
+    transport.messages.assert_called_once_with(
+        "localhost:50051",
+        "GetPackage",
+        '\'{"name":"test-operator"}\'',
+        streamed=False,
+    )
+    transport.close.assert_called_once()
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+def test_index_session_transport_without_container(mock_container_manager):
+    transport = MagicMock(requires_container=False)
+    transport.messages.return_value = iter([{"name": "test-operator"}])
+    with IndexSession("test_address:50051", transport=transport) as session:
+        assert session.list_packages() == [{"name": "test-operator"}]
+    transport.messages.assert_called_once_with(
+        "test_address:50051", "ListPackages", None, streamed=True
+    )
+    mock_container_manager.assert_not_called()
+
+
+def test_index_session_stream():
+    transport = MagicMock(requires_container=False)
+    transport.stream.return_value = iter(['{"name": "test-operator"}'])
+    with IndexSession("test_address:50051", transport=transport) as session:
+        assert list(session.stream("ListPackages")) == ['{"name": "test-operator"}']
+    transport.stream.assert_called_once_with(
+        "test_address:50051", "ListPackages", call_argument=None
+    )
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+@patch("OIIInspector.oii_client.run_cmd_stream")
+def test_iter_bundles(mock_run_cmd_stream, mock_container_manager):
+    mock_container_manager.return_value.__enter__.return_value.local_address_of_image = (
+        "localhost:50051"
+    )
+    content = load_file("list_bundles.json")
+    # split the response in the middle of the objects
+    mock_run_cmd_stream.return_value = iter(
+        content[start:][:1000] for start in range(0, len(content), 1000)
+    )
+    bundles = iter_bundles("test_address:50051")
+    first = next(bundles)
+    assert first["csvName"] == "test_csv_name 1"
+    assert first["object"][2]["apiVersion"] == "test_api_version_0"
+    mock_container_manager.return_value.__exit__.assert_not_called()
+    bundles.close()
+    mock_container_manager.return_value.__exit__.assert_called_once()
+    mock_run_cmd_stream.assert_called_once_with(
+        "grpcurl -plaintext localhost:50051 api.Registry/ListBundles"
+    )
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+@patch(
+    "OIIInspector.oii_client.run_cmd_stream",
+    return_value=iter([load_file("list_packages.json")]),
+)
+def test_iter_packages(mock_run_cmd_stream, mock_container_manager):
+    mock_container_manager.return_value.__enter__.return_value.local_address_of_image = (
+        "localhost:50051"
+    )
+    names = [package["name"] for package in iter_packages("test_address:50051")]
+    assert names[0] == "test-operator"
+    assert names[-1] == "web-terminal"
+    mock_container_manager.return_value.__exit__.assert_called_once()
+
+
+@patch("OIIInspector.oii_client.ContainerManager")
+@patch(
+    "OIIInspector.oii_client.run_cmd_stream",
+    return_value=iter([load_file("list_packages.json")]),
+)
+@patch("OIIInspector.oii_client.run_cmd", return_value=load_file("get_package.json"))
+def test_index_session_profiled(
+    mock_run_cmd, mock_run_cmd_stream, mock_container_manager
+):
+    cache = MagicMock()
+    cache.load.side_effect = [None, None, iter([{"name": "cached"}])]
+    cache.store.side_effect = lambda image, api, argument, messages: messages
+    profiler = profiling.Profiler()
+    with profiling.use_profiler(profiler):
+        with IndexSession("test_address:50051", cache=cache) as session:
+            assert len(session.list_packages()) > 1
+            session.get_package("test")
+            assert session.list_packages() == [{"name": "cached"}]
+    spans = profiler.report()["spans"]
+    assert [(span["name"], span["method"]) for span in spans] == [
+        ("query", "ListPackages"),
+        ("convert", "ListPackages"),
+        ("query", "GetPackage"),
+        ("convert", "GetPackage"),
+        ("cache_load", "ListPackages"),
+        ("convert", "ListPackages"),
+    ]
+    assert spans[1]["items"] == spans[0]["items"] > 1
+    # queries not answered from the cache are cache misses
+    assert spans[0]["cache"] == spans[2]["cache"] == "miss"
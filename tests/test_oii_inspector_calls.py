@@ -1,12 +1,15 @@
+import io
+import json
 import sys
 import pytest
 from unittest.mock import patch
-from OIIInspector import oii_inspector_calls
+from OIIInspector import daemon, oii_inspector_calls, profiling
+from OIIInspector.cache import get_active_cache
 
 input_file_name = "./tests/data/{test_name}"
 
 
-@patch("OIIInspector.oii_inspector_calls.get_bundle", return_value="Client-response")
+@patch("OIIInspector.oii_client.get_bundle", return_value="Client-response")
 @patch("OIIInspector.oii_inspector_calls.json.dump")
 def test_get_bundle_main(mock_json_dump, mock_get_bundle):
     test_args = [
@@ -36,7 +39,7 @@ def test_get_bundle_main_ends_without_args():
         oii_inspector_calls.get_bundle_main()
 
 
-@patch("OIIInspector.oii_inspector_calls.list_packages", return_value="Client-response")
+@patch("OIIInspector.oii_client.list_packages", return_value="Client-response")
 @patch("OIIInspector.oii_inspector_calls.json.dump")
 def test_list_packages_main(mock_json_dump, mock_list_packages):
     test_args = ["name", "--address", "test-address:1"]
@@ -54,7 +57,7 @@ def test_list_packages_main_ends_without_args():
         oii_inspector_calls.list_packages_main()
 
 
-@patch("OIIInspector.oii_inspector_calls.list_bundles", return_value="Client-response")
+@patch("OIIInspector.oii_client.list_bundles", return_value="Client-response")
 @patch("OIIInspector.oii_inspector_calls.json.dump")
 def test_list_bundles_main(mock_json_dump, mock_list_bundles):
     test_args = ["name", "--address", "test-address:1"]
@@ -67,12 +70,84 @@ def test_list_bundles_main(mock_json_dump, mock_list_bundles):
     assert output == "Client-response"
 
 
+@patch("OIIInspector.oii_client.list_bundles", return_value="Client-response")
+@patch("OIIInspector.daemon.forward_query")
+@patch("OIIInspector.oii_inspector_calls.json.dump")
+def test_list_bundles_main_filtered(
+    mock_json_dump, mock_forward_query, mock_list_bundles
+):
+    mock_forward_query.return_value = daemon.NOT_RUNNING
+    test_args = [
+        "name",
+        "--address",
+        "test-address:1",
+        "--fields",
+        "csvName",
+        "version",
+        "--package",
+        "etcd",
+        "--min-version",
+        "0.9",
+    ]
+
+    oii_inspector_calls.list_bundles_main(test_args)
+    expected_kwargs = {
+        "fields": ["csvName", "version"],
+        "filters": {"package": "etcd", "min_version": "0.9"},
+    }
+    mock_forward_query.assert_called_once_with(
+        "test-address:1", "list_bundles", expected_kwargs
+    )
+    mock_list_bundles.assert_called_once_with("test-address:1", **expected_kwargs)
+
+
+@patch("OIIInspector.oii_client.iter_bundles")
+def test_list_bundles_main_ndjson(mock_iter_bundles, capsys):
+    def bundles(address):
+        yield {"csvName": "a"}
+        # the first bundle is written before the next one is read
+        assert capsys.readouterr().out == '{"csvName":"a"}\n'
+        yield {"csvName": "b"}
+
+    mock_iter_bundles.side_effect = bundles
+    test_args = ["name", "--address", "test-address:1", "--no-daemon"]
+    output = oii_inspector_calls.list_bundles_main(
+        test_args + ["--output-format", "ndjson"]
+    )
+    assert output is None
+    assert capsys.readouterr().out == '{"csvName":"b"}\n'
+
+
+@patch("OIIInspector.oii_client.iter_packages")
+@patch("OIIInspector.daemon.forward_query")
+def test_list_packages_main_ndjson_from_daemon(
+    mock_forward_query, mock_iter_packages, capsys
+):
+    mock_forward_query.return_value = [{"name": "a"}, {"name": "b"}]
+    test_args = ["name", "--address", "test-address:1", "--output-format", "ndjson"]
+    assert oii_inspector_calls.list_packages_main(test_args) is None
+    mock_iter_packages.assert_not_called()
+    assert capsys.readouterr().out == '{"name":"a"}\n{"name":"b"}\n'
+
+
+@patch("OIIInspector.oii_client.get_package", return_value={"name": "a"})
+def test_output_formats(mock_get_package, capsys):
+    test_args = ["name", "--address", "test-address:1", "--package-name", "a"]
+    test_args.append("--no-daemon")
+    oii_inspector_calls.get_package_main(test_args + ["--output-format", "compact"])
+    assert capsys.readouterr().out == '{"name":"a"}\n'
+    oii_inspector_calls.get_package_main(test_args + ["--output-format", "ndjson"])
+    assert capsys.readouterr().out == '{"name":"a"}\n'
+    with pytest.raises(SystemExit):
+        oii_inspector_calls.get_package_main(test_args + ["--output-format", "xml"])
+
+
 def test_list_bundles_main_ends_without_args():
     with pytest.raises(SystemExit):
         oii_inspector_calls.list_bundles_main()
 
 
-@patch("OIIInspector.oii_inspector_calls.get_package", return_value="Client-response")
+@patch("OIIInspector.oii_client.get_package", return_value="Client-response")
 @patch("OIIInspector.oii_inspector_calls.json.dump")
 def test_get_package_main(mock_json_dump, mock_get_package):
     test_args = [
@@ -97,7 +172,7 @@ def test_get_package_dump_ends_without_args():
 
 
 @patch(
-    "OIIInspector.oii_inspector_calls.get_bundle_for_channel",
+    "OIIInspector.oii_client.get_bundle_for_channel",
     return_value="Client-response",
 )
 @patch("OIIInspector.oii_inspector_calls.json.dump")
@@ -128,7 +203,7 @@ def test_get_bundle_for_channel_dump_ends_without_args():
 
 
 @patch(
-    "OIIInspector.oii_inspector_calls.get_bundle_that_replaces",
+    "OIIInspector.oii_client.get_bundle_that_replaces",
     return_value="Client-response",
 )
 @patch("OIIInspector.oii_inspector_calls.json.dump")
@@ -161,7 +236,7 @@ def test_get_bundle_that_replaces_dump_ends_without_args():
 
 
 @patch(
-    "OIIInspector.oii_inspector_calls.get_default_bundle_that_provides",
+    "OIIInspector.oii_client.get_default_bundle_that_provides",
     return_value="Client-response",
 )
 @patch("OIIInspector.oii_inspector_calls.json.dump")
@@ -195,3 +270,268 @@ def test_get_default_bundle_that_provides_main(
 def test_get_default_bundle_that_provides_dump_ends_without_args():
     with pytest.raises(SystemExit):
         oii_inspector_calls.get_default_bundle_that_provides_main()
+
+
+@patch(
+    "OIIInspector.daemon.forward_query",
+    return_value=daemon.NOT_RUNNING,
+)
+@patch("OIIInspector.oii_client.get_package")
+@patch("OIIInspector.oii_inspector_calls.json.dump")
+def test_cache_arguments(mock_json_dump, mock_get_package, mock_forward_query):
+    test_args = ["name", "--address", "test-address:1", "--package-name", "test"]
+    used_caches = []
+    mock_get_package.side_effect = lambda *args: used_caches.append(get_active_cache())
+
+    oii_inspector_calls.get_package_main(test_args)
+    oii_inspector_calls.get_package_main(test_args + ["--refresh"])
+    oii_inspector_calls.get_package_main(test_args + ["--no-cache"])
+    assert used_caches[0]._refresh is False
+    assert used_caches[1]._refresh is True
+    assert used_caches[2] is None
+    assert get_active_cache() is None
+    # the daemon does not see the cache arguments, queries bypassing the cache are not forwarded
+    mock_forward_query.assert_called_once_with(
+        "test-address:1", "get_package", ["test"]
+    )
+
+
+@patch("OIIInspector.batch.run_queries")
+def test_batch_main(mock_run_queries, tmp_path, capsys):
+    queries_file = tmp_path / "queries.jsonl"
+    queries_file.write_text('{"image": "a", "method": "list_packages"}\n')
+    mock_run_queries.return_value = iter([{"index": 0, "result": []}])
+
+    output = oii_inspector_calls.batch_main(
+        ["name", "--queries", str(queries_file), "--no-cache"]
+    )
+    mock_run_queries.assert_called_once_with(
+        [{"image": "a", "method": "list_packages"}]
+    )
+    assert output == [{"index": 0, "result": []}]
+    assert capsys.readouterr().out == '{"index": 0, "result": []}\n'
+
+
+@patch("OIIInspector.batch.run_queries", return_value=iter([]))
+def test_batch_main_reads_stdin(mock_run_queries, monkeypatch):
+    monkeypatch.setattr(
+        "sys.stdin", io.StringIO('[{"image": "a", "method": "list_bundles"}]')
+    )
+    assert oii_inspector_calls.batch_main(["name", "--queries", "-"]) == []
+    mock_run_queries.assert_called_once_with([{"image": "a", "method": "list_bundles"}])
+
+
+def test_batch_main_ends_without_args():
+    with pytest.raises(SystemExit):
+        oii_inspector_calls.batch_main()
+
+
+@patch("OIIInspector.parallel.inspect_images", return_value="Client-response")
+@patch("OIIInspector.oii_inspector_calls.json.dump")
+def test_inspect_images_main(mock_json_dump, mock_inspect_images, tmp_path):
+    queries_file = tmp_path / "queries.jsonl"
+    queries_file.write_text('{"method": "list_packages"}\n')
+    test_args = [
+        "name",
+        "--images",
+        "image-1",
+        "image-2",
+        "--queries",
+        str(queries_file),
+        "--max-pulls",
+        "1",
+    ]
+
+    output = oii_inspector_calls.inspect_images_main(test_args)
+    mock_inspect_images.assert_called_once_with(
+        ["image-1", "image-2"],
+        [{"method": "list_packages"}],
+        max_pulls=1,
+        max_containers=4,
+    )
+    mock_json_dump.assert_called_once_with(
+        "Client-response", sys.stdout, sort_keys=True, indent=4, separators=(",", ": ")
+    )
+    assert output == "Client-response"
+
+
+def test_inspect_images_main_ends_without_args():
+    with pytest.raises(SystemExit):
+        oii_inspector_calls.inspect_images_main()
+
+
+@patch("OIIInspector.oii_client.get_package")
+def test_profile(mock_get_package, capsys, tmp_path):
+    def get_package(address, package_name):
+        with profiling.span("pull"):
+            profiling.count("subprocesses")
+        return {"name": package_name}
+
+    mock_get_package.side_effect = get_package
+    test_args = ["name", "--address", "test-address:1", "--package-name", "a"]
+    test_args += ["--no-daemon", "--output-format", "compact"]
+
+    oii_inspector_calls.get_package_main(test_args + ["--profile"])
+    captured = capsys.readouterr()
+    assert captured.out == '{"name":"a"}\n'
+    report = json.loads(captured.err)
+    assert [span["name"] for span in report["spans"]] == ["pull", "output"]
+    assert report["counters"] == {"subprocesses": 1}
+
+    profile_path = tmp_path / "profile.json"
+    oii_inspector_calls.get_package_main(test_args + ["--profile", str(profile_path)])
+    assert capsys.readouterr().err == ""
+    report = json.loads(profile_path.read_text())
+    assert set(report["phases"]) == {"pull", "output"}
+
+
+@patch("OIIInspector.oii_client.get_package")
+def test_metrics_file(mock_get_package, capsys, tmp_path):
+    def get_package(address, package_name):
+        with profiling.span("pull"):
+            profiling.count("subprocesses")
+        return {"name": package_name}
+
+    mock_get_package.side_effect = get_package
+    metrics_path = tmp_path / "oii.prom"
+    test_args = ["name", "--address", "test-address:1", "--package-name", "a"]
+    test_args += ["--no-daemon", "--metrics-file", str(metrics_path)]
+    oii_inspector_calls.get_package_main(test_args + ["--profile"])
+    report = json.loads(capsys.readouterr().err)
+    assert report["counters"] == {"subprocesses": 1}
+    metrics = metrics_path.read_text()
+    assert "oii_subprocesses_total 1\n" in metrics
+    assert "oii_pull_seconds_count 1\n" in metrics
+
+    # metrics are written without the profile too
+    metrics_path.unlink()
+    oii_inspector_calls.get_package_main(test_args)
+    assert capsys.readouterr().err == ""
+    assert "oii_subprocesses_total 1\n" in metrics_path.read_text()
+
+
+@patch("OIIInspector.daemon.forward_query")
+def test_profile_ndjson(mock_forward_query, capsys):
+    mock_forward_query.return_value = [{"csvName": "a"}]
+    test_args = ["name", "--address", "test-address:1", "--output-format", "ndjson"]
+    oii_inspector_calls.list_bundles_main(test_args + ["--profile"])
+    captured = capsys.readouterr()
+    assert captured.out == '{"csvName":"a"}\n'
+    report = json.loads(captured.err)
+    assert [span["name"] for span in report["spans"]] == ["daemon", "output"]
+
+
+@patch("OIIInspector.index_diff.diff_index_images")
+def test_diff_main(mock_diff_index_images, capsys):
+    mock_diff_index_images.return_value = {
+        "added": [{"csvName": "b"}],
+        "removed": [],
+        "changed": [{"csvName": "a", "changedFields": ["version"]}],
+        "unchanged": 3,
+    }
+    test_args = ["name", "--old-address", "old:1", "--new-address", "new:1"]
+
+    output = oii_inspector_calls.diff_main(test_args + ["--output-format", "compact"])
+    mock_diff_index_images.assert_called_once_with(
+        "old:1", "new:1", ignore_fields=["bundlePath"]
+    )
+    assert output == mock_diff_index_images.return_value
+    assert capsys.readouterr().out.startswith('{"added":[{"csvName":"b"}]')
+
+    mock_diff_index_images.reset_mock()
+    oii_inspector_calls.diff_main(
+        test_args + ["--ignore-fields", "--output-format", "ndjson"]
+    )
+    mock_diff_index_images.assert_called_once_with("old:1", "new:1", ignore_fields=[])
+    assert capsys.readouterr().out == (
+        '{"change":"added","csvName":"b"}\n'
+        '{"change":"changed","csvName":"a","changedFields":["version"]}\n'
+    )
+
+
+def test_diff_main_ends_without_args():
+    with pytest.raises(SystemExit):
+        oii_inspector_calls.diff_main()
+
+
+@patch("OIIInspector.oii_client.get_package")
+@patch("OIIInspector.daemon.forward_query", return_value="Daemon-response")
+@patch("OIIInspector.oii_inspector_calls.json.dump")
+def test_query_forwarded_to_daemon(
+    mock_json_dump, mock_forward_query, mock_get_package
+):
+    test_args = ["name", "--address", "test-address:1", "--package-name", "test"]
+
+    output = oii_inspector_calls.get_package_main(test_args)
+    mock_forward_query.assert_called_once_with(
+        "test-address:1", "get_package", ["test"]
+    )
+    mock_get_package.assert_not_called()
+    assert output == "Daemon-response"
+
+    mock_forward_query.reset_mock()
+    oii_inspector_calls.get_package_main(test_args + ["--no-daemon"])
+    mock_forward_query.assert_not_called()
+    mock_get_package.assert_called_once_with("test-address:1", "test")
+
+
+@patch("OIIInspector.snapshot.write_snapshot")
+def test_snapshot_main(mock_write_snapshot, capsys):
+    mock_write_snapshot.return_value = {"packages": 1, "bundles": 2}
+    resp = oii_inspector_calls.snapshot_main(
+        ["name", "--address", "test-address:1", "--output", "index.oiisnap"]
+    )
+    assert resp == {"packages": 1, "bundles": 2}
+    mock_write_snapshot.assert_called_once_with("test-address:1", "index.oiisnap")
+    assert json.loads(capsys.readouterr().out) == resp
+
+
+@patch("OIIInspector.daemon.forward_query")
+@patch("OIIInspector.oii_client.get_package", return_value={"name": "a"})
+def test_query_snapshot(mock_get_package, mock_forward_query, capsys):
+    oii_inspector_calls.get_package_main(
+        ["name", "--address", "index.oiisnap", "--package-name", "a", "--snapshot"]
+    )
+    mock_forward_query.assert_not_called()
+    mock_get_package.assert_called_once_with("index.oiisnap", "a", transport="snapshot")
+
+
+@patch("OIIInspector.shell.InspectorShell")
+@patch("OIIInspector.oii_client.IndexSession")
+def test_shell_main(mock_index_session, mock_shell):
+    oii_inspector_calls.shell_main(
+        ["name", "--address", "test-address:1", "--output-format", "compact"]
+    )
+    mock_index_session.assert_called_once_with("test-address:1")
+    session = mock_index_session.return_value.__enter__.return_value
+    mock_shell.assert_called_once_with(session, output_format="compact")
+    mock_shell.return_value.cmdloop.assert_called_once_with()
+    mock_index_session.return_value.__exit__.assert_called_once()
+
+
+@patch("OIIInspector.daemon.InspectorDaemon")
+def test_daemon_main(mock_daemon):
+    server = mock_daemon.return_value.__enter__.return_value
+    server.serve_forever.side_effect = KeyboardInterrupt
+    oii_inspector_calls.daemon_main(
+        ["name", "--socket", "/tmp/test.sock", "--capacity", "2", "--idle-ttl", "30"]
+    )
+    mock_daemon.assert_called_once_with("/tmp/test.sock", 2, 30.0)
+    server.serve_forever.assert_called_once_with()
+    mock_daemon.return_value.__exit__.assert_called_once()
+
+
+@patch("OIIInspector.daemon.InspectorDaemon")
+@patch("OIIInspector.metrics.InspectionMetrics")
+def test_daemon_main_metrics(mock_metrics, mock_daemon):
+    server = mock_daemon.return_value.__enter__.return_value
+    server.serve_forever.side_effect = KeyboardInterrupt
+    oii_inspector_calls.daemon_main(["name", "--metrics-port", "9464"])
+    mock_metrics.return_value.registry.serve.assert_called_once_with(9464)
+    mock_daemon.assert_called_once_with(
+        daemon.DEFAULT_SOCKET_PATH,
+        daemon.DEFAULT_CAPACITY,
+        daemon.DEFAULT_IDLE_TTL,
+        profiler=mock_metrics.return_value,
+    )
+    mock_metrics.return_value.registry.serve.return_value.__exit__.assert_called_once()
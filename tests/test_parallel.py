@@ -0,0 +1,97 @@
+from unittest.mock import patch, MagicMock
+import threading
+import time
+from OIIInspector import parallel
+from OIIInspector.cache import get_active_cache, use_cache
+from OIIInspector.container_manager import ContainerLimits
+
+
+@patch("OIIInspector.batch.IndexSession")
+def test_inspect_images(mock_index_session):
+    sessions = []
+    cache = MagicMock()
+
+    def create_session(image, **session_options):
+        session = MagicMock()
+        session.__enter__.return_value = session
+        session.list_packages.return_value = [{"name": image}]
+        session.get_package.side_effect = RuntimeError("missing")
+        sessions.append((image, session_options, get_active_cache()))
+        return session
+
+    mock_index_session.side_effect = create_session
+    queries = [
+        {"method": "list_packages", "id": "packages"},
+        {"method": "get_package", "args": ["test"]},
+    ]
+    with use_cache(cache):
+        results = parallel.inspect_images(
+            ["image-1", "image-2", "image-1"], queries, transport="grpc"
+        )
+    assert results == {
+        image: {
+            "results": [
+                {
+                    "index": 0,
+                    "id": "packages",
+                    "image": image,
+                    "method": "list_packages",
+                    "result": [{"name": image}],
+                },
+                {
+                    "index": 1,
+                    "image": image,
+                    "method": "get_package",
+                    "error": "RuntimeError: missing",
+                },
+            ]
+        }
+        for image in ("image-1", "image-2")
+    }
+    assert sorted(image for image, _, _ in sessions) == ["image-1", "image-2"]
+    for _, session_options, used_cache in sessions:
+        assert session_options["transport"] == "grpc"
+        assert isinstance(session_options["container_limits"], ContainerLimits)
+        assert used_cache is cache
+
+
+@patch("OIIInspector.parallel.run_queries")
+def test_inspect_images_isolates_errors(mock_run_queries):
+    def run_queries(queries, **session_options):
+        if queries[0]["image"] == "broken":
+            raise OSError("image can not be inspected")
+        return iter([{"index": 0, "result": []}])
+
+    mock_run_queries.side_effect = run_queries
+    results = parallel.inspect_images(
+        ["broken", "working"], [{"method": "list_packages"}], max_workers=1
+    )
+    assert results == {
+        "broken": {"error": "OSError: image can not be inspected"},
+        "working": {"results": [{"index": 0, "result": []}]},
+    }
+    assert parallel.inspect_images([], [{"method": "list_packages"}]) == {}
+
+
+@patch("OIIInspector.parallel.run_queries")
+def test_inspect_images_bounded_workers(mock_run_queries):
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def run_queries(queries, **session_options):
+        with lock:
+            running.append(queries[0]["image"])
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(queries[0]["image"])
+        return iter([])
+
+    mock_run_queries.side_effect = run_queries
+    images = [f"image-{number}" for number in range(6)]
+    results = parallel.inspect_images(
+        images, [{"method": "list_packages"}], max_containers=2
+    )
+    assert list(results) == images
+    assert max(peak) <= 2
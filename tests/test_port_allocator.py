@@ -0,0 +1,76 @@
+import os
+from unittest.mock import patch
+import pytest
+import OIIInspector.exceptions as exceptions
+from OIIInspector import port_allocator
+
+
+@pytest.fixture(autouse=True)
+def reservations_dir(tmp_path):
+    (tmp_path / "ports").mkdir(mode=0o700)
+    with patch.object(port_allocator, "RESERVATIONS_DIR", str(tmp_path / "ports")):
+        yield tmp_path / "ports"
+
+
+def test_reserve_and_release_port(reservations_dir):
+    port = port_allocator.reserve_free_port()
+    second_port = port_allocator.reserve_free_port()
+    assert port != second_port
+    assert (reservations_dir / str(port)).read_text() == str(os.getpid())
+    port_allocator.release_port(port)
+    assert not (reservations_dir / str(port)).exists()
+    # releasing of not reserved port is ignored
+    port_allocator.release_port(port)
+    port_allocator.release_port(second_port)
+    assert sorted(os.listdir(reservations_dir)) == [".lock"]
+
+
+@patch("OIIInspector.port_allocator._get_kernel_free_port")
+def test_port_reserved_by_other_process_is_skipped(mock_free_port, reservations_dir):
+    mock_free_port.side_effect = [41000, 41001, 41002]
+    # parent process is alive, while reservation with not existing PID is stale
+    (reservations_dir / "41000").write_text(str(os.getppid()))
+    (reservations_dir / "41001").write_text("999999999")
+    assert port_allocator.reserve_free_port() == 41001
+    assert (reservations_dir / "41001").read_text() == str(os.getpid())
+    port_allocator.release_port(41001)
+
+
+@patch("OIIInspector.port_allocator.os.kill", side_effect=PermissionError)
+@patch("OIIInspector.port_allocator._get_kernel_free_port", return_value=41000)
+def test_no_free_port(mock_free_port, mock_kill, reservations_dir):
+    (reservations_dir / "41000").write_text("1")
+    with pytest.raises(exceptions.NoFreePortFound):
+        port_allocator.reserve_free_port()
+    assert mock_free_port.call_count == port_allocator.MAX_ALLOCATION_TRIES
+
+
+@patch("OIIInspector.port_allocator._get_kernel_free_port", return_value=41000)
+def test_port_reserved_in_this_process_is_skipped(mock_free_port, reservations_dir):
+    assert port_allocator.reserve_free_port() == 41000
+    with pytest.raises(exceptions.NoFreePortFound):
+        port_allocator.reserve_free_port()
+    # reservation overwritten by different process is not removed
+    (reservations_dir / "41000").write_text("invalid")
+    port_allocator.release_port(41000)
+    assert (reservations_dir / "41000").exists()
+
+
+def test_reservations_dir_is_private(reservations_dir):
+    reservations_dir.rmdir()
+    port_allocator.release_port(port_allocator.reserve_free_port())
+    assert reservations_dir.stat().st_mode & 0o777 == 0o700
+    assert (reservations_dir / ".lock").stat().st_mode & 0o777 == 0o600
+
+
+def test_reservations_dir_accessible_by_others(reservations_dir, tmp_path):
+    reservations_dir.chmod(0o777)
+    with pytest.raises(exceptions.OIIInspectorError, match="accessible only by"):
+        port_allocator.reserve_free_port()
+    reservations_dir.rmdir()
+    # directory planted as a symlink is not followed
+    (tmp_path / "planted").mkdir(mode=0o700)
+    reservations_dir.symlink_to(tmp_path / "planted")
+    with pytest.raises(exceptions.OIIInspectorError, match="accessible only by"):
+        port_allocator.reserve_free_port()
+    assert os.listdir(tmp_path / "planted") == []
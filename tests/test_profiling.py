@@ -0,0 +1,162 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import sys
+import time
+from unittest.mock import patch
+import pytest
+from OIIInspector import profiling
+from OIIInspector.utils import run_cmd, run_cmd_stream
+
+
+def test_disabled_profiling():
+    assert profiling.get_active_profiler() is None
+    items = [1, 2]
+    assert list(profiling.timed_iter("items", items)) == items
+    with profiling.span("nothing"):
+        profiling.count("subprocesses")
+
+
+def test_spans_and_counters():
+    finished = []
+    profiler = profiling.Profiler(hooks=[finished.append])
+    with profiling.use_profiler(profiler):
+        assert profiling.get_active_profiler() is profiler
+        with profiling.span("outer", image="test"):
+            with profiling.span("inner"):
+                time.sleep(0.01)
+            profiling.count("subprocesses")
+            profiling.count("bytes_read", 10)
+            profiling.count("bytes_read", 5)
+    assert profiling.get_active_profiler() is None
+    assert [span.name for span in finished] == ["inner", "outer"]
+    inner, outer = finished
+    assert inner.parent is outer
+    assert outer.child_duration == inner.duration >= 0.01
+    assert outer.self_duration == pytest.approx(outer.duration - inner.duration)
+
+    report = profiler.report()
+    assert report["counters"] == {"subprocesses": 1, "bytes_read": 15}
+    assert [span["name"] for span in report["spans"]] == ["inner", "outer"]
+    assert report["spans"][1]["image"] == "test"
+    assert report["spans"][1]["duration_s"] == outer.duration
+    assert report["phases"]["outer"]["count"] == 1
+    assert report["phases"]["inner"]["self_s"] == inner.duration
+
+
+def test_timed_iter():
+    profiler = profiling.Profiler()
+    later = []
+    profiler.add_hook(later.append)
+
+    def produce():
+        for item in range(3):
+            with profiling.span("produce"):
+                time.sleep(0.005)
+            yield item
+
+    with profiling.use_profiler(profiler):
+        for item in profiling.timed_iter("items", produce(), method="ListBundles"):
+            # time of the consumer is not counted
+            time.sleep(0.01)
+    items = later[-1]
+    assert items.name == "items"
+    assert items.attributes == {"method": "ListBundles", "items": 3}
+    produce_phase = profiler.report()["phases"]["produce"]
+    assert produce_phase["count"] == 3
+    assert items.duration >= produce_phase["total_s"] >= 0.015
+    assert items.child_duration == pytest.approx(produce_phase["total_s"])
+
+
+def test_timed_iter_closed_early():
+    closed = []
+
+    def produce():
+        try:
+            yield from range(10)
+        finally:
+            closed.append(True)
+
+    profiler = profiling.Profiler()
+    with profiling.use_profiler(profiler):
+        iterator = profiling.timed_iter("items", produce())
+        assert next(iterator) == 0
+        iterator.close()
+    assert closed == [True]
+    assert profiler.report()["spans"][0]["items"] == 1
+    # stop of the iteration by the consumer is not an error
+    assert profiler._spans[0].error is None
+
+
+def test_failed_spans():
+    def produce():
+        yield 1
+        raise RuntimeError("failed")
+
+    finished = []
+    with profiling.use_profiler(profiling.Profiler([finished.append])):
+        with pytest.raises(RuntimeError):
+            with profiling.span("serve"):
+                raise RuntimeError("failed")
+        with pytest.raises(RuntimeError):
+            list(profiling.timed_iter("query", produce()))
+        with profiling.span("output"):
+            pass
+    assert [type(span.error) for span in finished] == [RuntimeError] * 2 + [type(None)]
+
+
+def test_profiler_shared_by_threads():
+    profiler = profiling.Profiler()
+
+    def work():
+        with profiling.span("work"):
+            profiling.count("subprocesses")
+
+    with profiling.use_profiler(profiler), ThreadPoolExecutor(2) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, work) for _ in range(4)
+        ]
+        for future in futures:
+            future.result()
+    assert profiler.report()["counters"]["subprocesses"] == 4
+    assert profiler.report()["phases"]["work"]["count"] == 4
+
+
+def test_run_cmd_profiled():
+    profiler = profiling.Profiler()
+    with profiling.use_profiler(profiler):
+        assert run_cmd(f"{sys.executable} -c \"print('x' * 9, end='')\"") == "x" * 9
+        chunks = run_cmd_stream(f"{sys.executable} -c \"print('y' * 9, end='')\"")
+        assert "".join(chunks) == "y" * 9
+    report = profiler.report()
+    assert report["counters"] == {"subprocesses": 2, "bytes_read": 18}
+    assert [span["name"] for span in report["spans"]] == ["run_cmd", "run_cmd_stream"]
+    assert report["spans"][0]["command"] == sys.executable
+
+
+@patch("OIIInspector.container_manager.run_cmd")
+@patch("OIIInspector.container_manager.subprocess")
+@patch("OIIInspector.container_manager.socket")
+def test_container_manager_profiled(mock_socket, mock_subprocess, mock_run_cmd):
+    from OIIInspector.container_manager import ContainerManager
+    from OIIInspector.container_runtime import PodmanRuntime
+
+    mock_subprocess.Popen.return_value.poll.return_value = None
+    mock_run_cmd.return_value = "api.Registry.ListPackages"
+    profiler = profiling.Profiler()
+    with profiling.use_profiler(profiler):
+        with patch(
+            "OIIInspector.container_manager.detect_runtime",
+            return_value=PodmanRuntime(),
+        ):
+            with ContainerManager("test") as manager:
+                manager.start_container()
+    report = profiler.report()
+    assert [span["name"] for span in report["spans"]] == [
+        "detect_runtime",
+        "pull",
+        "readiness",
+        "serve",
+        "teardown",
+    ]
+    assert report["counters"] == {"port_attempts": 1}
+    assert report["spans"][1]["image"] == "test"
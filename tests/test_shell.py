@@ -0,0 +1,186 @@
+import io
+import pytest
+from unittest.mock import MagicMock, patch
+import OIIInspector.exceptions as exceptions
+from OIIInspector import shell
+
+
+@pytest.fixture
+def session():
+    session = MagicMock()
+    session.list_packages.return_value = [{"name": "etcd"}, {"name": "amq-streams"}]
+    session.get_package.return_value = {
+        "name": "etcd",
+        "channels": [
+            {"name": "singlenamespace-alpha", "csvName": "etcdoperator.v0.9.4"},
+            {"name": "clusterwide-alpha", "csvName": "etcdoperator.v0.9.4-clusterwide"},
+        ],
+    }
+    session.list_bundles.return_value = [
+        {
+            "packageName": "etcd",
+            "channelName": "singlenamespace-alpha",
+            "csvName": "etcdoperator.v0.9.4",
+        },
+        {
+            "packageName": "etcd",
+            "channelName": "singlenamespace-alpha",
+            "csvName": "etcdoperator.v0.9.2",
+        },
+        {
+            "packageName": "etcd",
+            "channelName": "clusterwide-alpha",
+            "csvName": "etcdoperator.v0.9.4-clusterwide",
+        },
+        {
+            "packageName": "amq-streams",
+            "channelName": "stable",
+            "csvName": "amqstreams.v1.0.0",
+        },
+    ]
+    session.get_bundle.return_value = {"csvName": "etcdoperator.v0.9.4"}
+    session.get_bundle_for_channel.return_value = {"csvName": "etcdoperator.v0.9.4"}
+    session.get_bundle_that_replaces.return_value = {"csvName": "etcdoperator.v0.9.4"}
+    session.get_default_bundle_that_provides.return_value = {
+        "csvName": "etcdoperator.v0.9.4"
+    }
+    return session
+
+
+def run_shell(session, commands, output_format="compact"):
+    stdout = io.StringIO()
+    inspector_shell = shell.InspectorShell(
+        session, output_format, stdin=io.StringIO(commands), stdout=stdout
+    )
+    inspector_shell.cmdloop()
+    # prompts are written to the output when the commands are not read from a terminal
+    return stdout.getvalue().replace(shell.InspectorShell.prompt, "")
+
+
+def test_shell_commands(session):
+    output = run_shell(
+        session,
+        "\n"
+        "get_bundle etcd singlenamespace-alpha etcdoperator.v0.9.4\n"
+        "get_package etcd\n"
+        "list_packages\n"
+        "list_bundles etcd clusterwide-alpha\n"
+        "get_bundle_for_channel etcd clusterwide-alpha\n"
+        "get_bundle_that_replaces etcd clusterwide-alpha etcdoperator.v0.9.2\n"
+        "get_default_bundle_that_provides etcd.database.coreos.com v1beta2 EtcdCluster etcdclusters\n"
+        "exit\n"
+        "list_packages\n",
+    )
+    assert '{"csvName":"etcdoperator.v0.9.4"}\n' in output
+    session.get_bundle.assert_called_once_with(
+        "etcd", "singlenamespace-alpha", "etcdoperator.v0.9.4"
+    )
+    session.get_package.assert_called_once_with("etcd")
+    # names are listed once on start, the command after exit is not run
+    session.list_packages.assert_called_once_with()
+    assert session.list_bundles.call_count == 2
+    session.list_bundles.assert_called_with(
+        filters={"package": "etcd", "channel": "clusterwide-alpha"}
+    )
+    session.get_bundle_for_channel.assert_called_once_with("etcd", "clusterwide-alpha")
+    session.get_bundle_that_replaces.assert_called_once_with(
+        "etcd", "clusterwide-alpha", "etcdoperator.v0.9.2"
+    )
+    session.get_default_bundle_that_provides.assert_called_once_with(
+        "etcd.database.coreos.com", "v1beta2", "EtcdCluster", "etcdclusters"
+    )
+    session.close.assert_not_called()
+
+
+def test_shell_errors(session):
+    session.get_package.side_effect = exceptions.OIIInspectorError("Package not found")
+    session.get_bundle_for_channel.side_effect = OSError("Broken pipe")
+    output = run_shell(
+        session,
+        "get_package missing\n"
+        "get_bundle_for_channel etcd stable\n"
+        "get_bundle etcd\n"
+        "list_bundles a b c\n"
+        "get_package 'etcd\n"
+        "list_packages extra\n"
+        "remove etcd\n",
+    )
+    assert output.splitlines()[1:] == [
+        "Error: Package not found",
+        "Error: Broken pipe",
+        "Usage: get_bundle PACKAGE CHANNEL CSV",
+        "Usage: list_bundles [PACKAGE [CHANNEL]]",
+        "Error: No closing quotation",
+        "Usage: list_packages",
+        "Unknown command: remove, type help to list the commands",
+        "",
+    ]
+
+
+def test_shell_pretty_output(session):
+    output = run_shell(session, "list_packages\n", output_format="pretty")
+    assert output.splitlines()[1:4] == ["[", "    {", '        "name": "etcd"']
+
+
+def test_shell_completion(session):
+    inspector_shell = shell.InspectorShell(session, stdin=io.StringIO())
+    inspector_shell.preloop()
+    assert inspector_shell.complete_get_package("", "get_package ", 12, 12) == [
+        "amq-streams",
+        "etcd",
+    ]
+    line = "get_bundle etcd single"
+    assert inspector_shell.complete_get_bundle("single", line, 16, 22) == [
+        "singlenamespace-alpha"
+    ]
+    line = "get_bundle_that_replaces etcd singlenamespace-alpha etcdoperator."
+    assert inspector_shell.complete_get_bundle_that_replaces(
+        "etcdoperator.", line, 52, 65
+    ) == ["etcdoperator.v0.9.2", "etcdoperator.v0.9.4"]
+    line = "get_bundle_for_channel etcd cluster"
+    assert inspector_shell.complete_get_bundle_for_channel("cluster", line, 28, 35) == [
+        "clusterwide-alpha"
+    ]
+    line = "list_bundles etcd clusterwide-alpha "
+    assert inspector_shell.complete_list_bundles("", line, 36, 36) == []
+    line = "get_bundle 'etcd "
+    assert inspector_shell.complete_get_bundle("", line, 17, 17) == []
+    line = "get_bundle etcd clusterwide-alpha "
+    assert inspector_shell.complete_get_bundle("", line, 34, 34) == [
+        "etcdoperator.v0.9.4-clusterwide"
+    ]
+    assert inspector_shell.complete_get_bundle("", "get_bundle missing ", 19, 19) == []
+    # all names are listed with one call when the shell starts
+    session.list_bundles.assert_called_once_with(
+        fields=["packageName", "channelName", "csvName"]
+    )
+    session.get_package.assert_not_called()
+    session.list_packages.assert_not_called()
+
+
+def test_shell_completion_errors(session):
+    session.list_bundles.side_effect = RuntimeError("grpcurl failed")
+    output = run_shell(session, "get_package etcd\n")
+    # the shell keeps running without completion
+    assert output.startswith("Error: grpcurl failed, names will not be completed\n")
+    session.get_package.assert_called_once_with("etcd")
+    inspector_shell = shell.InspectorShell(session, stdin=io.StringIO())
+    inspector_shell.preloop()
+    assert inspector_shell.complete_get_package("", "get_package ", 12, 12) == []
+    assert inspector_shell.complete_get_bundle("", "get_bundle etcd ", 16, 16) == []
+
+
+@patch("OIIInspector.shell.readline")
+def test_shell_completer_delims(mock_readline, session):
+    mock_readline.get_completer_delims.return_value = " -."
+    inspector_shell = shell.InspectorShell(session)
+    inspector_shell.preloop()
+    mock_readline.set_completer_delims.assert_called_once_with(shell.COMPLETER_DELIMS)
+    inspector_shell.postloop()
+    mock_readline.set_completer_delims.assert_called_with(" -.")
+    inspector_shell.postloop()
+    assert mock_readline.set_completer_delims.call_count == 2
+
+
+def test_shell_eof(session):
+    assert run_shell(session, "") == shell.InspectorShell.intro + "\n\n"
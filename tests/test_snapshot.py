@@ -0,0 +1,250 @@
+import json
+import os
+import zlib
+import pytest
+from unittest.mock import MagicMock, patch
+import OIIInspector.exceptions as exceptions
+from OIIInspector import oii_client, snapshot
+from OIIInspector.cache import ResponseCache, use_cache
+from OIIInspector.utils import parse_call_argument
+
+ETCD_CLUSTER = {
+    "group": "etcd.database.coreos.com",
+    "version": "v1beta2",
+    "kind": "EtcdCluster",
+}
+
+
+def bundle(package, channel, csv_name, replaces=None, provided_apis=()):
+    csv = {"kind": "ClusterServiceVersion", "metadata": {"name": csv_name}}
+    crd = {"kind": "CustomResourceDefinition", "metadata": {"name": csv_name + "-crd"}}
+    message = {
+        "csvName": csv_name,
+        "packageName": package,
+        "channelName": channel,
+        "csvJson": json.dumps(csv),
+        "object": [json.dumps(crd), json.dumps(csv)],
+        "providedApis": list(provided_apis),
+        "version": csv_name.split(".v", 1)[1],
+    }
+    if replaces:
+        message["replaces"] = replaces
+    if package == "prometheus":
+        # bundle of an old index image, without the CSV among its objects
+        message["object"] = message["object"][:1]
+    return message
+
+
+BUNDLES = [
+    bundle("etcd-legacy", "old", "etcd-legacy.v0.1.0", provided_apis=[ETCD_CLUSTER]),
+    bundle("etcd-legacy", "new", "etcd-legacy.v0.2.0"),
+    bundle("etcd", "alpha", "etcd.v0.9.0", provided_apis=[ETCD_CLUSTER]),
+    bundle("etcd", "alpha", "etcd.v0.9.2", "etcd.v0.9.0", provided_apis=[ETCD_CLUSTER]),
+    bundle(
+        "etcd", "clusterwide", "etcd.v0.9.2-clusterwide", provided_apis=[ETCD_CLUSTER]
+    ),
+    bundle("prometheus", "beta", "prometheus.v0.32.0"),
+    # bundle of a package listed already, its block is built from both runs
+    bundle("etcd", "alpha", "etcd.v0.9.3", "etcd.v0.9.2"),
+]
+PACKAGES = [
+    {
+        "name": "etcd",
+        "channels": [
+            # head stored by the registry, not the bundle derived from the replaces edges
+            {"name": "alpha", "csvName": "etcd.v0.9.2"},
+            {"name": "clusterwide", "csvName": "etcd.v0.9.2-clusterwide"},
+        ],
+        "defaultChannelName": "alpha",
+    },
+    {
+        "name": "etcd-legacy",
+        "channels": [
+            {"name": "new", "csvName": "etcd-legacy.v0.2.0"},
+            {"name": "old", "csvName": "etcd-legacy.v0.1.0"},
+        ],
+        "defaultChannelName": "new",
+    },
+    {"name": "empty"},
+]
+
+
+class CatalogTransport:
+    """Transport answering from BUNDLES and PACKAGES, prometheus is missing in ListPackages."""
+
+    requires_container = False
+
+    def __init__(self):
+        """Initialize the CatalogTransport."""
+        self.calls = []
+
+    def messages(self, address, api_address, call_argument=None, streamed=False):
+        """Answer ListBundles, ListPackages and GetPackage."""
+        self.calls.append(api_address)
+        if api_address == "ListBundles":
+            return iter([dict(message) for message in BUNDLES])
+        if api_address == "ListPackages":
+            return iter([{"name": package["name"]} for package in PACKAGES])
+        (package,) = [
+            package
+            for package in PACKAGES
+            if package["name"] == parse_call_argument(call_argument)["name"]
+        ]
+        return iter([package])
+
+    def close(self):
+        """Release nothing, the transport holds no resources."""
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    path = str(tmp_path / "index.oiisnap")
+    transport = CatalogTransport()
+    stats = snapshot.write_snapshot("registry/index:v1", path, transport=transport)
+    assert transport.calls == ["ListBundles", "ListPackages"] + ["GetPackage"] * 3
+    assert stats["packages"] == 4
+    assert stats["bundles"] == 7
+    assert stats["snapshotBytes"] == os.path.getsize(path)
+    assert stats["snapshotBytes"] < stats["rawBytes"]
+    assert os.listdir(tmp_path) == ["index.oiisnap"]
+    return path
+
+
+def test_snapshot_queries(snapshot_path):
+    options = {"transport": "snapshot"}
+    assert oii_client.list_packages(snapshot_path, **options) == [
+        {"name": "etcd"},
+        {"name": "etcd-legacy"},
+        {"name": "empty"},
+        {"name": "prometheus"},
+    ]
+    assert oii_client.get_package(snapshot_path, "etcd", **options) == PACKAGES[0]
+    assert oii_client.get_package(snapshot_path, "prometheus", **options) == {
+        "name": "prometheus"
+    }
+    bundles = oii_client.list_bundles(snapshot_path, **options)
+    assert sorted(bundle["csvName"] for bundle in bundles) == sorted(
+        bundle["csvName"] for bundle in BUNDLES
+    )
+    filtered = oii_client.list_bundles(
+        snapshot_path, fields=["csvName"], filters={"channel": "alpha"}, **options
+    )
+    assert filtered == [
+        {"csvName": "etcd.v0.9.0"},
+        {"csvName": "etcd.v0.9.2"},
+        {"csvName": "etcd.v0.9.3"},
+    ]
+
+    resp = oii_client.get_bundle(
+        snapshot_path, "etcd", "alpha", "etcd.v0.9.0", **options
+    )
+    assert resp["csvJson"] == {
+        "kind": "ClusterServiceVersion",
+        "metadata": {"name": "etcd.v0.9.0"},
+    }
+    # CSV stored once is restored in the object field
+    assert resp["object"][1] == resp["csvJson"]
+    # cached messages are not decoded in place by the session
+    resp = oii_client.get_bundle(
+        snapshot_path, "etcd", "alpha", "etcd.v0.9.0", **options
+    )
+    assert resp["csvJson"]["kind"] == "ClusterServiceVersion"
+    # head of the channel agrees with the package
+    resp = oii_client.get_bundle_for_channel(snapshot_path, "etcd", "alpha", **options)
+    assert resp["csvName"] == "etcd.v0.9.2"
+    resp = oii_client.get_bundle_that_replaces(
+        snapshot_path, "etcd", "alpha", "etcd.v0.9.0", **options
+    )
+    assert resp["csvName"] == "etcd.v0.9.2"
+    resp = oii_client.get_default_bundle_that_provides(
+        snapshot_path, *ETCD_CLUSTER.values(), "etcdclusters", **options
+    )
+    assert resp["csvName"] == "etcd.v0.9.2"
+
+
+def test_snapshot_point_query_decompresses_one_block(snapshot_path):
+    with patch.object(
+        snapshot.zlib, "decompress", wraps=zlib.decompress
+    ) as mock_decompress:
+        with snapshot.Snapshot(snapshot_path) as index_snapshot:
+            assert index_snapshot.image == "registry/index:v1"
+            assert mock_decompress.call_count == 1
+            index_snapshot.get_bundle("etcd", "alpha", "etcd.v0.9.2")
+            index_snapshot.get_bundle_for_channel("etcd", "clusterwide")
+            assert mock_decompress.call_count == 2
+
+
+def test_snapshot_errors(snapshot_path, tmp_path):
+    with snapshot.Snapshot(snapshot_path) as index_snapshot:
+        with pytest.raises(RuntimeError, match="package has not been found"):
+            index_snapshot.get_package("missing")
+        with pytest.raises(RuntimeError, match="bundle has not been found"):
+            index_snapshot.get_bundle("etcd", "alpha", "etcd.v1.0.0")
+        with pytest.raises(RuntimeError, match="bundle has not been found"):
+            index_snapshot.get_bundle_for_channel("etcd", "stable")
+        with pytest.raises(RuntimeError, match="bundle has not been found"):
+            index_snapshot.get_default_bundle_that_provides("group", "v1", "Kind")
+        with pytest.raises(RuntimeError, match="not supported"):
+            list(index_snapshot.query("ListChannels"))
+
+    not_snapshot = tmp_path / "index.json"
+    not_snapshot.write_text("{}")
+    with pytest.raises(exceptions.OIIInspectorError, match="is not a snapshot"):
+        snapshot.Snapshot(str(not_snapshot))
+    content = open(snapshot_path, "rb").read()
+    truncated = tmp_path / "truncated.oiisnap"
+    truncated.write_bytes(content[:-1])
+    with pytest.raises(exceptions.OIIInspectorError, match="is truncated"):
+        snapshot.Snapshot(str(truncated))
+    unsupported = tmp_path / "unsupported.oiisnap"
+    index = zlib.compress(json.dumps({"version": 0}).encode("utf-8"))
+    unsupported.write_bytes(
+        snapshot.MAGIC
+        + index
+        + snapshot.TRAILER.pack(len(snapshot.MAGIC), len(index), snapshot.MAGIC)
+    )
+    with pytest.raises(exceptions.OIIInspectorError, match="Version 0"):
+        snapshot.Snapshot(str(unsupported))
+
+
+def test_write_snapshot_failure(tmp_path):
+    with patch.object(snapshot.zlib, "compress", side_effect=MemoryError):
+        with pytest.raises(MemoryError):
+            snapshot.write_snapshot(
+                "registry/index:v1",
+                str(tmp_path / "index.oiisnap"),
+                transport=CatalogTransport(),
+            )
+    assert os.listdir(tmp_path) == []
+
+
+def test_snapshot_transport(snapshot_path):
+    transport = oii_client.get_transport("snapshot")
+    assert isinstance(transport, snapshot.SnapshotTransport)
+    assert (
+        json.loads(transport.call(snapshot_path, "GetPackage", '\'{"name":"etcd"}\''))
+        == PACKAGES[0]
+    )
+    assert len(list(transport.stream(snapshot_path, "ListPackages"))) == 4
+    transport.close()
+    # snapshot is not stored in the response cache
+    cache = MagicMock()
+    with use_cache(cache):
+        assert oii_client.list_packages(snapshot_path, transport="snapshot")
+    cache.load.assert_not_called()
+
+
+def test_write_snapshot_from_cache(tmp_path):
+    response_cache = ResponseCache(cache_dir=str(tmp_path / "cache"))
+    paths = [str(tmp_path / "first.oiisnap"), str(tmp_path / "second.oiisnap")]
+    transport = CatalogTransport()
+    with use_cache(response_cache):
+        for path in paths:
+            snapshot.write_snapshot(
+                "registry/index@sha256:1234", path, transport=transport
+            )
+    # the second snapshot is written from the cached responses
+    assert transport.calls == ["ListBundles", "ListPackages"] + ["GetPackage"] * 3
+    assert [open(path, "rb").read() for path in paths[1:]] == [
+        open(paths[0], "rb").read()
+    ]
@@ -0,0 +1,124 @@
+import pytest
+from OIIInspector.upgrade_graph import UpgradeGraph
+
+
+def bundle(csv_name, version, channel="stable", **fields):
+    return {
+        "packageName": "etcd",
+        "channelName": channel,
+        "csvName": csv_name,
+        "version": version,
+        **fields,
+    }
+
+
+BUNDLES = [
+    bundle("etcd.v0.9.4", "0.9.4", replaces="etcd.v0.9.2", skips=["etcd.v0.9.3"]),
+    bundle("etcd.v0.9.0", "0.9.0"),
+    bundle("etcd.v0.9.2", "0.9.2", replaces="etcd.v0.9.0"),
+    bundle("etcd.v0.9.3", "0.9.3", replaces="etcd.v0.9.2"),
+    bundle("etcd.v0.10.0", "0.10.0", skipRange=">=0.9.0 <0.10.0"),
+    bundle("etcd.v0.8.0", "0.8.0", replaces="etcd.v0.7.0"),
+    bundle("etcd.v1.0.0", "1.0.0", channel="alpha", replaces="etcd.v0.10.0"),
+    bundle("etcd.v0.9.0", "0.9.0", channel="alpha"),
+]
+
+
+@pytest.fixture
+def graph():
+    return UpgradeGraph(BUNDLES)
+
+
+def test_nodes_sorted_by_version(graph):
+    assert graph.channels() == [("etcd", "alpha"), ("etcd", "stable")]
+    assert graph.nodes("etcd", "stable") == [
+        "etcd.v0.8.0",
+        "etcd.v0.9.0",
+        "etcd.v0.9.2",
+        "etcd.v0.9.3",
+        "etcd.v0.9.4",
+        "etcd.v0.10.0",
+    ]
+    assert graph.nodes("etcd", "beta") == []
+
+
+def test_upgrades(graph):
+    assert graph.upgrades("etcd", "stable", "etcd.v0.9.2") == [
+        "etcd.v0.9.3",
+        "etcd.v0.9.4",
+        "etcd.v0.10.0",
+    ]
+    assert graph.upgrades("etcd", "stable", "etcd.v0.9.3") == [
+        "etcd.v0.9.4",
+        "etcd.v0.10.0",
+    ]
+    assert graph.upgrades("etcd", "stable", "etcd.v0.8.0") == []
+    # replaced bundle of other channel does not add an edge
+    assert graph.upgrades("etcd", "alpha", "etcd.v0.9.0") == []
+
+
+def test_heads(caplog):
+    graph = UpgradeGraph(BUNDLES)
+    assert graph.heads == {
+        ("etcd", "stable"): "etcd.v0.10.0",
+        ("etcd", "alpha"): "etcd.v1.0.0",
+    }
+    assert "Channel stable of etcd has 2 heads" in caplog.text
+    assert "Channel alpha of etcd has 2 heads" in caplog.text
+
+
+def test_single_head_without_warning(caplog):
+    graph = UpgradeGraph(BUNDLES[:5])
+    assert graph.heads == {("etcd", "stable"): "etcd.v0.10.0"}
+    assert "heads" not in caplog.text
+
+
+def test_cycle_head():
+    graph = UpgradeGraph(
+        [
+            bundle("etcd.v1", "1.0.0", replaces="etcd.v2"),
+            bundle("etcd.v2", None, replaces="etcd.v1"),
+        ]
+    )
+    assert graph.heads == {("etcd", "stable"): "etcd.v1"}
+    assert graph.nodes("etcd", "stable") == ["etcd.v2", "etcd.v1"]
+
+
+def test_reachable(graph):
+    assert graph.reachable("etcd", "stable", "etcd.v0.9.0") == [
+        "etcd.v0.9.2",
+        "etcd.v0.9.3",
+        "etcd.v0.9.4",
+        "etcd.v0.10.0",
+    ]
+    assert graph.reachable("etcd", "stable", "etcd.v0.10.0") == []
+
+
+def test_shortest_path(graph):
+    assert graph.shortest_path("etcd", "stable", "etcd.v0.9.0") == [
+        "etcd.v0.9.0",
+        "etcd.v0.10.0",
+    ]
+    assert graph.shortest_path("etcd", "stable", "etcd.v0.9.0", "etcd.v0.9.4") == [
+        "etcd.v0.9.0",
+        "etcd.v0.9.2",
+        "etcd.v0.9.4",
+    ]
+    assert graph.shortest_path("etcd", "stable", "etcd.v0.10.0") == ["etcd.v0.10.0"]
+    assert graph.shortest_path("etcd", "stable", "etcd.v0.8.0") is None
+
+
+def test_unknown_bundle(graph):
+    with pytest.raises(
+        RuntimeError, match="Requested bundle has not been found in the upgrade graph."
+    ):
+        graph.reachable("etcd", "stable", "etcd.v0.7.0")
+    with pytest.raises(RuntimeError):
+        graph.shortest_path("etcd", "stable", "etcd.v0.9.0", "etcd.v1.0.0")
+
+
+def test_orphaned(graph):
+    assert graph.orphaned() == [
+        ("etcd", "alpha", "etcd.v0.9.0"),
+        ("etcd", "stable", "etcd.v0.8.0"),
+    ]
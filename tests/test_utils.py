@@ -1,8 +1,22 @@
 import json.decoder
 from unittest.mock import MagicMock, patch
 import pytest
-from OIIInspector.utils import run_cmd, convert_output, setup_arg_parser
-
+from OIIInspector.utils import (
+    run_cmd,
+    convert_output,
+    setup_arg_parser,
+    parse_call_argument,
+    run_cmd_stream,
+    iter_json_objects,
+    run_cmd_async,
+    run_cmd_stream_async,
+    aiter_json_objects,
+    convert_message,
+    parse_output,
+    LazyMessage,
+)
+import asyncio
+import sys
 
 input_file_name = "./tests/data/{test_name}"
 CONVERT_OUTPUT_SPEC_JSON_OBJECTS_COUNT = 4
@@ -66,6 +80,45 @@ def test_convert_output_spec():
     assert len(converted_input["spec"]) == CONVERT_OUTPUT_SPEC_JSON_OBJECTS_COUNT
 
 
+def load_message(file_name):
+    with open(input_file_name.format(test_name=file_name), "r") as file:
+        return parse_output(file.read())
+
+
+def test_lazy_message():
+    raw_message = load_message("convert_output_combined.json")
+    eager = convert_message(dict(raw_message))
+    with patch("OIIInspector.utils.json.loads", side_effect=json.loads) as mock_loads:
+        lazy = convert_message(raw_message, lazy=True)
+        assert isinstance(lazy, LazyMessage)
+        assert sorted(lazy) == sorted(eager)
+        assert mock_loads.call_count == 0
+        assert len(lazy["csvJson"]) == CONVERT_OUTPUT_CSVJSON_OBJECTS_COUNT
+        assert lazy["csvJson"] is lazy.get("csvJson")
+        assert mock_loads.call_count == 1
+    # the original message is left encoded
+    assert isinstance(raw_message["spec"], str)
+    assert lazy == eager
+    assert not lazy != eager
+    assert convert_message(raw_message, lazy=True) == lazy
+    assert repr(convert_message(raw_message, lazy=True)) == repr(raw_message)
+
+
+def test_lazy_message_copies():
+    raw_message = load_message("convert_output_combined.json")
+    eager = convert_message(dict(raw_message))
+    assert json.dumps(LazyMessage(raw_message)) == json.dumps(eager)
+    assert json.dumps(LazyMessage(raw_message), indent=4) == json.dumps(eager, indent=4)
+    assert dict(LazyMessage(raw_message)) == eager
+    assert type(LazyMessage(raw_message).copy()) is dict
+    assert list(LazyMessage(raw_message).values()) == list(eager.values())
+    lazy = LazyMessage(raw_message)
+    lazy["spec"] = "replaced"
+    assert lazy.pop("spec") == "replaced"
+    assert lazy.pop("object") == eager["object"]
+    assert lazy.get("missing", 1) == 1
+
+
 def test_convert_output_empty_input():
     with pytest.raises(RuntimeError):
         convert_output("")
@@ -116,6 +169,15 @@ def test_parser_arg_groups(capsys):
     assert "Group 2:" in out
 
 
+def test_parser_choices():
+    parser = setup_arg_parser(
+        {("--format",): {"type": str, "default": "a", "choices": ("a", "b")}}
+    )
+    assert parser.parse_args(["--format", "b"]).format == "b"
+    with pytest.raises(SystemExit):
+        parser.parse_args(["--format", "c"])
+
+
 def test_parser_arg_required():
     args = {
         ("--arg2",): {
@@ -220,3 +282,109 @@ def test_parser_action():
     parser = setup_arg_parser(args)
     parsed_args = parser.parse_args(["--arg1"])
     assert parsed_args.arg1 is True
+
+
+def test_parse_call_argument():
+    assert parse_call_argument(None) == {}
+    assert parse_call_argument('\'{"pkgName":"test", "channelName":"4.3"}\'') == {
+        "pkgName": "test",
+        "channelName": "4.3",
+    }
+
+
+def test_run_cmd_stream():
+    cmd = f"{sys.executable} -c \"print('{{}}' * 5000, end='')\""
+    chunks = list(run_cmd_stream(cmd, chunk_size=4096))
+    assert len(chunks) == 3
+    assert "".join(chunks) == "{}" * 5000
+
+
+def test_run_cmd_stream_fail():
+    cmd = f"{sys.executable} -c \"import sys; print('out'); sys.exit('err')\""
+    with pytest.raises(RuntimeError):
+        list(run_cmd_stream(cmd))
+
+
+def test_run_cmd_stream_stopped_early():
+    cmd = f"{sys.executable} -c \"print('x' * 100000); import time; time.sleep(60)\""
+    stream = run_cmd_stream(cmd, chunk_size=10)
+    assert next(stream) == "x" * 10
+    # closing the generator kills the process instead of waiting for it
+    stream.close()
+
+
+def test_iter_json_objects():
+    with open(input_file_name.format(test_name="list_bundles.json"), "r") as file:
+        content = file.read()
+    expected = list(iter_json_objects([content]))
+    assert len(expected) == 3
+    for chunk_size in (1, 7, 100, 4096):
+        starts = range(0, len(content), chunk_size)
+        chunks = (content[start:][:chunk_size] for start in starts)
+        assert list(iter_json_objects(chunks)) == expected
+    assert list(iter_json_objects(["", "  \n"])) == []
+    assert list(iter_json_objects(['{"a": 1}{"b"', ": 2}"])) == [{"a": 1}, {"b": 2}]
+
+
+def test_iter_json_objects_bad_input():
+    with pytest.raises(json.decoder.JSONDecodeError):
+        list(iter_json_objects(['{"a": 1}', '{"b": ']))
+
+
+def test_run_cmd_async():
+    cmd = f"{sys.executable} -c \"print('out')\""
+    assert asyncio.run(run_cmd_async(cmd)) == "out\n"
+    fail_cmd = f"{sys.executable} -c \"import sys; sys.exit('err')\""
+    with pytest.raises(RuntimeError):
+        asyncio.run(run_cmd_async(fail_cmd))
+    assert asyncio.run(run_cmd_async(fail_cmd, tolerate_err=True)) == ""
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+def test_run_cmd_stream_async():
+    cmd = f"{sys.executable} -c \"print('{{}}' * 5000, end='')\""
+    chunks = asyncio.run(collect(run_cmd_stream_async(cmd, chunk_size=4096)))
+    assert len(chunks) == 3
+    assert "".join(chunks) == "{}" * 5000
+
+
+def test_run_cmd_stream_async_fail():
+    cmd = f"{sys.executable} -c \"import sys; print('out'); sys.exit('err')\""
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect(run_cmd_stream_async(cmd)))
+
+
+def test_run_cmd_stream_async_stopped_early():
+    async def read_first_chunk():
+        cmd = (
+            f"{sys.executable} -c \"print('x' * 100000); import time; time.sleep(60)\""
+        )
+        stream = run_cmd_stream_async(cmd, chunk_size=10)
+        chunk = await stream.__anext__()
+        # closing the generator kills the process instead of waiting for it
+        await stream.aclose()
+        return chunk
+
+    assert asyncio.run(read_first_chunk()) == "x" * 10
+
+
+def test_aiter_json_objects():
+    async def chunks(*items):
+        for item in items:
+            yield item
+
+    with open(input_file_name.format(test_name="list_bundles.json"), "r") as file:
+        content = file.read()
+    expected = list(iter_json_objects([content]))
+    starts = range(0, len(content), 7)
+    decoded = asyncio.run(
+        collect(aiter_json_objects(chunks(*(content[start:][:7] for start in starts))))
+    )
+    assert decoded == expected
+    assert asyncio.run(collect(aiter_json_objects(chunks('{"a": 1}{"b": ', "2}")))) == [
+        {"a": 1},
+        {"b": 2},
+    ]
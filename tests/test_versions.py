@@ -0,0 +1,89 @@
+import operator
+import pytest
+from OIIInspector.versions import (
+    key_in_version_range,
+    matches_version_range,
+    parse_version_range,
+    sorted_keys_in_version_range,
+    version_key,
+    version_in_range,
+)
+
+
+@pytest.mark.parametrize(
+    "lower, higher",
+    [
+        ("1.2.0", "1.10.0"),
+        ("1.2.0-rc.1", "1.2.0"),
+        ("1.2.0-alpha", "1.2.0-alpha.1"),
+        ("1.2.0-alpha.2", "1.2.0-alpha.10"),
+        ("1.2.0-alpha.10", "1.2.0-beta"),
+        ("0.9", "v1.0.0"),
+    ],
+)
+def test_version_order(lower, higher):
+    assert version_key(lower) < version_key(higher)
+
+
+def test_version_equality():
+    assert version_key("1.2") == version_key("v1.2.0")
+    assert version_key("1.2.0+build.5") == version_key("1.2.0")
+
+
+def test_version_in_range():
+    assert version_in_range("1.2.0")
+    assert version_in_range("1.2.0", min_version="1.2")
+    assert not version_in_range("1.2.0", max_version="1.2")
+    assert not version_in_range("1.1.9", min_version="1.2", max_version="2")
+    assert version_in_range("1.9.9", min_version="1.2", max_version="2")
+
+
+@pytest.mark.parametrize(
+    "version, version_range, expected",
+    [
+        ("4.2.1", ">=4.1.0 <4.3.0", True),
+        ("4.3.0", ">= 4.1.0 < 4.3.0", False),
+        ("4.1.0", ">4.1.0", False),
+        ("4.5", ">=4.1.0 <4.3.0 || 4.5.0", True),
+        ("4.5.1", ">=4.1.0 <4.3.0 || =4.5.0", False),
+        ("v1.0.0", "<=1.0 !=0.9.0", True),
+        ("0.9.0", "<=1.0 !=0.9.0", False),
+        ("1.0.0", "==1", True),
+        ("1.0.0", "", False),
+    ],
+)
+def test_matches_version_range(version, version_range, expected):
+    assert matches_version_range(version, version_range) is expected
+
+
+def test_parse_version_range():
+    assert parse_version_range(">=1.0.0 <2.0.0 || 3.0.0") == (
+        (
+            (operator.ge, version_key("1.0.0")),
+            (operator.lt, version_key("2.0.0")),
+        ),
+        ((operator.eq, version_key("3.0.0")),),
+    )
+    assert key_in_version_range(version_key("1.5"), ">=1.0.0 <2.0.0 || 3.0.0")
+
+
+@pytest.mark.parametrize(
+    "version_range",
+    [
+        ">=4.1.0 <4.3.0",
+        ">4.1.0 <=4.3",
+        ">=4.1.0 <4.3.0 || 4.5.0",
+        "<=4.3 !=4.2.0",
+        "==4.1 || >=4.2.0 <4.3.0",
+        ">4.5.0",
+        "",
+    ],
+)
+def test_sorted_keys_in_version_range(version_range):
+    versions = ["4.0.0", "4.1", "4.1.0", "4.2.0-rc.1", "4.2.0", "4.3.0", "4.5.0"]
+    keys = [version_key(version) for version in versions]
+    assert sorted_keys_in_version_range(keys, version_range) == [
+        index
+        for index, version in enumerate(versions)
+        if matches_version_range(version, version_range)
+    ]